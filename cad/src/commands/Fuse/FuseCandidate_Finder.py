@@ -0,0 +1,236 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+FuseCandidate_Finder.py -- finds bondable pairs of bondpoints, and
+overlapping atoms, between some chunks and others (for Fuse Chunks and
+the DNA generators), without comparing every atom of one chunk with
+every atom of the other.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+The atoms (or only the bondpoints) of the chunks to search are put into
+one CellList, along with arrays of their chunks and elements. All the
+atoms (or bondpoints) of the chunks to search from are then looked up in
+it together, using whole-array operations, and the pairs found are
+filtered by chunk and element the same way.
+
+The CellList is kept until the chunks to search, or their atoms or atom
+positions, change. Its cells are large enough for the largest tolerance
+the Fuse Chunks tolerance slider allows, so just changing the tolerance
+doesn't require a new one; neither does moving the chunks searched from
+(e.g. the selected chunks dragged in Fuse Chunks mode).
+
+The pairs found are the same as those found by the original searches
+in fusechunksBase.find_bondable_pairs and
+FuseChunks_Command.find_overlapping_atoms, except that when more than one
+atom of a chunk overlaps an atom searched from, the closest one is found.
+"""
+
+from Numeric import array, take, compress, not_equal, equal
+from Numeric import concatenate, zeros, Float, Int
+
+from geometry.CellList import CellList
+from model.elements import Singlet
+
+# The largest tolerance (in Angstroms) permitted by the Fuse Chunks
+# tolerance slider (300%); indexes are made with cells at least this large.
+_MIN_CELLSIZE = 3.0
+
+def _same_objects(list1, list2):
+    """
+    Return True if the two lists contain the same objects (by identity)
+    in the same order.
+    """
+    if len(list1) != len(list2):
+        return False
+    for obj1, obj2 in zip(list1, list2):
+        if obj1 is not obj2:
+            return False
+    return True
+
+class _ChunkAtoms:
+    """
+    The atoms (or only the bondpoints) of one chunk, and their indices
+    in its atlist (and atpos), for as long as its atlist doesn't change.
+    """
+    def __init__(self, chunk, bondpoints):
+        self.chunk = chunk
+        self.atlist = atlist = chunk.atlist
+        if bondpoints:
+            atoms = [atom for atom in atlist if atom.element is Singlet]
+        else:
+            atoms = [atom for atom in atlist if atom.element is not Singlet]
+        self.atoms = atoms
+        self.indices = array([atom.index for atom in atoms], Int)
+        self.eltnums = [atom.element.eltnum for atom in atoms]
+        return
+
+    def is_current(self):
+        return self.chunk.atlist is self.atlist
+
+    def positions(self):
+        if not self.atoms:
+            return zeros((0, 3), Float)
+        return take(self.chunk.atpos, self.indices, 0)
+
+    pass
+
+class _AtomIndex:
+    """
+    A CellList of the atoms (or only the bondpoints) of some chunks,
+    with arrays of the chunk number (in the list of chunks) and element
+    number of each of its points.
+    """
+    def __init__(self, chunk_atoms_list, cellsize):
+        self.chunks = [chunk_atoms.chunk for chunk_atoms in chunk_atoms_list]
+        self.atpos_arrays = [chunk.atpos for chunk in self.chunks]
+        self.cellsize = cellsize
+        self.chunk_number = {} # id(chunk) -> its index in self.chunks
+        atoms = []
+        positions = []
+        owners = []
+        eltnums = []
+        for number in range(len(chunk_atoms_list)):
+            chunk_atoms = chunk_atoms_list[number]
+            self.chunk_number[id(chunk_atoms.chunk)] = number
+            if not chunk_atoms.atoms:
+                continue
+            atoms.extend(chunk_atoms.atoms)
+            positions.append(chunk_atoms.positions())
+            owners.extend([number] * len(chunk_atoms.atoms))
+            eltnums.extend(chunk_atoms.eltnums)
+        self.atoms = atoms
+        self.owners = array(owners, Int)
+        self.eltnums = array(eltnums, Int)
+        if positions:
+            positions = concatenate(positions)
+        self.cells = CellList(positions, cellsize)
+        return
+
+    def is_current(self, chunks, tol):
+        if tol > self.cellsize:
+            return False
+        if not _same_objects(self.chunks, chunks):
+            return False
+        return _same_objects(self.atpos_arrays,
+                             [chunk.atpos for chunk in chunks])
+
+    pass
+
+class FuseCandidate_Finder:
+    """
+    Finds bondable pairs of bondpoints, or overlapping atoms, between
+    the chunks searched from and the chunks searched, and remembers
+    what it can for the next search.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._chunk_atoms = {} # (id(chunk), bondpoints) -> _ChunkAtoms
+        self._indexes = {} # bondpoints -> _AtomIndex
+
+    def _get_chunk_atoms(self, chunk, bondpoints):
+        key = (id(chunk), bondpoints)
+        chunk_atoms = self._chunk_atoms.get(key)
+        if chunk_atoms is None or chunk_atoms.chunk is not chunk or \
+           not chunk_atoms.is_current():
+            chunk_atoms = _ChunkAtoms(chunk, bondpoints)
+            self._chunk_atoms[key] = chunk_atoms
+        return chunk_atoms
+
+    def _get_index(self, chunks, bondpoints, tol):
+        index = self._indexes.get(bondpoints)
+        if index is None or not index.is_current(chunks, tol):
+            index = _AtomIndex(
+                [self._get_chunk_atoms(chunk, bondpoints) for chunk in chunks],
+                max(tol, _MIN_CELLSIZE))
+            self._indexes[bondpoints] = index
+        return index
+
+    def _forget_unused_chunk_atoms(self, chunks_lists):
+        used = {}
+        for chunks in chunks_lists:
+            for chunk in chunks:
+                used[id(chunk)] = 1
+        for key in self._chunk_atoms.keys():
+            if not used.has_key(key[0]):
+                del self._chunk_atoms[key]
+        return
+
+    def _close_pairs(self, from_chunks, chunks, bondpoints, tol):
+        """
+        Return (from_atoms, index, q, i, dist2), where from_atoms are the
+        atoms (or bondpoints) of from_chunks, index is the _AtomIndex for
+        chunks, and the arrays q, i and dist2 give the pairs of
+        from_atoms[q[k]] and index.atoms[i[k]], in different chunks, which
+        are within tol of each other, and the square of their distance.
+        """
+        index = self._get_index(chunks, bondpoints, tol)
+        self._forget_unused_chunk_atoms([chunks, from_chunks])
+        from_atoms = []
+        positions = []
+        from_owners = [] # number of each from_atom's chunk in index, or -1
+        for chunk in from_chunks:
+            chunk_atoms = self._get_chunk_atoms(chunk, bondpoints)
+            if not chunk_atoms.atoms:
+                continue
+            from_atoms.extend(chunk_atoms.atoms)
+            positions.append(chunk_atoms.positions())
+            number = index.chunk_number.get(id(chunk), -1)
+            from_owners.extend([number] * len(chunk_atoms.atoms))
+        if not from_atoms or not index.atoms:
+            empty = zeros((0,), Int)
+            return from_atoms, index, empty, empty, zeros((0,), Float)
+        q, i, dist2 = index.cells.near_pairs(concatenate(positions), tol)
+        # a chunk's atoms are never paired with each other
+        different = not_equal(take(array(from_owners, Int), q, 0),
+                              take(index.owners, i, 0))
+        return from_atoms, index, \
+               compress(different, q, 0), \
+               compress(different, i, 0), \
+               compress(different, dist2, 0)
+
+    def bondable_pairs(self, from_chunks, chunks, tol):
+        """
+        Return a list of the pairs (s1, s2) of bondpoints, with s1 in one
+        of from_chunks and s2 in a different chunk in chunks, which are
+        within tol of each other, ordered by s1.
+        """
+        from_atoms, index, q, i, dist2 = \
+                    self._close_pairs(from_chunks, chunks, True, tol)
+        pairs = zip(q.tolist(), i.tolist())
+        pairs.sort()
+        atoms = index.atoms
+        return [(from_atoms[k], atoms[m]) for k, m in pairs]
+
+    def overlapping_atoms(self, from_chunks, chunks, tol):
+        """
+        Return a list of the pairs (a1, a2) of atoms of the same element
+        (but not bondpoints), with a1 in one of from_chunks and a2 in a
+        different chunk in chunks, which are within tol of each other.
+        For each a1, only the closest such a2 in each of chunks is included.
+        The list is ordered by a1.
+        """
+        from_atoms, index, q, i, dist2 = \
+                    self._close_pairs(from_chunks, chunks, False, tol)
+        from_eltnums = array([atom.element.eltnum for atom in from_atoms],
+                             Int)
+        same = equal(take(from_eltnums, q, 0), take(index.eltnums, i, 0))
+        q = compress(same, q, 0).tolist()
+        i = compress(same, i, 0).tolist()
+        dist2 = compress(same, dist2, 0).tolist()
+        owners = take(index.owners, i, 0).tolist()
+        closest = {} # (k, chunk number) -> (dist2, m)
+        for k, m, owner, d2 in zip(q, i, owners, dist2):
+            key = (k, owner)
+            if not closest.has_key(key) or d2 < closest[key][0]:
+                closest[key] = (d2, m)
+        items = closest.items()
+        items.sort()
+        atoms = index.atoms
+        return [(from_atoms[k], atoms[m]) for (k, owner), (d2, m) in items]
+
+    pass
+
+# end
@@ -29,6 +29,7 @@ from platform_dependent.PlatformDependent import fix_plurals
 from commands.Fuse.FusePropertyManager import FusePropertyManager
 
 from utilities.constants import diINVISIBLE
+from utilities.GlobalPreferences import debug_pref_indexed_fuse_search
 
 from commands.Move.Move_Command import Move_Command
 from commands.Fuse.fusechunksMode import fusechunksBase
@@ -108,6 +109,15 @@ class FuseChunks_Command(Move_Command, fusechunksBase):
         if self.o.assy.selmols:
             self.graphicsMode.something_was_picked = True
 
+    def command_will_exit(self):
+        """
+        Extends superclass method.
+        @see: baseCommand.command_will_exit() for documentation.
+        """
+        self.get_fuse_candidate_finder().clear()
+            # don't keep the atoms it indexed [bruce 090327]
+        super(FuseChunks_Command, self).command_will_exit()
+
     def command_enter_misc_actions(self):
         self.w.toolsFuseChunksAction.setChecked(1)
 
@@ -279,6 +289,37 @@ class FuseChunks_Command(Move_Command, fusechunksBase):
 
         self.overlapping_atoms = []
 
+        if debug_pref_indexed_fuse_search():
+            #bruce 090327 find the same atoms using FuseCandidate_Finder
+            # (except that it finds the closest overlapping atom in each mol,
+            #  rather than the first one)
+            selmols = self.o.assy.selmols
+            selected = dict([(id(chunk), chunk) for chunk in selmols])
+            from_chunks = [chunk for chunk in selmols
+                           if not (chunk.hidden or chunk.display == diINVISIBLE)]
+            chunks = [mol for mol in self.o.assy.molecules
+                      if not (mol.hidden or mol.display == diINVISIBLE)
+                      and not selected.has_key(id(mol))]
+            if from_chunks:
+                finder = self.get_fuse_candidate_finder()
+                self.overlapping_atoms = finder.overlapping_atoms(from_chunks,
+                                                                  chunks,
+                                                                  self.tol)
+        else:
+            self._find_overlapping_atoms_one_at_a_time()
+
+        # Update tolerance label and status bar msgs.
+        natoms = len(self.overlapping_atoms)
+        tol_str = fusechunks_lambda_tol_natoms(self.tol, natoms)
+        tolerenceLabel = tol_str
+        self.propMgr.toleranceSlider.labelWidget.setText(tolerenceLabel)
+
+
+    def _find_overlapping_atoms_one_at_a_time(self):
+        """
+        [private helper for find_overlapping_atoms; the original search,
+         which compares atoms of each pair of chunks one pair at a time]
+        """
         for chunk in self.o.assy.selmols:
 
             if chunk.hidden or chunk.display == diINVISIBLE:
@@ -333,13 +374,7 @@ class FuseChunks_Command(Move_Command, fusechunksBase):
                                 self.overlapping_atoms.append( (a1,a2) )
                                 # No need to check other atoms in this chunk--
                                 break
-
-        # Update tolerance label and status bar msgs.
-        natoms = len(self.overlapping_atoms)
-        tol_str = fusechunks_lambda_tol_natoms(self.tol, natoms)
-        tolerenceLabel = tol_str
-        self.propMgr.toleranceSlider.labelWidget.setText(tolerenceLabel)
-
+        return
 
     def find_overlapping_atoms_to_delete_from_atomlists(self,
                                               atomlist_to_keep,
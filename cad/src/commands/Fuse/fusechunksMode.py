@@ -15,6 +15,8 @@ from geometry.VQT import vlen
 from model.bonds import bond_at_singlets
 from utilities.Log import orangemsg
 from utilities.constants import diINVISIBLE
+from utilities.GlobalPreferences import debug_pref_indexed_fuse_search
+from commands.Fuse.FuseCandidate_Finder import FuseCandidate_Finder
 
 def fusechunks_lambda_tol_nbonds(tol, nbonds, mbonds, bondable_pairs):
     """
@@ -76,6 +78,35 @@ class fusechunksBase:
         # For "Make Bonds", tol is the distance between two bondable singlets
         # For "Fuse Atoms", tol is the distance between two atoms to be considered overlapping
 
+    _fuse_candidate_finder = None
+
+    def get_fuse_candidate_finder(self): #bruce 090327
+        """
+        Return our FuseCandidate_Finder (making it if necessary), which
+        keeps the index of the chunks we search between our searches.
+        """
+        if self._fuse_candidate_finder is None:
+            self._fuse_candidate_finder = FuseCandidate_Finder()
+        return self._fuse_candidate_finder
+
+    def _add_bondable_pair(self, s1, s2):
+        """
+        Add (s1, s2) to self.bondable_pairs, and count it as a way of bonding
+        for each of them.
+        """
+        self.bondable_pairs.append( (s1,s2) ) # Add this pair to the list
+
+        # Now increment ways_of_bonding for each of the two singlets.
+        if s1.key in self.ways_of_bonding:
+            self.ways_of_bonding[s1.key] += 1
+        else:
+            self.ways_of_bonding[s1.key] = 1
+        if s2.key in self.ways_of_bonding:
+            self.ways_of_bonding[s2.key] += 1
+        else:
+            self.ways_of_bonding[s2.key] = 1
+        return
+
     def find_bondable_pairs(self,
                             chunk_list = None,
                             selmols_list = None,
@@ -97,7 +128,36 @@ class fusechunksBase:
         if not selmols_list:
             selmols_list = self.o.assy.selmols
 
+        if debug_pref_indexed_fuse_search():
+            #bruce 090327 find the same pairs using FuseCandidate_Finder
+            from_chunks = [chunk for chunk in selmols_list
+                           if not (chunk.hidden or chunk.display == diINVISIBLE)]
+            chunks = [mol for mol in chunk_list
+                      if not (mol.hidden or mol.display == diINVISIBLE)
+                      and not (mol.picked and not ignore_chunk_picked_state)]
+            if from_chunks:
+                finder = self.get_fuse_candidate_finder()
+                for s1, s2 in finder.bondable_pairs(from_chunks, chunks, self.tol):
+                    self._add_bondable_pair(s1, s2)
+        else:
+            self._find_bondable_pairs_one_at_a_time(chunk_list,
+                                                    selmols_list,
+                                                    ignore_chunk_picked_state)
+
+        # Update tolerance label and status bar msgs.
+        nbonds = len(self.bondable_pairs)
+        mbonds, singlets_not_bonded, singlet_pairs = self.multibonds()
+        tol_str = fusechunks_lambda_tol_nbonds(self.tol, nbonds, mbonds, singlet_pairs)
+        return tol_str
 
+    def _find_bondable_pairs_one_at_a_time(self,
+                                           chunk_list,
+                                           selmols_list,
+                                           ignore_chunk_picked_state):
+        """
+        [private helper for find_bondable_pairs; the original search,
+         which compares bondpoints of each pair of chunks one pair at a time]
+        """
         for chunk in selmols_list:
             if chunk.hidden or chunk.display == diINVISIBLE:
                 # Skip selected chunk if hidden or invisible. Fixes bug 970. mark 060404
@@ -136,23 +196,8 @@ class fusechunksBase:
                             # if ok:
                             # we can ignore ideal and err, we know s1, s2 can bond at this tol
 
-                                self.bondable_pairs.append( (s1,s2) ) # Add this pair to the list
-
-                                # Now increment ways_of_bonding for each of the two singlets.
-                                if s1.key in self.ways_of_bonding:
-                                    self.ways_of_bonding[s1.key] += 1
-                                else:
-                                    self.ways_of_bonding[s1.key] = 1
-                                if s2.key in self.ways_of_bonding:
-                                    self.ways_of_bonding[s2.key] += 1
-                                else:
-                                    self.ways_of_bonding[s2.key] = 1
-
-        # Update tolerance label and status bar msgs.
-        nbonds = len(self.bondable_pairs)
-        mbonds, singlets_not_bonded, singlet_pairs = self.multibonds()
-        tol_str = fusechunks_lambda_tol_nbonds(self.tol, nbonds, mbonds, singlet_pairs)
-        return tol_str
+                                self._add_bondable_pair(s1, s2)
+        return
 
     def find_bondable_pairs_in_given_atompairs(self, atomPairs):
         """
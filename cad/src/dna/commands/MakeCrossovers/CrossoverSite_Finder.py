@@ -0,0 +1,461 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+CrossoverSite_Finder.py -- finds the potential crossover sites between
+DnaSegments, for CrossoverSite_Marker, without comparing every strand atom
+pair of every segment with those of every other segment.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+The sites found are the same as those found by the original search in
+CrossoverSite_Marker (see its _mark_crossoverSites_bet_segment_and_its_neighbors
+and the methods it calls), but the work is divided up like this:
+
+- For each segment, the strand base atoms of its ladders, the axis atoms
+  paired with them, and the bonded pairs of those strand atoms (ordered by
+  bond direction) are found once, and kept (as arrays of positions, pair
+  centers and strand-to-axis directions) until the segment's ladders or
+  atom positions change. Positions are taken from the chunks' atpos arrays,
+  whose identity also tells us when they change.
+
+- The segments' axes, sampled along their length, are put into a CellList,
+  so the pairs of segments close enough for any of their pair centers to
+  be within the maximum crossover site distance are found together, using
+  whole-array operations.
+
+- The orthogonal distance test between a segment and its possible
+  neighbors is done for all of them at once, and then each remaining
+  pair of segments compares only the strand atom pairs which face the
+  other segment, as whole arrays.
+
+- The sites found for each pair of segments are kept until either segment
+  changes, so when only the segments being dragged change (as during
+  MakeCrossovers_GraphicsMode.leftDrag), only their pairs are redone.
+"""
+
+from math import pi, cos
+
+from Numeric import array, zeros, take, concatenate, nonzero
+from Numeric import add, sqrt, arccos, clip, absolute, dot, transpose
+from Numeric import less, less_equal, greater, logical_and, reshape, maximum
+from Numeric import Float, Int
+
+from geometry.CellList import CellList
+from model.bonds import bond_direction
+
+_TEENY = 1.0e-10 # as in geometry.VQT.angleBetween
+
+def _same_objects(list1, list2):
+    """
+    Return True if the two lists contain the same objects (by identity)
+    in the same order.
+    """
+    if len(list1) != len(list2):
+        return False
+    for obj1, obj2 in zip(list1, list2):
+        if obj1 is not obj2:
+            return False
+    return True
+
+def _chunk_runs(atoms):
+    """
+    Return a list of (chunk, list of atom.index) for the runs of
+    consecutive atoms in atoms which are in the same chunk, so that the
+    atoms' positions are the concatenation of take(chunk.atpos, indices).
+    """
+    runs = []
+    chunk = None
+    indices = None
+    for atom in atoms:
+        if atom.molecule is not chunk:
+            chunk = atom.molecule
+            indices = []
+            runs.append((chunk, indices))
+        indices.append(atom.index)
+    return runs
+
+def _run_positions(runs):
+    if not runs:
+        return zeros((0, 3), Float)
+    return concatenate([take(chunk.atpos, indices, 0)
+                        for chunk, indices in runs])
+
+def _unit_vectors(vectors):
+    """
+    Return an (N,3) array of vectors normalized to length 1, leaving the
+    (nearly) zero ones zero.
+    """
+    lengths = sqrt(add.reduce(vectors * vectors, 1))
+    lengths = lengths + less_equal(lengths, _TEENY)
+    return vectors / lengths[:, None]
+
+# ==
+
+class _SegmentCrossoverData:
+    """
+    Arrays describing the strand atom pairs of one DnaSegment, which may be
+    part of a crossover, as of one set of its atom positions.
+    """
+    def __init__(self, segment, ladder_key, previous = None):
+        """
+        @param ladder_key: list of the segment's content strand chunks and
+                           their ladders (see _ladder_key)
+
+        @param previous: if not None, an older _SegmentCrossoverData for
+                         the same segment and ladders, whose atoms and
+                         atom pairs we can reuse
+        """
+        self.segment = segment
+        self.ladder_key = ladder_key
+        if previous is not None and \
+           _same_objects(previous.atlists, [chunk.atlist
+                                            for chunk in previous.chunks]):
+            self.strand_atoms = previous.strand_atoms
+            self.strand_runs = previous.strand_runs
+            self.axis_runs = previous.axis_runs
+            self.chunks = previous.chunks
+            self.atlists = previous.atlists
+            self.pair_i = previous.pair_i
+            self.pair_j = previous.pair_j
+        else:
+            self._find_atoms_and_pairs(ladder_key)
+        # (keep these arrays, so their identities can't be reused)
+        self.atpos_arrays = [chunk.atpos for chunk in self.chunks]
+        self._compute_geometry()
+        return
+
+    def _find_atoms_and_pairs(self, ladder_key):
+        strand_atoms = []
+        axis_atoms = []
+        for chunk, ladder in ladder_key:
+            if not ladder.axis_rail:
+                continue
+            if chunk == ladder.strand_rails[0].baseatoms[0].molecule:
+                chunk_strand = 0
+            else:
+                chunk_strand = 1
+            strand_atoms.extend(ladder.strand_rails[chunk_strand].baseatoms)
+            axis_atoms.extend(ladder.axis_rail.baseatoms)
+        self.strand_atoms = strand_atoms
+        self.strand_runs = _chunk_runs(strand_atoms)
+        self.axis_runs = _chunk_runs(axis_atoms)
+        chunks = {}
+        for chunk, indices in self.strand_runs + self.axis_runs:
+            chunks[id(chunk)] = chunk
+        self.chunks = chunks.values()
+        self.atlists = [chunk.atlist for chunk in self.chunks]
+
+        # bonded pairs of strand atoms, ordered by bond direction
+        # (as in CrossoverSite_Marker._filter_neighbor_atompairs)
+        atom_indices = {}
+        for i in range(len(strand_atoms)):
+            atom_indices[id(strand_atoms[i])] = i
+        pairs = {}
+        for i in range(len(strand_atoms)):
+            atom = strand_atoms[i]
+            for neighbor in atom.neighbors():
+                j = atom_indices.get(id(neighbor))
+                if j is None:
+                    continue
+                if bond_direction(atom, neighbor) == - 1:
+                    pairs[(j, i)] = 1
+                else:
+                    pairs[(i, j)] = 1
+        pairs = pairs.keys()
+        pairs.sort()
+        self.pair_i = array([i for i, j in pairs], Int)
+        self.pair_j = array([j for i, j in pairs], Int)
+        return
+
+    def _compute_geometry(self):
+        strand_positions = _run_positions(self.strand_runs)
+        axis_positions = _run_positions(self.axis_runs)
+        self.strand_positions = strand_positions
+        self.directions = _unit_vectors(strand_positions - axis_positions)
+        self.centers = (take(strand_positions, self.pair_i, 0) +
+                        take(strand_positions, self.pair_j, 0)) / 2.0
+        self.end1, self.end2 = self.segment.getAxisEndPoints()
+        self.radius = 0.0
+        if self.end1 is None or self.end2 is None or not len(self.centers):
+            self.end1 = None
+            return
+        # the largest distance from a pair center to the axis line segment
+        axis = self.end2 - self.end1
+        length2 = dot(axis, axis)
+        offsets = self.centers - self.end1
+        if length2 > _TEENY:
+            t = clip(dot(offsets, axis) / length2, 0.0, 1.0)
+            offsets = offsets - t[:, None] * axis
+        self.radius = sqrt(maximum.reduce(add.reduce(offsets * offsets, 1)))
+        return
+
+    def is_current(self, ladder_key):
+        """
+        Is self still correct for our segment, whose current ladder key
+        is ladder_key?
+        """
+        if not _same_objects(self.ladder_key, ladder_key):
+            return False
+        return _same_objects(self.atpos_arrays,
+                             [chunk.atpos for chunk in self.chunks])
+
+    def can_reuse_atoms(self, ladder_key):
+        return _same_objects(self.ladder_key, ladder_key)
+
+    pass
+
+def _ladder_key(segment):
+    res = []
+    for chunk in segment.get_content_strand_chunks():
+        res.append((chunk, chunk.ladder))
+    return res
+
+# ==
+
+class CrossoverSite_Finder:
+    """
+    Finds (and remembers, for incremental updates) the potential crossover
+    sites between DnaSegments.
+    """
+    def __init__(self,
+                 max_site_distance,
+                 max_axis_distance,
+                 max_angle):
+        """
+        @param max_site_distance: the largest distance between the centers
+               of two strand atom pairs which form a crossover site
+        @param max_axis_distance: the largest distance of a neighbor
+               segment's first axis end from a segment's axis line
+        @param max_angle: the largest angle (degrees) between the vector
+               joining the two centers and the orthogonal vector between
+               the segments
+        """
+        self._max_site_distance = max_site_distance
+        self._max_axis_distance = max_axis_distance
+        self._max_angle = max_angle
+        self._segment_data = {} # id(segment) -> _SegmentCrossoverData
+        self._sites = {} # (id(seg1), id(seg2)) -> (data1, data2, angle, sites)
+        return
+
+    def clear(self):
+        self._segment_data = {}
+        self._sites = {}
+
+    def _update_segment_data(self, segments):
+        """
+        Make sure self._segment_data is current for the given segments,
+        and forget it for all other segments.
+        """
+        old_data = self._segment_data
+        new_data = {}
+        for segment in segments:
+            if new_data.has_key(id(segment)):
+                continue
+            ladder_key = _ladder_key(segment)
+            data = old_data.get(id(segment))
+            if data is not None and data.segment is segment:
+                if not data.is_current(ladder_key):
+                    if data.can_reuse_atoms(ladder_key):
+                        data = _SegmentCrossoverData(segment, ladder_key, data)
+                    else:
+                        data = _SegmentCrossoverData(segment, ladder_key)
+            else:
+                data = _SegmentCrossoverData(segment, ladder_key)
+            new_data[id(segment)] = data
+        self._segment_data = new_data
+        return
+
+    def _close_segment_pairs(self, datas):
+        """
+        Return a dict whose keys are the pairs (i, j) of indices into
+        datas (in both orders) of segments whose axes are close enough for
+        some of their strand atom pair centers to be within
+        max_site_distance of each other.
+        """
+        radius = 0.0
+        for data in datas:
+            if data.end1 is not None:
+                radius = max(radius, data.radius)
+        # Two segments can have a site only if their axis line segments are
+        # within this distance. Each axis is sampled at intervals of half
+        # that, so their samples are then within 1.5 times it.
+        limit = self._max_site_distance + 2 * radius
+        step = limit / 2.0
+        samples = []
+        owners = []
+        for index in range(len(datas)):
+            data = datas[index]
+            if data.end1 is None:
+                continue
+            axis = data.end2 - data.end1
+            count = int(sqrt(dot(axis, axis)) / step) + 1
+            for k in range(count + 1):
+                samples.append(data.end1 + axis * (float(k) / count))
+                owners.append(index)
+        res = {}
+        if len(samples) < 2:
+            return res
+        cells = CellList(samples, 1.5 * limit)
+        i, j, dist2 = cells.pairs_within()
+        owners = array(owners, Int)
+        owner_i = take(owners, i, 0).tolist()
+        owner_j = take(owners, j, 0).tolist()
+        for pair in zip(owner_i, owner_j):
+            res[pair] = 1
+        for pair in res.keys():
+            res[(pair[1], pair[0])] = 1
+        return res
+
+    def find_crossover_sites(self,
+                             segments_to_search,
+                             all_segments,
+                             indicators_angle):
+        """
+        Generate (segment, neighbor, sites) for each pair of segments
+        searched by the original algorithm, in the same order, where
+        sites is a list of (crossoverPairs, center1, center2) for the
+        potential crossovers between them, as found by
+        CrossoverSite_Marker._are_crossover_atompairs. (The caller is
+        responsible for ignoring the atom pairs which are already part
+        of crossovers found earlier.)
+        """
+        self._update_segment_data(list(all_segments) + list(segments_to_search))
+        datas = [self._segment_data[id(segment)] for segment in all_segments]
+        close_pairs = self._close_segment_pairs(datas)
+        index_of_segment = {}
+        for index in range(len(datas)):
+            index_of_segment[id(all_segments[index])] = index
+        ends = zeros((len(datas), 3), Float)
+        for index in range(len(datas)):
+            if datas[index].end1 is not None:
+                ends[index] = datas[index].end1
+
+        used_sites = {}
+        searched = {}
+        for segment in segments_to_search:
+            searched[id(segment)] = segment
+            data = self._segment_data[id(segment)]
+            if data.end1 is None or not datas:
+                continue
+            index = index_of_segment.get(id(segment))
+            axisVector = _unit_vectors(
+                reshape(data.end2 - data.end1, (1, 3)))[0]
+            # the orthogonal distance test, for all possible neighbors at once
+            offsets = ends - data.end1
+            along = dot(offsets, axisVector)
+            orthogonal = data.end1 + along[:, None] * axisVector - ends
+            orthogonal_dist = sqrt(add.reduce(orthogonal * orthogonal, 1))
+            near = less_equal(orthogonal_dist, self._max_axis_distance)
+            for neighbor_index in nonzero(near):
+                neighbor = all_segments[neighbor_index]
+                if neighbor is segment or searched.has_key(id(neighbor)):
+                    continue
+                neighbor_data = datas[neighbor_index]
+                if neighbor_data.end1 is None:
+                    continue
+                if index is not None and \
+                   not close_pairs.has_key((index, neighbor_index)):
+                    continue
+                key = (id(segment), id(neighbor))
+                used_sites[key] = 1
+                cached = self._sites.get(key)
+                if cached is not None and \
+                   cached[0] is data and \
+                   cached[1] is neighbor_data and \
+                   cached[2] == indicators_angle:
+                    sites = cached[3]
+                else:
+                    sites = self._sites_between(data,
+                                                neighbor_data,
+                                                orthogonal[neighbor_index],
+                                                indicators_angle)
+                    self._sites[key] = (data, neighbor_data,
+                                        indicators_angle, sites)
+                if sites:
+                    yield segment, neighbor, sites
+                continue
+            continue
+
+        for key in self._sites.keys():
+            if not used_sites.has_key(key):
+                del self._sites[key]
+        return
+
+    def _facing_pairs(self, data, unit_normal, cos_limit):
+        """
+        Return the indices of data's strand atom pairs whose atoms both
+        point (from their axis atoms) within the indicator angle of the
+        normal or its opposite (as tested by
+        get_all_available_dna_base_orientation_indicators).
+        """
+        cosines = absolute(dot(data.directions, unit_normal))
+        facing = greater(cosines, cos_limit)
+        both = logical_and(take(facing, data.pair_i, 0),
+                           take(facing, data.pair_j, 0))
+        return nonzero(both)
+
+    def _sites_between(self, data1, data2, orthogonal_vector, indicators_angle):
+        """
+        Return the list of (crossoverPairs, center1, center2) for the
+        potential crossover sites between the segments of data1 and data2,
+        given the orthogonal vector between them.
+        """
+        length = sqrt(dot(orthogonal_vector, orthogonal_vector))
+        if length * length < _TEENY:
+            return []
+        unit_normal = orthogonal_vector / length
+        cos_limit = _cos_degrees(indicators_angle)
+        pairs1 = self._facing_pairs(data1, unit_normal, cos_limit)
+        pairs2 = self._facing_pairs(data2, unit_normal, cos_limit)
+        if not len(pairs1) or not len(pairs2):
+            return []
+        centers1 = take(data1.centers, pairs1, 0)
+        centers2 = take(data2.centers, pairs2, 0)
+
+        # all squared distances between centers1 and centers2
+        dist2 = (add.reduce(centers1 * centers1, 1)[:, None] +
+                 add.reduce(centers2 * centers2, 1)[None, :] -
+                 2.0 * dot(centers1, transpose(centers2)))
+        n2 = len(pairs2)
+        close = nonzero(less_equal(dist2.flat,
+                                   self._max_site_distance ** 2 + _TEENY))
+        if not len(close):
+            return []
+        k1 = close / n2
+        k2 = close % n2
+        center_vecs = take(centers1, k1, 0) - take(centers2, k2, 0)
+        # exact distance test, as in _are_crossover_atompairs
+        lengths = sqrt(add.reduce(center_vecs * center_vecs, 1))
+        dots = dot(center_vecs, orthogonal_vector)
+        # theta = angleBetween(orthogonal_vector, centerVec), which is
+        # 0 for a (nearly) zero centerVec
+        nonzero_length = greater(lengths * lengths, _TEENY)
+        cosines = clip(dot(center_vecs, unit_normal) /
+                       (lengths + 1 - nonzero_length), -1.0, 1.0)
+        cosines = cosines * nonzero_length + (1 - nonzero_length)
+        theta = arccos(cosines) * (180.0 / pi)
+        theta = theta + less(dots, 1) * (180.0 - 2 * theta)
+        ok = logical_and(less_equal(lengths, self._max_site_distance),
+                         less_equal(absolute(theta), self._max_angle))
+
+        atoms1 = data1.strand_atoms
+        atoms2 = data2.strand_atoms
+        sites = []
+        for k in nonzero(ok):
+            pair1 = pairs1[k1[k]]
+            pair2 = pairs2[k2[k]]
+            crossoverPairs = (atoms1[data1.pair_i[pair1]],
+                              atoms1[data1.pair_j[pair1]],
+                              atoms2[data2.pair_i[pair2]],
+                              atoms2[data2.pair_j[pair2]])
+            sites.append((crossoverPairs,
+                          + data1.centers[pair1],
+                          + data2.centers[pair2]))
+        return sites
+
+    pass
+
+def _cos_degrees(angle):
+    return cos(angle * pi / 180.0)
+
+# end
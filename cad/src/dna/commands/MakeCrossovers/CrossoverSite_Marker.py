@@ -36,6 +36,7 @@ import foundation.env as env
 import time
 from utilities.constants import black, banana
 from dna.commands.MakeCrossovers.MakeCrossovers_Handle import MakeCrossovers_Handle
+from dna.commands.MakeCrossovers.CrossoverSite_Finder import CrossoverSite_Finder
 
 from geometry.VQT import orthodist, norm, vlen, angleBetween
 from Numeric import dot
@@ -48,6 +49,8 @@ from exprs.Arrow           import Arrow
 from exprs.Highlightable    import Highlightable
 
 from utilities.prefs_constants import makeCrossoversCommand_crossoverSearch_bet_given_segments_only_prefs_key
+from utilities.prefs_constants import dnaBaseIndicatorsAngle_prefs_key
+from utilities.GlobalPreferences import debug_pref_indexed_crossover_site_search
 
 
 MAX_DISTANCE_BETWEEN_CROSSOVER_SITES = 17
@@ -89,6 +92,14 @@ class CrossoverSite_Marker:
         self._raw_crossover_atoms_with_neighbors_dict = {}
         self._final_crossover_atoms_dict = {}
 
+        #Finds the crossover sites when debug_pref_indexed_crossover_site_search
+        #is enabled, remembering them between updates for segments which
+        #don't change.
+        self._crossoverSite_finder = CrossoverSite_Finder(
+            MAX_DISTANCE_BETWEEN_CROSSOVER_SITES,
+            MAX_PERPENDICULAR_DISTANCE_BET_SEGMENT_AXES,
+            MAX_ANGLE_BET_PLANE_NORMAL_AND_AVG_CENTER_VECTOR_OF_CROSSOVER_PAIRS)
+
     def update(self):
         """
         Does a full update (including exprs handle creation
@@ -212,6 +223,9 @@ class CrossoverSite_Marker:
                 self._allDnaSegmentDict[id(segment)] = segment
 
     def _updateCrossoverSites(self):
+        if self._use_crossoverSite_finder():
+            self._updateCrossoverSites_using_finder()
+            return
         allSegments = self._allDnaSegmentDict.values()
         #dict segments_searched_for_neighbors is a dictionary object that
         #maintains all the dna segments that have been gone trorugh a
@@ -226,6 +240,55 @@ class CrossoverSite_Marker:
                 segments_searched_for_neighbors,
                 allSegments )
 
+    def _use_crossoverSite_finder(self):
+        """
+        Return True if the crossover sites should be found by
+        self._crossoverSite_finder. (The original search is still used
+        when drawing its debug information, which the finder doesn't
+        compute.)
+        """
+        if not debug_pref_indexed_crossover_site_search():
+            return False
+        graphicsMode = self.graphicsMode
+        if graphicsMode.DEBUG_DRAW_PLANE_NORMALS or \
+           graphicsMode.DEBUG_DRAW_ALL_POTENTIAL_CROSSOVER_SITES or \
+           graphicsMode.DEBUG_DRAW_AVERAGE_CENTER_PAIRS_OF_POTENTIAL_CROSSOVERS:
+            return False
+        return True
+
+    def _updateCrossoverSites_using_finder(self):
+        """
+        Find the same crossover sites as the search done by
+        self._mark_crossoverSites_bet_segment_and_its_neighbors, using
+        self._crossoverSite_finder.
+        @see: CrossoverSite_Finder
+        """
+        allSegments = self._allDnaSegmentDict.values()
+        segments_to_be_searched = self.command.getSegmentList()
+        indicators_angle = env.prefs[dnaBaseIndicatorsAngle_prefs_key]
+
+        for dnaSegment, neighbor, sites in \
+            self._crossoverSite_finder.find_crossover_sites(
+                segments_to_be_searched,
+                allSegments,
+                indicators_angle):
+            #As in self._filter_neighbor_atompairs, skip the atom pairs
+            #which were already part of a crossover site when the search
+            #of this pair of segments began.
+            final_atoms = self._final_crossover_atoms_dict
+            usable_sites = []
+            for crossoverPairs, center_1, center_2 in sites:
+                atm1, neighbor1, atm2, neighbor2 = crossoverPairs
+                if final_atoms.has_key(id(atm1)) and \
+                   final_atoms.has_key(id(neighbor1)):
+                    continue
+                if final_atoms.has_key(id(atm2)) and \
+                   final_atoms.has_key(id(neighbor2)):
+                    continue
+                usable_sites.append((crossoverPairs, center_1, center_2))
+            for crossoverPairs, center_1, center_2 in usable_sites:
+                self._add_crossover_site(crossoverPairs, center_1, center_2)
+
     def _mark_crossoverSites_bet_segment_and_its_neighbors(self,
                                                            dnaSegment,
                                                            segments_searched_for_neighbors,
@@ -459,7 +522,15 @@ class CrossoverSite_Marker:
             return False, distance, ()
 
         crossoverPairs = (atm1, neighbor1, atm2, neighbor2)
+        self._add_crossover_site(crossoverPairs, center_1, center_2)
+
+        return True, distance, crossoverPairs
 
+    def _add_crossover_site(self, crossoverPairs, center_1, center_2):
+        """
+        Record crossoverPairs (atm1, neighbor1, atm2, neighbor2), whose atom
+        pairs have the given centers, as a crossover site.
+        """
         for a in crossoverPairs:
             if not self._final_crossover_atoms_dict.has_key(id(a)):
                 self._final_crossover_atoms_dict[id(a)] = a
@@ -472,8 +543,6 @@ class CrossoverSite_Marker:
             self._final_avg_center_pairs_for_crossovers_dict[crossoverPairs_id] = (center_1, center_2)
             self.final_crossover_pairs_dict[crossoverPairs_id] = crossoverPairs
 
-        return True, distance, crossoverPairs
-
     def _create_crossoverPairs_id(self, crossoverPairs):
         #important to sort this to create a unique id. Makes sure that same
         #crossover pairs are not added to the self.final_crossover_pairs_dict
@@ -56,6 +56,166 @@ from Numeric import dot
 
 from utilities.debug import print_compact_stack
 from model.bonds import bond_at_singlets
+from model.bonds import bond_atoms_faster
+from model.chem import Atom
+from Numeric import array, zeros, take, add, multiply, Float
+from utilities.GlobalPreferences import debug_pref_dna_generator_templates
+
+# ==
+
+# Atom attributes which the mmp reader may set, and which a template
+# copies to the atoms it makes (if set in the template's atoms).
+_TEMPLATE_ATOM_ATTRS = ('display',
+                        'info',
+                        'ghost',
+                        '_dnaBaseName',
+                        '_dnaStrandId_for_generators',
+                        )
+
+class _BasePairTemplate:
+    """
+    The atoms and bonds of a base-pair mmp file, read once, from which
+    any number of base-pair chunks can be made without reading the file
+    again.
+
+    Atoms are numbered in the order of the file's chunks, and of their
+    atoms by key; all positions are kept in one Numeric array so that
+    many copies can be rotated and translated at once.
+    """
+    def __init__(self, assy, filename):
+        try:
+            ok, grouplist = readmmp(assy, filename, isInsert = True)
+        except IOError:
+            raise PluginBug("Cannot read file: " + filename)
+        if not grouplist:
+            raise PluginBug("No atoms in DNA base? " + filename)
+
+        viewdata, mainpart, shelf = grouplist
+
+        self.filename = filename
+        self.chunks = [] # (first atom index, end atom index, display, color)
+        self.atoms = [] # (atomtype or element symbol, [(attr, value) ...])
+        self.singlets = [] # indices of bondpoints
+        self.bonds = [] # (index1, index2, v6, bond direction from index1)
+        positions = []
+        index = {} # atom key -> index
+
+        for member in mainpart.members:
+            start = len(self.atoms)
+            atoms = member.atoms.items()
+            atoms.sort()
+            for key, atm in atoms:
+                index[key] = len(self.atoms)
+                if atm.is_singlet():
+                    self.singlets.append(len(self.atoms))
+                # Like the mmp reader, leave the atomtype unset unless
+                # the file specified it.
+                atomtype = atm.atomtype_iff_set() or atm.element.symbol
+                attrs = [(attr, atm.__dict__[attr])
+                         for attr in _TEMPLATE_ATOM_ATTRS
+                         if atm.__dict__.has_key(attr)]
+                self.atoms.append((atomtype, attrs))
+                positions.append(atm.posn())
+            self.chunks.append((start, len(self.atoms),
+                                member.display, member.color))
+
+        for member in mainpart.members:
+            for atm in member.atoms.itervalues():
+                for bond in atm.bonds:
+                    if bond.atom1 is atm:
+                        direction = bond.bond_direction_from(atm)
+                        self.bonds.append((index[atm.key],
+                                           index[bond.atom2.key],
+                                           bond.v6,
+                                           direction))
+
+        self.positions = array(positions, Float)
+
+        # Clean up. (The template's own atoms are never used again.)
+        del viewdata
+        mainpart.kill()
+        shelf.kill()
+        return
+
+    def transformed_positions(self, thetas, zs, position = V(0, 0, 0)):
+        """
+        Return an array of shape (len(thetas), number of atoms, 3) of our
+        atom positions, each copy rotated about the Z axis by one of
+        thetas, then translated along it by the corresponding one of zs,
+        and by position (as Dna_Generator._rotateTranslateXYZ does for
+        one position).
+        """
+        c = array(map(cos, thetas), Float)
+        s = array(map(sin, thetas), Float)
+        zs = array(zs, Float)
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        z = self.positions[:, 2]
+        res = zeros((len(thetas), len(self.atoms), 3), Float)
+        res[:, :, 0] = multiply.outer(c, x) + multiply.outer(s, y) + position[0]
+        res[:, :, 1] = multiply.outer(-s, x) + multiply.outer(c, y) + position[1]
+        res[:, :, 2] = add.outer(zs, z) + position[2]
+        return res
+
+    def make_chunks(self, assy, positions, name = "BasePairChunk"):
+        """
+        Make new chunks (not yet added to any group) containing a copy of
+        our atoms and bonds, with the given atom positions (an array like
+        one element of the result of transformed_positions).
+
+        @return: (list of new chunks, list of new atoms in our order)
+        """
+        newatoms = []
+        chunks = []
+        for start, end, display, color in self.chunks:
+            chunk = assy.Chunk(assy, name)
+            atoms = []
+            for i in range(start, end):
+                atomtype, attrs = self.atoms[i]
+                atm = Atom(atomtype, positions[i])
+                if type(atomtype) == type(""):
+                    atm.unset_atomtype()
+                for attr, value in attrs:
+                    setattr(atm, attr, value)
+                atoms.append(atm)
+            chunk.addatoms(atoms)
+            chunk.display = display
+            if color is not None:
+                chunk.setcolor(color)
+            newatoms.extend(atoms)
+            chunks.append(chunk)
+        for i1, i2, v6, direction in self.bonds:
+            bond = bond_atoms_faster(newatoms[i1], newatoms[i2], v6)
+            if direction and bond.is_directional():
+                bond.set_bond_direction_from(newatoms[i1], direction)
+        return chunks, newatoms
+
+    def bondable_singlet_pairs(self, previous, theta, z, tol):
+        """
+        Return the list of (i, j) such that our bondpoint i, in a copy of
+        us rotated by theta and raised by z, would be bonded by
+        fusechunksBase (at tolerance tol) to bondpoint j of an
+        untransformed copy of the template previous.
+        """
+        p1 = self.transformed_positions([theta], [z])[0]
+        p2 = previous.positions
+        pairs = []
+        ways_of_bonding = {}
+        for i in self.singlets:
+            for j in previous.singlets:
+                if vlen(p1[i] - p2[j]) <= tol:
+                    pairs.append((i, j))
+                    for key in ((1, i), (2, j)):
+                        ways_of_bonding[key] = ways_of_bonding.get(key, 0) + 1
+        return [(i, j) for i, j in pairs
+                if ways_of_bonding[(1, i)] == 1 and
+                   ways_of_bonding[(2, j)] == 1]
+
+    pass
+
+# base-pair mmp filename -> _BasePairTemplate, for the rest of the session
+_base_pair_templates = {}
+
 
 
 class Dna_Generator:
@@ -1001,6 +1161,41 @@ class Dna_Generator:
         theta = 0.0
         z     = 0.5 * duplexRise * (numberOfBasePairs - 1)
 
+        if debug_pref_dna_generator_templates():
+            self._create_raw_duplex_from_templates(subgroup,
+                                                   numberOfBasePairs,
+                                                   twistPerBase,
+                                                   duplexRise,
+                                                   position)
+        else:
+            self._create_raw_duplex_from_mmp_files(subgroup,
+                                                   numberOfBasePairs,
+                                                   twistPerBase,
+                                                   duplexRise,
+                                                   position)
+
+        try:
+            self._postProcess(self.baseList)
+        except:
+            if env.debug():
+                print_compact_traceback(
+                    "debug: exception in %r._postProcess(self.baseList = %r) " \
+                    "(reraising): " % (self, self.baseList,))
+            raise
+
+    def _create_raw_duplex_from_mmp_files(self,
+                                          subgroup,
+                                          numberOfBasePairs,
+                                          twistPerBase,
+                                          duplexRise,
+                                          position):
+        """
+        Make and fuse the base-pair chunks for self._create_raw_duplex,
+        reading one base-pair mmp file per base-pair.
+        """
+        theta = 0.0
+        z     = 0.5 * duplexRise * (numberOfBasePairs - 1)
+
         # Create duplex.
         for i in range(numberOfBasePairs):
             basefile, zoffset, thetaOffset = self._strandAinfo(i)
@@ -1046,15 +1241,93 @@ class Dna_Generator:
 
         # Fuse the base-pair chunks together into continuous strands.
         self.fuseBasePairChunks(self.baseList)
+        return
 
-        try:
-            self._postProcess(self.baseList)
-        except:
-            if env.debug():
-                print_compact_traceback(
-                    "debug: exception in %r._postProcess(self.baseList = %r) " \
-                    "(reraising): " % (self, self.baseList,))
-            raise
+    def _create_raw_duplex_from_templates(self,
+                                          subgroup,
+                                          numberOfBasePairs,
+                                          twistPerBase,
+                                          duplexRise,
+                                          position,
+                                          fuseTolerance = 1.5):
+        """
+        Make and bond the base-pair chunks for self._create_raw_duplex,
+        like _create_raw_duplex_from_mmp_files, but copying cached
+        templates of the base-pair mmp files (see _BasePairTemplate),
+        transforming the positions of all copies of each template at once,
+        and bonding adjacent base-pairs at the bondpoints which
+        fuseBasePairChunks would find, worked out once for each pair of
+        templates and relative twist and rise.
+        """
+        # Where each base-pair goes, computed as the old loop does.
+        templates = []
+        thetas = []
+        zs = []
+        theta = 0.0
+        z     = 0.5 * duplexRise * (numberOfBasePairs - 1)
+        for i in range(numberOfBasePairs):
+            basefile, zoffset, thetaOffset = self._strandAinfo(i)
+            templates.append(self._basePairTemplate(basefile))
+            thetas.append(theta + thetaOffset)
+            zs.append(z + zoffset)
+            theta -= twistPerBase
+            z     -= duplexRise
+
+        # Make the atoms of all copies of each template.
+        indices_for_template = {}
+        for i in range(numberOfBasePairs):
+            indices_for_template.setdefault(templates[i], []).append(i)
+        chunks_and_atoms = [None] * numberOfBasePairs
+        for template, indices in indices_for_template.items():
+            positions = template.transformed_positions(
+                [thetas[i] for i in indices],
+                [zs[i] for i in indices],
+                position)
+            for k in range(len(indices)):
+                chunks_and_atoms[indices[k]] = \
+                    template.make_chunks(self.assy, positions[k])
+
+        #Note that this modifies self.baseList, as _insertBaseFromMmp does.
+        for chunks, atoms in chunks_and_atoms:
+            for chunk in chunks:
+                subgroup.addchild(chunk)
+                self.baseList.append(chunk)
+
+        #See the comments in _create_raw_duplex_from_mmp_files about this.
+        self._determine_axis_and_strandA_endAtoms_at_end_1(self.baseList[0])
+
+        # Fuse the base-pair chunks together into continuous strands.
+        pairs_for_key = {}
+        nbonds = 0
+        for i in range(numberOfBasePairs - 1):
+            # (The rounding lets nearly equal steps share their pairs.)
+            key = (templates[i], templates[i + 1],
+                   round(thetas[i + 1] - thetas[i], 6),
+                   round(zs[i + 1] - zs[i], 6))
+            pairs = pairs_for_key.get(key)
+            if pairs is None:
+                pairs = templates[i + 1].bondable_singlet_pairs(
+                    templates[i], key[2], key[3], fuseTolerance)
+                pairs_for_key[key] = pairs
+            atoms1 = chunks_and_atoms[i][1]
+            atoms2 = chunks_and_atoms[i + 1][1]
+            for j2, j1 in pairs:
+                bond_at_singlets(atoms2[j2], atoms1[j1], move = False)
+                nbonds += 1
+        if nbonds:
+            self.assy.changed()
+        return
+
+    def _basePairTemplate(self, filename):
+        """
+        Return the _BasePairTemplate for the given base-pair mmp file,
+        reading the file only if this hasn't been done before.
+        """
+        template = _base_pair_templates.get(filename)
+        if template is None:
+            template = _BasePairTemplate(self.assy, filename)
+            _base_pair_templates[filename] = template
+        return template
 
 
 
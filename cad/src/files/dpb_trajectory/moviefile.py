@@ -15,16 +15,42 @@ moviefile.py -- classes and other code for interpreting movie files
 
 # these imports are anticipated, perhaps not all needed
 import os, sys
+import mmap
+from bisect import bisect_left, bisect_right, insort
 from struct import unpack # fyi: used for old-format header, no longer for delta frames
 ## from VQT import A
-from Numeric import array, Int8
+from Numeric import array, Int8, Float, fromstring, reshape, add
 from utilities import debug_flags
 from utilities.debug import print_compact_stack, print_compact_traceback
 import foundation.env as env
 
-def MovieFile(filename): #bruce 050913 removed history arg, since all callers passed env.history
+# Every this many frames, OldFormatMovieFile keeps a copy of the absolute
+# positions it computes (a "key frame" in its index), so that reaching any
+# frame from the nearest key frame takes at most this many delta frames.
+# It's made larger for movies whose index would not fit in
+# _KEYFRAME_INDEX_MAXBYTES.
+_KEYFRAME_INTERVAL = 100
+
+_KEYFRAME_INDEX_MAXBYTES = 128 * 1024 * 1024
+
+# Movie files no larger than this are indexed as soon as the client donates
+# a reference frame, by one sequential pass over the file; larger ones are
+# indexed as frames are visited.
+_EAGER_INDEX_MAXFILESIZE = 64 * 1024 * 1024
+
+# Maximum total size of the recently visited frames OldFormatMovieFile
+# keeps, so that scrubbing back and forth over a region is fast.
+_FRAME_CACHE_MAXBYTES = 32 * 1024 * 1024
+
+_BYTES_PER_POSITION = 3 * 8 # one Float (double) per coordinate
+
+# Runs of delta frames are decoded in blocks of about this many bytes
+# of positions at a time.
+_DELTA_BLOCK_MAXBYTES = 1024 * 1024
+
+def MovieFile(filename, use_mmap = True): #bruce 050913 removed history arg, since all callers passed env.history
     """
-    Given the name of an existing old-format movie file,
+    Given the name of an existing movie file (in old or new format),
     return an object which can read frames from it
     (perhaps only after receiving further advice from its client code,
      like the absolute atom positions for one specific frame).
@@ -33,22 +59,70 @@ def MovieFile(filename): #bruce 050913 removed history arg, since all callers pa
     for the old format, that's all there is.
        In case of a fatal error, print an appropriate message to env.history
     and return None. We might also print warnings to history (I don't know #k).
-       In future, when new format is available, we'll detect the format in the file
-    and open it in the proper way, perhaps also taking optional arguments for a trace filename,
-    perhaps handling files that have not yet been finished or perhaps not yet even started, etc....
-       See also the docstring of class OldFormatMovieFile.
+       We detect the format in the file and open it in the proper way
+    (in future, perhaps also taking optional arguments for a trace filename,
+    perhaps handling files that have not yet been finished or perhaps not yet even started, etc....)
+       See also the docstrings of classes OldFormatMovieFile and NewFormatMovieFile.
+       If use_mmap is true (the default), memory-map the file for reading
+    delta frames, if possible.
     """
-    # for now, assume old format, and assume file exists and has reached its final size.
-    reader = OldFormatMovieFile_startup( filename)
+    # for now, assume file exists and has reached its final size.
+    if is_new_format_moviefile(filename):
+        reader = NewFormatMovieFile_startup( filename, use_mmap)
+        if reader.open_and_read_header_errQ():
+            return None
+        return NewFormatMovieFile( reader)
+    reader = OldFormatMovieFile_startup( filename, use_mmap)
     if reader.open_and_read_header_errQ():
         return None
     return OldFormatMovieFile( reader)
 
+def is_new_format_moviefile(filename):
+    """
+    Return True if filename is a movie file in the simulator's "new" format
+    (which starts with text header lines), False if it might be in the old
+    format (which starts with a binary frame count).
+    """
+    try:
+        file1 = open(filename, 'rb')
+        try:
+            return file1.read(2) == "#!"
+        finally:
+            file1.close()
+    except IOError:
+        return False
+    pass
+
+def moviefile_natoms_and_nframes(filename):
+    """
+    Return (natoms, nframes) for the movie file of the given name,
+    as well as we can tell from its header, without checking the rest
+    of the file (other than its size, for old-format files).
+    For an invalid new-format file, print an error message to env.history
+    and return None.
+    """
+    if is_new_format_moviefile(filename):
+        reader = NewFormatMovieFile_startup( filename)
+        errQ = reader.open_and_read_header_errQ()
+        reader.close()
+        if errQ:
+            return None
+        return reader.natoms, reader.totalFramesActual
+    filesize = os.path.getsize(filename) - 4
+    fp = open(filename,'rb')
+    # Read header (4 bytes) from file containing the number of frames in the movie.
+    nframes = unpack('i',fp.read(4))[0]
+    fp.close()
+    natoms = int(filesize/(nframes*3))
+    return natoms, nframes
+
 class OldFormatMovieFile_startup:
     #e maybe make these same obj, so easier to recheck header later, and big one needs invalid state anyway
-    def __init__(self, filename): #bruce 050913 removed history arg
+    def __init__(self, filename, use_mmap = False): #bruce 050913 removed history arg
         self.filename = filename
         self.fileobj = None
+        self.use_mmap = use_mmap
+        self.filemap = None # an mmap of the whole file, if use_mmap and it worked
         self.errcode = None
     def open_and_read_header_errQ(self):
         # because we assume file is fully written, we can do all this stuff immediately for now:
@@ -59,6 +133,16 @@ class OldFormatMovieFile_startup:
     def open_file(self):
         assert not self.fileobj #e if we relax this, then worry about whether we should seek to start of file
         self.fileobj = open(self.filename,'rb') ###@@@ missing file is possible when we reopen after closing; this is caught below
+        if self.use_mmap:
+            try:
+                self.filemap = mmap.mmap(self.fileobj.fileno(), 0,
+                                         access = mmap.ACCESS_READ)
+            except:
+                # e.g. empty file, or not enough address space;
+                # just read it normally
+                if debug_flags.atom_debug:
+                    print_compact_traceback("atom_debug: can't mmap %r, reading it instead: " % self.filename)
+                self.filemap = None
     def read_header(self):
         # assume we're at start of file
         # Read header (4 bytes) from file containing the number of frames in the moviefile.
@@ -93,8 +177,11 @@ class OldFormatMovieFile_startup:
             if not self.fileobj:
                 # this might not yet ever happen, not sure.
                 self.open_file() #e check for error? check length still the same, etc?
-            self.fileobj.seek( filepos) ####@@@@ failure here might be possible if file got shorter after size measured -- not sure
-            res = self.fileobj.read(nbytes)
+            if self.filemap is not None:
+                res = self.filemap[filepos : filepos + nbytes]
+            else:
+                self.fileobj.seek( filepos) ####@@@@ failure here might be possible if file got shorter after size measured -- not sure
+                res = self.fileobj.read(nbytes)
             assert len(res) == nbytes # this can fail, if file got shorter after we measured its size...
         except:
             # might be good to detect, warn, set flag, return 0s.... ####@@@@ test this
@@ -103,7 +190,33 @@ class OldFormatMovieFile_startup:
             res = "\x00" * nbytes
             assert len(res) == nbytes, "mistake in python zero-byte syntax" # but I checked it, should be ok
         return res
+    def delta_frames_bytes(self, n1, n2):
+        """
+        Return the bytes of the delta frames with indices n1 through n2
+        inclusive, concatenated (assuming n1 <= n2 are within legal range).
+        """
+        assert 0 < n1 <= n2
+        nbytes = self.natoms * 3 * (n2 - n1 + 1)
+        filepos = ((n1-1) * self.natoms * 3) + 4
+        try:
+            if not self.fileobj:
+                self.open_file()
+            if self.filemap is not None:
+                res = self.filemap[filepos : filepos + nbytes]
+            else:
+                self.fileobj.seek( filepos)
+                res = self.fileobj.read(nbytes)
+            assert len(res) == nbytes # this can fail, if file got shorter after we measured its size...
+        except:
+            # same as in delta_frame_bytes
+            if debug_flags.atom_debug:
+                print_compact_traceback( "atom_debug: ignoring exception reading delta_frames %d-%d, returning all 00s: " % (n1, n2))
+            res = "\x00" * nbytes
+        return res
     def close(self):
+        if self.filemap is not None:
+            self.filemap.close()
+        self.filemap = None
         if self.fileobj:
             self.fileobj.close()
         self.fileobj = None
@@ -113,6 +226,48 @@ class OldFormatMovieFile_startup:
         return # no other large state in this object
     pass
 
+class FrameCache:
+    """
+    A memory-bounded cache of immutable frames (arrays of absolute atom
+    positions) indexed by frame number, which discards the least recently
+    used frames when their total size would exceed maxbytes.
+    """
+    def __init__(self, maxbytes, framebytes):
+        self.maxframes = max(0, maxbytes / max(1, framebytes))
+        self.frames = {} # maps frame number to (last use time, frame)
+        self.time = 0
+    def __contains__(self, n):
+        return n in self.frames
+    def keys(self):
+        return self.frames.keys()
+    def get(self, n):
+        """
+        Return the frame for n (which the caller must not modify),
+        or None if we don't have it.
+        """
+        try:
+            junk, frame = self.frames[n]
+        except KeyError:
+            return None
+        self.time += 1
+        self.frames[n] = (self.time, frame)
+        return frame
+    def put(self, n, frame):
+        """
+        Store frame (which the caller must not modify afterwards) for n,
+        discarding the least recently used frame if necessary.
+        """
+        if not self.maxframes:
+            return
+        if n not in self.frames and len(self.frames) >= self.maxframes:
+            oldest = min([(t, n1) for n1, (t, f) in self.frames.iteritems()])[1]
+            del self.frames[oldest]
+        self.time += 1
+        self.frames[n] = (self.time, frame)
+    def clear(self):
+        self.frames = {}
+    pass
+
 class OldFormatMovieFile: #bruce 050426
     """
     Know the filename and format of an existing moviefile, and enough about it to read requested frames from it
@@ -136,7 +291,13 @@ class OldFormatMovieFile: #bruce 050426
     # the general parts of the new-format file header, only the "trajectory part".
     # So probably some other object would parse the header and only then hand off the rest of the file
     # to one of these.
-    def __init__(self, filereader):
+    def __init__(self, filereader, keyframe_interval = None):
+        """
+        @param keyframe_interval: how many frames apart to keep key frames
+                                  in our index; None means choose a default
+                                  based on the movie's size, 0 means keep
+                                  no index or frame cache (as older code did).
+        """
         self.filereader = filereader # this has file pointer, knows filename & header, can read raw frames
 
         #e someday:
@@ -161,6 +322,24 @@ class OldFormatMovieFile: #bruce 050426
         self.temp_mutable_frames = {}
         self.cached_immutable_frames = {} #e for some callers, store a cached frame 0 here
 
+        # Frames derived from cached_immutable_frames and delta frames, and
+        # never modified: key frames every self.keyframe_interval frames
+        # (keyframe_indices is their sorted list of frame numbers), and a
+        # cache of recently visited frames. Both are discarded when the
+        # client donates a new immutable frame.
+        framebytes = self.natoms * _BYTES_PER_POSITION
+        if keyframe_interval is None:
+            keyframe_interval = max( _KEYFRAME_INTERVAL,
+                                     self.totalFramesActual * framebytes / _KEYFRAME_INDEX_MAXBYTES + 1 )
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = {}
+        self.keyframe_indices = []
+        if keyframe_interval:
+            self.frame_cache = FrameCache(_FRAME_CACHE_MAXBYTES, framebytes)
+        else:
+            self.frame_cache = FrameCache(0, framebytes)
+        self.deltas_applied = 0 # total delta frames added or subtracted, for benchmarks
+
     def get_totalFramesActual(self):
         return self.totalFramesActual
     def matches_alist(self, alist):
@@ -169,6 +348,7 @@ class OldFormatMovieFile: #bruce 050426
         return self.matches_alist(alist) ###@@@ stub, fails to recheck the file! should verify same header and same or larger nframes.
     def destroy(self):
         self.cached_immutable_frames = self.temp_mutable_frames = None
+        self.keyframes = self.keyframe_indices = self.frame_cache = None
         self.filereader.destroy()
         self.filereader = None
 
@@ -214,6 +394,13 @@ class OldFormatMovieFile: #bruce 050426
         n0 = self.nearest_knownposns_frame_index(n)
         frame0 = self.copy_of_known_frame_or_None(n0) # an array of absposns we're allowed to modify, valid for n0
         assert frame0 is not None # don't test it as a boolean -- it might be all 0.0 which in Numeric means it's false!
+        seeking = abs(n - n0) > 1 # (not just stepping through the movie)
+        K = self.keyframe_interval
+        self.deltas_applied += abs(n - n0)
+        if seeking:
+            # add up the delta frames in large blocks, not one at a time
+            self.apply_delta_frames(frame0, n0, n)
+            n0 = n
         while n0 < n:
             # move forwards using a delta frame (which is never cached, tho this code doesn't need to know that)
             # (##e btw it might be faster to read several at once and combine them into one, or add all at once, using Numeric ops!
@@ -225,6 +412,8 @@ class OldFormatMovieFile: #bruce 050426
             except ValueError: # frames are not aligned -- happens when slider reaches right end
                 print "frames not aligned; shapes:",frame0.shape, df.shape
                 raise
+            if K and n0 % K == 0 and n0 not in self.keyframes:
+                self.add_keyframe(n0, + frame0)
         while n0 > n:
             # (this never happens if we just moved forwards, but there's no need to "confirm" or "enforce" that fact)
             # move backwards using a delta frame
@@ -234,6 +423,11 @@ class OldFormatMovieFile: #bruce 050426
             df = self.delta_frame(n0)
             n0 -= 1 # note: we did this after grabbing the frame, not beforehand as above
             frame0 -= df
+            if K and n0 % K == 0 and n0 not in self.keyframes:
+                self.add_keyframe(n0, + frame0)
+        if seeking:
+            # keep a copy, in case the user scrubs back to this frame
+            self.frame_cache.put(n, + frame0)
         #e future:
         #e   If we'd especially like to keep a cached copy for future speed, make one now...
         #e   Or do this inside forward-going loop?
@@ -246,6 +440,98 @@ class OldFormatMovieFile: #bruce 050426
 ##                print "copy_of_frame %d[%d] is" % (n, ii), frame0[ii]
         return frame0
 
+    def _delta_block_length(self):
+        """
+        Return how many delta frames to decode at once.
+        """
+        return max(1, _DELTA_BLOCK_MAXBYTES / max(1, self.natoms * _BYTES_PER_POSITION))
+
+    def delta_frames_sums(self, n1, n2, step = 1):
+        """
+        Return a Numeric array of shape ((n2 - n1 + 1) / step, natoms, 3)
+        whose ith element is the sum of the delta frames n1 through
+        n1 + (i + 1) * step - 1 (in Angstroms), by reading them all at once
+        and adding them up with a single cumulative sum.
+        (n2 - n1 + 1 must be a multiple of step.)
+        """
+        nframes = n2 - n1 + 1
+        assert nframes % step == 0
+        bytes = self.filereader.delta_frames_bytes(n1, n2)
+        deltas = fromstring(bytes, Int8).astype(Float)
+            # (adding up these small integers in Float is exact)
+        if step == 1:
+            deltas.shape = (nframes, self.natoms, 3)
+        else:
+            deltas = add.reduce( reshape( deltas, (nframes / step, step, self.natoms, 3)), 1)
+        res = add.accumulate( deltas, 0)
+        res *= 0.01
+        return res
+
+    def apply_delta_frames(self, frame, n0, n):
+        """
+        Modify frame in place from the absolute positions of frame n0
+        to those of frame n, recording any key frames we pass (or reach).
+        """
+        K = self.keyframe_interval
+        blocklength = self._delta_block_length()
+        if n0 < n:
+            while n0 < n:
+                n1 = min(n, n0 + blocklength)
+                sums = self.delta_frames_sums(n0 + 1, n1) # frame n0 + 1 + i is frame + sums[i]
+                if K:
+                    for k in range(n0 + 1 + (-(n0 + 1) % K), n1 + 1, K):
+                        if k not in self.keyframes:
+                            self.add_keyframe(k, frame + sums[k - n0 - 1])
+                frame += sums[-1]
+                n0 = n1
+        else:
+            while n0 > n:
+                n1 = max(n, n0 - blocklength)
+                sums = self.delta_frames_sums(n1 + 1, n0)
+                total = sums[-1]
+                # frame n1 + i is frame - (total - sums[i - 1]) (for i > 0)
+                if K:
+                    for k in range(n1 + (-n1 % K), n0, K):
+                        if k not in self.keyframes:
+                            if k == n1:
+                                delta = total
+                            else:
+                                delta = total - sums[k - n1 - 1]
+                            self.add_keyframe(k, frame - delta)
+                frame -= total
+                n0 = n1
+        return
+
+    def frames(self, start = 0, stop = None, step = 1):
+        """
+        Generate the absolute atom positions of frames start, start + step,
+        etc (while less than stop, default all frames), as Numeric arrays
+        which the caller can keep but must not modify. This is much faster
+        than calling ref_to_transient_frame_n for each frame, since delta
+        frames are decoded in large blocks.
+        """
+        assert step > 0
+        if stop is None:
+            stop = self.totalFramesActual + 1
+        stop = min(stop, self.totalFramesActual + 1)
+        if start >= stop:
+            return
+        frame = self.copy_of_frame(start)
+        yield + frame
+        blocklength = max(step, self._delta_block_length())
+        n0 = start
+        last = start + ((stop - 1 - start) / step) * step # last frame to yield
+        while n0 < last:
+            # decode whole steps only, so each block ends on a yielded frame
+            n1 = min(last, n0 + (blocklength / step) * step)
+            positions = self.delta_frames_sums(n0 + 1, n1, step) # for frames n0 + step, ..., n1
+            positions += frame
+            for i in range(len(positions)):
+                yield positions[i]
+            frame = positions[-1]
+            n0 = n1
+        return
+
     def donate_mutable_known_frame(self, n, frame):
         """
         Caller has a frame of absolute atom positions it no longer needs --
@@ -275,7 +561,45 @@ class OldFormatMovieFile: #bruce 050426
         """
         self.cached_immutable_frames[n] = frame
             # note: we only need one per n! so don't worry if this replaces an older one.
-        ###e do something to affect the retval of nearest_knownposns_frame_index??
+        # frames we derived from older donated frames might not agree with
+        # this one, so forget them
+        self.keyframes = {}
+        self.keyframe_indices = []
+        self.frame_cache.clear()
+        return
+
+    def add_keyframe(self, n, frame):
+        """
+        Add frame (which the caller must not modify afterwards) to our index,
+        as the absolute positions for frame-index n.
+        """
+        self.keyframes[n] = frame
+        insort(self.keyframe_indices, n)
+        return
+
+    def build_keyframe_index(self):
+        """
+        Compute and save a key frame every self.keyframe_interval frames
+        throughout the file, by scanning it once in each direction from the
+        known frames, so that no later call of copy_of_frame needs to
+        apply more than that many delta frames.
+        Requires that the client has donated a known frame.
+        """
+        if not self.keyframe_interval:
+            return
+        self.copy_of_frame(self.totalFramesActual)
+        self.copy_of_frame(0)
+        self.frame_cache.clear() # (not needed for anything it holds)
+        return
+
+    def maybe_build_keyframe_index(self):
+        """
+        If our file is small enough to index quickly, do so now
+        (see build_keyframe_index); otherwise our index is built gradually,
+        as copy_of_frame passes key frames.
+        """
+        if self.totalFramesActual * self.natoms * 3 <= _EAGER_INDEX_MAXFILESIZE:
+            self.build_keyframe_index()
         return
 
     def copy_of_known_frame_or_None(self, n):
@@ -289,15 +613,34 @@ class OldFormatMovieFile: #bruce 050426
         try:
             return self.temp_mutable_frames.pop(n)
         except KeyError:
-            try:
-                #e we don't yet support files with key frames, so a cached one is our only chance.
-                frame_notouch = self.cached_immutable_frames[n]
-            except KeyError:
-                return None
-            else:
-                return + frame_notouch # the unary "+" makes a copy (since it's a Numeric array)
+            #e we don't yet support files with key frames, so a cached or
+            # derived one is our only chance.
+            frame_notouch = self.cached_immutable_frames.get(n)
+            if frame_notouch is None:
+                frame_notouch = self.keyframes.get(n)
+            if frame_notouch is None:
+                frame_notouch = self.frame_cache.get(n)
+            if frame_notouch is None:
+                return self.file_keyframe_or_None(n) # (already a new array)
+            return + frame_notouch # the unary "+" makes a copy (since it's a Numeric array)
         pass
 
+    def file_keyframe_indices_near(self, n):
+        """
+        Return a list of the nearest frame indices at or below n, and above n,
+        which have key frames (absolute positions) in our file.
+        [Old-format files have none; subclasses can override.]
+        """
+        return []
+
+    def file_keyframe_or_None(self, n):
+        """
+        Return a new array of the absolute positions for frame n read from
+        a key frame in our file, or None if there is none for n.
+        [Old-format files have none; subclasses can override.]
+        """
+        return None
+
     def nearest_knownposns_frame_index(self, n):
         """
         Figure out and return n0, the nearest frame index to n
@@ -321,14 +664,24 @@ class OldFormatMovieFile: #bruce 050426
         if n + 1 in self.temp_mutable_frames:
             return n + 1
         # It's also common than n is already known, so test that quickly too.
-        if n in self.temp_mutable_frames or n in self.cached_immutable_frames:
+        if n in self.temp_mutable_frames or n in self.cached_immutable_frames \
+           or n in self.keyframes or n in self.frame_cache:
             return n
-        # No exact match. In present code, we won't have very many known frames,
+        # No exact match. Apart from key frames (which we find by bisection
+        # in their sorted index), we won't have very many known frames,
         # so it's ok to just scan them all and find the one that's actually nearest.
-        # (For future moviefile format with frequent key frames, we'll revise this quite a bit.)
         max_lower = too_low = -1
         min_higher = too_high = 100000000000000000000000 # higher than any actual frame number (I hope!)
-        for n0 in self.temp_mutable_frames.keys() + self.cached_immutable_frames.keys():
+        candidates = self.temp_mutable_frames.keys() + \
+                     self.cached_immutable_frames.keys() + \
+                     self.frame_cache.keys() + \
+                     self.file_keyframe_indices_near(n)
+        if n in candidates:
+            return n
+        indices = self.keyframe_indices
+        i = bisect_left(indices, n)
+        candidates.extend(indices[max(0, i - 1) : i + 1])
+        for n0 in candidates:
             if n0 < n:
                 max_lower = max( max_lower, n0)
             else:
@@ -382,3 +735,506 @@ class OldFormatMovieFile: #bruce 050426
 
     pass # end of class MovieFile
 
+# == new-format movie files
+
+# Record types and magic numbers in new-format movie files,
+# as written by the simulator (see sim/src/writemovie.c).
+# Record headers contain the *_MAGIC values; the index contains
+# the *_TYPE values.
+DPB_SYNC_WORD          = "\xff\xff\xff\xff"
+DPB_BYTE_ORDER_MAGIC   = 0x01020304
+DPB_DELTA_RECORD_MAGIC = 0x44656c01
+DPB_DELTA_RECORD_TYPE  = 0x44656c02
+DPB_KEY_RECORD_MAGIC   = 0x4b657901
+DPB_KEY_RECORD_TYPE    = 0x4b657902
+DPB_INDEX_RECORD_MAGIC = 0x496e6401
+DPB_INDEX_RECORD_TYPE  = 0x496e6402
+DPB_END_RECORD_MAGIC   = 0x456f6601
+DPB_END_RECORD_TYPE    = 0x456f6602
+
+_RECORD_HEADER_SIZE = 12 # byte order, record type, record length
+_END_RECORD_SIZE = _RECORD_HEADER_SIZE + 16
+
+_MAX_HEADER_TEXT = 64 * 1024 # header text is much shorter than this
+
+_RECORD_TYPE_OF_MAGIC = {
+    DPB_DELTA_RECORD_MAGIC: DPB_DELTA_RECORD_TYPE,
+    DPB_KEY_RECORD_MAGIC: DPB_KEY_RECORD_TYPE,
+    DPB_INDEX_RECORD_MAGIC: DPB_INDEX_RECORD_TYPE,
+    DPB_END_RECORD_MAGIC: DPB_END_RECORD_TYPE,
+ }
+
+class NewFormatMovieFile_startup(OldFormatMovieFile_startup):
+    """
+    Read the header and index of a movie file in the simulator's "new" format
+    (see writeNewOutputHeader and its relatives in sim/src/writemovie.c),
+    and the raw data of its key and delta records.
+
+    After some text header lines, the file consists of binary records:
+    a key record (absolute positions) for the initial frame, a delta record
+    (changes in position, as in old-format files) for each frame, with
+    another key record after every few of them, then an index of all records
+    and their file offsets, and an end record pointing to the index.
+    A file that is incomplete (no valid end record) is indexed by scanning
+    its records instead.
+
+    Frame n (n > 0) of the movie is the one reached by the nth delta record,
+    and a key record is for the frame reached by all the delta records
+    before it. (The frame numbers stored in the records themselves are not
+    used, since they are ambiguous.)
+
+    If the simulator's KeyRecordInterval was 1 or less, the file has no delta
+    records. Then writeNewFrame writes a key record only every
+    max(1, KeyRecordInterval + 2) frames, and writeNewOutputTrailer writes
+    another one for the last frame if that wasn't one of them (the frame
+    count is found in the index record). The frames in between weren't
+    written at all, so NewFormatMovieFile shows the last key record before
+    each of them.
+    """
+    def read_header(self):
+        # assume we're at start of file
+        text = self.fileobj.read(_MAX_HEADER_TEXT)
+        i = text.find("\n" + DPB_SYNC_WORD)
+        if i < 0 or (i + 1) % 4 != 0:
+            self.error("Movie file [%s] has no valid header." % self.filename)
+            return
+        self.header = header = {}
+        for line in text[:i].split("\n"):
+            if not line.startswith("#") and '=' in line:
+                key, value = line.split('=', 1)
+                header[key.strip()] = value.strip()
+        try:
+            self.natoms = int(header['NumberOfAtoms'])
+        except (KeyError, ValueError):
+            self.error("Movie file [%s] header has no valid NumberOfAtoms." % self.filename)
+            return
+        try:
+            self.key_record_interval = int(header['KeyRecordInterval'])
+        except (KeyError, ValueError):
+            self.key_record_interval = -1 # (a key record for each frame)
+        self.offset_to_first_record = i + 1 + len(DPB_SYNC_WORD)
+
+        # records use the byte order of the machine that wrote them
+        self.fileobj.seek(self.offset_to_first_record)
+        hdr = self.fileobj.read(4)
+        for endian in ('<', '>'):
+            if len(hdr) == 4 and unpack(endian + 'i', hdr)[0] == DPB_BYTE_ORDER_MAGIC:
+                self.endian = endian
+                break
+        else:
+            self.error("Movie file [%s] has no valid records." % self.filename)
+            return
+
+        self.index_frame_count = None # set by read_index
+        entries = self.read_index() or self.scan_records()
+        self.build_frame_tables(entries)
+        if not self.key_frame_offsets:
+            self.error("Movie file [%s] has no key frames." % self.filename)
+        return
+
+    def read_record_header(self, offset):
+        """
+        Return (record magic, record length) for the record at offset,
+        or None if there isn't a complete valid record there.
+        """
+        self.fileobj.seek(offset)
+        hdr = self.fileobj.read(_RECORD_HEADER_SIZE)
+        if len(hdr) != _RECORD_HEADER_SIZE:
+            return None
+        byte_order, magic, length = unpack(self.endian + 'iii', hdr)
+        if byte_order != DPB_BYTE_ORDER_MAGIC or \
+           offset + _RECORD_HEADER_SIZE + length > self.filesize:
+            return None
+        return magic, length
+
+    def read_index(self):
+        """
+        Return the list of (record type, record offset) pairs in this file's
+        index (not including the index record), or None if it has no valid
+        end record or index. Also set self.index_frame_count to the number of
+        frames the simulator wrote, from the index record.
+        """
+        self.filesize = filesize = os.path.getsize(self.filename)
+        end = filesize - _END_RECORD_SIZE
+        if end < self.offset_to_first_record or \
+           self.read_record_header(end) != (DPB_END_RECORD_MAGIC, 16):
+            return None
+        high, low = unpack(self.endian + 'iI', self.fileobj.read(8))[:2] # offset to first record (not needed)
+        high, low = unpack(self.endian + 'iI', self.fileobj.read(8))
+        index_offset = filesize + ((high << 32) | low) # (the offset is relative to the end of the file)
+        hdr = self.read_record_header(index_offset)
+        if hdr is None or hdr[0] != DPB_INDEX_RECORD_MAGIC:
+            return None
+        nframes, count = unpack(self.endian + 'ii', self.fileobj.read(8))
+        if hdr[1] != 8 + count * 16:
+            return None
+        self.index_frame_count = nframes
+        entries = unpack(self.endian + 'iiiI' * count, self.fileobj.read(count * 16))
+        res = []
+        for i in xrange(0, 4 * count, 4):
+            record_type = entries[i]
+            if record_type != DPB_INDEX_RECORD_TYPE:
+                res.append( (record_type, (entries[i+2] << 32) | entries[i+3]) )
+        return res
+
+    def scan_records(self):
+        """
+        Return the list of (record type, record offset) pairs for all the
+        complete records in this file, by reading their headers in order.
+        """
+        self.filesize = os.path.getsize(self.filename)
+        res = []
+        offset = self.offset_to_first_record
+        while 1:
+            hdr = self.read_record_header(offset)
+            if hdr is None or hdr[0] not in _RECORD_TYPE_OF_MAGIC:
+                break
+            record_type = _RECORD_TYPE_OF_MAGIC[hdr[0]]
+            if record_type in (DPB_DELTA_RECORD_TYPE, DPB_KEY_RECORD_TYPE):
+                res.append( (record_type, offset) )
+            offset += _RECORD_HEADER_SIZE + hdr[1]
+        return res
+
+    def build_frame_tables(self, entries):
+        """
+        Set self.delta_frame_offsets (a list whose nth element is the offset
+        of the data in the delta record for frame n, or None for n == 0),
+        self.key_frame_offsets (a dict from frame number to the offset
+        of the data in its key record), self.has_deltas and
+        self.totalFramesActual, from the (record type, record offset) pairs
+        in entries.
+        """
+        data = _RECORD_HEADER_SIZE + 4 # skip the header and frame number
+        self.has_deltas = has_deltas = \
+            (DPB_DELTA_RECORD_TYPE in [t for t, o in entries])
+        deltas = [None]
+        keys = {}
+        if has_deltas:
+            for record_type, offset in entries:
+                if record_type == DPB_DELTA_RECORD_TYPE:
+                    deltas.append(offset + data)
+                elif record_type == DPB_KEY_RECORD_TYPE:
+                    keys[len(deltas) - 1] = offset + data
+            self.totalFramesActual = len(deltas) - 1
+        else:
+            # see class docstring
+            interval = max(1, self.key_record_interval + 2)
+            key_offsets = [offset + data for record_type, offset in entries
+                           if record_type == DPB_KEY_RECORD_TYPE]
+            for i in range(len(key_offsets)):
+                keys[i * interval] = key_offsets[i]
+            nframes = self.index_frame_count
+            if nframes is not None and nframes % interval and \
+               len(key_offsets) == nframes / interval + 2:
+                # the last one was written by writeNewOutputTrailer
+                del keys[(len(key_offsets) - 1) * interval]
+                keys[nframes] = key_offsets[-1]
+            self.totalFramesActual = max([0] + keys.keys())
+        self.delta_frame_offsets = deltas
+        self.key_frame_offsets = keys
+        self.key_frame_indices = keys.keys()
+        self.key_frame_indices.sort()
+        return
+
+    def read_bytes(self, filepos, nbytes):
+        """
+        Return nbytes bytes of our file starting at filepos.
+        """
+        if not self.fileobj:
+            self.open_file()
+        if self.filemap is not None:
+            res = self.filemap[filepos : filepos + nbytes]
+        else:
+            self.fileobj.seek( filepos)
+            res = self.fileobj.read(nbytes)
+        assert len(res) == nbytes
+        return res
+
+    def delta_frame_bytes(self, n):
+        """
+        return the bytes of the delta frame which has index n (assuming our file is open and n is within legal range)
+        """
+        assert n > 0
+        nbytes = self.natoms * 3
+        try:
+            res = self.read_bytes( self.delta_frame_offsets[n], nbytes)
+        except:
+            # same as in OldFormatMovieFile_startup
+            if debug_flags.atom_debug:
+                print_compact_traceback( "atom_debug: ignoring exception reading delta_frame %d, returning all 00s: " % n)
+            res = "\x00" * nbytes
+        return res
+
+    def delta_frames_bytes(self, n1, n2):
+        """
+        Return the bytes of the delta frames with indices n1 through n2
+        inclusive, concatenated (assuming n1 <= n2 are within legal range).
+        """
+        assert 0 < n1 <= n2
+        if self.filemap is not None:
+            # slicing the map is cheap enough to do once per frame
+            nbytes = self.natoms * 3
+            filemap = self.filemap
+            offsets = self.delta_frame_offsets[n1 : n2 + 1]
+            res = "".join([filemap[offset : offset + nbytes] for offset in offsets])
+            if len(res) == nbytes * len(offsets):
+                return res
+        return "".join([self.delta_frame_bytes(n) for n in range(n1, n2 + 1)])
+
+    def key_frame(self, n):
+        """
+        Return the absolute atom positions from the key record for frame n,
+        as a new Numeric array, or None if there is no key record for n.
+        """
+        offset = self.key_frame_offsets.get(n)
+        if offset is None:
+            return None
+        nints = self.natoms * 3
+        try:
+            ixyz = unpack( self.endian + '%di' % nints, self.read_bytes(offset, nints * 4))
+        except:
+            if debug_flags.atom_debug:
+                print_compact_traceback( "atom_debug: ignoring exception reading key frame %d: " % n)
+            return None
+        res = array(ixyz, Float)
+        res.shape = (-1, 3)
+        res *= 0.01 # same units as delta frames
+        return res
+
+    pass # end of class NewFormatMovieFile_startup
+
+class NewFormatMovieFile(OldFormatMovieFile):
+    """
+    Like OldFormatMovieFile, but for a movie file in the simulator's "new"
+    format, which has its own key frames (absolute atom positions) every few
+    frames, found using the file's index. Any frame can be computed from
+    the nearest key frame, so the client doesn't need to donate a known frame,
+    and we don't need to compute key frames of our own.
+    """
+    def __init__(self, filereader):
+        OldFormatMovieFile.__init__(self, filereader, keyframe_interval = 0)
+        # (but keep a cache of recently visited frames, as for old format)
+        self.frame_cache = FrameCache(_FRAME_CACHE_MAXBYTES,
+                                      self.natoms * _BYTES_PER_POSITION)
+        return
+
+    def file_keyframe_indices_near(self, n):
+        indices = self.filereader.key_frame_indices
+        i = bisect_left(indices, n)
+        if i < len(indices) and indices[i] == n:
+            return [n]
+        return indices[max(0, i - 1) : i + 1]
+
+    def file_keyframe_or_None(self, n):
+        return self.filereader.key_frame(n)
+
+    def copy_of_frame(self, n):
+        if self.filereader.has_deltas:
+            return OldFormatMovieFile.copy_of_frame(self, n)
+        # Without delta records, only the key frames were written (see
+        # NewFormatMovieFile_startup), so show the last one at or before n.
+        assert self.frame_index_in_range(n)
+        indices = self.filereader.key_frame_indices
+        n0 = indices[bisect_right(indices, n) - 1]
+        self.temp_mutable_frames.clear() # (they're only useful with deltas)
+        frame = self.cached_immutable_frames.get(n0)
+        if frame is not None:
+            return + frame
+        frame = self.file_keyframe_or_None(n0)
+        assert frame is not None
+        return frame
+
+    def frames(self, start = 0, stop = None, step = 1):
+        if self.filereader.has_deltas:
+            return OldFormatMovieFile.frames(self, start, stop, step)
+        return self._frames_without_deltas(start, stop, step)
+
+    def _frames_without_deltas(self, start, stop, step):
+        if stop is None:
+            stop = self.totalFramesActual + 1
+        stop = min(stop, self.totalFramesActual + 1)
+        for n in xrange(start, stop, step):
+            yield self.copy_of_frame(n)
+        return
+
+    pass # end of class NewFormatMovieFile
+
+
+# ==
+
+def _benchmark_scrubbing(natoms = 1000, nframes = 100000, nseeks = 200):
+    """
+    Write a synthetic old-format movie file with random delta frames,
+    and time random seeks into it (as when scrubbing the movie slider)
+    with and without a key frame index.
+    """
+    import random, tempfile, time
+    from struct import pack
+    from Numeric import zeros, Float
+    filename = tempfile.mktemp(".dpb")
+    file1 = open(filename, "wb")
+    file1.write(pack('i', nframes))
+    random.seed(0)
+    block = "".join([chr(random.randrange(256)) for i in range(natoms * 3 * 7)])
+    for i in range(nframes):
+        start = (i % 7) * natoms * 3
+        file1.write(block[start : start + natoms * 3])
+    file1.close()
+    seeks = [random.randrange(nframes + 1) for i in range(nseeks)]
+    try:
+        for keyframe_interval in (0, None):
+            reader = OldFormatMovieFile_startup(filename)
+            assert not reader.open_and_read_header_errQ()
+            movie = OldFormatMovieFile(reader, keyframe_interval)
+            movie.donate_immutable_cached_frame(0, zeros((natoms, 3), Float))
+            t0 = time.time()
+            movie.build_keyframe_index() # (does nothing if interval is 0)
+            t1 = time.time()
+            deltas0 = movie.deltas_applied
+            for n in seeks:
+                movie.ref_to_transient_frame_n(n)
+            t2 = time.time()
+            print "key frame interval %s: index built in %.2f sec; " \
+                  "%d random seeks in %.2f sec, %.1f delta frames per seek" % \
+                  (movie.keyframe_interval, t1 - t0, nseeks, t2 - t1,
+                   (movie.deltas_applied - deltas0) / float(nseeks))
+            movie.destroy()
+        # sequential playback, one frame at a time vs. in blocks
+        nplay = min(nframes, 5000)
+        for step in (1, 10):
+            reader = OldFormatMovieFile_startup(filename, use_mmap = True)
+            assert not reader.open_and_read_header_errQ()
+            movie = OldFormatMovieFile(reader, 0)
+            movie.donate_immutable_cached_frame(0, zeros((natoms, 3), Float))
+            t0 = time.time()
+            for n in range(0, nplay + 1, step):
+                movie.ref_to_transient_frame_n(n)
+            t1 = time.time()
+            for frame in movie.frames(0, nplay + 1, step):
+                pass
+            t2 = time.time()
+            print "playing %d frames with step %d: %.2f sec one at a time, " \
+                  "%.2f sec using frames()" % (nplay, step, t1 - t0, t2 - t1)
+            movie.destroy()
+    finally:
+        os.remove(filename)
+    return
+
+def _write_new_format_moviefile(filename, initial_ixyz, delta_frames,
+                                key_interval = 32):
+    """
+    Write a new-format movie file the same way the simulator does
+    (see writeNewOutputHeader and its relatives in sim/src/writemovie.c),
+    given initial integer positions (a Numeric array of natoms * 3 Int)
+    and a sequence of delta frames (strings of natoms * 3 signed bytes).
+    """
+    from struct import pack
+    from Numeric import Int, Int32
+    natoms = len(initial_ixyz) / 3
+    file1 = open(filename, "wb")
+    file1.write("#!/usr/local/bin/NanoEngineer1-viewer\n"
+                "#@ NanoEngineer-1 atom trajectory file, format version 050404\n"
+                "NumberOfAtoms = %d\n"
+                "KeyRecordInterval = %d\n" % (natoms, key_interval))
+    file1.write("# pad to 4 byte boundary:.")
+    while (file1.tell() + 1) % 4:
+        file1.write(".")
+    file1.write("\n" + DPB_SYNC_WORD)
+    offset_to_first_record = file1.tell()
+    index = []
+    state = {'frame_number': 0, 'ixyz': initial_ixyz.astype(Int)}
+    def write_record(magic, record_type, data):
+        index.append( (record_type, state['frame_number'], file1.tell()) )
+        file1.write(pack('=iii', DPB_BYTE_ORDER_MAGIC, magic, 4 + len(data)))
+        file1.write(pack('=i', state['frame_number']))
+        file1.write(data)
+    def write_key_record():
+        write_record(DPB_KEY_RECORD_MAGIC, DPB_KEY_RECORD_TYPE,
+                     state['ixyz'].astype(Int32).tostring())
+    write_key_record()
+    before_next_key = key_interval
+    for delta in delta_frames:
+        if key_interval > 1:
+            pad = "\0" * (-(4 + len(delta)) % 4)
+            write_record(DPB_DELTA_RECORD_MAGIC, DPB_DELTA_RECORD_TYPE, delta + pad)
+        state['ixyz'] = state['ixyz'] + fromstring(delta, Int8).astype(Int)
+        if before_next_key < 0:
+            write_key_record()
+            before_next_key = key_interval
+        else:
+            before_next_key -= 1
+        state['frame_number'] += 1
+    if before_next_key != key_interval:
+        write_key_record()
+    index.append( (DPB_INDEX_RECORD_TYPE, state['frame_number'], file1.tell()) )
+    index_offset = file1.tell()
+    file1.write(pack('=iii', DPB_BYTE_ORDER_MAGIC, DPB_INDEX_RECORD_MAGIC, 8 + 16 * len(index)))
+    file1.write(pack('=ii', state['frame_number'], len(index)))
+    for record_type, frame_number, offset in index:
+        file1.write(pack('=iiiI', record_type, frame_number, offset >> 32, offset & 0xffffffff))
+    end = file1.tell() + _END_RECORD_SIZE
+    file1.write(pack('=iii', DPB_BYTE_ORDER_MAGIC, DPB_END_RECORD_MAGIC, 16))
+    for offset in (offset_to_first_record - end, index_offset - end):
+        file1.write(pack('=iI', offset >> 32, offset & 0xffffffff))
+    file1.close()
+    return
+
+def _benchmark_new_format(natoms = 1000, nframes = 100000, nseeks = 200):
+    """
+    Write the same synthetic movie in old and new formats, and time
+    random seeks into each (the old format without its key frame index,
+    as if it was never built, and with it).
+    """
+    import random, tempfile, time
+    from struct import pack
+    from Numeric import zeros, Float, Int
+    random.seed(0)
+    block = "".join([chr(random.randrange(256)) for i in range(natoms * 3 * 7)])
+    deltas = [block[(i % 7) * natoms * 3 : (i % 7 + 1) * natoms * 3]
+              for i in range(7)]
+    old_filename = tempfile.mktemp(".dpb")
+    new_filename = tempfile.mktemp(".dpb")
+    file1 = open(old_filename, "wb")
+    file1.write(pack('i', nframes))
+    for i in range(nframes):
+        file1.write(deltas[i % 7])
+    file1.close()
+    t0 = time.time()
+    _write_new_format_moviefile(new_filename, zeros((natoms * 3,), Int),
+                                [deltas[i % 7] for i in xrange(nframes)])
+    print "wrote new-format file in %.2f sec" % (time.time() - t0)
+    seeks = [random.randrange(nframes + 1) for i in range(nseeks)]
+    try:
+        for label, filename, keyframe_interval in \
+                [("old format, no index", old_filename, 0),
+                 ("old format, index", old_filename, None),
+                 ("new format", new_filename, None)]:
+            t0 = time.time()
+            if filename is new_filename:
+                movie = MovieFile(filename)
+            else:
+                reader = OldFormatMovieFile_startup(filename, use_mmap = True)
+                assert not reader.open_and_read_header_errQ()
+                movie = OldFormatMovieFile(reader, keyframe_interval)
+                movie.donate_immutable_cached_frame(0, zeros((natoms, 3), Float))
+                movie.build_keyframe_index()
+            t1 = time.time()
+            deltas0 = movie.deltas_applied
+            for n in seeks:
+                movie.ref_to_transient_frame_n(n)
+            t2 = time.time()
+            print "%s: opened in %.2f sec; %d random seeks in %.2f sec, " \
+                  "%.1f delta frames per seek" % \
+                  (label, t1 - t0, nseeks, t2 - t1,
+                   (movie.deltas_applied - deltas0) / float(nseeks))
+            movie.destroy()
+    finally:
+        os.remove(old_filename)
+        os.remove(new_filename)
+    return
+
+if __name__ == '__main__':
+    _benchmark_scrubbing()
+    _benchmark_new_format()
+
+# end
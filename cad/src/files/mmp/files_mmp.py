@@ -27,7 +27,7 @@ for constructing them (since not everything uses the registration scheme
 or should have to).
 """
 
-import re, time
+import os, re, time
 
 import foundation.env as env
 from utilities import debug_flags
@@ -44,6 +44,7 @@ from analysis.ESP.ESPImage import ESPImage
 from model.jigs_measurements import MeasureAngle
 from model.jigs_measurements import MeasureDihedral
 from geometry.VQT import V, Q, A
+from Numeric import reshape
 from utilities.Log import redmsg, orangemsg, quote_html
 from model.elements import PeriodicTable
 from model.elements import Pl5
@@ -154,6 +155,22 @@ atom1pat = re.compile("atom (\d+) \((\d+)\) \((-?\d+), (-?\d+), (-?\d+)\)")
 ##atom2pat = re.compile("atom \d+ \(\d+\) \(.*\) (\S\S\S)")
 atom2pat = re.compile("atom \d+ \(\d+\) \(.*\) (\w+)") # \w == [a-zA-Z0-9_]
 
+# for decoding many atom records at once (see _readmmp_state.flush_atom_run);
+# finds the same fields as atom1pat and atom2pat, one match per line,
+# for atom records in the usual format
+atom_run_pat = re.compile("^atom (\d+) \((\d+)\) \((-?\d+), (-?\d+), (-?\d+)\)(?: (\w+))?",
+                          re.MULTILINE)
+
+# record names which can be read as part of a run of atom records
+# (along with "info atom" records); see _readmmp_state.readmmp_line
+_ATOM_RUN_RECORDNAMES = ('atom',
+                         'bond1', 'bond2', 'bond3', 'bonda', 'bondg', 'bondc',
+                         'bond_direction',
+                         'bond_chain', 'directional_bond_chain',
+                         'dna_rung_bonds')
+
+_MAX_ATOM_RUN = 20000 # max number of records in one run
+
 # Old Rotary Motor record format:
 # rmotor (name) (r, g, b) torque speed (cx, cy, cz) (ax, ay, az)
 old_rmotpat = re.compile("rmotor \((.+)\) \((\d+), (\d+), (\d+)\) (-?\d+\.\d+) (-?\d+\.\d+) \((-?\d+), (-?\d+), (-?\d+)\) \((-?\d+), (-?\d+), (-?\d+)\)")
@@ -262,6 +279,22 @@ def decode_atom_coordinate(coord_string): #bruce 080521
     # note: this is inlined in decode_atom_coordinates
     return float(coord_string) / 1000.0 # in Angstroms
 
+def decode_bond_record(card):
+    """
+    Return the list of atom numbers (as ints) in a bond record
+    (of any valence).
+    """
+    return map(int, re.findall("\d+", card[5:])) # note: this assumes all bond mmp-record-names are the same length, 5 chars.
+
+_BOND_RECORD_VALENCES = {
+    'bond1': V_SINGLE,
+    'bond2': V_DOUBLE,
+    'bond3': V_TRIPLE,
+    'bonda': V_AROMATIC,
+    'bondg': V_GRAPHITE,
+    'bondc': V_CARBOMERIC,
+ }
+
 def decode_atom_coordinates(xs, ys, zs): #bruce 080521
     """
     Decode three atom coordinate strings as used in the atom record
@@ -314,6 +347,13 @@ class _readmmp_state:
         self._info_objects = {} #bruce 071017 for info records
             # (replacing attributes of self named by the specific kinds)
         self._registered_parser_objects = {} #bruce 071017
+        self._linemethods = {} # cache for _find_linemethod, by recordname
+        self._atom_run = None
+            # list of (recordname, card) not yet read, if we're reading
+            # runs of atom records in batches (see start_atom_runs), or None
+        self.cache_items = None
+            # list of decoded records for files_mmp_cache, if we're
+            # recording them (see start_recording), or None
         self.listOfAtomsInFileOrder = []
         return
 
@@ -326,6 +366,9 @@ class _readmmp_state:
         self.sim_input_badnesses_so_far = None
         self._info_objects = None
         self._registered_parser_objects = None
+        self._linemethods = None
+        self._atom_run = None
+        self.cache_items = None
         self.listOfAtomsInFileOrder = None
         return
 
@@ -335,6 +378,7 @@ class _readmmp_state:
         (removing them from our artificial Group if any);
         but don't verify they are Groups or alter them, that's up to the caller.
         """
+        assert not self._atom_run, "flush_atom_run was not called"
         for marker in self.markers.values():
             marker.kill() #bruce 050422; semi-guess
         self.markers = None
@@ -364,6 +408,10 @@ class _readmmp_state:
         """
         returns None, or error msg(#k), or raises exception
         on bugs or maybe some syntax errors
+
+        @note: after start_atom_runs, a line might be saved and read
+               by a later call of this method or flush_atom_run,
+               which then reports its errors.
         """
         key_m = keypat.match(card)
         if not key_m:
@@ -372,15 +420,267 @@ class _readmmp_state:
         recordname = key_m.group(0)
         # recordname should now be the mmp record type, e.g. "group" or "mol"
 
-        linemethod, errmsg = self._find_linemethod(recordname)
+        atom_run = self._atom_run
+        if atom_run is not None:
+            if recordname == 'atom':
+                if len(atom_run) >= _MAX_ATOM_RUN:
+                    errmsg = self.flush_atom_run()
+                    if errmsg:
+                        return errmsg
+                    atom_run = self._atom_run
+                atom_run.append( (recordname, card) )
+                return None
+            elif atom_run and (recordname in _ATOM_RUN_RECORDNAMES or
+                               card.startswith("info atom ")):
+                atom_run.append( (recordname, card) )
+                return None
+            elif atom_run:
+                errmsg = self.flush_atom_run()
+                if errmsg:
+                    return errmsg
+            pass
+
+        if self.cache_items is not None:
+            self.cache_items.append( ('line', recordname, card) )
+        return self._read_record(recordname, card)
 
-        if errmsg or not linemethod:
-            return errmsg
+    def _read_record(self, recordname, card):
+        """
+        [private]
+
+        Read one mmp line whose record type is recordname,
+        returning None or an error message.
+        """
+        try:
+            linemethod = self._linemethods[recordname]
+        except KeyError:
+            linemethod, errmsg = self._find_linemethod(recordname)
+            if errmsg:
+                return errmsg
+            self._linemethods[recordname] = linemethod
+                # note: this caches None for unrecognized record types too
+
+        if not linemethod:
+            return None
 
         # if linemethod itself has an exception, best to let the caller handle it
         # (only it knows whether the line passed to us was made up or really in the file)
         return linemethod(card)
 
+    def start_atom_runs(self):
+        """
+        From now on, let readmmp_line save up runs of atom records,
+        together with the bond records and "info atom" records among them,
+        and read each run as a batch when it ends (or gets large).
+        The caller must call flush_atom_run after the last line.
+
+        This creates the same atoms and bonds as reading the records one
+        at a time, but decodes all atom records in a run with one regexp
+        search, and adds their atoms to their chunk all at once.
+        """
+        if self._atom_run is None:
+            self._atom_run = []
+        return
+
+    def start_recording(self):
+        """
+        From now on, record the decoded contents of the records we read
+        in self.cache_items, for files_mmp_cache; see read_cached_item
+        for their format. If we later read anything we can't decode that
+        way, self.cache_items becomes None.
+
+        @note: must be called after start_atom_runs.
+        """
+        assert self._atom_run is not None
+        self.cache_items = []
+        return
+
+    def flush_atom_run(self):
+        """
+        Read all records saved by readmmp_line, if any.
+        Return None, or an error message for the first record
+        we couldn't read (in which case the rest are skipped).
+        """
+        run = self._atom_run
+        if not run:
+            return None
+        self._atom_run = []
+
+        fields = self._decode_atom_run(run)
+            # None if we have to read the atom records one at a time
+        if fields is None:
+            atoms = None
+            self.cache_items = None # can't record this run
+        else:
+            atoms = self._make_atoms( *fields)
+            if atoms is None:
+                self.cache_items = None
+            elif self.cache_items is not None:
+                self._record_atom_run(run, fields)
+
+        atomcount = 0
+        for recordname, card in run:
+            try:
+                if recordname != 'atom':
+                    errmsg = self._read_record(recordname, card)
+                elif atoms is None:
+                    errmsg = self._read_atom(card)
+                else:
+                    n, a = atoms[atomcount]
+                    atomcount += 1
+                    # the rest of what _read_atom does
+                    self.listOfAtomsInFileOrder.append(a)
+                    self.ndix[n] = a
+                    self.prevatom = a
+                    self.prevcard = card
+                    errmsg = None
+            except:
+                # note: similar to error handling in _readmmp
+                errmsg = "bug while reading this mmp line: %s" % (card,)
+                print_compact_traceback("bug while reading this mmp line:\n  %s\n" % (card,) )
+            if errmsg:
+                return errmsg
+            continue
+        return None
+
+    def _decode_atom_run(self, run):
+        """
+        [private helper for flush_atom_run]
+
+        Decode all the atom records in run (a list of (recordname, card)
+        pairs) with one regexp search.
+
+        @return: (atom numbers, element numbers, coordinates, display names)
+                 for the atom records in order, where the coordinates are an
+                 (N,3) Numeric array in Angstroms and the display names are
+                 '' if not given; or None if any atom record has an unusual
+                 format, so it needs to be read by _read_atom.
+        """
+        cards = [card for recordname, card in run if recordname == 'atom']
+        fields = atom_run_pat.findall( "".join(cards) )
+        if len(fields) != len(cards):
+            return None
+        coords = []
+        for f in fields:
+            coords.extend(f[2:5])
+        coords = reshape( A(map(float, coords)) / 1000.0, (len(fields), 3))
+        return ( [int(f[0]) for f in fields],
+                 [int(f[1]) for f in fields],
+                 coords,
+                 [f[5] for f in fields] )
+
+    def _make_atoms(self, atnums, eltnums, coords, dispnames):
+        """
+        [private helper for flush_atom_run and read_cached_item]
+
+        Create atoms from decoded atom records (see _decode_atom_run for
+        the arguments), adding them all to the current chunk at once
+        (and creating that chunk if necessary, as _read_atom does).
+
+        @return: a list of (atom number, atom) in the same order as the atom
+                 records, or None (after creating nothing) if any element is
+                 unsupported, so the atom records need to be read by
+                 _read_atom.
+        """
+        symbols = {} # maps element number to symbol
+        getElement = PeriodicTable.getElement
+        try:
+            for eltnum in dict.fromkeys(eltnums):
+                symbols[eltnum] = getElement(eltnum).symbol
+        except:
+            # unsupported element; _read_atom will report it
+            return None
+
+        if self.prevchunk is None:
+            # same as in _read_atom
+            self.guess_sim_input('missing_group_or_chunk')
+            self.prevchunk = Chunk(self.assy,  "sim chunk")
+            self.addmember(self.prevchunk)
+        chunk = self.prevchunk
+
+        atoms = []
+        for eltnum, xyz in zip(eltnums, coords):
+            a = Atom(symbols[eltnum], xyz)
+            a.unset_atomtype() # see comment in _read_atom
+            atoms.append(a)
+        chunk.addatoms(atoms)
+        for dispname, a in zip(dispnames, atoms):
+            if dispname:
+                a.setDisplayStyle(interpret_dispName(dispname))
+        return zip(atnums, atoms)
+
+    def _record_atom_run(self, run, fields):
+        """
+        [private helper for flush_atom_run]
+
+        Append the decoded form of run to self.cache_items.
+        """
+        events = []
+        natoms = 0 # atoms not yet recorded in events
+        for recordname, card in run:
+            if recordname == 'atom':
+                natoms += 1
+                lastcard = card
+                continue
+            if natoms:
+                events.append( ('atoms', natoms, lastcard) )
+                natoms = 0
+            valence = _BOND_RECORD_VALENCES.get(recordname)
+            if valence is not None:
+                events.append( ('bond', valence, decode_bond_record(card), card) )
+            else:
+                events.append( ('line', recordname, card) )
+            continue
+        if natoms:
+            events.append( ('atoms', natoms, lastcard) )
+        self.cache_items.append( ('atoms', fields, events) )
+        return
+
+    def read_cached_item(self, item):
+        """
+        Read one item recorded by start_recording and saved in an
+        mmp cache file. This has the same effect as reading the records
+        it was decoded from.
+
+        The items are ('line', recordname, card) for one record which
+        is read as text, or ('atoms', fields, events) for one run of atom
+        records, where fields are as returned by _decode_atom_run, and
+        events are, in file order, ('atoms', n, card) for n atom records
+        (card being the last of them, for error messages about bonds),
+        ('bond', valence, atnums, card) for a bond record, or a 'line'
+        item for anything else.
+
+        @return: None, or an error message
+        """
+        if item[0] == 'line':
+            return self._read_record(item[1], item[2])
+        assert item[0] == 'atoms'
+        fields, events = item[1:]
+        atoms = self._make_atoms( *fields)
+        assert atoms is not None, "unsupported element in mmp cache"
+        atomcount = 0
+        for event in events:
+            kind = event[0]
+            if kind == 'atoms':
+                new_atoms = atoms[atomcount : atomcount + event[1]]
+                atomcount += event[1]
+                for n, a in new_atoms:
+                    self.listOfAtomsInFileOrder.append(a)
+                    self.ndix[n] = a
+                self.prevatom = a
+                self.prevcard = event[2]
+                errmsg = None
+            elif kind == 'bond':
+                valence, atnums, card = event[1:]
+                self.bond_prevatom_to(atnums, valence, card)
+                errmsg = None
+            else:
+                errmsg = self._read_record(event[1], event[2])
+            if errmsg:
+                return errmsg
+            continue
+        return None
+
     def _find_linemethod(self, recordname):
         """
         [private]
@@ -647,9 +947,17 @@ class _readmmp_state:
         return self.read_bond_record(card, V_CARBOMERIC)
 
     def read_bond_record(self, card, valence):
-        list1 = map(int, re.findall("\d+", card[5:])) # note: this assumes all bond mmp-record-names are the same length, 5 chars.
+        list1 = decode_bond_record(card)
+        self.bond_prevatom_to(list1, valence, card)
+
+    def bond_prevatom_to(self, atnums, valence, card):
+        """
+        Bond the last atom read to the atoms with the given atom numbers,
+        as specified by a bond record (card, used only in error messages)
+        of the given valence.
+        """
         try:
-            for a in map((lambda n: self.ndix[n]), list1):
+            for a in map((lambda n: self.ndix[n]), atnums):
                 bond_atoms( self.prevatom, a, valence, no_corrections = True) # bruce 050502 revised this
         except KeyError:
             print "error in MMP file: atom ", self.prevcard
@@ -1511,7 +1819,50 @@ _readmmp_aborted = False
 
 _reference_to_readmmp_abort_function = None #bruce 080606 precaution
 
-def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
+_READMMP_BLOCKSIZE = 1 << 20 # bytes per block, for streaming reads
+_READMMP_LINES_PER_BLOCK = 1000 # lines per block, for non-streaming reads
+
+def _blocks_of_lines(lines, blocklength = _READMMP_LINES_PER_BLOCK):
+    """
+    [private helper for _readmmp]
+
+    Generate the pairs (block, len(block)) for successive blocks (sublists)
+    of lines of length blocklength (except perhaps the last one).
+    """
+    for start in xrange(0, len(lines), blocklength):
+        block = lines[start : start + blocklength]
+        yield block, len(block)
+    return
+
+def _blocks_of_lines_from_file(file1, blocksize = _READMMP_BLOCKSIZE):
+    """
+    [private helper for _readmmp]
+
+    Read the open text file file1 in blocks of about blocksize bytes,
+    and generate the pairs (list of complete lines, kilobytes read)
+    for each block, until the end of the file (when file1 is closed).
+    The lines include their newlines, as for file.readlines().
+    """
+    partial = "" # incomplete last line of previous block
+    try:
+        while 1:
+            block = file1.read(blocksize)
+            if not block:
+                break
+            lines = (partial + block).splitlines(True)
+            partial = lines.pop()
+            if partial.endswith('\n'):
+                lines.append(partial)
+                partial = ""
+            yield lines, len(block) / 1024
+        if partial:
+            yield [partial], 0
+    finally:
+        file1.close()
+    return
+
+def _readmmp(assy, filename, isInsert = False, showProgressDialog = False,
+             streaming = None, use_cache = None):
     """
     Read an mmp file, print errors and warnings to history,
     modify assy in various ways (a bad design, see comment in insertmmp)
@@ -1543,6 +1894,20 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
                                a file. Default is False.
     @type  showProgressDialog: boolean
 
+    @param streaming: if True, read the file in large blocks rather than all
+                      at once, and create runs of atoms in batches (see
+                      _readmmp_state.start_atom_runs). If False, read it the
+                      old way. If None (the default), use a debug_pref.
+                      The resulting model is the same either way.
+    @type  streaming: boolean or None
+
+    @param use_cache: if True, and streaming, use a binary cache of this
+                      file's decoded contents (see files_mmp_cache.py) if one
+                      is available and up to date, instead of parsing its
+                      text; otherwise parse the text and save a new cache.
+                      If None (the default), use a debug_pref.
+    @type  use_cache: boolean or None
+
     @return: the tuple (ok, grouplist or None, listOfAtomsInFileOrder), where
              ok is one of the string constants named (in utilities.constants)
              SUCCESS, ABORTED, or READ_ERROR. (If ok is not SUCCESS, grouplist
@@ -1554,7 +1919,17 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
     #ericm 080409 revised return value to contain listOfAtomsInFileOrder
     #bruce 080502 documented return value; fixed it when file is empty
 
+    if streaming is None:
+        from utilities.GlobalPreferences import debug_pref_read_mmp_streaming
+        streaming = debug_pref_read_mmp_streaming()
+
+    if use_cache is None:
+        from utilities.GlobalPreferences import debug_pref_use_mmp_cache
+        use_cache = debug_pref_use_mmp_cache()
+
     state = _readmmp_state( assy, isInsert)
+    read_item = state.readmmp_line # reads one line or cached item
+    cache = None # or the MmpCache for this file, if we'll save a new one
 
     # The following code is experimental. It reads an mmp file that is contained
     # within a ZIP file. To test, create a zipfile (i.e. "part.zip") which
@@ -1564,6 +1939,8 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
     # Mark 2008-02-03
     READ_MAINMMP_FROM_ZIPFILE = False # Don't commit with True.
 
+    # blocks is an iterable of (list of lines, progress increment) pairs,
+    # and _progressFinishValue will be the sum of the progress increments.
     if READ_MAINMMP_FROM_ZIPFILE:
         # Experimental. Read "main.mmp", a standard mmp file contained within
         # a zipfile opened via "File > Open...".
@@ -1571,6 +1948,37 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
         _zipfile = ZipFile(filename, 'r')
         _bytes = _zipfile.read("main.mmp")
         lines = _bytes.splitlines()
+        blocks = _blocks_of_lines(lines)
+        _progressFinishValue = len(lines)
+    elif streaming:
+        items = None
+        if use_cache:
+            from files.mmp.files_mmp_cache import MmpCache
+            try:
+                cache = MmpCache(filename, _mmp_format_version_we_can_read())
+                items = cache.load()
+            except:
+                # e.g. file can't be read; let the code below report it
+                cache = None
+        if items is not None:
+            # Rebuild the model from the cache, without parsing text.
+            read_item = state.read_cached_item
+            blocks = _blocks_of_lines(items)
+            _progressFinishValue = len(items)
+            cache = None # no need to save it again
+        else:
+            # Read the file in large blocks, so we never hold all its text
+            # in memory at once. Progress is measured in kilobytes.
+            try:
+                file1 = open(filename, "rU")
+                _progressFinishValue = os.path.getsize(filename) / 1024
+            except:
+                return READ_ERROR, None, []
+            blocks = _blocks_of_lines_from_file(file1)
+            state.start_atom_runs()
+            if cache is not None:
+                state.start_recording()
+        del items
     else:
         # The normal way to read an MMP file.
         try:
@@ -1578,6 +1986,8 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
             # 'U' in filemode is for universal newline support
         except:
             return READ_ERROR, None, []
+        blocks = _blocks_of_lines(lines)
+        _progressFinishValue = len(lines)
 
     # Commented this out since the assy.filename should be (and is) set by
     # another caller based on success.
@@ -1600,7 +2010,6 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
             # [bruce 080319]
         assert not kluge_main_assy.assy_valid #bruce 080117
         _progressValue = 0
-        _progressFinishValue = len(lines)
         win = env.mainwindow()
         win.progressDialog.setLabelText("Reading file...")
         win.progressDialog.setRange(0, _progressFinishValue)
@@ -1637,25 +2046,32 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
 
         pass
 
-    for card in lines:
-        if _readmmp_aborted: # User aborted while reading the MMP file.
-            _readmmp_aborted = False # (precaution, not really needed, since not
-                # sufficient to replace the reset earlier in this function)
-            return ABORTED, None, []
-        try:
-            errmsg = state.readmmp_line( card) # None or an error message
-        except:
-            # note: the following two error messages are similar but not identical
-            errmsg = "bug while reading this mmp line: %s" % (card,) #e include line number; note, two lines might be identical
-            print_compact_traceback("bug while reading this mmp line:\n  %s\n" % (card,) )
-        #e assert errmsg is None or a string
+    errmsg = None
+
+    for lines, _progressIncrement in blocks:
+        for card in lines:
+            if _readmmp_aborted: # User aborted while reading the MMP file.
+                _readmmp_aborted = False # (precaution, not really needed, since not
+                    # sufficient to replace the reset earlier in this function)
+                return ABORTED, None, []
+            try:
+                errmsg = read_item( card) # None or an error message
+            except:
+                # note: the following two error messages are similar but not identical
+                errmsg = "bug while reading this mmp line: %s" % (card,) #e include line number; note, two lines might be identical
+                print_compact_traceback("bug while reading this mmp line:\n  %s\n" % (card,) )
+            #e assert errmsg is None or a string
+            if errmsg:
+                ###e general history msg for stopping early on error
+                ###e special return value then??
+                break
+            continue
+
         if errmsg:
-            ###e general history msg for stopping early on error
-            ###e special return value then??
             break
 
         if showProgressDialog: # Update the progress dialog.
-            _progressValue += 1
+            _progressValue += _progressIncrement
             if _progressValue >= _progressFinishValue:
                 win.progressDialog.setLabelText("Building model...")
             elif _progressDialogDisplayed:
@@ -1674,6 +2090,17 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
                     # Display progress dialog after 0.25 seconds
                     win.progressDialog.setValue(_progressValue)
                     _progressDialogDisplayed = True
+        continue
+
+    if streaming:
+        # read the last run of atom records, if any
+        # (if we stopped early due to errmsg there is none, since each
+        #  error came from a call which first read or discarded them all)
+        if not errmsg:
+            errmsg = state.flush_atom_run()
+        del blocks # closes file1, if we opened it
+        if cache is not None and not errmsg and state.cache_items is not None:
+            cache.save(state.cache_items)
 
     grouplist = state.extract_toplevel_items() # for a normal mmp file this has 3 Groups, whose roles are viewdata, tree, shelf
 
@@ -0,0 +1,249 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+files_mmp_cache.py -- binary sidecar cache of decoded mmp files,
+so a file which has been read before can be rebuilt without parsing
+its text.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+The streaming mmp reader (see _readmmp_state.start_recording in
+files_mmp.py) can record what it decodes from each record: atom runs
+as atom numbers, element numbers, a coordinate array and display names,
+with the bond records among them as lists of atom numbers; everything
+else (groups, chunks, jigs, info records, etc) as (recordname, card)
+pairs, which are read again from their text on a cache hit.
+
+Cache files live in ~/Nanorex/MmpCache, named by the SHA-1 of the mmp
+file's contents, and also record the mmp format version the reader
+understood and the version of this cache format, so editing the file,
+or changing the reader, makes the old cache entry unusable. A cache file
+which doesn't match, or can't be read for any reason, is ignored, and
+the caller reads the text as usual.
+
+Running this module as a script times reading an mmp file without
+and with the cache:
+
+  ./ExecSubDir.py files/mmp/files_mmp_cache.py file.mmp
+"""
+
+import os
+import sys
+import time
+import cPickle
+import zlib
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from Numeric import fromstring, reshape, Float
+
+from utilities import debug_flags
+from utilities.debug import print_compact_traceback
+
+# Change this whenever the format of cache files or of the items
+# recorded by _readmmp_state changes.
+MMPCACHE_FORMAT_VERSION = 2
+
+_MAGIC = "NE1 mmp cache\n"
+
+_MAX_CACHE_FILES = 20 # older cache files are removed when saving a new one
+
+_HASH_BLOCKSIZE = 1 << 20
+
+def _cache_directory():
+    from platform_dependent.PlatformDependent import find_or_make_Nanorex_subdir
+    return find_or_make_Nanorex_subdir("MmpCache")
+
+def _file_digest(filename):
+    """
+    Return the SHA-1 hex digest of the contents of the given file.
+    """
+    digest = sha1()
+    file1 = open(filename, "rb")
+    try:
+        while 1:
+            block = file1.read(_HASH_BLOCKSIZE)
+            if not block:
+                break
+            digest.update(block)
+    finally:
+        file1.close()
+    return digest.hexdigest()
+
+# ==
+
+def _encode_item(item):
+    """
+    Return a picklable form of an item recorded by _readmmp_state,
+    which stores coordinate arrays as strings of their raw data.
+    """
+    if item[0] == 'atoms':
+        atnums, eltnums, coords, dispnames = item[1]
+        fields = (atnums, eltnums, coords.astype(Float).tostring(), dispnames)
+        return ('atoms', fields, item[2])
+    return item
+
+def _decode_item(item):
+    """
+    Inverse of _encode_item.
+    """
+    if item[0] == 'atoms':
+        atnums, eltnums, coords, dispnames = item[1]
+        coords = reshape( fromstring(coords, Float), (len(atnums), 3))
+        return ('atoms', (atnums, eltnums, coords, dispnames), item[2])
+    return item
+
+# ==
+
+class MmpCache(object):
+    """
+    The cache entry (which may or may not exist yet) for one mmp file,
+    as read by the mmp reader whose format version is reader_version.
+    """
+    def __init__(self, filename, reader_version):
+        """
+        @param filename: the mmp file
+
+        @param reader_version: the mmpformat version string describing what
+                               the mmp reader can read (see
+                               _mmp_format_version_we_can_read in
+                               files_mmp.py)
+
+        @note: this reads the entire file, to compute its hash.
+        """
+        self.filename = filename
+        self.key = (MMPCACHE_FORMAT_VERSION,
+                    reader_version,
+                    _file_digest(filename))
+        self.cachefile = None # set by _cachefile
+        return
+
+    def _cachefile(self):
+        """
+        Return the name of our cache file, or None if the cache
+        directory can't be made.
+        """
+        if self.cachefile is None:
+            directory = _cache_directory()
+            if directory:
+                self.cachefile = os.path.join(directory,
+                                              self.key[2] + ".mmpcache")
+        return self.cachefile
+
+    def load(self):
+        """
+        Return the list of items saved in our cache file, or None if there
+        is no usable cache file (because it doesn't exist, was made from
+        different file contents or by a different reader or cache format,
+        or is damaged).
+        """
+        cachefile = self._cachefile()
+        if not cachefile or not os.path.exists(cachefile):
+            return None
+        try:
+            file1 = open(cachefile, "rb")
+            try:
+                if file1.read(len(_MAGIC)) != _MAGIC:
+                    return None
+                key, checksum, data = cPickle.load(file1)
+            finally:
+                file1.close()
+            if key != self.key or zlib.crc32(data) != checksum:
+                return None
+            items = map(_decode_item, cPickle.loads(data))
+        except:
+            if debug_flags.atom_debug:
+                print_compact_traceback("ignoring damaged mmp cache %r: " %
+                                        (cachefile,))
+            return None
+        return items
+
+    def save(self, items):
+        """
+        Save items in our cache file (replacing any old one), and remove
+        the oldest cache files if there are too many. Errors are printed
+        but otherwise ignored, since the cache is optional.
+        """
+        cachefile = self._cachefile()
+        if not cachefile:
+            return
+        tempfile = cachefile + ".tmp"
+        try:
+            data = cPickle.dumps(map(_encode_item, items),
+                                 cPickle.HIGHEST_PROTOCOL)
+            file1 = open(tempfile, "wb")
+            try:
+                file1.write(_MAGIC)
+                cPickle.dump((self.key, zlib.crc32(data), data), file1,
+                             cPickle.HIGHEST_PROTOCOL)
+            finally:
+                file1.close()
+            if os.path.exists(cachefile):
+                os.remove(cachefile) # needed on Windows before rename
+            os.rename(tempfile, cachefile)
+        except:
+            print_compact_traceback("error saving mmp cache %r (ignored): " %
+                                    (cachefile,))
+            return
+        _prune_cache_directory(os.path.dirname(cachefile))
+        return
+
+    pass # end of class MmpCache
+
+def _prune_cache_directory(directory, maxfiles = _MAX_CACHE_FILES):
+    """
+    Remove all but the maxfiles most recently written cache files
+    in directory.
+    """
+    try:
+        names = [name for name in os.listdir(directory)
+                 if name.endswith(".mmpcache")]
+        if len(names) <= maxfiles:
+            return
+        paths = [os.path.join(directory, name) for name in names]
+        dated = [(os.path.getmtime(path), path) for path in paths]
+        dated.sort()
+        for mtime, path in dated[:-maxfiles]:
+            os.remove(path)
+    except:
+        print_compact_traceback("error pruning mmp cache directory (ignored): ")
+    return
+
+# ==
+
+def _time_readmmp(filename):
+    """
+    Read filename with the text reader (saving a cache file), then with the
+    cache, and print how long each took.
+    """
+    from model.assembly import Assembly
+    from files.mmp.files_mmp import _readmmp, _mmp_format_version_we_can_read
+
+    cache = MmpCache(filename, _mmp_format_version_we_can_read())
+    cachefile = cache._cachefile()
+    if cachefile and os.path.exists(cachefile):
+        os.remove(cachefile) # make the first read a cold one
+    for label in ("cold (text, saving cache)", "warm (from cache)"):
+        assy = Assembly(None)
+        assy.assy_valid = False # disable updaters, as readmmp does
+        t0 = time.time()
+        ok, grouplist, atoms = _readmmp(assy, filename, True,
+                                        streaming = True, use_cache = True)
+        duration = time.time() - t0
+        print "%s: %s, %d atoms, %.3f sec" % (label, ok, len(atoms), duration)
+        continue
+    if cachefile and os.path.exists(cachefile):
+        print "cache file %r: %d KB" % \
+              (cachefile, os.path.getsize(cachefile) / 1024)
+    return
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print "usage: %s file.mmp" % sys.argv[0]
+        sys.exit(1)
+    _time_readmmp(sys.argv[1])
+
+# end
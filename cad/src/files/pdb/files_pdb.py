@@ -26,7 +26,6 @@ from string import capitalize
 from model.elements import PeriodicTable, Singlet
 from platform_dependent.PlatformDependent import fix_plurals
 from utilities.Log import redmsg, orangemsg
-from geometry.VQT import A
 from utilities.version import Version
 from utilities.debug_prefs import debug_pref, Choice_boolean_False
 from datetime import datetime
@@ -40,6 +39,199 @@ from utilities.constants import gensym
 from protein.model.Protein import Protein
 from protein.model.Residue import Residue
 
+from files.pdb.pdb_cards import read_pdb_cards
+
+_ATOMNAME_EXCEPTIONS = {
+    "HB":"H", #k these are all guesses -- I can't find this documented
+              # anywhere [bruce 070410]
+    ## "HE":"H", ### REVIEW: I'm not sure about this one --
+                ###          leaving it out means it's read as Helium,
+    # but including it erroneously might prevent reading an actual Helium
+    # if that was intended.
+    # Guess for now: include it for ATOM but not HETATM. (So it's
+    # specialcased below, rather than being included in this table.)
+    # (Later: can't we use the case of the 'E' to distinguish it from He?)
+    "HN":"H",
+ }
+
+# used by _readpdb_new
+_ATOMNAME_EXCEPTIONS_NEW = dict(_ATOMNAME_EXCEPTIONS)
+_ATOMNAME_EXCEPTIONS_NEW.update({
+    "CA":"C",
+    "NE":"N",
+    "HG":"H",
+ })
+
+def _nodigits(name):
+    for bad in "0123456789":
+        name = name.replace(bad, "")
+    return name
+
+def _atomnames_to_try(name_field):
+    """
+    Return a list of atom names to try to recognize as element symbols,
+    in order, given the atom name field of an ATOM or HETATM card.
+    """
+    # bruce 080508 revision (guess at a bugfix for reading NE1-saved
+    # pdb files):
+    # get a list of atomnames to try; use the first one we recognize.
+    # Note that full atom name is in columns 13-16 i.e. card[12:16];
+    # see http://www.wwpdb.org/documentation/format2.3-0108-us.pdf,
+    # page 156. The old code only looked at two characters,
+    # card[12:14] == columns 13-14, and discarded ' ' and '_',
+    # and capitalized (the first character only). The code as I revised
+    # it on 070410 also discarded digits, and handled HB, HE, HN
+    # (guesses) using the atomname_exceptions dict.
+    name4 = name_field[0:4].replace(" ", "").replace("_", "")
+    name3 = name_field[0:3].replace(" ", "").replace("_", "")
+    name2 = name_field[0:2].replace(" ", "").replace("_", "")
+    return [
+        name4, # as seems best according to documentation
+        name3,
+        name2, # like old code
+        _nodigits(name4),
+        _nodigits(name3),
+        _nodigits(name2) # like code as revised on 070410
+    ]
+
+def _is_element_symbol(sym):
+    try:
+        PeriodicTable.getElement(sym)
+    except:
+        # note: this typically fails with AssertionError
+        # (not e.g. KeyError) [bruce 050322]
+        return False
+    return True
+
+def _guess_element(key, name_field, symbol_field):
+    """
+    Guess the element of an ATOM or HETATM card (with record_key key)
+    from its atom name, for _readpdb. Return (sym, known) as described in
+    read_pdb_cards, with "C" as the placeholder for unknown elements.
+    """
+    for atomname in _atomnames_to_try(name_field):
+        atomname = _ATOMNAME_EXCEPTIONS.get(atomname, atomname)
+        if atomname == "HE" and key == "atom":
+            atomname = "H" # see comment in _ATOMNAME_EXCEPTIONS
+        sym = capitalize(atomname) # turns either 'he' or 'HE' into 'He'
+        if _is_element_symbol(sym):
+            return sym, True
+    return "C", False
+
+def _guess_element_new(key, name_field, symbol_field):
+    """
+    Like _guess_element, but for _readpdb_new: first try the element
+    symbol field, then the atom name.
+    """
+    # piotr 080819: first look at the 77-78 field - it should include
+    # the element symbol.
+    if _is_element_symbol(symbol_field):
+        return symbol_field, True
+    # if not found, look at possible atom names
+    for atomname in _atomnames_to_try(name_field):
+        atomname = _ATOMNAME_EXCEPTIONS_NEW.get(atomname, atomname)
+        if atomname[:1] == 'H' and key == "atom":
+            atomname = "H" # see comment in _ATOMNAME_EXCEPTIONS
+        sym = capitalize(atomname) # turns either 'he' or 'HE' into 'He'
+        if _is_element_symbol(sym):
+            return sym, True
+    return "C", False
+
+def _warn_unknown_element(name, card):
+    msg = "Warning: Pdb file: will use Carbon in place of unknown element %s in: %s" \
+        % (name, card)
+    print msg #bruce 070410 added this print
+    env.history.message( redmsg( msg ))
+
+    ##e It would probably be better to create a fake atom, so the
+    # CONECT records would still work.
+    #bruce 080508 let's do that: [the element guessers return "C"]
+
+    # Better still might be to create a fake element,
+    # so we could write out the pdb file again
+    # (albeit missing lots of info). [bruce 070410 comment]
+
+    # Note: an advisor tells us:
+    #   PDB files sometimes encode atomtypes,
+    #   using C_R instead of C, for example, to represent sp2
+    #   carbons.
+    # That particular case won't trigger this exception, since we
+    # only look at 2 characters [eventually, after trying more, as of 080508],
+    # i.e. C_ in that case. It would be better to realize this means
+    # sp2 and set the atomtype here (and perhaps then use it when
+    # inferring bonds,  which we do later if the file doesn't have
+    # any bonds). [bruce 060614/070410 comment]
+    return
+
+def _read_conect(card, ndix):
+    """
+    Bond the atoms listed in a CONECT card, looking them up by serial
+    number in ndix. Return the number of bonds made.
+    """
+    numconects = 0
+    try:
+        a1 = ndix[int(card[6:11])]
+    except:
+        #bruce 050322 added this level of try/except and its message;
+        # see code below for at least two kinds of errors this might
+        # catch, but we don't try to distinguish these here. BTW this
+        # also happens as a consequence of not finding the element
+        # symbol, above,  since atoms with unknown elements are not
+        # created.
+        env.history.message( redmsg( "Warning: Pdb file: can't find first atom in CONECT record: %s" % (card,) ))
+    else:
+        for i in range(11, 70, 5):
+            try:
+                a2 = ndix[int(card[i:i+5])]
+            except ValueError:
+                # bruce 050323 comment:
+                # we assume this is from int('') or int(' ') etc;
+                # this is the usual way of ending this loop.
+                break
+            except KeyError:
+                #bruce 050322-23 added history warning for this,
+                # assuming it comes from ndix[] lookup.
+                env.history.message( redmsg( "Warning: Pdb file: can't find atom %s in: %s" % (card[i:i+5], card) ))
+                continue
+            bond_atoms(a1, a2)
+            numconects += 1
+    return numconects
+
+class _ProgressDialogUpdater:
+    """
+    A progress_callback for read_pdb_cards which shows the progress of
+    reading a file in the main window's progress dialog, once reading it
+    has taken more than 0.25 seconds.
+    """
+    # One issue with this implem is that QProgressDialog always displays
+    # a "Cancel" button, which is not hooked up. I think this is OK for now,
+    # but later we should either hook it up or create our own progress
+    # dialog that doesn't include a "Cancel" button. --mark 2007-12-06
+    def __init__(self, filename):
+        self.win = env.mainwindow()
+        self.finish_value = os.path.getsize(filename)
+        self.win.progressDialog.setLabelText("Reading file...")
+        self.win.progressDialog.setRange(0, self.finish_value)
+        self.displayed = False
+        self.timer_start = time.time()
+
+    def __call__(self, position, size):
+        if position >= self.finish_value:
+            self.win.progressDialog.setLabelText("Building model...")
+        elif self.displayed:
+            self.win.progressDialog.setValue(position)
+        elif time.time() - self.timer_start > 0.25:
+            # Display progress dialog after 0.25 seconds
+            self.win.progressDialog.setValue(position)
+            self.displayed = True
+        return
+
+    def done(self):
+        # Make the progress dialog go away.
+        self.win.progressDialog.setValue(self.finish_value)
+
+    pass
+
 def _readpdb(assy,
              filename,
              isInsert = False,
@@ -74,10 +266,6 @@ def _readpdb(assy,
     @see: U{B{PDB File Format}<http://www.wwpdb.org/documentation/format23/v2.3.html>}
     """
 
-    fi = open(filename,"rU")
-    lines = fi.readlines()
-    fi.close()
-
     dir, nodename = os.path.split(filename)
     if not isInsert:
         assy.filename = filename
@@ -85,151 +273,27 @@ def _readpdb(assy,
     mol = Chunk(assy, nodename)
     numconects = 0
 
-    atomname_exceptions = {
-        "HB":"H", #k these are all guesses -- I can't find this documented
-                  # anywhere [bruce 070410]
-        ## "HE":"H", ### REVIEW: I'm not sure about this one --
-                    ###          leaving it out means it's read as Helium,
-        # but including it erroneously might prevent reading an actual Helium
-        # if that was intended.
-        # Guess for now: include it for ATOM but not HETATM. (So it's
-        # specialcased below, rather than being included in this table.)
-        # (Later: can't we use the case of the 'E' to distinguish it from He?)
-        "HN":"H",
-     }
-
-    # Create and display a Progress dialog while reading the MMP file.
-    # One issue with this implem is that QProgressDialog always displays
-    # a "Cancel" button, which is not hooked up. I think this is OK for now,
-    # but later we should either hook it up or create our own progress
-    # dialog that doesn't include a "Cancel" button. --mark 2007-12-06
+    # Create and display a Progress dialog while reading the PDB file.
+    progress = None
     if showProgressDialog:
-        _progressValue = 0
-        _progressFinishValue = len(lines)
-        win = env.mainwindow()
-        win.progressDialog.setLabelText("Reading file...")
-        win.progressDialog.setRange(0, _progressFinishValue)
-        _progressDialogDisplayed = False
-        _timerStart = time.time()
-    for card in lines:
-        key = card[:6].lower().replace(" ", "")
-        if key in ["atom", "hetatm"]:
-            ## sym = capitalize(card[12:14].replace(" ", "").replace("_", ""))
-            # bruce 080508 revision (guess at a bugfix for reading NE1-saved
-            # pdb files):
-            # get a list of atomnames to try; use the first one we recognize.
-            # Note that full atom name is in columns 13-16 i.e. card[12:16];
-            # see http://www.wwpdb.org/documentation/format2.3-0108-us.pdf,
-            # page 156. The old code only looked at two characters,
-            # card[12:14] == columns 13-14, and discarded ' ' and '_',
-            # and capitalized (the first character only). The code as I revised
-            # it on 070410 also discarded digits, and handled HB, HE, HN
-            # (guesses) using the atomname_exceptions dict.
-            name4 = card[12:16].replace(" ", "").replace("_", "")
-            name3 = card[12:15].replace(" ", "").replace("_", "")
-            name2 = card[12:14].replace(" ", "").replace("_", "")
-            def nodigits(name):
-                for bad in "0123456789":
-                    name = name.replace(bad, "")
-                return name
-            atomnames_to_try = [
-                name4, # as seems best according to documentation
-                name3,
-                name2, # like old code
-                nodigits(name4),
-                nodigits(name3),
-                nodigits(name2) # like code as revised on 070410
-            ]
-            foundit = False
-            for atomname in atomnames_to_try:
-                atomname = atomname_exceptions.get(atomname, atomname)
-                if atomname == "HE" and key == "atom":
-                    atomname = "H" # see comment in atomname_exceptions
-                sym = capitalize(atomname) # turns either 'he' or 'HE' into 'He'
-                try:
-                    PeriodicTable.getElement(sym)
-                except:
-                    # note: this typically fails with AssertionError
-                    # (not e.g. KeyError) [bruce 050322]
-                    continue
-                else:
-                    foundit = True
-                    break
-                pass
-            if not foundit:
-                msg = "Warning: Pdb file: will use Carbon in place of unknown element %s in: %s" \
-                    % (name4, card)
-                print msg #bruce 070410 added this print
-                env.history.message( redmsg( msg ))
-
-                ##e It would probably be better to create a fake atom, so the
-                # CONECT records would still work.
-                #bruce 080508 let's do that:
-                sym = "C"
-
-                # Better still might be to create a fake element,
-                # so we could write out the pdb file again
-                # (albeit missing lots of info). [bruce 070410 comment]
-
-                # Note: an advisor tells us:
-                #   PDB files sometimes encode atomtypes,
-                #   using C_R instead of C, for example, to represent sp2
-                #   carbons.
-                # That particular case won't trigger this exception, since we
-                # only look at 2 characters [eventually, after trying more, as of 080508],
-                # i.e. C_ in that case. It would be better to realize this means
-                # sp2 and set the atomtype here (and perhaps then use it when
-                # inferring bonds,  which we do later if the file doesn't have
-                # any bonds). [bruce 060614/070410 comment]
-
-            # Now the element name is in sym.
-            xyz = map(float, [card[30:38], card[38:46], card[46:54]] )
-            n = int(card[6:11])
-            a = Atom(sym, A(xyz), mol)
-            ndix[n] = a
+        progress = _ProgressDialogUpdater(filename)
+
+    for key, data in read_pdb_cards(filename, _guess_element, progress):
+        if key == "atoms":
+            cards = data
+            elements = cards.elements
+            positions = cards.positions
+            serials = cards.serials
+            for i in range(len(cards)):
+                if not cards.known[i]:
+                    _warn_unknown_element(cards.names[i], cards.cards[i])
+                a = Atom(elements[i], positions[i], mol)
+                ndix[serials[i]] = a
         elif key == "conect":
-            try:
-                a1 = ndix[int(card[6:11])]
-            except:
-                #bruce 050322 added this level of try/except and its message;
-                # see code below for at least two kinds of errors this might
-                # catch, but we don't try to distinguish these here. BTW this
-                # also happens as a consequence of not finding the element
-                # symbol, above,  since atoms with unknown elements are not
-                # created.
-                env.history.message( redmsg( "Warning: Pdb file: can't find first atom in CONECT record: %s" % (card,) ))
-            else:
-                for i in range(11, 70, 5):
-                    try:
-                        a2 = ndix[int(card[i:i+5])]
-                    except ValueError:
-                        # bruce 050323 comment:
-                        # we assume this is from int('') or int(' ') etc;
-                        # this is the usual way of ending this loop.
-                        break
-                    except KeyError:
-                        #bruce 050322-23 added history warning for this,
-                        # assuming it comes from ndix[] lookup.
-                        env.history.message( redmsg( "Warning: Pdb file: can't find atom %s in: %s" % (card[i:i+5], card) ))
-                        continue
-                    bond_atoms(a1, a2)
-                    numconects += 1
-
-        if showProgressDialog: # Update the progress dialog.
-            _progressValue += 1
-            if _progressValue >= _progressFinishValue:
-                win.progressDialog.setLabelText("Building model...")
-            elif _progressDialogDisplayed:
-                win.progressDialog.setValue(_progressValue)
-            else:
-                _timerDuration = time.time() - _timerStart
-                if _timerDuration > 0.25:
-                    # Display progress dialog after 0.25 seconds
-                    win.progressDialog.setValue(_progressValue)
-                    _progressDialogDisplayed = True
+            numconects += _read_conect(data, ndix)
 
-    if showProgressDialog: # Make the progress dialog go away.
-        win.progressDialog.setValue(_progressFinishValue)
+    if progress:
+        progress.done()
 
     #bruce 050322 part of fix for bug 433: don't return an empty chunk
     if not mol.atoms:
@@ -495,16 +559,16 @@ def _readpdb_new(assy,
                 # Found the atom.
                 atom_type = atom_type_dict[atom_name]
                 if atom_type == "sp2a":
-                    sp2a_atoms.append(atom)
+                    sp2a_atoms[atom.key] = atom
                     atom_type = "sp2"
                 if atom_type == "sp2c":
-                    sp2c_atoms.append(atom)
+                    sp2c_atoms[atom.key] = atom
                     atom_type = "sp2"
                 if atom_type == "sp2b":
-                    sp2b_atoms.append(atom)
+                    sp2b_atoms[atom.key] = atom
                     atom_type = "sp2"
                 if atom_type == "sp2aro":
-                    aromatic_atoms.append(atom)
+                    aromatic_atoms[atom.key] = atom
                     atom_type = "sp2"
                 atom.set_atomtype_but_dont_revise_singlets(atom_type)
                 _assigned = True
@@ -515,13 +579,13 @@ def _readpdb_new(assy,
                 # Found the atom.
                 atom_type = atom_type_dict[atom_name]
                 if atom_type == "sp2a":
-                    sp2a_atoms.append(atom)
+                    sp2a_atoms[atom.key] = atom
                     atom_type = "sp2"
                 if atom_type == "sp2b":
-                    sp2b_atoms.append(atom)
+                    sp2b_atoms[atom.key] = atom
                     atom_type = "sp2"
                 if atom_type == "sp2c":
-                    sp2c_atoms.append(atom)
+                    sp2c_atoms[atom.key] = atom
                     atom_type = "sp2"
                 atom.set_atomtype_but_dont_revise_singlets(atom_type)
                 _assigned = True
@@ -588,19 +652,21 @@ def _readpdb_new(assy,
                             atom2_type = bond.atom2.getAtomTypeName()
                             if (atom1_type == "sp2" and
                                 atom2_type == "sp2"):
-                                if (bond.atom1 in aromatic_atoms and
-                                    bond.atom2 in aromatic_atoms):
+                                key1 = bond.atom1.key
+                                key2 = bond.atom2.key
+                                if (aromatic_atoms.has_key(key1) and
+                                    aromatic_atoms.has_key(key2)):
                                     bond.set_v6(V_AROMATIC)
-                                elif ((bond.atom1 in sp2a_atoms and
-                                       bond.atom2 in sp2a_atoms) or
-                                      (bond.atom1 in sp2b_atoms and
-                                       bond.atom2 in sp2b_atoms) or
-                                      (bond.atom1 in sp2c_atoms and
-                                       bond.atom2 in sp2c_atoms) or
-                                      (bond.atom1 not in sp2a_atoms and
-                                       bond.atom1 not in sp2b_atoms and
-                                       bond.atom1 not in sp2c_atoms and
-                                       bond.atom1 not in aromatic_atoms)):
+                                elif ((sp2a_atoms.has_key(key1) and
+                                       sp2a_atoms.has_key(key2)) or
+                                      (sp2b_atoms.has_key(key1) and
+                                       sp2b_atoms.has_key(key2)) or
+                                      (sp2c_atoms.has_key(key1) and
+                                       sp2c_atoms.has_key(key2)) or
+                                      (not sp2a_atoms.has_key(key1) and
+                                       not sp2b_atoms.has_key(key1) and
+                                       not sp2c_atoms.has_key(key1) and
+                                       not aromatic_atoms.has_key(key1))):
                                     bond.set_v6(V_DOUBLE)
                             # for phosphate P - charged oxygen bond: assign V_GRAPHITE
                             if ((atom1_type == "sp3(p)" and
@@ -629,25 +695,22 @@ def _readpdb_new(assy,
 
         pass # _finalize_molecule
 
-    # Read the file contents.
-    fi = open(filename,"rU")
-    lines = fi.readlines()
-    fi.close()
-
     assy.part.ensure_toplevel_group()
 
-    aromatic_atoms = []
-    sp2a_atoms = []
-    sp2b_atoms = []
-    sp2c_atoms = []
+    # Atoms (as dicts from atom.key to atom) of each of the types
+    # recognized by _set_atom_type.
+    aromatic_atoms = {}
+    sp2a_atoms = {}
+    sp2b_atoms = {}
+    sp2c_atoms = {}
 
     # List of molecules read from PDB file.
     mollist = []
 
-    # Lists of secondary structure tuples (res_id, chain_id)
-    helix = []
-    sheet = []
-    turn = []
+    # Secondary structure tuples (res_id, chain_id), as dict keys
+    helix = {}
+    sheet = {}
+    turn = {}
 
     dir, nodename = os.path.split(filename)
     if not isInsert:
@@ -678,261 +741,143 @@ def _readpdb_new(assy,
     # file header.
     pdbid = nodename.replace(".pdb","").lower()
 
-    atomname_exceptions = {
-        "HB":"H", #k these are all guesses -- I can't find this documented
-                  # anywhere [bruce 070410]
-        "CA":"C",
-        "NE":"N",
-        "HG":"H",
-        ## "HE":"H", ### REVIEW: I'm not sure about this one --
-                    ###          leaving it out means it's read as Helium,
-        # but including it erroneously might prevent reading an actual Helium
-        # if that was intended.
-        # Guess for now: include it for ATOM but not HETATM. (So it's
-        # specialcased below, rather than being included in this table.)
-        # (Later: can't we use the case of the 'E' to distinguish it from He?)
-        "HN":"H",
-     }
-
-    # Create and display a Progress dialog while reading the MMP file.
-    # One issue with this implem is that QProgressDialog always displays
-    # a "Cancel" button, which is not hooked up. I think this is OK for now,
-    # but later we should either hook it up or create our own progress
-    # dialog that doesn't include a "Cancel" button. --mark 2007-12-06
+    # resName -> (_is_water, _is_amino_acid, _is_nucleotide)
+    residue_kinds = {}
+
+    # Create and display a Progress dialog while reading the PDB file.
+    progress = None
     if showProgressDialog:
-        _progressValue = 0
-        _progressFinishValue = len(lines)
-        win = env.mainwindow()
-        win.progressDialog.setLabelText("Reading file...")
-        win.progressDialog.setRange(0, _progressFinishValue)
-        _progressDialogDisplayed = False
-        _timerStart = time.time()
-
-    for card in lines:
-        key = card[:6].lower().replace(" ", "")
-        if key in ["atom", "hetatm"]:
-
-            # Set _is_hetero flag for HETATM
-            if key == "atom":
-                _is_hetero = False
-            else:
-                _is_hetero = True
-
-            ## sym = capitalize(card[12:14].replace(" ", "").replace("_", ""))
-            # bruce 080508 revision (guess at a bugfix for reading NE1-saved
-            # pdb files):
-            # get a list of atomnames to try; use the first one we recognize.
-            # Note that full atom name is in columns 13-16 i.e. card[12:16];
-            # see http://www.wwpdb.org/documentation/format2.3-0108-us.pdf,
-            # page 156. The old code only looked at two characters,
-            # card[12:14] == columns 13-14, and discarded ' ' and '_',
-            # and capitalized (the first character only). The code as I revised
-            # it on 070410 also discarded digits, and handled HB, HE, HN
-            # (guesses) using the atomname_exceptions dict.
-            name4 = card[12:16].replace(" ", "").replace("_", "")
-            name3 = card[12:15].replace(" ", "").replace("_", "")
-            name2 = card[12:14].replace(" ", "").replace("_", "")
-            chainId = card[21]
-
-            resId = card[22:26].replace(" ", "") + card[27]
-
-            if lastResId == None:
-                lastResId = resId
+        progress = _ProgressDialogUpdater(filename)
 
-            resName = card[17:20]
+    # Read the file contents, a batch of cards at a time.
+    for key, data in read_pdb_cards(filename, _guess_element_new, progress):
+        if key == "atoms":
+            cards = data
+            for i in range(len(cards)):
 
-            _is_water = is_water(resName)
-            _is_amino_acid = is_amino_acid(resName)
-            _is_nucleotide = is_nucleotide(resName)
+                # Set _is_hetero flag for HETATM
+                _is_hetero = cards.keys[i] != "atom"
 
-            sym = card[77:79] # Element symbol
+                name4 = cards.names[i]
+                chainId = cards.chain_ids[i]
 
-            alt = card[16] # Alternate location indicator
+                resId = cards.residue_ids[i]
 
-            if alt != ' ' and \
-               alt != 'A':
-                # Skip non-standard alternate location
-                # This is not very safe test, it should preserve
-                # the remaining atoms. piotr 080715
-                continue
+                if lastResId == None:
+                    lastResId = resId
+
+                resName = cards.residue_names[i]
+
+                kinds = residue_kinds.get(resName)
+                if kinds is None:
+                    kinds = (is_water(resName),
+                             is_amino_acid(resName),
+                             is_nucleotide(resName))
+                    residue_kinds[resName] = kinds
+                _is_water, _is_amino_acid, _is_nucleotide = kinds
+
+                alt = cards.alt_locs[i] # Alternate location indicator
+
+                if alt != ' ' and \
+                   alt != 'A':
+                    # Skip non-standard alternate location
+                    # This is not very safe test, it should preserve
+                    # the remaining atoms. piotr 080715
+                    continue
 
 ###ATOM    131  CB  ARG A  18     104.359  32.924  58.573  1.00 36.93           C
 
-            def nodigits(name):
-                for bad in "0123456789":
-                    name = name.replace(bad, "")
-                return name
-            atomnames_to_try = [
-                name4, # as seems best according to documentation
-                name3,
-                name2, # like old code
-                nodigits(name4),
-                nodigits(name3),
-                nodigits(name2) # like code as revised on 070410
-            ]
-
-            # piotr 080819: first look at the 77-78 field - it should include
-            # the element symbol.
-            foundit = False
-            try:
-                PeriodicTable.getElement(sym)
-            except:
-                pass
-            else:
-                foundit = True
-            # if not found, look at possible atom names
-            if not foundit:
-                for atomname in atomnames_to_try:
-                    atomname = atomname_exceptions.get(atomname, atomname)
-                    if atomname[0] == 'H' and key == "atom":
-                        atomname = "H" # see comment in atomname_exceptions
-
-                    sym = capitalize(atomname) # turns either 'he' or 'HE' into 'He'
-
-                    try:
-                        PeriodicTable.getElement(sym)
-                    except:
-                        # note: this typically fails with AssertionError
-                        # (not e.g. KeyError) [bruce 050322]
-                        continue
-                    else:
-                        foundit = True
-                        break
-                    pass
-            if not foundit:
-                msg = "Warning: Pdb file: will use Carbon in place of unknown element %s in: %s" \
-                    % (name4, card)
-                print msg #bruce 070410 added this print
-                env.history.message( redmsg( msg ))
-
-                ##e It would probably be better to create a fake atom, so the
-                # CONECT records would still work.
-                #bruce 080508 let's do that:
-                sym = "C"
-
-                # Better still might be to create a fake element,
-                # so we could write out the pdb file again
-                # (albeit missing lots of info). [bruce 070410 comment]
-
-                # Note: an advisor tells us:
-                #   PDB files sometimes encode atomtypes,
-                #   using C_R instead of C, for example, to represent sp2
-                #   carbons.
-                # That particular case won't trigger this exception, since we
-                # only look at 2 characters [eventually, after trying more, as of 080508],
-                # i.e. C_ in that case. It would be better to realize this means
-                # sp2 and set the atomtype here (and perhaps then use it when
-                # inferring bonds,  which we do later if the file doesn't have
-                # any bonds). [bruce 060614/070410 comment]
-
-            # Now the element name is in sym.
-            xyz = map(float, [card[30:38], card[38:46], card[46:54]] )
-            n = int(card[6:11])
-
-            if resId != lastResId and \
-               not _is_amino_acid and \
-               not _is_nucleotide and \
-               not _is_water:
-                # Finalize current molecule.
-                _finalize_molecule()
-
-                # Discard the original molecule and create a new one.
-                mol = Chunk(assy, nodename)
-                mol.protein = Protein()
-                dont_split = False
-
-            if _is_water:
-                # If this is a water molecule, add the atom to the Water chunk
-                a = Atom(sym, A(xyz), water)
-            else:
-                # Otherwise, add it to the current molecule.
-                a = Atom(sym, A(xyz), mol)
-
-            # Store PDB information in the Atom object pdb_info dict.
-            if not a.pdb_info:
-                # Create the pdb_info dictionary if it doesn't exist.
-                a.pdb_info = {}
-
-            # Store PDB atom properties in the pdb_info dict
-            a.pdb_info['atom_name'] = name4
-            a.pdb_info['residue_id'] = resId
-            a.pdb_info['residue_name'] = resName
-            a.pdb_info['chain_id'] = chainId
-
-            if not _is_hetero:
-                # The 'standard_atom' key represents a bool value set to
-                # true if this atom is "standard PDB atom", e.g. it was
-                # read from ATOM record.
-                a.pdb_info['standard_atom'] = True
-
-            # Normally, the connectivity information is only available
-            # for HETATM records. But other programs can write CONECT info
-            # for ATOM records, as well.
-            ndix[n] = a
-
-            if _is_amino_acid or \
-               _is_nucleotide:
-                # Don't split proteins or nucleotides into individual
-                # residues. What about carbohydrates? piotr 081908
-                dont_split = True
-
-            if not _is_water:
-                # Adds the atom to the "protein" chunk.
-                mol.protein.add_pdb_atom(a,
-                                         name4,
-                                         resId,
-                                         resName,
-                                         setType=True)
-
-            if _is_amino_acid or \
-               _is_nucleotide:
-                # Recognize atom type by pattern matching of the atom name.
-                # Do this only for proteins and nucleic acids.
-                _set_atom_type(a, name4, resName)
-
-            # Assign one of three types of secondary structure.
-            if (resId, chainId) in helix:
-                # helix
-                mol.protein.assign_helix(resId)
-
-            if (resId, chainId) in sheet:
-                # extended
-                mol.protein.assign_strand(resId)
-
-            if (resId, chainId) in turn:
-                # turn
-                mol.protein.assign_turn(resId)
-
-            # Remember the most recent resId
-            lastResId = resId
+                if not cards.known[i]:
+                    _warn_unknown_element(name4, cards.cards[i])
+
+                # Now the element name is in sym.
+                sym = cards.elements[i]
+                xyz = cards.positions[i]
+                n = cards.serials[i]
+
+                if resId != lastResId and \
+                   not _is_amino_acid and \
+                   not _is_nucleotide and \
+                   not _is_water:
+                    # Finalize current molecule.
+                    _finalize_molecule()
+
+                    # Discard the original molecule and create a new one.
+                    mol = Chunk(assy, nodename)
+                    mol.protein = Protein()
+                    dont_split = False
+
+                if _is_water:
+                    # If this is a water molecule, add the atom to the Water chunk
+                    a = Atom(sym, xyz, water)
+                else:
+                    # Otherwise, add it to the current molecule.
+                    a = Atom(sym, xyz, mol)
+
+                # Store PDB information in the Atom object pdb_info dict.
+                if not a.pdb_info:
+                    # Create the pdb_info dictionary if it doesn't exist.
+                    a.pdb_info = {}
+
+                # Store PDB atom properties in the pdb_info dict
+                a.pdb_info['atom_name'] = name4
+                a.pdb_info['residue_id'] = resId
+                a.pdb_info['residue_name'] = resName
+                a.pdb_info['chain_id'] = chainId
+
+                if not _is_hetero:
+                    # The 'standard_atom' key represents a bool value set to
+                    # true if this atom is "standard PDB atom", e.g. it was
+                    # read from ATOM record.
+                    a.pdb_info['standard_atom'] = True
+
+                # Normally, the connectivity information is only available
+                # for HETATM records. But other programs can write CONECT info
+                # for ATOM records, as well.
+                ndix[n] = a
+
+                if _is_amino_acid or \
+                   _is_nucleotide:
+                    # Don't split proteins or nucleotides into individual
+                    # residues. What about carbohydrates? piotr 081908
+                    dont_split = True
+
+                if not _is_water:
+                    # Adds the atom to the "protein" chunk.
+                    mol.protein.add_pdb_atom(a,
+                                             name4,
+                                             resId,
+                                             resName,
+                                             setType=True)
+
+                if _is_amino_acid or \
+                   _is_nucleotide:
+                    # Recognize atom type by pattern matching of the atom name.
+                    # Do this only for proteins and nucleic acids.
+                    _set_atom_type(a, name4, resName)
+
+                # Assign one of three types of secondary structure.
+                if helix.has_key((resId, chainId)):
+                    # helix
+                    mol.protein.assign_helix(resId)
+
+                if sheet.has_key((resId, chainId)):
+                    # extended
+                    mol.protein.assign_strand(resId)
+
+                if turn.has_key((resId, chainId)):
+                    # turn
+                    mol.protein.assign_turn(resId)
+
+                # Remember the most recent resId
+                lastResId = resId
 
-        elif key == "conect":
-            try:
-                a1 = ndix[int(card[6:11])]
-            except:
-                #bruce 050322 added this level of try/except and its message;
-                # see code below for at least two kinds of errors this might
-                # catch, but we don't try to distinguish these here. BTW this
-                # also happens as a consequence of not finding the element
-                # symbol, above,  since atoms with unknown elements are not
-                # created.
-                env.history.message( redmsg( "Warning: Pdb file: can't find first atom in CONECT record: %s" % (card,) ))
-            else:
-                for i in range(11, 70, 5):
-                    try:
-                        a2 = ndix[int(card[i:i+5])]
-                    except ValueError:
-                        # bruce 050323 comment:
-                        # we assume this is from int('') or int(' ') etc;
-                        # this is the usual way of ending this loop.
-                        break
-                    except KeyError:
-                        #bruce 050322-23 added history warning for this,
-                        # assuming it comes from ndix[] lookup.
-                        env.history.message( redmsg( "Warning: Pdb file: can't find atom %s in: %s" % (card[i:i+5], card) ))
-                        continue
-                    bond_atoms(a1, a2)
-                    numconects += 1
+            continue
+
+        card = data
+
+        if key == "conect":
+            numconects += _read_conect(card, ndix)
 
         elif key == "ter":
             # Finalize current molecule.
@@ -974,19 +919,19 @@ def _readpdb_new(assy,
                 end = int(card[34:37])
                 chainId = card[19]
                 for s in range(begin, end+1):
-                    helix.append((s, chainId))
+                    helix[(s, chainId)] = 1
             elif key == "sheet":
                 begin = int(card[23:26])
                 end = int(card[34:37])
                 chainId = card[21]
                 for s in range(begin, end+1):
-                    sheet.append((s, chainId))
+                    sheet[(s, chainId)] = 1
             elif key == "turn":
                 begin = int(card[23:26])
                 end = int(card[34:37])
                 chainId = card[19]
                 for s in range(begin, end+1):
-                    turn.append((s, chainId))
+                    turn[(s, chainId)] = 1
         else:
             # Rosetta-written PDB files include scoring information.
             if card[7:15] == "ntrials:":
@@ -998,21 +943,8 @@ def _readpdb_new(assy,
             if _read_rosetta_info:
                 comment_text += card
 
-        if showProgressDialog: # Update the progress dialog.
-            _progressValue += 1
-            if _progressValue >= _progressFinishValue:
-                win.progressDialog.setLabelText("Building model...")
-            elif _progressDialogDisplayed:
-                win.progressDialog.setValue(_progressValue)
-            else:
-                _timerDuration = time.time() - _timerStart
-                if _timerDuration > 0.25:
-                    # Display progress dialog after 0.25 seconds
-                    win.progressDialog.setValue(_progressValue)
-                    _progressDialogDisplayed = True
-
-    if showProgressDialog: # Make the progress dialog go away.
-        win.progressDialog.setValue(_progressFinishValue)
+    if progress:
+        progress.done()
 
     _finalize_molecule()
 
@@ -1145,9 +1077,6 @@ def insertpdb(assy,
 
 
 # Write a PDB ATOM record record.
-# Copied and modified version of chem.py Atom.writepdb method.
-# Should be moved back to Atom class as soon as we decided that the
-# new implementation is satisfactory.
 # piotr 080710
 
 def writepdb_atom(atom, file, atomSerialNumber, atomName, chainId, resId, \
@@ -1168,65 +1097,141 @@ def writepdb_atom(atom, file, atomSerialNumber, atomName, chainId, resId, \
                     documentation for the ATOM record more information.
     @type  chainId: str
 
-    @note: If you edit the ATOM record, be sure to to test QuteMolX.
+    @note: If you edit the ATOM record (in _ATOM_RECORD_FORMAT), be sure
+           to to test QuteMolX.
 
     @see: U{B{ATOM Record Format}<http://www.wwpdb.org/documentation/format23/sect9.html#ATOM>}
+    @see: PdbRecordWriter.add_atom, which formats the record.
     """
-    space = " "
-    # Begin ATOM record ----------------------------------
-    # Column 1-6: "ATOM  " (str) or "HETATM" depending on a type of atom
-    if hetatm:
-        atomRecord = "HETATM"
-    else:
-        atomRecord = "ATOM  "
-    # Column 7-11: Atom serial number (int)
-    atomRecord += "%5d" % atomSerialNumber
-    # Column 12: Whitespace (str)
-    atomRecord += "%1s" % space
-    # Column 13-16 Atom name (str)
-    # piotr 080710: moved Atom name to column 13
-    if len(atomName) == 4:
-        atomRecord += "%-4s" % atomName[:4]
-    else:
-        atomRecord += " %-3s" % atomName[:3]
-    # Column 17: Alternate location indicator (str) *unused*
-    atomRecord += "%1s" % space
-    # Column 18-20: Residue name - unused (str)
-    atomRecord += "%3s" % resName
-    # Column 21: Whitespace (str)
-    atomRecord += "%1s" % space
-    # Column 22: Chain identifier - single letter (str)
-    # This has been tested with 35 chunks and still works in QuteMolX.
-    atomRecord += "%1s" % chainId.upper()
-    # Column 23-27: Residue sequence number (int) + Code for insertion of residues (AChar)
-    atomRecord += "%5s" % resId
-    # Column 28-30: Whitespace (str)
-    atomRecord += "%3s" % space
-    # Get atom XYZ coordinate
-    _xyz = atom.posn()
-    # Column 31-38: X coord in Angstroms (float 8.3)
-    atomRecord += "%8.3f" % float(_xyz[0])
-    # Column 39-46: Y coord in Angstroms (float 8.3)
-    atomRecord += "%8.3f" % float(_xyz[1])
-    # Column 47-54: Z coord in Angstroms (float 8.3)
-    atomRecord += "%8.3f" % float(_xyz[2])
-    # Column 55-60: Occupancy (float 6.2) - should be "1.0"
-    atomRecord += "%6.2f" % occup
-    # Column 61-66: Temperature factor. (float 6.2) *unused*
-    atomRecord += "%6.2f" % temp
-    # Column 67-76: Whitespace (str)
-    atomRecord += "%10s" % space
-    # Column 77-78: Element symbol, right-justified (str)
-    atomRecord += "%2s" % atom.element.symbol[:2]
-    # Column 79-80: Charge on the atom (str) *unused*
-    atomRecord += "%2s\n" % space
-    # End ATOM record ----------------------------------
-
-    file.write(atomRecord)
-
+    writer = PdbRecordWriter(file)
+    writer.add_atom(atom, atomSerialNumber, atomName, chainId, resId,
+                    resName, hetatm, occup, temp)
+    writer.flush()
     return
 
 
+# Number of records PdbRecordWriter formats and writes at a time.
+_RECORD_BLOCK_SIZE = 10000
+
+# The ATOM or HETATM record written by writepdb_atom (given its record
+# name), and the ATOM record written by Atom.writepdb. Columns:
+#
+#   1-6    record name ("ATOM  " or "HETATM")
+#   7-11   atom serial number
+#   13-16  atom name (piotr 080710: starts in column 13 if it has 4
+#          characters, otherwise in column 14, like the element symbol
+#          of Atom.writepdb [piotr 080711])
+#   17     alternate location indicator (unused)
+#   18-20  residue name (unused by Atom.writepdb)
+#   22     chain identifier, a single letter (tested with 35 chunks in
+#          QuteMolX)
+#   23-27  residue sequence number and insertion code (Atom.writepdb
+#          writes residue number 1, since certain programs may have
+#          difficulties reading the file if this field is empty)
+#   31-54  x, y, z in Angstroms (8.3f each)
+#   55-60  occupancy (unused by Atom.writepdb)
+#   61-66  temperature factor (unused by Atom.writepdb)
+#   77-78  element symbol, right-justified
+#   79-80  charge on the atom (unused)
+_ATOM_RECORD_FORMAT = \
+    "%s%5d %s %3s %1s%5s   %8.3f%8.3f%8.3f%6.2f%6.2f          %2s  \n"
+_PLAIN_ATOM_RECORD_FORMAT = \
+    "ATOM  %5d  %-3s     %1s   1    %8.3f%8.3f%8.3f                      %2s  \n"
+
+class PdbRecordWriter:
+    """
+    Writes records to a PDB file a block at a time. The fields of each
+    record are gathered by one of the add methods, and formatted and
+    written along with those of many other records by flush (which is
+    also called whenever a block is full). writepdb_atom and
+    Atom.writepdb use it to write a single ATOM record.
+
+    Records are written in the order they were added, but callers must
+    call flush before writing anything else to the file, and when done.
+    """
+    def __init__(self, file):
+        self.file = file
+        self._records = [] # (format, fields) for each record not yet written
+
+    def add_atom(self, atom, atomSerialNumber, atomName, chainId, resId,
+                 resName, hetatm, occup, temp, position = None):
+        """
+        Add the ATOM or HETATM record that writepdb_atom would write
+        with the same arguments.
+
+        @param position: atom.posn(), if the caller already has it
+                         (e.g. from its chunk's atpos).
+        """
+        if hetatm:
+            recordName = "HETATM"
+        else:
+            recordName = "ATOM  "
+        # piotr 080710: moved Atom name to column 13
+        if len(atomName) == 4:
+            atomName = "%-4s" % atomName[:4]
+        else:
+            atomName = " %-3s" % atomName[:3]
+        if position is None:
+            position = atom.posn()
+        x, y, z = position
+        self._add(_ATOM_RECORD_FORMAT,
+                  (recordName, atomSerialNumber, atomName, resName,
+                   chainId.upper(), resId, x, y, z, occup, temp,
+                   atom.element.symbol[:2]))
+        return
+
+    def add_plain_atom(self, atom, atomSerialNumber, chainId,
+                       position = None):
+        """
+        Add the ATOM record that atom.writepdb would write with the same
+        arguments.
+
+        @param position: as for add_atom.
+        """
+        symbol = atom.element.symbol
+        if position is None:
+            position = atom.posn()
+        x, y, z = position
+        self._add(_PLAIN_ATOM_RECORD_FORMAT,
+                  (atomSerialNumber, symbol, chainId.upper(), x, y, z,
+                   symbol[:2].upper()))
+        return
+
+    def add_conect(self, atomSerialNumbers):
+        """
+        Add a CONECT record bonding the atom with the first of the given
+        serial numbers to the others.
+        """
+        self._add("CONECT" + "%5d" * len(atomSerialNumbers) + "\n",
+                  tuple(atomSerialNumbers))
+        return
+
+    def add_record(self, record):
+        """
+        Add a record which has already been formatted (including its
+        newline).
+        """
+        self._add("%s", (record,))
+        return
+
+    def _add(self, format, fields):
+        self._records.append((format, fields))
+        if len(self._records) >= _RECORD_BLOCK_SIZE:
+            self.flush()
+        return
+
+    def flush(self):
+        """
+        Write all the records added since the last flush.
+        """
+        if self._records:
+            self.file.write("".join([format % fields
+                                     for format, fields in self._records]))
+            self._records = []
+        return
+
+    pass
+
 # Write all Chunks into a Protein DataBank-format file
 # [bruce 050318 revised comments, and made it not write singlets or their bonds,
 #  and made it not write useless 1-atom CONECT records, and include each bond
@@ -1344,6 +1349,9 @@ def writepdb(part,
     if mode == 'w':
         writePDB_Header(f)
 
+    # ATOM, HETATM, TER and CONECT records are written by this, in blocks
+    writer = PdbRecordWriter(f)
+
     # get a list of chunks in model tree order
     mollist = part.nodes_in_mmpfile_order(nodeclass = Chunk)
 
@@ -1357,6 +1365,10 @@ def writepdb(part,
         # write atoms in proper order
         ordered_atoms = mol.atoms_in_mmp_file_order()
 
+        # all our atoms' positions at once, indexed by atom.index
+        # (the same values atom.posn() would return)
+        positions = mol.atpos.tolist()
+
         for a in ordered_atoms:
             if exclude(a):
                 excluded += 1
@@ -1389,18 +1401,19 @@ def writepdb(part,
                     if a.pdb_info.has_key('temperature_factor'):
                         temp = a.pdb_info['temperature_factor']
 
-                writepdb_atom(a,
-                              f,
-                              atomSerialNumber,
-                              atomName,
-                              chr(chainIdChar),
-                              resId,
-                              resName,
-                              hetatm,
-                              occup,
-                              temp)
+                writer.add_atom(a,
+                                atomSerialNumber,
+                                atomName,
+                                chr(chainIdChar),
+                                resId,
+                                resName,
+                                hetatm,
+                                occup,
+                                temp,
+                                positions[a.index])
             else:
-                a.writepdb(f, atomSerialNumber, chr(chainIdChar))
+                writer.add_plain_atom(a, atomSerialNumber, chr(chainIdChar),
+                                      positions[a.index])
 
             if hetatm:
                 atomConnectList.append(a)
@@ -1448,7 +1461,7 @@ def writepdb(part,
         # shouldn't be saved between consecutive non-standard residues
         # (HETATM records), e.g. water molecules shouldn't be separated
         # by TER records.
-        f.write("TER   %5d          %1s\n" % (molnum, chr(chainIdChar)))
+        writer.add_record("TER   %5d          %1s\n" % (molnum, chr(chainIdChar)))
 
         molnum += 1
         chainIdChar += 1
@@ -1459,15 +1472,9 @@ def writepdb(part,
             break
 
     for atomConnectList in connectLists:
-        # Begin CONECT record ----------------------------------
-        f.write("CONECT")
-        for a in atomConnectList:
-            index = atomsTable[a.key]
-            f.write("%5d" % index)
-        f.write("\n")
-        # End CONECT record ----------------------------------
-        connectLists = []
+        writer.add_conect([atomsTable[a.key] for a in atomConnectList])
 
+    writer.flush()
     f.write("END\n")
 
     f.close()
@@ -0,0 +1,161 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+pdb_cards.py -- read the cards (lines) of a PDB file a batch at a time,
+parsing the fixed-column fields of runs of ATOM and HETATM cards into
+arrays and lists.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+This lets files_pdb.py read files too large to hold as a list of lines
+(e.g. multi-million atom assemblies), and does the per-card work which
+doesn't depend on what was read before (finding the record type,
+slicing fields, parsing numbers, and guessing the element from the atom
+name) with one operation per field per batch, or once per distinct atom
+name, rather than separately for every card.
+"""
+
+import os
+
+from Numeric import array, reshape, zeros, Float
+
+# Number of bytes of a PDB file to read at a time.
+_BATCH_SIZE = 1 << 20
+
+# Record types (see record_key) of the cards parsed into PdbAtomCards.
+_ATOM_KEYS = {"atom": 1, "hetatm": 1}
+
+_record_keys = {} # first 6 characters of a card -> its record_key
+
+def record_key(card):
+    """
+    Return the record type of a PDB card, as its first 6 characters
+    in lowercase with spaces removed (e.g. "atom" or "hetatm").
+    """
+    prefix = card[:6]
+    key = _record_keys.get(prefix)
+    if key is None:
+        key = prefix.lower().replace(" ", "")
+        _record_keys[prefix] = key
+    return key
+
+class PdbAtomCards:
+    """
+    A run of consecutive ATOM and HETATM cards from a PDB file, with their
+    fields parsed into parallel sequences (all indexed like self.cards):
+
+    - keys: the record_key of each card ("atom" or "hetatm")
+    - serials: the atom serial numbers (a list of ints)
+    - positions: an (N,3) Numeric array of the coordinates
+    - names: the atom names, without spaces or underscores
+    - alt_locs: the alternate location indicators
+    - residue_names: the 3-character residue names
+    - chain_ids: the chain identifiers
+    - residue_ids: the residue sequence numbers, without spaces, followed
+      by the insertion codes (as strings)
+    - elements: the element symbol for each atom, as guessed by the
+      guess_element function passed to read_pdb_cards
+    - known: whether guess_element recognized each atom's element
+    """
+    def __init__(self, cards, keys, guess_element, guesses):
+        """
+        @param guesses: a dict in which to remember the results of
+                        guess_element, for all the cards of one file.
+        """
+        self.cards = cards
+        self.keys = keys
+        n = len(cards)
+        self.serials = map(int, [card[6:11] for card in cards])
+        coordinates = " ".join([card[30:38] + " " + card[38:46] + " " +
+                                card[46:54] for card in cards]).split()
+        if len(coordinates) != 3 * n:
+            # some card has a missing coordinate; get the same error as
+            # parsing each card separately
+            coordinates = []
+            for card in cards:
+                coordinates.extend(map(float, [card[30:38], card[38:46],
+                                               card[46:54]]))
+        if n:
+            self.positions = reshape(array(map(float, coordinates), Float),
+                                     (n, 3))
+        else:
+            self.positions = zeros((0, 3), Float)
+        self.names = [card[12:16].replace(" ", "").replace("_", "")
+                      for card in cards]
+        self.alt_locs = [card[16:17] for card in cards]
+        self.residue_names = [card[17:20] for card in cards]
+        self.chain_ids = [card[21:22] for card in cards]
+        self.residue_ids = [card[22:26].replace(" ", "") + card[27:28]
+                            for card in cards]
+        elements = []
+        known = []
+        for key, card in zip(keys, cards):
+            guess_key = (key, card[12:16], card[77:79])
+            guess = guesses.get(guess_key)
+            if guess is None:
+                guess = guess_element(key, card[12:16], card[77:79])
+                guesses[guess_key] = guess
+            elements.append(guess[0])
+            known.append(guess[1])
+        self.elements = elements
+        self.known = known
+        return
+
+    def __len__(self):
+        return len(self.cards)
+
+    pass
+
+def read_pdb_cards(filename, guess_element, progress_callback = None):
+    """
+    Read the PDB file filename, yielding a pair (key, data) for each of
+    its cards other than ATOM or HETATM cards, where key is the card's
+    record_key and data is the card, and a pair ("atoms", data) for each
+    run of ATOM and HETATM cards, where data is a PdbAtomCards for them,
+    in the order they're in the file. Only one batch of the file's cards
+    is held in memory at a time; a long run of ATOM and HETATM cards may
+    be split into several PdbAtomCards.
+
+    @param guess_element: a function which is passed the record_key of an
+                          ATOM or HETATM card, its atom name field (columns
+                          13-16) and its card[77:79], and returns a pair
+                          (sym, known), where sym is the element symbol to
+                          use for it, and known is False if that is only a
+                          placeholder for an unrecognized element. It's only
+                          called once for each distinct set of arguments.
+
+    @param progress_callback: if provided, called after each batch of cards
+                              as progress_callback(position, size), where
+                              position is how many bytes of the file have
+                              been read so far and size is its size.
+    """
+    size = os.path.getsize(filename)
+    guesses = {} # (key, name field, card[77:79]) -> guess_element result
+    fi = open(filename, "rU")
+    while 1:
+        lines = fi.readlines(_BATCH_SIZE)
+        if not lines:
+            break
+        atom_cards = []
+        atom_keys = []
+        for card in lines:
+            key = record_key(card)
+            if _ATOM_KEYS.has_key(key):
+                atom_cards.append(card)
+                atom_keys.append(key)
+                continue
+            if atom_cards:
+                yield "atoms", PdbAtomCards(atom_cards, atom_keys,
+                                            guess_element, guesses)
+                atom_cards = []
+                atom_keys = []
+            yield key, card
+        if atom_cards:
+            yield "atoms", PdbAtomCards(atom_cards, atom_keys,
+                                        guess_element, guesses)
+        if progress_callback:
+            progress_callback(min(fi.tell(), size), size)
+    fi.close()
+    return
+
+# end
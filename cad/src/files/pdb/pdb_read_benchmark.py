@@ -0,0 +1,115 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+pdb_read_benchmark.py -- time parsing the cards of large PDB files with
+read_pdb_cards, compared with parsing them one card at a time as
+files_pdb.py used to.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py files/pdb/pdb_read_benchmark.py [natoms ...]
+
+For each number of atoms (default 100000 and 1000000), a made-up PDB file
+of that many atoms (chains of alanine residues) is written to a temporary
+file, and the time to parse its cards (record types, coordinates, serial
+numbers, names, residue and chain fields, and elements) is printed for
+both ways of parsing it. Making the Chunks and Atoms is not timed.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from files.pdb.pdb_cards import read_pdb_cards
+from files.pdb.files_pdb import _guess_element_new
+
+_RESIDUE = (" N  ", " CA ", " C  ", " O  ", " CB ")
+
+_RESIDUES_PER_CHAIN = 1000
+
+def _write_made_up_pdb(filename, natoms):
+    out = open(filename, "w")
+    out.write("HEADER    MADE-UP PDB FILE FOR pdb_read_benchmark.py\n")
+    for i in range(natoms):
+        residue = i / len(_RESIDUE)
+        chain = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[residue / _RESIDUES_PER_CHAIN % 26]
+        name = _RESIDUE[i % len(_RESIDUE)]
+        out.write("ATOM  %5d %s ALA %s%4d    %8.3f%8.3f%8.3f  1.00  0.00"
+                  "           %s\n" %
+                  (i % 100000, name, chain, residue % 10000,
+                   (i % 97) * 1.1, (i / 97 % 89) * 1.3, (i / 8633) * 1.2,
+                   name.strip()[0]))
+        if residue % _RESIDUES_PER_CHAIN == _RESIDUES_PER_CHAIN - 1 and \
+           i % len(_RESIDUE) == len(_RESIDUE) - 1:
+            out.write("TER\n")
+    out.write("END\n")
+    out.close()
+    return
+
+def _parse_one_card_at_a_time(filename):
+    """
+    Parse the ATOM and HETATM cards of a PDB file the way files_pdb.py
+    did before it used read_pdb_cards; return the number of atoms.
+    """
+    fi = open(filename, "rU")
+    lines = fi.readlines()
+    fi.close()
+    natoms = 0
+    for card in lines:
+        key = card[:6].lower().replace(" ", "")
+        if key in ["atom", "hetatm"]:
+            name4 = card[12:16].replace(" ", "").replace("_", "")
+            chainId = card[21]
+            resId = card[22:26].replace(" ", "") + card[27]
+            resName = card[17:20]
+            alt = card[16]
+            sym, known = _guess_element_new(key, card[12:16], card[77:79])
+            xyz = map(float, [card[30:38], card[38:46], card[46:54]])
+            n = int(card[6:11])
+            natoms += 1
+    return natoms
+
+def _parse_in_batches(filename):
+    """
+    Parse the cards of a PDB file with read_pdb_cards; return the number
+    of atoms and the number of progress_callback calls.
+    """
+    calls = []
+    def progress_callback(position, size):
+        calls.append(position)
+    natoms = 0
+    for key, data in read_pdb_cards(filename, _guess_element_new,
+                                    progress_callback):
+        if key == "atoms":
+            natoms += len(data)
+    return natoms, len(calls)
+
+def _run(sizes):
+    for natoms in sizes:
+        filename = tempfile.mktemp(".pdb")
+        _write_made_up_pdb(filename, natoms)
+        try:
+            t0 = time.time()
+            count1 = _parse_one_card_at_a_time(filename)
+            t1 = time.time()
+            count2, calls = _parse_in_batches(filename)
+            t2 = time.time()
+        finally:
+            os.remove(filename)
+        assert count1 == count2 == natoms
+        print "%d atoms: one card at a time %.2f sec, in batches %.2f sec " \
+              "(%.1fx, %d progress callbacks)" % \
+              (natoms, t1 - t0, t2 - t1, (t1 - t0) / (t2 - t1), calls)
+    return
+
+if __name__ == '__main__':
+    args = sys.argv[2:] # sys.argv[1] is this file, when run by ExecSubDir.py
+    if args:
+        _run(map(int, args))
+    else:
+        _run([100000, 1000000])
+
+# end
@@ -444,7 +444,7 @@ class Node( StateMixin):
         self.disabled_by_user_choice = val
         self.changed()
 
-    def changed(self):
+    def changed(self, atoms_layer_only = False):
         """
         Call this whenever something in the node changes
         which would affect what gets written to an mmp file
@@ -455,11 +455,13 @@ class Node( StateMixin):
         upon loading a new one, even when there are no actual changes.
            But if you're not sure, calling it when not needed is better
         than not calling it when needed.
+           Pass atoms_layer_only = True if the only undoable state that
+        changed is in atoms or bonds (see assy.changed).
         """
         #bruce 050505; not yet uniformly used (most code calls part.changed or
         #assy.changed directly)
         if self.part is not None:
-            self.part.changed()
+            self.part.changed(atoms_layer_only = atoms_layer_only)
                 #e someday we'll do self.changed which will do dad.changed....
         elif self.assy is not None:
             pass
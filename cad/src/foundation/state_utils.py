@@ -159,6 +159,8 @@ TODO [as of 090206]:
 """
 
 from types import InstanceType
+import zlib
+import tempfile
 
 from foundation.state_constants import S_DATA
 from foundation.state_constants import S_CHILD, S_CHILDREN, S_CHILDREN_NOT_DATA
@@ -175,6 +177,13 @@ from utilities.Comparison import same_vals, SAMEVALS_SPEEDUP
 from utilities.constants import remove_prefix
 
 from utilities.GlobalPreferences import debug_pyrex_atoms
+from utilities.GlobalPreferences import debug_pref_columnar_undo_snapshots
+
+from Numeric import zeros, ones, arange, concatenate, take, put, compress
+from Numeric import nonzero, argsort, searchsorted, minimum, add
+from Numeric import equal, not_equal, logical_or, sometrue, bitwise_xor
+from Numeric import reshape, fromstring
+from Numeric import Float, Int, UnsignedInt8
 
 DEBUG_PYREX_ATOMS = debug_pyrex_atoms()
 
@@ -611,6 +620,10 @@ class InstanceClassification(Classification): #k used to be called StateHolderIn
                     if specialcase_type == UNDO_SPECIALCASE_ATOM and \
                        attr_its_about == ATOM_CHUNK_ATTRIBUTE_NAME:
                         self.dict_of_all_Atom_chunk_attrcodes[ attrcode ] = None #071114
+                    if specialcase_type == UNDO_SPECIALCASE_ATOM:
+                        column_class = _column_class_for_attr(attr_its_about)
+                        if column_class is not None:
+                            _columnar_attrcodes[ attrcode ] = column_class #bruce 090312
                 pass
             elif name == '_s_isPureData': # note: exact name (not a prefix), and doesn't end with '_'
                 self.warn = False # enough to be legitimate data
@@ -1346,7 +1359,7 @@ class StateSnapshot:
         Make an attrdict for attrcode. Assume we don't already have one.
         """
         assert self.attrdicts.get(attrcode) is None
-        self.attrdicts[attrcode] = {}
+        self.attrdicts[attrcode] = _new_attrdict(attrcode)
     def size(self): ##e should this be a __len__ and/or a __nonzero__ method? ### shares code with DiffObj; use common superclass?
         """
         return the total number of attribute values we're storing (over all objects and all attrnames)
@@ -1478,11 +1491,50 @@ class DiffObj:
         """
         res = 0
         for attrcode, d in self.attrdicts.iteritems():
+            if isinstance(d, PosnDiff):
+                res += d.RAM_usage_guess()
+                continue
             attr, acode_unused = attrcode
             valsize = self.attrname_valsizes.get(attr, 24) # it's a kluge to use attr rather than attrcode here
                 # 24 is a guess, and is conservative: 2 pointers in dict item == 8, 2 small pyobjects (8 each??)
             res += len(d) * valsize
         return res
+    def compress(self): #bruce 090313
+        """
+        Pack our atom position diffs (see PosnDiff.pack), to save RAM.
+        (This doesn't change what we represent.)
+        """
+        for attrcode, d in self.attrdicts.items():
+            if not isinstance(d, PosnDiff):
+                attr, acode = attrcode
+                if attr != '_posn' or not d or \
+                   not _KLUGE_acode_is_special_for_extract_layers(acode):
+                    continue
+                # a diff stored before columnar snapshots were turned on
+                posndiff = PosnDiff()
+                posndiff.update(d)
+                self.attrdicts[attrcode] = d = posndiff
+            d.pack()
+        return
+    def spill(self, spillfile): #bruce 090313
+        """
+        Compress our atom position diffs and move them into spillfile
+        (an UndoSpillFile), to save more RAM.
+        """
+        self.compress()
+        for d in self.attrdicts.itervalues():
+            if isinstance(d, PosnDiff):
+                d.spill(spillfile)
+        return
+    def spilled_size(self): #bruce 090313
+        """
+        Return the number of bytes of our data in an UndoSpillFile.
+        """
+        res = 0
+        for d in self.attrdicts.itervalues():
+            if isinstance(d, PosnDiff):
+                res += d.spilled_size()
+        return res
     def __len__(self):
         return self.size()
     def nonempty(self):
@@ -1506,6 +1558,11 @@ class DiffObj:
         dicts1 = self.attrdicts
         for attrcode, d2 in dicts2.iteritems():
             d1 = dicts1.setdefault(attrcode, {})
+            if isinstance(d2, PosnDiff) and not isinstance(d1, PosnDiff):
+                # accumulate positions in arrays too [bruce 090312]
+                old_d1 = d1
+                d1 = dicts1[attrcode] = PosnDiff()
+                d1.update(old_d1)
             d1.update(d2) # even if d1 starts out {}, it's important to copy d2 here, not share it
         return
     pass
@@ -1593,13 +1650,20 @@ def diffdicts(d1, d2, dflt = None, whatret = 0, val_diff_func = None):
 ##            print "one place we can make a %s priorstate like %r is: %s" % (what, priorstate, stack)
 ##    return
 
-def diff_and_copy_state(archive, assy, priorstate): #060228 (#e maybe this is really an archive method? 060408 comment & revised docstring)
+def diff_and_copy_state(archive, assy, priorstate, scan_childobjs = True): #060228 (#e maybe this is really an archive method? 060408 comment & revised docstring)
     """
     Figure out how the current actual model state (of assy) differs from the last model state we archived (in archive/priorstate).
     Return a new StatePlace (representing a logically immutable snapshot of the current model state)
     which presently owns a complete copy of that state (a mutable StateSnapshot which always tracks our most recent snapshot
     of the actual state), but is willing to give that up (and redefine itself (equivalently) as a diff from a changed version of that)
     when this function is next called.
+
+    If scan_childobjs is false, the caller promises that nothing outside the
+    'atoms layer' (atoms and bonds, and chunks' sets of atoms) has changed
+    since priorstate was made, so we don't scan the other objects reachable
+    from assy, but find all changes using the global changedicts for atoms
+    and bonds, in time proportional to the number of changed objects.
+    [bruce 090316]
     """
     # background: we keep a mutable snapshot of the last checkpointed state. right now it's inside priorstate (and defines
     # that immutable-state-object's state), but we're going to grab it out of there and modify it to equal actual current state
@@ -1612,9 +1676,26 @@ def diff_and_copy_state(archive, assy, priorstate): #060228 (#e maybe this is re
     new = StatePlace() # will be given stewardship of our maintained copy of almost-current state, and returned
     # diffobj is not yet needed now, just returned from diff_snapshots_oneway:
     ## diffobj = DiffObj() # will record diff from new back to priorstate (one-way diff is ok, if traversing it also reverses it)
+    childobj_dict = None
+    if not scan_childobjs:
+        childobj_dict = priorstate.lastsnap._childobj_dict
+            # still valid, since the objects it lists haven't changed;
+            # if None (not expected), we fall back to scanning
     steal_lastsnap_method = priorstate.steal_lastsnap
     lastsnap = steal_lastsnap_method( ) # and we promise to replace it with (new, diffobj) later, so priorstate is again defined
     assert isinstance(lastsnap, StateSnapshot) # remove when works, eventually ###@@@
+    if childobj_dict is not None:
+        # only the 'atoms layer' might have changed; the rest of lastsnap
+        # is already current and can be kept as it is
+        lastsnap_diffscan_layers = lastsnap.extract_layers( ('atoms',) )
+        diffobj = DiffObj()
+        lastsnap._childobj_dict = childobj_dict
+        modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers, ('atoms',), diffobj, childobj_dict )
+        lastsnap.insert_layers(lastsnap_diffscan_layers)
+        new.own_this_lastsnap(lastsnap)
+        priorstate.define_by_diff_from_stateplace(diffobj, new)
+        new.really_changed = not not diffobj.nonempty()
+        return new
     # now we own lastsnap, and we'll modify it to agree with actual current state, and record the changes required to undo this...
     # 060329: this (to end of function) is where we have to do things differently when we only want to scan changed objects.
     # So we do the old full scan for most kinds of things, but not for the 'atoms layer' (atoms, bonds, Chunk.atoms attr).
@@ -1688,20 +1769,39 @@ def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers,
     ## print "changed_live = %s, changed_dead = %s" % (changed_live,changed_dead)
     key4obj = keyknower.key4obj_maybe_new
     diff_attrdicts = diffobj.attrdicts
+    state_attrdicts = lastsnap_diffscan_layers.attrdicts
     for attrcode in archive.obj_classifier.dict_of_all_state_attrcodes.iterkeys():
         acode = attrcode[1]
         ## if acode in ('Atom', 'Bond'):
         if _KLUGE_acode_is_special_for_extract_layers(acode):
-            diff_attrdicts.setdefault(attrcode, {}) # this makes some diffs too big, but speeds up our loops ###k is it ok??
+            diff_attrdicts.setdefault(attrcode, _new_diff_attrdict(state_attrdicts.get(attrcode)))
+                # this makes some diffs too big, but speeds up our loops ###k is it ok??
             # if this turns out to cause trouble, just remove these dicts at the end if they're still empty
-    state_attrdicts = lastsnap_diffscan_layers.attrdicts
     objclsfr = archive.obj_classifier
     ci = objclsfr.classify_instance
+    # For attrcodes whose state attrdicts are columns (see AtomColumn),
+    # we collect the objects of each clas and handle them all at once,
+    # after this loop. [bruce 090312]
+    attrcodes_for_clas = {} # maps clas to (no-dflt attrcodes to handle here, columnar attrcodes, list of (key, obj))
     # warning: we now have 3 similar but not identical 'for attrcode' loop bodies,
     # handling live/dflt, live/no-dflt, and dead.
     for idobj, obj in changed_live.iteritems(): # similar to obj_classifier.collect_state
         key = key4obj(obj)
         clas = ci(obj) #e could heavily optimize this if we kept all leaf classes separate; probably should
+        try:
+            attrcodes_with_no_dflt, columnar_attrcodes, columnar_objs = attrcodes_for_clas[clas]
+        except KeyError:
+            attrcodes_with_no_dflt = []
+            columnar_attrcodes = []
+            for attrcode in clas.attrcodes_with_no_dflt:
+                if isinstance(state_attrdicts.get(attrcode), AtomColumn):
+                    columnar_attrcodes.append(attrcode)
+                else:
+                    attrcodes_with_no_dflt.append(attrcode)
+            columnar_objs = []
+            attrcodes_for_clas[clas] = attrcodes_with_no_dflt, columnar_attrcodes, columnar_objs
+        if columnar_attrcodes:
+            columnar_objs.append( (key, obj) )
         for attrcode, dflt in clas.attrcode_dflt_pairs:
             attr, acode_unused = attrcode
             ## state_attrdict = state_attrdicts[attrcode] #k if this fails, just use setdefault with {} [it did; makes sense]
@@ -1723,7 +1823,7 @@ def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers,
                 diff_attrdicts[attrcode][key] = oldval
         dflt = None
         del dflt
-        for attrcode in clas.attrcodes_with_no_dflt:
+        for attrcode in attrcodes_with_no_dflt:
             attr, acode_unused = attrcode
             state_attrdict = state_attrdicts[attrcode]
             val = getattr(obj, attr, _Bugval)
@@ -1740,6 +1840,15 @@ def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers,
                 diff_attrdict[key] = oldval #k if this fails, just use setdefault with {}
         attrcode = None
         del attrcode
+    for attrcodes_with_no_dflt, columnar_attrcodes, columnar_objs in attrcodes_for_clas.itervalues():
+        if not columnar_objs:
+            continue
+        keys = [key for key, obj in columnar_objs]
+        for attrcode in columnar_attrcodes:
+            attr, acode_unused = attrcode
+            vals = [getattr(obj, attr, _Bugval) for key, obj in columnar_objs]
+            state_attrdicts[attrcode].diff_and_store( keys, vals, diff_attrdicts[attrcode] )
+        continue
     for idobj, obj in changed_dead.iteritems():
         #e if we assumed these all have same clas, we could invert loop order and heavily optimize
         key = key4obj(obj)
@@ -1877,6 +1986,10 @@ def apply_and_reverse_diff(diff, snap):
     """
     for attrcode, dict1 in diff.attrdicts.items():
         dictsnap = snap.attrdicts.setdefault(attrcode, {})
+        if isinstance(dict1, PosnDiff) and \
+           isinstance(dictsnap, PosnColumn) and \
+           dictsnap.apply_and_reverse(dict1): #bruce 090312
+            continue
         if 1:
             # if no special diff restoring func for this attrcode:
             for key, val in dict1.iteritems():
@@ -1917,6 +2030,636 @@ def apply_and_reverse_diff(diff, snap):
             #
     return
 
+# == columnar attrdicts for atoms [bruce 090312]
+
+# For the attributes named here, of classes whose _s_undo_specialcase is
+# UNDO_SPECIALCASE_ATOM, StateSnapshot attrdicts are columns indexed by
+# objkey (instances of the class given here) rather than dicts, if
+# debug_pref_columnar_undo_snapshots is set when they're made. Columns
+# support the dict methods our callers use, so code which handles an
+# attrdict one key at a time still works; the speedup comes from the
+# methods which handle many keys at once, used in
+# modify_and_diff_snap_for_changed_objects, apply_and_reverse_diff,
+# DiffObj.accumulate_diffs and undo_archive.mash_attrs.
+#
+# Diffs of a PosnColumn are stored (by those methods) in a PosnDiff,
+# a sparse map from objkey to position, so a checkpoint after all atoms
+# move (e.g. after Minimize) stores a few arrays rather than a dict entry
+# and a Numeric array per atom.
+
+_columnar_attrcodes = {} # maps attrcode to column class; see _find_attr_decls
+
+def _column_class_for_attr(attr):
+    if attr == '_posn':
+        return PosnColumn
+    elif attr in ('element', 'atomtype', ATOM_CHUNK_ATTRIBUTE_NAME):
+        return AtomColumn
+    return None
+
+def _new_attrdict(attrcode):
+    """
+    Return a new empty attrdict for attrcode, for use in a StateSnapshot.
+    """
+    column_class = _columnar_attrcodes.get(attrcode)
+    if column_class is not None and debug_pref_columnar_undo_snapshots():
+        return column_class()
+    return {}
+
+def _new_diff_attrdict(state_attrdict):
+    """
+    Return a new empty attrdict for the diffs of the given StateSnapshot
+    attrdict (which might be None).
+    """
+    if isinstance(state_attrdict, PosnColumn):
+        return PosnDiff()
+    return {}
+
+def _is_posn(val):
+    return type(val) is _Numeric_array_type and val.shape == (3,)
+
+class AtomColumn(object):
+    """
+    A StateSnapshot attrdict (mapping objkeys to values of one attrcode
+    of an UNDO_SPECIALCASE_ATOM class) stored as a list indexed by objkey,
+    which is compact since objkeys are small ints allocated in order,
+    with _UNSET_ where we have no value.
+    """
+    def __init__(self):
+        self._vals = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def get(self, key, dflt = None):
+        try:
+            val = self._vals[key]
+        except IndexError:
+            return dflt
+        if val is _UNSET_:
+            return dflt
+        return val
+
+    def __getitem__(self, key):
+        val = self.get(key, _UNSET_)
+        if val is _UNSET_:
+            raise KeyError, key
+        return val
+
+    def has_key(self, key):
+        return self.get(key, _UNSET_) is not _UNSET_
+
+    __contains__ = has_key
+
+    def __setitem__(self, key, val):
+        if val is _UNSET_:
+            # (a missing value means the same thing)
+            self.pop(key, None)
+            return
+        vals = self._vals
+        if key >= len(vals):
+            vals.extend( [_UNSET_] * (key + 1 - len(vals)) )
+        if vals[key] is _UNSET_:
+            self._len += 1
+        vals[key] = val
+
+    def pop(self, key, *dflt):
+        val = AtomColumn.get(self, key, _UNSET_)
+        if val is _UNSET_:
+            if dflt:
+                return dflt[0]
+            raise KeyError, key
+        self._vals[key] = _UNSET_
+        self._len -= 1
+        return val
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def setdefault(self, key, dflt = None):
+        val = self.get(key, _UNSET_)
+        if val is _UNSET_:
+            self[key] = val = dflt
+        return val
+
+    def items(self):
+        vals = self._vals
+        return [(key, vals[key]) for key in range(len(vals))
+                if vals[key] is not _UNSET_]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def keys(self):
+        return [key for key, val in self.items()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    __iter__ = iterkeys
+
+    def values(self):
+        return [val for key, val in self.items()]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def update(self, other):
+        for key, val in other.iteritems():
+            self[key] = val
+        return
+
+    def clear(self):
+        self._vals = []
+        self._len = 0
+
+    def diff_and_store(self, keys, vals, diff_attrdict):
+        """
+        For each objkey in the list keys and the corresponding new value
+        in the list vals, if the value differs (by same_vals) from ours
+        (or we have none), store a copy of it, and store our old value
+        (or _UNSET_) in diff_attrdict at that key.
+        """
+        for key, val in zip(keys, vals):
+            old = self.get(key, _UNSET_)
+            if old is val or same_vals(old, val):
+                continue
+            self[key] = copy_val(val)
+            diff_attrdict[key] = old
+        return
+
+    pass # end of class AtomColumn
+
+class PosnColumn(AtomColumn):
+    """
+    An AtomColumn for atom positions, which keeps them in an (N,3)
+    Numeric array indexed by objkey, so that they can be compared and
+    stored many at a time. (Values which are not 3-vectors, if there ever
+    are any, are kept in the list inherited from AtomColumn, and make us
+    use the inherited methods.)
+    """
+    def __init__(self):
+        AtomColumn.__init__(self)
+        self._posns = zeros((0, 3), Float)
+        self._present = zeros((0,), Int) # 1 where self._posns has a value
+        self._narray = 0 # number of values in self._posns
+
+    def _reserve(self, maxkey):
+        size = len(self._present)
+        if maxkey < size:
+            return
+        newsize = max(maxkey + 1, 2 * size, 1024)
+        self._posns = concatenate(( self._posns,
+                                    zeros((newsize - size, 3), Float) ))
+        self._present = concatenate(( self._present,
+                                      zeros((newsize - size,), Int) ))
+        return
+
+    def get(self, key, dflt = None):
+        if key < len(self._present) and self._present[key]:
+            return + self._posns[key]
+        return AtomColumn.get(self, key, dflt)
+
+    def __setitem__(self, key, val):
+        if not _is_posn(val):
+            self.pop(key, None)
+            AtomColumn.__setitem__(self, key, val)
+            return
+        AtomColumn.pop(self, key, None)
+        self._reserve(key)
+        if not self._present[key]:
+            self._present[key] = 1
+            self._narray += 1
+            self._len += 1
+        self._posns[key] = val
+
+    def pop(self, key, *dflt):
+        if key < len(self._present) and self._present[key]:
+            self._present[key] = 0
+            self._narray -= 1
+            self._len -= 1
+            return + self._posns[key]
+        return AtomColumn.pop(self, key, *dflt)
+
+    def items(self):
+        posns = self._posns
+        res = [(key, + posns[key]) for key in nonzero(self._present)]
+        res.extend(AtomColumn.items(self))
+        return res
+
+    def clear(self):
+        AtomColumn.clear(self)
+        self._posns = zeros((0, 3), Float)
+        self._present = zeros((0,), Int)
+        self._narray = 0
+
+    def _take(self, keys):
+        """
+        Return (present, posns) arrays for the given array of objkeys,
+        where present is 0 where we have no value.
+        """
+        self._reserve(max(keys))
+        return take(self._present, keys), take(self._posns, keys, 0)
+
+    def _put(self, keys, present, posns):
+        """
+        Store the given values (or lack of them, where present is 0)
+        at the given array of objkeys.
+        """
+        self._reserve(max(keys))
+        old_present = take(self._present, keys)
+        put(self._present, keys, present)
+        put(self._posns, add.outer(keys * 3, arange(3)).flat, posns.flat)
+        delta = add.reduce(present) - add.reduce(old_present)
+        self._narray += delta
+        self._len += delta
+        return
+
+    def diff_and_store(self, keys, vals, diff_attrdict):
+        if not keys:
+            return
+        new = None
+        if self._len == self._narray and isinstance(diff_attrdict, PosnDiff):
+            try:
+                new = array(vals, Float)
+            except:
+                pass
+        if new is None or new.shape != (len(keys), 3):
+            # some value is not a position, or we have such values
+            AtomColumn.diff_and_store(self, keys, vals, diff_attrdict)
+            return
+        keys = array(keys, Int)
+        present, old = self._take(keys)
+        changed = nonzero( logical_or( equal(present, 0),
+                                       sometrue( not_equal(old, new), 1 )))
+        if not len(changed):
+            return
+        keys = take(keys, changed)
+        present = take(present, changed)
+        self._put(keys, ones(len(keys), Int), take(new, changed, 0))
+        diff_attrdict._store_many( keys, take(old, changed, 0),
+                                   equal(present, 0) )
+        return
+
+    def apply_and_reverse(self, diff):
+        """
+        [helper for apply_and_reverse_diff]
+        If we can, store the values in diff (a PosnDiff) into self, and
+        replace them in diff with our old values (or _UNSET_), and return
+        True. If we can't do that all at once, do nothing and return False.
+        """
+        diff._compact()
+        if diff._extra or self._len != self._narray:
+            return False
+        keys = diff._keys
+        if not len(keys):
+            return True
+        present, old = self._take(keys)
+        self._put(keys, equal(diff._unset, 0), diff._posns)
+        diff._posns = old
+        diff._unset = equal(present, 0)
+        return True
+
+    pass # end of class PosnColumn
+
+class PosnDiff(object):
+    """
+    A DiffObj attrdict for the diffs of a PosnColumn: a map from objkey
+    to position or _UNSET_, mostly stored as a sorted array of objkeys
+    and arrays of their positions and of flags saying which are _UNSET_.
+    Values stored one at a time go into a dict, self._extra, which
+    overrides the arrays until _compact moves them there.
+
+    To save RAM on the undo stack, pack can compress those arrays into a
+    string, and spill can move that string into an UndoSpillFile; they're
+    restored (by _unpack) the next time they're needed.
+    """
+    _packed = None # compressed form of our arrays, if pack was called
+    _spilled = None # (spillfile, offset, length) if spill was called
+    _npacked = 0 # number of keys in _packed or _spilled
+
+    def __init__(self):
+        self._keys = zeros((0,), Int)
+        self._posns = zeros((0, 3), Float)
+        self._unset = zeros((0,), Int)
+        self._extra = {}
+
+    def _index(self, key):
+        """
+        Return the index of key in self._keys, or -1 if it's not there.
+        """
+        self._unpack()
+        keys = self._keys
+        i = searchsorted(keys, [key])[0]
+        if i < len(keys) and keys[i] == key:
+            return i
+        return -1
+
+    def get(self, key, dflt = None):
+        try:
+            return self._extra[key]
+        except KeyError:
+            pass
+        i = self._index(key)
+        if i < 0:
+            return dflt
+        if self._unset[i]:
+            return _UNSET_
+        return + self._posns[i]
+
+    def __getitem__(self, key):
+        res = self.get(key, self)
+        if res is self:
+            raise KeyError, key
+        return res
+
+    def has_key(self, key):
+        return self._extra.has_key(key) or self._index(key) >= 0
+
+    __contains__ = has_key
+
+    def __setitem__(self, key, val):
+        self._extra[key] = val
+
+    def __len__(self):
+        if (self._packed is not None or self._spilled is not None) and \
+           not self._extra:
+            return self._npacked
+        self._compact()
+        return len(self._keys) + len(self._extra)
+
+    def items(self):
+        self._compact()
+        posns = self._posns
+        unset = self._unset
+        res = []
+        for i in range(len(self._keys)):
+            if unset[i]:
+                res.append( (self._keys[i], _UNSET_) )
+            else:
+                res.append( (self._keys[i], + posns[i]) )
+        res.extend(self._extra.items())
+        return res
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def keys(self):
+        return [key for key, val in self.items()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    __iter__ = iterkeys
+
+    def values(self):
+        return [val for key, val in self.items()]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def update(self, other):
+        if isinstance(other, PosnDiff):
+            other._compact()
+            self._store_many(other._keys, other._posns, other._unset)
+            for key, val in other._extra.iteritems():
+                self[key] = val
+        else:
+            for key, val in other.iteritems():
+                self[key] = val
+        return
+
+    def _store_many(self, keys, posns, unset):
+        """
+        Store positions (or _UNSET_, where unset is true) at the objkeys
+        in the given arrays, replacing any values already at those keys.
+        """
+        if not len(keys):
+            return
+        self._compact()
+        extra = self._extra
+        if extra:
+            for key in keys:
+                extra.pop(key, None)
+        order = argsort(keys)
+        keys = take(keys, order)
+        posns = take(posns, order, 0)
+        unset = take(unset, order)
+        old_keys = self._keys
+        if len(old_keys):
+            # keep only the old values at keys we're not replacing
+            i = minimum( searchsorted(keys, old_keys), len(keys) - 1 )
+            keep = not_equal( take(keys, i), old_keys )
+            keys = concatenate(( compress(keep, old_keys), keys ))
+            posns = concatenate(( compress(keep, self._posns, 0), posns ))
+            unset = concatenate(( compress(keep, self._unset), unset ))
+            order = argsort(keys)
+            keys = take(keys, order)
+            posns = take(posns, order, 0)
+            unset = take(unset, order)
+        self._keys = keys
+        self._posns = posns
+        self._unset = unset
+        return
+
+    def _compact(self):
+        """
+        Move the values in self._extra into our arrays, if we can.
+        """
+        self._unpack()
+        if not self._extra:
+            return
+        keys = []
+        posns = []
+        unset = []
+        odd = {}
+        for key, val in self._extra.iteritems():
+            if val is _UNSET_:
+                keys.append(key)
+                posns.append( (0.0, 0.0, 0.0) )
+                unset.append(1)
+            elif _is_posn(val):
+                keys.append(key)
+                posns.append(val)
+                unset.append(0)
+            else:
+                odd[key] = val
+        if keys:
+            # (otherwise leave self._extra alone, so its order doesn't
+            #  change between calls of items, keys and values)
+            self._extra = {}
+            self._store_many( array(keys, Int), array(posns, Float),
+                              array(unset, Int) )
+            self._extra = odd
+        if odd and len(self._keys):
+            # the values which are not positions replace ours at their keys
+            oddkeys = odd.keys()
+            oddkeys.sort()
+            oddkeys = array(oddkeys, Int)
+            i = minimum( searchsorted(oddkeys, self._keys), len(oddkeys) - 1 )
+            keep = not_equal( take(oddkeys, i), self._keys )
+            self._keys = compress(keep, self._keys)
+            self._posns = compress(keep, self._posns, 0)
+            self._unset = compress(keep, self._unset)
+        return
+
+    def set_posns(self):
+        """
+        Return a list of the objkeys at which we store positions (not
+        _UNSET_), and a list of copies of those positions, in the same
+        order.
+        """
+        self._compact()
+        isset = equal(self._unset, 0)
+        posns = compress(isset, self._posns, 0)
+        keys = compress(isset, self._keys).tolist()
+        posns = [+ posn for posn in posns]
+        for key, val in self._extra.iteritems():
+            if val is not _UNSET_:
+                keys.append(key)
+                posns.append(copy_val(val))
+        return keys, posns
+
+    def pack(self):
+        """
+        Compress our arrays into a string. Keys are stored as differences
+        from the previous key, and positions as the XOR of their bits
+        with those of the previous position, which is exact, and leaves
+        mostly zero bits for nearby atoms (since objkeys are allocated in
+        creation order, their positions tend to be nearby too).
+        """
+        if self._packed is not None or self._spilled is not None:
+            return
+        self._compact()
+        n = len(self._keys)
+        if not n:
+            return
+        keys = self._keys
+        deltas = concatenate(( keys[:1], keys[1:] - keys[:-1] ))
+        bits = reshape( fromstring(self._posns.tostring(), Int), (n, -1) )
+        bits = concatenate(( bits[:1], bitwise_xor(bits[1:], bits[:-1]) ))
+        self._packed = zlib.compress( deltas.tostring() +
+                                      bits.tostring() +
+                                      self._unset.astype(UnsignedInt8).tostring() )
+        self._npacked = n
+        self._keys = self._posns = self._unset = None
+        return
+
+    def spill(self, spillfile):
+        """
+        Pack our arrays (if necessary) and move them into spillfile
+        (an UndoSpillFile), leaving only a small record of where they are.
+        """
+        self.pack()
+        if self._packed is None:
+            return
+        offset, length = spillfile.write(self._packed)
+        self._spilled = (spillfile, offset, length)
+        self._packed = None
+        return
+
+    def _unpack(self):
+        """
+        Undo the effect of pack and spill, if they were called.
+        """
+        if self._spilled is not None:
+            spillfile, offset, length = self._spilled
+            self._packed = spillfile.read(offset, length)
+            self._spilled = None
+        if self._packed is None:
+            return
+        data = zlib.decompress(self._packed)
+        n = self._npacked
+        keybytes = n * _INT_SIZE
+        posnbytes = n * _POSN_SIZE
+        self._keys = add.accumulate( fromstring(data[:keybytes], Int) )
+        bits = reshape( fromstring(data[keybytes:keybytes + posnbytes], Int),
+                        (n, -1) )
+        bits = bitwise_xor.accumulate(bits)
+        self._posns = reshape( fromstring(bits.tostring(), Float), (n, 3) )
+        self._unset = fromstring(data[keybytes + posnbytes:],
+                                 UnsignedInt8).astype(Int)
+        self._packed = None
+        self._npacked = 0
+        return
+
+    def spilled_size(self):
+        if self._spilled is not None:
+            return self._spilled[2]
+        return 0
+
+    def RAM_usage_guess(self):
+        res = DiffObj.attrname_valsizes['_posn'] * len(self._extra)
+        if self._spilled is not None:
+            return res + 100
+        elif self._packed is not None:
+            return res + len(self._packed) + 100
+        # 8 bytes per key, 24 per position, 8 per unset flag
+        return res + 40 * len(self._keys)
+
+    pass # end of class PosnDiff
+
+_INT_SIZE = len(zeros((1,), Int).tostring())
+_POSN_SIZE = len(zeros((3,), Float).tostring())
+
+class UndoSpillFile:
+    """
+    An anonymous temporary file holding the packed arrays of PosnDiffs
+    which are spilled there (see PosnDiff.spill) to save RAM, until they're
+    next needed. The file is deleted when it's closed (or when the process
+    exits).
+
+    Space in the file is not reused, but once all the data written to it
+    has been read back, the file is truncated. (Data in spilled diffs which
+    are discarded without being unpacked, as when the redo stack is
+    cleared, stays in the file until it's closed.)
+    """
+    def __init__(self):
+        self._file = None
+        self._size = 0 # bytes in the file
+        self._live = 0 # bytes written but not yet read back
+    def write(self, data):
+        """
+        Append data (a string) to the file, and return (offset, length)
+        for passing to self.read.
+        """
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix = "ne1-undo-")
+        offset = self._size
+        self._file.seek(offset)
+        self._file.write(data)
+        self._size += len(data)
+        self._live += len(data)
+        return offset, len(data)
+    def read(self, offset, length):
+        """
+        Return the data written at offset by self.write. This must be
+        called at most once for each call of write.
+        """
+        self._file.seek(offset)
+        data = self._file.read(length)
+        assert len(data) == length, \
+               "undo spill file is missing data (%d of %d bytes at %d)" % \
+               (len(data), length, offset)
+        self._live -= length
+        if not self._live:
+            self._file.seek(0)
+            self._file.truncate()
+            self._size = 0
+        return data
+    def size(self):
+        """
+        Return the size of the file, in bytes.
+        """
+        return self._size
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._size = self._live = 0
+        return
+    pass # end of class UndoSpillFile
+
 # ==
 
 # Terminology/spelling note: in comments, we use "class" for python classes, "clas" for Classification objects.
@@ -14,20 +14,24 @@ providing undo/redo ops which apply those diffs to the model state.
 """
 
 import time
+import weakref
 from utilities import debug_flags
 from utilities.debug import print_compact_traceback, print_compact_stack, safe_repr
 from utilities.debug_prefs import debug_pref, Choice_boolean_False, Choice_boolean_True
+from utilities.GlobalPreferences import debug_pref_undo_skip_unchanged_node_scan
 import foundation.env as env
 
 import foundation.state_utils as state_utils
 from foundation.state_utils import objkey_allocator, obj_classifier, diff_and_copy_state
 from foundation.state_utils import transclose, StatePlace, StateSnapshot
+from foundation.state_utils import PosnDiff, UndoSpillFile
 
 from foundation.state_constants import _UNSET_
 from foundation.state_constants import UNDO_SPECIALCASE_ATOM, UNDO_SPECIALCASE_BOND
 from foundation.state_constants import ATOM_CHUNK_ATTRIBUTE_NAME
 
 from utilities.prefs_constants import historyMsgSerialNumber_prefs_key
+from utilities.prefs_constants import undoStackMemoryLimit_prefs_key
 from foundation.changes import register_postinit_object
 import foundation.changedicts as changedicts # warning: very similar to some local variable names
 
@@ -164,6 +168,8 @@ def assy_become_state(self, stateplace, archive):
         print "assy_become_state begin, chg ctrs =", \
               archive.assy.all_change_indicators()
 
+    call_pre_scan_updaters() # before we store into the attrs they store into
+
     try:
         assy_become_scanned_state(archive, self, stateplace)
             # that either does self.update_parts()
@@ -358,6 +364,11 @@ def mash_attrs( archive, attrdicts, modified, invalmols, differential = False ):
         attr, acode = attrcode
         might_have_undo_setattr = attrcodes_with_undo_setattr.has_key(attrcode)
             #060404; this matters now (for hotspot)
+        if differential and isinstance(dict1, PosnDiff) and \
+           not might_have_undo_setattr and \
+           not archive.attrcode_is_Atom_chunk(attrcode):
+            _mash_attrs_posns(archive, attr, dict1, modified)
+            continue
         for key, val in dict1.iteritems(): # maps objkey to attrval
             obj = modified_get(key)
             if obj is None:
@@ -466,6 +477,29 @@ def mash_attrs( archive, attrdicts, modified, invalmols, differential = False ):
 
 # ==
 
+def _mash_attrs_posns(archive, attr, dict1, modified): #bruce 090312
+    """
+    Special case for differential mash_attrs when dict1 is a PosnDiff
+    (holding new atom positions, or _UNSET_ for atoms which are not alive
+    in the new state): store all the new positions at once.
+    (Private helper function for mash_attrs.)
+    """
+    obj4key = archive.obj4key
+    keys, posns = dict1.set_posns() # (posns are already copies)
+    if _undo_debug_obj is None:
+        for key, posn in zip(keys, posns):
+            obj = obj4key[key]
+            modified[key] = obj
+            setattr(obj, attr, posn)
+    else:
+        for key, posn in zip(keys, posns):
+            obj = obj4key[key]
+            modified[key] = obj
+            if obj is _undo_debug_obj:
+                _undo_debug_message("undo/redo: %r.%s = %r" % (obj, attr, posn))
+            setattr(obj, attr, posn)
+    return
+
 def _mash_attrs_Atom_chunk(key, obj, attrname, val, modified, invalmols):
     """
     Special case for differential mash_attrs when changing an
@@ -829,6 +863,36 @@ def call_registered_undo_updaters(archive):
         continue
     return # from call_registered_undo_updaters
 
+pre_scan_updaters = []
+
+def register_pre_scan_updater( func): #bruce 090326
+    """
+    Register func (which takes no arguments) to be called before Undo
+    scans or restores the model state, for example to store attribute values
+    which are kept somewhere else between checkpoints (for speed) into the
+    attributes Undo scans.
+
+    Such a func must not change anything else which Undo tracks.
+    """
+    pre_scan_updaters.append(func)
+    return
+
+def call_pre_scan_updaters():
+    """
+    [private helper for current_state, update_before_checkpoint, and
+     assy_become_state]
+    Call the funcs registered with register_pre_scan_updater.
+    """
+    for func in pre_scan_updaters:
+        try:
+            func()
+        except:
+            msg = "exception in some registered pre-scan updater %s; " \
+                  "skipping it: " % safe_repr(func)
+            print_compact_traceback( msg)
+        continue
+    return
+
 def final_post_undo_updates(archive):
     #060409 seems likely to be safe/sufficient for differential mash_attrs ##k
     """
@@ -1313,6 +1377,7 @@ def current_state(archive, assy, **options):
         if debug_pref("simulate bug in next undo checkpoint", Choice_boolean_False, prefs_key = pkey):
             env.prefs[pkey] = False
             assert 0, "this simulates a bug in this undo checkpoint"
+        call_pre_scan_updaters()
         data = mmp_state_from_assy(archive, assy, **options)
         assert isinstance( data, StateSnapshot) ###k [this is just to make sure i am right about it -- i'm not 100% sure it's true - bruce 060407]
     except:
@@ -1483,6 +1548,12 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         self.all_changed_Atoms = {} # atom.key -> atom, for all changed Atoms (all attrs lumped together; this could be changed)
         self.all_changed_Bonds = {} # id(bond) -> bond, for all changed Bonds (all attrs)
         self.ourdicts = (self.all_changed_Atoms, self.all_changed_Bonds,) #e use this more
+        self._filled_cps = [] # weakrefs to our filled checkpoints, oldest first [bruce 090313]
+        self._nonatom_change_indicator_at_last_scan = None
+            # assy.nonatom_change_indicator() when we last scanned all
+            # undoable objects, or None if we must do that next time
+            # [bruce 090316]
+        self._spillfile = UndoSpillFile() # where old diffs go when we're over budget
         # rest of init is done later, by self.initial_checkpoint, when caller is more ready [060223]
         ###e not sure were really initialized enough to return... we'll see
         return
@@ -1535,6 +1606,8 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         self.current_diff = None
         self.next_cp = None
         self.stored_ops = {}
+        self._filled_cps = []
+        self._spillfile.close()
         self.objkey_allocator.clear() # after this, all existing keys (in diffs or checkpoints) are nonsense...
         # ... so we'd better get rid of them (above and here):
         self._undo_archive_initialized = False
@@ -1572,7 +1645,9 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         cursnap = current_state(self, assy, initial = True, **self.format_options)
              # initial = True is ignored; obs cmt: it's a kluge to pass initial; revise to detect this in assy itself
         state = StatePlace(cursnap) #####k this is the central fix of the initial-state kluge [060407]
+        self._nonatom_change_indicator_at_last_scan = assy.nonatom_change_indicator()
         fill_checkpoint(cp, state, assy)
+        self._filled_cps.append( weakref.ref(cp) )
         if self.pref_report_checkpoints():
             self.debug_histmessage("(initial checkpoint: %r)" % cp)
         self.last_cp = self.initial_cp = cp
@@ -1839,6 +1914,8 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         self.next_cp = self.last_cp = self.initial_cp = None
         self.assy = None
         self.stored_ops = {} #e more, if it can contain any cycles -- design was that it wouldn't, but true situation not reviewed lately [060301]
+        self._filled_cps = []
+        self._spillfile.close()
         self.current_diff = None #e destroy it first?
         self.objkey_allocator.destroy()
         self.objkey_allocator = None
@@ -1886,6 +1963,10 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         # (caller has just stored archived state into model). (This should remove a big slowdown of the first operation after Undo or Redo.) [bruce 060407]
         self.clear_changed_object_sets()
 
+        # The nodes were also modified without our knowledge, and the _childobj_dict
+        # of the restored snapshot is gone, so the next checkpoint must scan them all. [bruce 090316]
+        self._nonatom_change_indicator_at_last_scan = None
+
         # not sure this is right, but it's simplest that could work, plus some attempts to clean up unused objects:
         self.current_diff.destroy() # just to save memory; might not be needed (probably refdecr would take care of it) since no ops stored from it yet
         self.last_cp.end_of_undo_chain_for_awhile = True # not used by anything, but might help with debugging someday; "for awhile" because we might Redo to it
@@ -1955,6 +2036,8 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         #bruce 060313: we no longer need to update mol.atpos for every chunk. See comments in chunk.py docstring about atom.index.
         # [removed commented-out code for it, 060314]
 
+        call_pre_scan_updaters() #bruce 090326
+
 # this was never tested -- it would be needed for _s_attr__hotspot,
 # but I changed to _s_attr_hotspot and _undo_setattr_hotspot instead [060404]
 ##        chunks = self.assy.allNodes(Chunk) # note: this covers all Parts, whereas assy.molecules only covers the current Part
@@ -2107,7 +2190,12 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
                 else:
                     #060228
                     assert self.format_options == dict(use_060213_format = True), "nim for mmp kluge code" #e in fact, remove that code when new bugs gone
-                    state = diff_and_copy_state(self, self.assy, self.last_cp.state)
+                    nonatom_cc = self.assy.nonatom_change_indicator()
+                    scan_childobjs = (nonatom_cc != self._nonatom_change_indicator_at_last_scan or
+                                      not debug_pref_undo_skip_unchanged_node_scan())
+                    state = diff_and_copy_state(self, self.assy, self.last_cp.state,
+                                                scan_childobjs = scan_childobjs )
+                    self._nonatom_change_indicator_at_last_scan = nonatom_cc
 #obs, it's fixed now [060301]
 ##                        # note: last_cp.state is no longer current after an Undo!
 ##                        # so this has a problem when we're doing the end-cmd checkpoint after an Undo command.
@@ -2159,6 +2247,9 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
                 self.current_diff.suppress_storing_undo_redo_ops = True # (this is not the only way this flag can be set)
                     # I'm not sure this is right, but as long as varid_vers are the same, or states equal, it seems to make sense... #####@@@@@
             fill_checkpoint(self.next_cp, state, self.assy) # stores self.assy.all_change_indicators() onto it -- do that here, for clarity?
+            if really_changed:
+                self._filled_cps.append( weakref.ref(self.next_cp) )
+                self._enforce_undo_memory_budget()
                 #e This will be revised once we incrementally track some changes - it won't redundantly grab unchanged state,
                 # though it's likely to finalize and compress changes in some manner, or grab changed parts of the state.
                 # It will also be revised if we compute diffs to save space, even for changes not tracked incrementally.
@@ -2193,8 +2284,112 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
     ##        self.last_cp_arrival_reason = cptype # affects semantics of Undo/Redo user-level ops
     ##            # (this is not redundant, since it might differ if we later revisit same cp as self.last_cp)
             self._setup_next_cp() # sets self.next_cp and self.current_diff
+            if really_changed and self.pref_report_memory_usage():
+                self.debug_histmessage( "(undo memory: %s)" %
+                                        self.describe_undo_memory_usage() )
+        return
+
+    # == undo memory budget [bruce 090313]
+
+    # Diffs between the last few checkpoints are left alone, since they're
+    # the ones most likely to be undone, and the newest one can still be
+    # modified by merging.
+    _N_UNCOMPRESSED_DIFFS = 4
+
+    def _live_diffs(self):
+        """
+        [private helper for _enforce_undo_memory_budget and undo_memory_usage]
+        Return a list of (cp, diff) pairs, newest cp first, for the
+        DiffObjs which let our filled checkpoints' states be reconstructed
+        from the current one (each of which is stored on the StatePlace
+        of one checkpoint). Forget checkpoints which no longer exist.
+        """
+        cps = []
+        refs = []
+        for ref in self._filled_cps:
+            cp = ref()
+            if cp is not None:
+                cps.append(cp)
+                refs.append(ref)
+        self._filled_cps = refs
+        res = []
+        places_seen = {}
+        cps.reverse()
+        for cp in cps:
+            place = cp.state
+            if places_seen.has_key(id(place)):
+                # (a cp filled when nothing changed shares the prior cp's state)
+                continue
+            places_seen[id(place)] = place
+            if place.diff_and_place is not None:
+                res.append( (cp, place.diff_and_place[0]) )
+        return res
+
+    def _enforce_undo_memory_budget(self):
+        """
+        Keep the RAM used by our undo diffs within the limit set in the
+        preferences dialog (undoStackMemoryLimit_prefs_key, in megabytes),
+        by compressing the atom positions stored in older diffs once
+        they use over half of it, and moving them into a temporary file
+        once they use all of it. They're restored when Undo needs them.
+
+        Note that only position diffs (usually most of the undo stack,
+        after dragging or minimizing) are compressed; other diffs refer
+        to live objects and can't be.
+        """
+        budget = env.prefs[undoStackMemoryLimit_prefs_key] * 1024 * 1024
+        if budget <= 0:
+            return
+        total = 0
+        spillfile = self._spillfile
+        for i, (cp, diff) in enumerate(self._live_diffs()):
+            if i >= self._N_UNCOMPRESSED_DIFFS:
+                if total + diff.RAM_usage_guess() > budget:
+                    diff.spill(spillfile)
+                elif total > budget / 2:
+                    diff.compress()
+            total += diff.RAM_usage_guess()
         return
 
+    def undo_memory_usage(self):
+        """
+        Return a list of (cp, ram, spilled) triples, newest cp first,
+        giving our guess about the RAM used by the diff stored on each of
+        our checkpoints, and the number of bytes of it spilled to our
+        temporary file, followed by the totals of those and the size
+        of that file.
+
+        @note: for debugging and performance measurement.
+        """
+        res = []
+        total_ram = total_spilled = 0
+        for cp, diff in self._live_diffs():
+            ram = diff.RAM_usage_guess()
+            spilled = diff.spilled_size()
+            res.append( (cp, ram, spilled) )
+            total_ram += ram
+            total_spilled += spilled
+        return res, total_ram, total_spilled, self._spillfile.size()
+
+    def describe_undo_memory_usage(self):
+        """
+        Return a short summary of self.undo_memory_usage().
+        """
+        per_cp, total_ram, total_spilled, filesize = self.undo_memory_usage()
+        return "%d diffs, %d bytes in RAM, %d bytes spilled (file size %d)" % \
+               (len(per_cp), total_ram, total_spilled, filesize)
+
+    def pref_report_memory_usage(self):
+        """
+        whether to report the undo stack's memory usage after each
+        checkpoint which sees any changes
+        """
+        res = debug_pref("undo/report memory use", Choice_boolean_False,
+                         prefs_key = True)
+        return res
+
+    # ==
+
     def clear_redo_stack( self, from_cp = None, except_diff = None ): #060309 (untested)
         "#doc"
         #e scan diff+1s from from_cp except except_diff, thinking of diffs as edges, cp's or their indices as nodes.
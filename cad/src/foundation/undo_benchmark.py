@@ -0,0 +1,107 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+undo_benchmark.py -- time Undo checkpoints after dragging one atom,
+for models of various sizes, with and without
+debug_pref_undo_skip_unchanged_node_scan, without a GUI.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py foundation/undo_benchmark.py [file.mmp ...]
+
+With no files, models of several sizes are made up, each consisting of
+chunks of 100 unbonded carbon atoms.
+
+For each model, one atom is moved a little at a time, with an undo
+checkpoint after each move (as happens while dragging it), and the
+average time per checkpoint is printed for each setting of the pref.
+With the pref on, that time should hardly depend on the model size.
+"""
+
+import sys
+import time
+
+from geometry.VQT import V
+
+import foundation.env as env
+
+from utilities.debug_prefs import debug_pref_object
+from utilities.GlobalPreferences import debug_pref_undo_skip_unchanged_node_scan
+
+_ATOMS_PER_CHUNK = 100
+
+_MODEL_SIZES = (1000, 10000, 50000)
+
+_NSTEPS = 20 # checkpoints per drag
+
+def _make_model(natoms):
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom
+    assy = Assembly(None)
+    part = assy.part
+    nchunks = (natoms + _ATOMS_PER_CHUNK - 1) / _ATOMS_PER_CHUNK
+    for i in range(nchunks):
+        chunk = Chunk(assy, "chunk-%d" % i)
+        for j in range(_ATOMS_PER_CHUNK):
+            Atom('C', V(i * 10.0, (j / 10) * 1.5, (j % 10) * 1.5), chunk)
+        part.addmol(chunk)
+    return assy
+
+def _read_model(filename):
+    from model.assembly import Assembly
+    from files.mmp.files_mmp import readmmp
+    assy = Assembly(None)
+    readmmp(assy, filename, isInsert = True)
+    return assy
+
+def _time_drag(assy, skip_scan):
+    """
+    Return the average time per checkpoint for a drag of one atom
+    in assy, with the given setting of the pref.
+    """
+    from foundation.undo_archive import AssyUndoArchive
+    prefs_key = debug_pref_object(
+        "Undo: only scan changed atoms when possible?" ).prefs_key
+    old = env.prefs[prefs_key]
+    env.prefs[prefs_key] = skip_scan
+    try:
+        archive = AssyUndoArchive(assy)
+        archive.initial_checkpoint()
+        atom = assy.part.molecules[0].atoms.values()[0]
+        total = 0.0
+        for i in range(_NSTEPS):
+            atom.setposn(atom.posn() + V(0.1, 0, 0))
+            t0 = time.time()
+            archive.checkpoint( cptype = 'end_cmd' )
+            total += time.time() - t0
+            if not archive.last_cp.state.really_changed:
+                print "bug: checkpoint didn't notice the atom was moved"
+        archive.destroy()
+    finally:
+        env.prefs[prefs_key] = old
+    return total / _NSTEPS
+
+def _run(filenames):
+    debug_pref_undo_skip_unchanged_node_scan() # register it, so debug_pref_object works
+    if filenames:
+        models = [(filename, _read_model(filename)) for filename in filenames]
+    else:
+        models = [("%d atoms" % natoms, _make_model(natoms))
+                  for natoms in _MODEL_SIZES]
+    for name, assy in models:
+        natoms = sum([len(mol.atoms) for mol in assy.part.molecules])
+        print "%s: %d chunks, %d atoms" % \
+              (name, len(assy.part.molecules), natoms)
+        for skip_scan in (False, True):
+            t = _time_drag(assy, skip_scan)
+            print "  skip node scan %-5s: %.2f msec per checkpoint" % \
+                  (skip_scan, t * 1000)
+    return
+
+if __name__ == '__main__':
+    _run(sys.argv[1:])
+
+# end
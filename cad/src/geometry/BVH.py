@@ -0,0 +1,143 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+BVH.py -- a bounding volume hierarchy over axis-aligned boxes (or points),
+built and queried with whole-array operations, for finding which items
+a line (such as the line of sight under the mouse) might pass through.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+This is a "linear BVH": items are sorted along a Morton (Z-order) curve
+through the centers of their boxes, grouped in that order into leaves of
+a fixed number of items, and the leaves are made into a complete binary
+tree, each level of which is stored as two arrays of box corners. So
+building one takes a sort and a few reductions, and a query tests all the
+nodes it reaches at one level of the tree at once, descending only into
+the children of the nodes the line passes through.
+
+Items are referred to by their indices in the arrays the BVH was built
+from. A BVH can't be modified; when its items move, make a new one.
+
+Nothing here knows about atoms or chunks; see Chunk.findAtomUnderMouse
+and ops_select_Mixin.findAtomUnderMouse for the callers.
+"""
+
+from Numeric import array, zeros, reshape, take, compress, concatenate
+from Numeric import add, minimum, maximum, less, less_equal, absolute
+from Numeric import left_shift, bitwise_or, bitwise_and, arange, argsort
+from Numeric import where, Float, Int
+
+_LEAFSIZE = 32
+
+_MORTON_BITS = 10 # per axis, so codes fit in 30 bits
+
+_TINY = 1e-12 # smallest direction component we divide by
+
+def _spread_bits(x):
+    """
+    Return the integers in the array x (each less than 2**10) with their
+    bits spread out so that there are two zero bits between each of them.
+    """
+    x = bitwise_and(bitwise_or(x, left_shift(x, 16)), 0x030000FF)
+    x = bitwise_and(bitwise_or(x, left_shift(x, 8)), 0x0300F00F)
+    x = bitwise_and(bitwise_or(x, left_shift(x, 4)), 0x030C30C3)
+    x = bitwise_and(bitwise_or(x, left_shift(x, 2)), 0x09249249)
+    return x
+
+def morton_codes(points):
+    """
+    Return an array of the Morton (Z-order) codes of an (N,3) array of
+    points, quantized in their bounding box, so that sorting by code puts
+    nearby points mostly near each other.
+    """
+    lo = minimum.reduce(points)
+    span = max(maximum.reduce(points) - lo)
+    if span <= 0.0:
+        span = 1.0
+    scale = ((1 << _MORTON_BITS) - 1) / span
+    q = ((points - lo) * scale).astype(Int)
+    return bitwise_or(bitwise_or(_spread_bits(q[:, 0]),
+                                 left_shift(_spread_bits(q[:, 1]), 1)),
+                      left_shift(_spread_bits(q[:, 2]), 2))
+
+class BVH(object):
+    """
+    A bounding volume hierarchy over N axis-aligned boxes, given as (N,3)
+    arrays of their low and high corners (which may be the same array,
+    for points).
+    """
+    def __init__(self, lo, hi, leafsize = _LEAFSIZE):
+        lo = array(lo, Float)
+        hi = array(hi, Float)
+        assert lo.shape == hi.shape
+        n = len(lo)
+        self._count = n
+        self._leafsize = leafsize
+        self._levels = [] # (lo, hi) arrays for each level, root first
+        if not n:
+            self._order = zeros((0,), Int)
+            return
+        order = argsort(morton_codes((lo + hi) * 0.5))
+        nleaves = (n + leafsize - 1) / leafsize
+        npadded = 1
+        while npadded < nleaves:
+            npadded *= 2
+        # pad the last leaf, and the empty ones after it, with copies of the
+        # last item, so every leaf is full without making any box bigger
+        padding = npadded * leafsize - n
+        if padding:
+            order = concatenate((order, [order[-1]] * padding))
+        self._order = order
+        node_lo = minimum.reduce(
+            reshape(take(lo, order, 0), (npadded, leafsize, 3)), 1)
+        node_hi = maximum.reduce(
+            reshape(take(hi, order, 0), (npadded, leafsize, 3)), 1)
+        levels = [(node_lo, node_hi)]
+        while len(node_lo) > 1:
+            node_lo = minimum(node_lo[0::2], node_lo[1::2])
+            node_hi = maximum(node_hi[0::2], node_hi[1::2])
+            levels.append((node_lo, node_hi))
+        levels.reverse()
+        self._levels = levels
+        return
+
+    def __len__(self):
+        return self._count
+
+    def line_query(self, point, direction, margin = 0.0):
+        """
+        Return an array of the indices of the items whose boxes, expanded
+        by margin on every side, the infinite line through point in the
+        given direction passes through (or might, since the test is done
+        in floating point -- callers should still check the items exactly).
+        Indices are in no particular order.
+        """
+        if not self._count:
+            return zeros((0,), Int)
+        direction = array(direction, Float)
+        direction = where(less(absolute(direction), _TINY),
+                          _TINY, direction)
+        inverse = 1.0 / direction
+        point = array(point, Float)
+        nodes = zeros((1,), Int) # the root
+        for level in range(len(self._levels)):
+            level_lo, level_hi = self._levels[level]
+            if level:
+                # the children of the nodes which passed at the last level
+                nodes = concatenate((2 * nodes, 2 * nodes + 1))
+            t1 = (take(level_lo, nodes, 0) - margin - point) * inverse
+            t2 = (take(level_hi, nodes, 0) + margin - point) * inverse
+            near = maximum.reduce(minimum(t1, t2), 1)
+            far = minimum.reduce(maximum(t1, t2), 1)
+            nodes = compress(less_equal(near, far), nodes)
+            if not len(nodes):
+                return zeros((0,), Int)
+        leafsize = self._leafsize
+        slots = add.outer(nodes * leafsize, arange(leafsize)).flat
+        # (the padding slots are all at the end, past the real items)
+        slots = compress(less(slots, self._count), slots)
+        return take(self._order, slots)
+
+    pass # end of class BVH
+
+# end
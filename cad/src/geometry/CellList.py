@@ -0,0 +1,406 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+CellList.py -- array-backed spatial hashing of points into cubic cells,
+for fast "what's near here" and "which pairs are close" queries.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Points are stored by index in a Numeric array of positions, so large
+point sets can be built, and all their close pairs found, using a few
+whole-array operations rather than one Python operation per point.
+Points can also be added, moved or discarded one at a time afterwards.
+
+Nothing here knows about atoms; see NeighborhoodGenerator.py for the
+atom-level interface used by most callers.
+"""
+
+from Numeric import array, zeros, floor, Float, Int
+from Numeric import add, less, greater, minimum, maximum
+from Numeric import argsort, take, compress, repeat, searchsorted
+from Numeric import arange, concatenate, not_equal, clip, less_equal
+
+_MIN_CAPACITY = 16
+
+# The 13 "forward" neighbor cell offsets; together with the cell itself,
+# these visit each unordered pair of adjacent cells exactly once.
+_HALF_SHELL = [(dx, dy, dz)
+               for dx in (-1, 0, 1)
+               for dy in (-1, 0, 1)
+               for dz in (-1, 0, 1)
+               if (dx, dy, dz) > (0, 0, 0)]
+
+def _as_positions(positions):
+    """
+    Return positions (any sequence of 3-vectors, or an (N,3) array)
+    as an (N,3) Numeric Float array.
+    """
+    if not len(positions):
+        return zeros((0, 3), Float)
+    return array(positions, Float)
+
+def _runs_to_pairs(lo, hi):
+    """
+    Given arrays lo and hi of the same length n, where the kth element
+    has the run of sorted points lo[k] .. hi[k] - 1 as its candidates
+    (an empty run if hi[k] <= lo[k]), return (first, second), arrays
+    of the same length listing every (k, candidate) pair.
+    """
+    counts = hi - lo
+    counts = counts * greater(counts, 0)
+    total = int(add.reduce(counts))
+    if not total:
+        empty = zeros((0,), Int)
+        return empty, empty
+    first = repeat(arange(len(lo)), counts, 0)
+    # position of each candidate within its run, from 0
+    run_starts = add.accumulate(counts) - counts
+    within = arange(total) - repeat(run_starts, counts, 0)
+    second = take(lo, first, 0) + within
+    return first, second
+
+class CellList(object):
+    """
+    A set of points in space, indexed by the integers 0 .. n-1 in the order
+    they were added, bucketed into cubic cells of edge cellsize so that any
+    query with a radius no larger than cellsize only needs to look in the
+    27 cells around its center.
+
+    Discarded points keep their index (which is never reused), but are
+    no longer returned by queries.
+    """
+    def __init__(self, positions, cellsize):
+        """
+        @param positions: initial points, as a sequence of 3-vectors or an
+                          (N,3) array. They get indices 0 .. N-1.
+
+        @param cellsize: edge length of the cubic cells; this is the largest
+                         radius which queries can use.
+        """
+        assert cellsize > 0
+        self._cellsize = 1.0 * cellsize
+        positions = _as_positions(positions)
+        n = len(positions)
+        self._count = n
+        self._positions = zeros((max(n, _MIN_CAPACITY), 3), Float)
+        self._positions[:n] = positions
+        self._alive = zeros((max(n, _MIN_CAPACITY),), Int)
+        self._alive[:n] = 1
+        self._n_discarded = 0
+        self._cellkeys = [] # index -> cell key (an (i, j, k) tuple)
+        self._buckets = {} # cell key -> list of indices
+        self._sorted = None # see _sorted_points
+        if n:
+            self._bulk_add(positions)
+        return
+
+    def __len__(self):
+        """
+        Return the number of points which have not been discarded.
+        """
+        return self._count - self._n_discarded
+
+    def _cells(self, positions):
+        """
+        Return the integer cell coordinates of an (N,3) array of positions,
+        as an (N,3) array.
+        """
+        return floor(positions / self._cellsize).astype(Int)
+
+    def _quantize(self, pos):
+        cellsize = self._cellsize
+        return (int(floor(pos[0] / cellsize)),
+                int(floor(pos[1] / cellsize)),
+                int(floor(pos[2] / cellsize)))
+
+    def _bulk_add(self, positions):
+        """
+        Bucket all of the initial points, by sorting them by cell rather
+        than hashing them one at a time.
+        """
+        n = len(positions)
+        cells = self._cells(positions)
+        ids = self._linear_cell_ids(cells)[0]
+        order = argsort(ids)
+        sorted_ids = take(ids, order, 0)
+        # boundaries between runs of equal cell ids in sorted order
+        starts = compress(not_equal(sorted_ids[1:], sorted_ids[:-1]),
+                          arange(1, n), 0)
+        starts = concatenate(([0], starts)).tolist()
+        ends = starts[1:] + [n]
+        order = order.tolist()
+        cellkeys = map(tuple, cells.tolist())
+        buckets = self._buckets
+        for start, end in zip(starts, ends):
+            buckets[cellkeys[order[start]]] = order[start:end]
+        self._cellkeys = cellkeys
+        return
+
+    def _linear_cell_ids(self, cells):
+        """
+        Number the cells given by the rows of an (N,3) integer array of cell
+        coordinates, so that adjacent cells never share a number, and so
+        that moving by a given cell offset always changes the number by
+        the same amount.
+
+        @return: (ids, strides), where ids is an (N,) array of cell numbers,
+                 and strides are the increments of the cell number per
+                 unit step in x, y and z.
+        """
+        lo = minimum.reduce(cells) - 1 # pad by one cell on the low side
+        cells = cells - lo
+        hi = maximum.reduce(cells)
+        ny = int(hi[1]) + 2 # pad by one cell on the high side
+        nz = int(hi[2]) + 2
+        strides = (ny * nz, nz, 1)
+        ids = (cells[:, 0] * strides[0] +
+               cells[:, 1] * strides[1] +
+               cells[:, 2])
+        return ids, strides
+
+    # == incremental changes
+
+    def _grow(self):
+        capacity = len(self._alive)
+        if self._count < capacity:
+            return
+        positions = zeros((2 * capacity, 3), Float)
+        positions[:capacity] = self._positions
+        self._positions = positions
+        alive = zeros((2 * capacity,), Int)
+        alive[:capacity] = self._alive
+        self._alive = alive
+        return
+
+    def append(self, pos):
+        """
+        Add one point, and return its index.
+        """
+        self._grow()
+        self._sorted = None
+        index = self._count
+        self._count += 1
+        self._positions[index] = pos
+        self._alive[index] = 1
+        key = self._quantize(pos)
+        self._cellkeys.append(key)
+        self._buckets.setdefault(key, []).append(index)
+        return index
+
+    def move(self, index, pos):
+        """
+        Record a new position for the point with the given index.
+        """
+        assert self._alive[index], "can't move discarded point %d" % index
+        self._sorted = None
+        self._positions[index] = pos
+        key = self._quantize(pos)
+        oldkey = self._cellkeys[index]
+        if key != oldkey:
+            self._buckets[oldkey].remove(index)
+            self._buckets.setdefault(key, []).append(index)
+            self._cellkeys[index] = key
+        return
+
+    def discard(self, index):
+        """
+        Remove the point with the given index from future query results,
+        if it's not already removed.
+        """
+        if not self._alive[index]:
+            return
+        self._alive[index] = 0
+        self._sorted = None
+        self._n_discarded += 1
+        self._buckets[self._cellkeys[index]].remove(index)
+        return
+
+    def position(self, index):
+        return self._positions[index]
+
+    # == queries
+
+    def region(self, center, radius = None):
+        """
+        Return a list of the indices of all points closer than radius
+        (default cellsize, which is also the largest permitted radius)
+        to center.
+        """
+        if radius is None:
+            radius = self._cellsize
+        assert radius <= self._cellsize
+        get = self._buckets.get
+        indices = []
+        x0, y0, z0 = self._quantize(center)
+        for x in (x0 - 1, x0, x0 + 1):
+            for y in (y0 - 1, y0, y0 + 1):
+                for z in (z0 - 1, z0, z0 + 1):
+                    bucket = get((x, y, z))
+                    if bucket:
+                        indices.extend(bucket)
+        if not indices:
+            return indices
+        delta = take(self._positions, indices, 0) - center
+        dist2 = add.reduce(delta * delta, 1)
+        return compress(less(dist2, radius * radius), indices, 0).tolist()
+
+    def live_indices(self):
+        """
+        Return an array of the indices of all points not discarded.
+        """
+        alive = self._alive[:self._count]
+        indices = arange(self._count)
+        if self._n_discarded:
+            indices = compress(alive, indices, 0)
+        return indices
+
+    def pairs_within(self, cutoff = None):
+        """
+        Find every unordered pair of points closer than cutoff (default
+        cellsize, which is also the largest permitted cutoff) to each
+        other, using whole-array operations.
+
+        @return: (i, j, dist2), three arrays of the same length, where
+                 i[k] < j[k] are the indices of the kth pair of points and
+                 dist2[k] is the square of the distance between them.
+                 Pairs are in no particular order.
+        """
+        if cutoff is None:
+            cutoff = self._cellsize
+        assert cutoff <= self._cellsize
+        indices = self.live_indices()
+        n = len(indices)
+        if n < 2:
+            empty = zeros((0,), Int)
+            return empty, empty, zeros((0,), Float)
+        positions = take(self._positions, indices, 0)
+        cells = self._cells(positions)
+        ids, strides = self._linear_cell_ids(cells)
+        order = argsort(ids)
+        sorted_ids = take(ids, order, 0)
+        sorted_pos = take(positions, order, 0)
+        cutoff2 = cutoff * cutoff
+        result_i = []
+        result_j = []
+        result_d2 = []
+        for offset in [(0, 0, 0)] + _HALF_SHELL:
+            delta = (offset[0] * strides[0] +
+                     offset[1] * strides[1] +
+                     offset[2])
+            target = sorted_ids + delta
+            # for each point (in sorted order), the run of sorted points
+            # which lie in the target cell
+            lo = searchsorted(sorted_ids, target)
+            hi = searchsorted(sorted_ids, target + 1)
+            if delta == 0:
+                # same cell: only pair each point with later ones
+                lo = arange(n) + 1
+            first, second = _runs_to_pairs(lo, hi)
+            if not len(first):
+                continue
+            diff = take(sorted_pos, first, 0) - take(sorted_pos, second, 0)
+            dist2 = add.reduce(diff * diff, 1)
+            close = less(dist2, cutoff2)
+            result_i.append(compress(close, first, 0))
+            result_j.append(compress(close, second, 0))
+            result_d2.append(compress(close, dist2, 0))
+        if not result_i:
+            empty = zeros((0,), Int)
+            return empty, empty, zeros((0,), Float)
+        # map sorted positions back to point indices
+        original = take(indices, order, 0)
+        i = take(original, concatenate(result_i), 0)
+        j = take(original, concatenate(result_j), 0)
+        swap = greater(i, j)
+        i, j = i + swap * (j - i), j - swap * (j - i)
+        return i, j, concatenate(result_d2)
+
+    def _sorted_points(self):
+        """
+        Return (lo, top, strides, sorted_ids, sorted_indices, sorted_pos)
+        for all points not discarded, sorted by a linear cell number
+        (see _linear_cell_ids) of the box of cells from lo to top
+        (inclusive, as arrays of 3 integer cell coordinates), which is
+        one cell larger on each side than the cells of the points.
+        This is kept until a point is added, moved or discarded.
+        """
+        if self._sorted is None:
+            indices = self.live_indices()
+            positions = take(self._positions, indices, 0)
+            cells = self._cells(positions)
+            ids, strides = self._linear_cell_ids(cells)
+            lo = minimum.reduce(cells) - 1
+            top = maximum.reduce(cells) + 1
+            order = argsort(ids)
+            self._sorted = (lo, top, strides,
+                            take(ids, order, 0),
+                            take(indices, order, 0),
+                            take(positions, order, 0))
+        return self._sorted
+
+    def near_pairs(self, positions, cutoff = None):
+        """
+        Find every pair of a query position (from the sequence of 3-vectors
+        or (M,3) array positions) and a point no farther than cutoff
+        (default cellsize, which is also the largest permitted cutoff)
+        from it, using whole-array operations.
+
+        The points are sorted by cell once, and this is kept for later
+        queries until a point is added, moved or discarded; so it's fast
+        to query the same points many times, with different positions or
+        cutoffs.
+
+        @return: (q, i, dist2), three arrays of the same length, where
+                 q[k] is the index into positions and i[k] is the index
+                 of a point which are within cutoff of each other, and
+                 dist2[k] is the square of the distance between them.
+                 Pairs are in no particular order.
+        """
+        if cutoff is None:
+            cutoff = self._cellsize
+        assert cutoff <= self._cellsize
+        positions = _as_positions(positions)
+        if not len(positions) or not len(self):
+            empty = zeros((0,), Int)
+            return empty, empty, zeros((0,), Float)
+        lo, top, strides, sorted_ids, sorted_indices, sorted_pos = \
+            self._sorted_points()
+        # Query positions far from all points are moved to the edge of
+        # the box, so their cell numbers don't alias other cells; any
+        # points this makes them find are too far away to pass the
+        # distance test. (The box is one cell larger than the points'
+        # cells, so no close pair is affected.)
+        cells = clip(self._cells(positions), lo, top) - lo
+        ids = (cells[:, 0] * strides[0] +
+               cells[:, 1] * strides[1] +
+               cells[:, 2])
+        cutoff2 = cutoff * cutoff
+        result_q = []
+        result_i = []
+        result_d2 = []
+        for offset in [(0, 0, 0)] + _HALF_SHELL + \
+                [(-dx, -dy, -dz) for (dx, dy, dz) in _HALF_SHELL]:
+            delta = (offset[0] * strides[0] +
+                     offset[1] * strides[1] +
+                     offset[2])
+            target = ids + delta
+            first, second = _runs_to_pairs(
+                searchsorted(sorted_ids, target),
+                searchsorted(sorted_ids, target + 1))
+            if not len(first):
+                continue
+            diff = take(positions, first, 0) - take(sorted_pos, second, 0)
+            dist2 = add.reduce(diff * diff, 1)
+            close = less_equal(dist2, cutoff2)
+            result_q.append(compress(close, first, 0))
+            result_i.append(compress(close, second, 0))
+            result_d2.append(compress(close, dist2, 0))
+        if not result_q:
+            empty = zeros((0,), Int)
+            return empty, empty, zeros((0,), Float)
+        i = take(sorted_indices, concatenate(result_i), 0)
+        return concatenate(result_q), i, concatenate(result_d2)
+
+    pass # end of class CellList
+
+# end
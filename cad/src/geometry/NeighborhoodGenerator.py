@@ -15,7 +15,15 @@ as geometry (i.e. moving it into that source package)
 since it's essentially purely geometric (and could easily
 be generalized to be entirely so) -- all it assumes about
 "atoms" is that they have a few methods like .posn()
-and .is_singlet(), and it needs no imports from model.
+and .is_singlet(), and a .key attribute, and it needs no imports
+from model.
+
+NeighborhoodGenerator is now built on the array-backed CellList
+(see CellList.py), which buckets all the initial atoms with a few
+whole-array operations and can find all close pairs of atoms at once
+(see pairs()). The original dict-of-lists implementation is retained
+as DictNeighborhoodGenerator, for comparison (see the benchmark at
+the end of this file) and in case of bugs in the new one.
 """
 
 import struct
@@ -23,14 +31,95 @@ import struct
 from Numeric import floor
 
 from geometry.VQT import vlen
+from geometry.CellList import CellList
 
 # ==
 
+class NeighborhoodGenerator:
+    """
+    Given a list of atoms and a radius, be able to quickly take a
+    point and generate a neighborhood, which is a list of the atoms
+    within that radius of the point, or to generate all pairs of atoms
+    within that radius of each other.
+
+    Building the generator takes O(n) time (with a small constant, since
+    the atom positions are bucketed as one array), where n is the number
+    of atoms in the list. Generating a neighborhood around a point takes
+    O(1) time; generating all close pairs takes time proportional to
+    their number.
+    """
+    def __init__(self, atomlist, maxradius, include_singlets = False,
+                 positions = None):
+        """
+        @param positions: if provided, an (N,3) array or sequence of the
+                          positions of the atoms in atomlist (in the same
+                          order), saving the cost of calling atom.posn()
+                          on each one. Must not be provided unless
+                          include_singlets is true, or atomlist contains
+                          no singlets.
+        """
+        self._maxradius = 1.0 * maxradius
+        self.include_singlets = include_singlets
+        if not include_singlets and positions is None:
+            atomlist = [atom for atom in atomlist if not atom.is_singlet()]
+        self._atoms = atoms = list(atomlist)
+        self._indices = dict([(atom.key, i) for i, atom in enumerate(atoms)])
+        if positions is None:
+            positions = [atom.posn() for atom in atoms]
+        assert len(positions) == len(atoms)
+        self._cells = CellList(positions, self._maxradius)
+        return
+
+    def add(self, atom):
+        if self.include_singlets or not atom.is_singlet():
+            index = self._cells.append(atom.posn())
+            self._atoms.append(atom)
+            self._indices[atom.key] = index
+        return
+
+    def atom_moved(self, atom):
+        """
+        If an atom has been added to a neighborhood generator and
+        is later moved, this method must be called to refresh the
+        generator's position information. This only needs to be done
+        during the useful lifecycle of the generator.
+        """
+        self._cells.move(self._indices[atom.key], atom.posn())
+
+    def region(self, center):
+        """
+        Given a position in space, return the list of atoms that
+        are within the neighborhood radius of that position.
+        """
+        atoms = self._atoms
+        return [atoms[i] for i in self._cells.region(center)]
+
+    def pairs(self, cutoff = None):
+        """
+        Return a list of (atom1, atom2, distance) for every pair of
+        distinct atoms in self which are closer together than cutoff
+        (default and maximum, the neighborhood radius).
+        Each pair occurs only once, in no particular order.
+        """
+        i, j, dist2 = self._cells.pairs_within(cutoff)
+        atoms = self._atoms
+        return [(atoms[i1], atoms[j1], d2 ** 0.5)
+                for i1, j1, d2 in zip(i.tolist(), j.tolist(), dist2.tolist())]
+
+    def remove(self, atom):
+        index = self._indices.pop(atom.key, None)
+        if index is not None:
+            self._cells.discard(index)
+        return
+
+    pass # end of class NeighborhoodGenerator
+
+# ==
 
 # This is an order(N) operation that produces a function which gets a
 # list of potential neighbors in order(1) time. This is handy for
 # inferring bonds for PDB files that lack any bonding information.
-class NeighborhoodGenerator:
+class DictNeighborhoodGenerator:
     """
     Given a list of atoms and a radius, be able to quickly take a
     point and generate a neighborhood, which is a list of the atoms
@@ -103,13 +192,66 @@ class NeighborhoodGenerator:
                         lst += filter(closeEnough, buckets[key])
         return lst
 
-    def remove(self, atom):
-        key = self._quantize(atom.posn())
+    def remove(self, atom, _pack = struct.pack):
+        key = _pack('lll', *self._quantize(atom.posn()))
         try:
             self._buckets[key].remove(atom)
         except:
             pass
 
-    pass # end of class NeighborhoodGenerator
+    pass # end of class DictNeighborhoodGenerator
+
+# ==
+
+def _benchmark(sizes = (10000, 100000, 1000000), maxradius = 2.0):
+    """
+    Compare the time to build each kind of generator for random atoms
+    (at roughly the density of atoms in condensed matter), and to find
+    every atom's neighborhood with it.
+
+    Run this from cad/src as ./ExecSubDir.py geometry/NeighborhoodGenerator.py
+    """
+    import random
+    import time
+    from geometry.VQT import V
+
+    class _FakeAtom(object):
+        def __init__(self, key, pos):
+            self.key = key
+            self._posn = pos
+        def posn(self):
+            return self._posn
+        def is_singlet(self):
+            return False
+        pass
+
+    for n in sizes:
+        side = (n * 10.0) ** (1.0 / 3) # about 0.1 atoms per cubic Angstrom
+        atoms = [_FakeAtom(key, V(random.uniform(0, side),
+                                  random.uniform(0, side),
+                                  random.uniform(0, side)))
+                 for key in xrange(n)]
+        for klass in (DictNeighborhoodGenerator, NeighborhoodGenerator):
+            t0 = time.time()
+            ngen = klass(atoms, maxradius)
+            t1 = time.time()
+            npairs = 0
+            for atom in atoms:
+                npairs += len(ngen.region(atom.posn()))
+            t2 = time.time()
+            print "%s, %d atoms: build %.2f sec, %d region() calls %.2f sec" % \
+                  (klass.__name__, n, t1 - t0, n, t2 - t1)
+            continue
+        t0 = time.time()
+        pairs = ngen.pairs()
+        t1 = time.time()
+        print "NeighborhoodGenerator, %d atoms: pairs() %.2f sec " \
+              "(%d pairs, vs %d from region())" % \
+              (n, t1 - t0, len(pairs), (npairs - n) / 2)
+        continue
+    return
+
+if __name__ == '__main__':
+    _benchmark()
 
 # end
@@ -428,24 +428,31 @@ class Q(DataMixin):
     def __len__(self):
         return 4
 
-    def __add__(self, q1): # TODO: optimize using self.vec, q1.vec
+    def __add__(self, q1):
         """
         Q + Q1 is the quaternion representing the rotation achieved
         by doing Q and then Q1.
         """
-        return Q(q1.w*self.w - q1.x*self.x - q1.y*self.y - q1.z*self.z,
-                 q1.w*self.x + q1.x*self.w + q1.y*self.z - q1.z*self.y,
-                 q1.w*self.y - q1.x*self.z + q1.y*self.w + q1.z*self.x,
-                 q1.w*self.z + q1.x*self.y - q1.y*self.x + q1.z*self.w)
-
-    def __iadd__(self, q1): # TODO: optimize using self.vec, q1.vec
+        #bruce 090326 optimized using self.vec, q1.vec
+        # (avoiding 32 __getattr__ calls; same formula as before)
+        w, x, y, z = self.vec
+        w1, x1, y1, z1 = q1.vec
+        return Q(w1*w - x1*x - y1*y - z1*z,
+                 w1*x + x1*w + y1*z - z1*y,
+                 w1*y - x1*z + y1*w + z1*x,
+                 w1*z + x1*y - y1*x + z1*w)
+
+    def __iadd__(self, q1):
         """
         this is self += q1
         """
-        temp = V(q1.w*self.w - q1.x*self.x - q1.y*self.y - q1.z*self.z,
-                 q1.w*self.x + q1.x*self.w + q1.y*self.z - q1.z*self.y,
-                 q1.w*self.y - q1.x*self.z + q1.y*self.w + q1.z*self.x,
-                 q1.w*self.z + q1.x*self.y - q1.y*self.x + q1.z*self.w)
+        #bruce 090326 optimized like __add__
+        w, x, y, z = self.vec
+        w1, x1, y1, z1 = q1.vec
+        temp = V(w1*w - x1*x - y1*y - z1*z,
+                 w1*x + x1*w + y1*z - z1*y,
+                 w1*y - x1*z + y1*w + z1*x,
+                 w1*z + x1*y - y1*x + z1*w)
         self.vec = temp
 
         self.counter -= 1
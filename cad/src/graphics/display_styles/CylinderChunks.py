@@ -106,15 +106,38 @@ class CylinderChunks(ChunkDisplayMode):
         If the real work can depend on more than chunk's ordinary appearance can, the access would need to be in drawchunk;
         otherwise it could be in drawchunk or in this method compute_memo.
         """
+        return self.compute_memo_from_inputs( self.memo_inputs(chunk))
+
+    # compute_memo is split into these parts so most of it can run in a
+    # worker thread [bruce 090325]
+
+    compute_memo_in_background = True
+
+    def memo_inputs(self, chunk):
+        """
+        Return what compute_memo_from_inputs needs to know about chunk.
+        """
         # for this example, we'll turn the chunk axes into a cylinder.
         # Since chunk.axis is not always one of the vectors chunk.evecs (actually chunk.poly_evals_evecs_axis[2]),
         # it's best to just use the axis and center, then recompute a bounding cylinder.
         if not chunk.atoms:
             return None
         axis = chunk.axis
-        axis = norm(axis) # needed (unless we're sure it's already unit length, which is likely)
         center = chunk.center
         points = chunk.atpos - center # not sure if basepos points are already centered
+            # (note: this is a new array, so the model can't modify it)
+        bcenter = chunk.abs_to_base(center)
+        color = chunk.color
+        return axis, points, bcenter, color
+
+    def compute_memo_from_inputs(self, inputs):
+        """
+        Compute our memo from what memo_inputs returned.
+        """
+        if inputs is None:
+            return None
+        axis, points, bcenter, color = inputs
+        axis = norm(axis) # needed (unless we're sure it's already unit length, which is likely)
         # compare following Numeric Python code to findAtomUnderMouse and its caller
         matrix = matrix_putting_axis_at_z(axis)
         v = dot( points, matrix)
@@ -130,9 +153,7 @@ class CylinderChunks(ChunkDisplayMode):
         z = v[:,2]
         min_z = z[argmin(z)]
         max_z = z[argmax(z)]
-        bcenter = chunk.abs_to_base(center)
         # return, in chunk-relative coords, end1, end2, and radius of the cylinder, and color.
-        color = chunk.color
         if color is None:
             color = V(0.5,0.5,0.5)
         # make sure it's longer than zero (in case of a single-atom chunk); in fact, add a small margin all around
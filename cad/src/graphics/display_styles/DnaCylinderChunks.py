@@ -51,11 +51,12 @@ from graphics.drawing.drawers import drawFilledCircle
 from graphics.drawing.drawers import drawtext
 
 from math import sin, cos, pi
-from Numeric import dot, argmax, argmin, sqrt
+from Numeric import dot, argmax, argmin, sqrt, take
 
 from graphics.display_styles.displaymodes import ChunkDisplayMode
+from graphics.display_styles.spline_tube import SplineTubeCache
 
-from geometry.VQT import V, Q, norm, cross, angleBetween
+from geometry.VQT import V, Q, A, norm, cross, angleBetween
 
 from utilities.debug import print_compact_traceback
 from utilities.debug_prefs import debug_pref, Choice, Choice_boolean_True, Choice_boolean_False
@@ -357,32 +358,6 @@ class DnaCylinderChunks(ChunkDisplayMode):
     # Several of the methods below should be split into their own files.
     # piotr 082708
 
-    def _compute_spline(self, data, idx, t):
-        """
-        Implements a Catmull-Rom spline. Interpolates between data[idx]
-        and data[idx+1]. 0.0 <= t <= 1.0.
-
-        @param data: array with at least four values to be used for
-        interpolation. The following values are used: data[idx-1], data[idx],
-        data[idx+1], data[idx+2]
-
-        @param t: position (0 <= t <= 1)
-        @type t: float
-
-        @return: spline value at t
-        """
-        t2 = t * t
-        t3 = t2 * t
-        x0 = data[idx-1]
-        x1 = data[idx]
-        x2 = data[idx+1]
-        x3 = data[idx+2]
-        res = 0.5 * ((2.0 * x1) +
-                     t * (-x0 + x2) +
-                     t2 * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3) +
-                     t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
-        return res
-
     def _get_rainbow_color(self, hue, saturation, value):
         """
         Gets a color of a hue range limited to 0 - 0.667 (red - blue color range).
@@ -565,63 +540,24 @@ class DnaCylinderChunks(ChunkDisplayMode):
             hue = 1.0
         return self._get_nice_rainbow_color(hue, saturation, value)
 
-    def _make_curved_strand(self, points, colors, radii):
+    def _get_base_positions(self, chunk, atom_list):
         """
-        Converts a polycylinder tube to a smooth, curved tube
-        by spline interpolating of points, colors and radii.
-
-        Assumes that len(points) == len(colors) == len(radii)
-
-        @param points: consecutive points to be interpolated
-        @type points: list of V or list of float[3]
+        Return an array of the positions of the atoms in atom_list in
+        chunk-relative coordinates (as chunk.abs_to_base(atom.posn())
+        would return for each atom).
 
-        @param colors: colors corresponding to the points
-        @type colors: list of colors
-
-        @param radii: radii correspoding to individual points
-        @type radii: list of radii
+        @param chunk: chunk
+        @type chunk: Chunk
 
-        @return: tuple of interpolated (points, colors, radii)
+        @param atom_list: list of atoms (usually all in chunk)
+        @type atom_list: list of Atoms
         """
-        n = len(points)
-        if n > 3:
-            # Create lists for the interpolated positions, colors, and radii.
-            new_points = [ None ] * (4*(n-2)-1)
-            new_colors = [ None ] * (4*(n-2)-1)
-            new_radii = [ 0.0 ] * (4*(n-2)-1)
-            for p in range(0, (4*(n-2)-1)):
-                new_points[p] = [ 0.0 ] * 3
-                new_colors[p] = [ 0.0 ] * 3
-            o = 1
-            # Fill-in the lists by computing spline values at consecutive points.
-            # Assume that the spline resolution equals 4.
-            for p in range (1, n-2):
-                for m in range (0, 4):
-                    t = 0.25 * m
-                    new_points[o] = self._compute_spline(points, p, t)
-                    new_colors[o] = self._compute_spline(colors, p, t)
-                    new_radii[o] = self._compute_spline(radii, p, t)
-                    o += 1
-
-            # Fill-in terminal positions.
-            new_points[o] = self._compute_spline(points, p, 1.0)
-            new_colors[o] = self._compute_spline(colors, p, 1.0)
-            new_radii[o] = self._compute_spline(radii, p, 1.0)
-            o += 1
-            new_points[0] = 3.0 * new_points[1] \
-                      - 3.0 * new_points[2] \
-                      + new_points[3]
-            new_points[o] = 3.0 * new_points[o-1] \
-                      - 3.0 * new_points[o-2] \
-                      + new_points[o-3]
-            new_colors[0] = new_colors[1]
-            new_colors[o] = new_colors[o - 1]
-            new_radii[0] = new_radii[1]
-            new_radii[o] = new_radii[o - 1]
-            return (new_points, new_colors, new_radii)
-        else:
-            # if not enough points, just return the initial lists
-            return (points, colors, radii)
+        basepos = chunk.basepos # (this also makes sure atom.index is valid)
+        for atom in atom_list:
+            if atom.molecule is not chunk:
+                return chunk.quat.vunrot(A([atom.posn() for atom in atom_list])
+                                         - chunk.basecenter)
+        return take(basepos, [atom.index for atom in atom_list])
 
     def _get_axis_positions(self, chunk, atom_list, color_style):
         """
@@ -643,6 +579,7 @@ class DnaCylinderChunks(ChunkDisplayMode):
         @return: positions of the DNA axis cylinder
         """
         n_atoms = len(atom_list)
+        atom_positions = self._get_base_positions(chunk, atom_list)
         if color_style == 2 or color_style == 3:
             # Use discrete colors. Below is an explanation of how the "discrete"
             # colors work. piotr 080827
@@ -658,21 +595,16 @@ class DnaCylinderChunks(ChunkDisplayMode):
             # New sequence: (P0,C0) - (P1,C0) - (P1,C1) - (P2,C1) - (P2,C2)
             # where (Px,Cx) is a (position,color) pair of an individual link.
             positions = [None] * (2 * n_atoms + 2)
-            pos = 2
-            for i in range (1, n_atoms):
-                pos1 = chunk.abs_to_base(atom_list[i-1].posn())
-                pos2 = chunk.abs_to_base(atom_list[i].posn())
-                positions[pos] = 0.5*(pos1 + pos2)
-                positions[pos + 1] = 0.5*(pos1 + pos2)
-                pos += 2
-            positions[1] = chunk.abs_to_base(atom_list[0].posn())
+            midpoints = list(0.5 * (atom_positions[:-1] + atom_positions[1:]))
+            positions[2:2 * n_atoms:2] = midpoints
+            positions[3:2 * n_atoms:2] = midpoints
+            pos = 2 * n_atoms
+            positions[1] = atom_positions[0]
+            positions[pos] = atom_positions[n_atoms - 1]
             positions[0] = 2 * positions[1] - positions[2]
-            positions[pos] = chunk.abs_to_base(atom_list[n_atoms - 1].posn())
             positions[pos + 1] = 2 * positions[pos] - positions[pos - 1]
         else:
-            positions = [None] * (n_atoms + 2)
-            for i in range(1, n_atoms + 1):
-                positions[i] = chunk.abs_to_base(atom_list[i-1].posn())
+            positions = [None] + list(atom_positions) + [None]
             if n_atoms > 1:
                 positions[0] = 2 * positions[1] - positions[2]
             else:
@@ -831,9 +763,9 @@ class DnaCylinderChunks(ChunkDisplayMode):
         @param atom_list: list of strand atom positions
         """
         n_atoms = len(atom_list)
-        positions = [None] * (n_atoms + 2)
-        for i in range(1, n_atoms + 1):
-            positions[i] = chunk.abs_to_base(atom_list[i-1].posn())
+        positions = [None] + \
+                    list(self._get_base_positions(chunk, atom_list)) + \
+                    [None]
         if n_atoms < 3:
             positions[0] = positions[1]
             positions[n_atoms + 1] = positions[n_atoms]
@@ -944,12 +876,7 @@ class DnaCylinderChunks(ChunkDisplayMode):
         @param radius: scale factor of the strands
         """
         n_atoms = len(atom_list)
-        radii = [None] * (n_atoms + 2)
-        for i in range(1, n_atoms + 1):
-            radii[i] = radius
-        radii[0] = radii[1]
-        radii[n_atoms + 1] = radii[n_atoms]
-        return radii
+        return [radius] * (n_atoms + 2)
 
 
     def _make_discrete_polycone(self, positions, colors, radii):
@@ -1020,7 +947,7 @@ class DnaCylinderChunks(ChunkDisplayMode):
             return
 
         positions, colors, radii, \
-        arrows, struts_cylinders, base_cartoons = memo
+        arrows, struts_cylinders, base_cartoons, spline_cache = memo
 
         # render the axis cylinder
         if chunk.isAxisChunk() and \
@@ -1888,7 +1815,7 @@ class DnaCylinderChunks(ChunkDisplayMode):
             return
 
         positions, colors, radii, \
-        arrows, struts_cylinders, base_cartoons = memo
+        arrows, struts_cylinders, base_cartoons, spline_cache = memo
 
         if positions is None:
             return
@@ -2079,6 +2006,13 @@ class DnaCylinderChunks(ChunkDisplayMode):
         colors = None
         radii = None
 
+        # curved strand tubes, kept from the previous memo if unchanged
+        old_memo = self.old_memo(chunk)
+        if old_memo is not None and len(old_memo) > 6:
+            spline_cache = SplineTubeCache(old_memo[6])
+        else:
+            spline_cache = SplineTubeCache()
+
         # pre-calculate polycylinder positions (main drawing primitive
         # for strands and/or central axis)
 
@@ -2202,7 +2136,7 @@ class DnaCylinderChunks(ChunkDisplayMode):
                     # strand shape is a tube
                     positions, \
                     colors, \
-                    radii = self._make_curved_strand(
+                    radii = spline_cache.make_curved_strand(
                         positions,
                         colors,
                         radii )
@@ -2368,7 +2302,8 @@ class DnaCylinderChunks(ChunkDisplayMode):
                 radii,
                 arrows,
                 struts_cylinders,
-                base_cartoons)
+                base_cartoons,
+                spline_cache)
 
     pass # end of class DnaCylinderChunks
 
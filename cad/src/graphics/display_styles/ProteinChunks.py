@@ -31,6 +31,7 @@ import foundation.env as env
 from geometry.VQT import V, norm, cross
 
 from graphics.display_styles.displaymodes import ChunkDisplayMode
+from graphics.display_styles.spline_tube import SplineTubeCache
 
 from graphics.drawing.CS_draw_primitives import drawcylinder
 from graphics.drawing.CS_draw_primitives import drawpolycone_multicolor
@@ -197,108 +198,6 @@ AA_COLORS_ACIDITY = {
     "TYR" : green,
     "VAL" : green }
 
-def compute_spline(data, idx, t):
-    """
-    Implements a Catmull-Rom spline. Interpolates between data[idx] and
-    data[idx+1] using data[idx-1], data[idx], data[idx+1] and data[idx+2]
-    points.
-
-    @param data: list of data points to interpolate. it needs to have at least
-    data points, otherwise will cause an exception
-
-    @param idx: index of data points to be interpolated between
-    @type idx: int
-
-    @param t: interpolation ratio (0.0 <= t <= 1.0)
-    @type t: float
-
-    @note: this method is basically identical to the one in DnaCylinderChunks,
-    so it should be splitted out from here and moved to another, more general
-    file
-
-    """
-    t2 = t*t
-    t3 = t2*t
-    x0 = data[idx-1]
-    x1 = data[idx]
-    x2 = data[idx+1]
-    x3 = data[idx+2]
-    res = 0.5 * ((2.0 * x1) +
-                 t * (-x0 + x2) +
-                 t2 * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3) +
-                 t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
-    return res
-
-def make_tube(points, colors, radii, dpos, resolution=3):
-    """
-    Converts a polycylinder tube into a smooth, curved tube using spline
-    interpolation of points, colors and radii.
-
-    If there is not enough data points, returns the original lists.
-    Thus, it can be used in the following way:
-
-    pos, col, rad, dpos = make_tube(pos, col, rad, dpos, resolution)
-
-    Assumes that len(points) == len(colors) == len(radii)
-
-    @param points: consecutive points to be interpolated
-    @type points: list of V or list of float[3]
-
-    @param colors: colors corresponding to the points
-    @type colors: list of colors
-
-    @param radii: radii correspoding to individual points
-    @type radii: list of radii
-
-    @param dpos: dpos vectors correspoding to individual points
-    @type dpos: list of dpos vectors
-
-    @param resolution: specifies a number of points intepolated in-between
-    two consecutive input points
-    @type resolution: integer
-
-    @return: tuple of interpolated (points, colors, radii, dpos)
-    """
-    n = len(points)
-    if n > 3:
-        new_points = []
-        new_colors = []
-        new_radii = []
-        new_dpos = []
-        o = 1
-        ir = 1.0/float(resolution)
-        for p in range (1, n-2):
-            start_spline = 0
-            end_spline = int(resolution) #@@@
-            if p == 1:
-                start_spline = int(resolution / 2 - 1)
-            if p == n-3:
-                end_spline = int(resolution / 2 + 1)
-            for m in range (start_spline, end_spline):
-                t = ir * m
-                sp = compute_spline(points, p, t)
-                sc = compute_spline(colors, p, t)
-                sr = compute_spline(radii, p, t)
-                sd = compute_spline(dpos, p, t)
-                new_points.append(sp)
-                new_colors.append(sc)
-                new_radii.append(sr)
-                new_dpos.append(sd)
-
-        t = ir * (m + 1)
-        sp = compute_spline(points, p, t)
-        sc = compute_spline(colors, p, t)
-        sr = compute_spline(radii, p, t)
-        sd = compute_spline(dpos, p, t)
-
-        new_points.append(sp)
-        new_colors.append(sc)
-        new_radii.append(sr)
-        new_dpos.append(sd)
-        return (new_points, new_colors, new_radii, new_dpos)
-    else:
-        return (points, colors, radii, dpos)
-
 # These two methods are identical to these found in DnaCylinderChunks.
 
 def get_rainbow_color(hue, saturation, value):
@@ -452,7 +351,7 @@ class ProteinChunks(ChunkDisplayMode):
         # much changes.
 
         # Retrieve parameters from memo
-        structure, total_length, ca_list, n_sec = memo
+        structure, total_length, ca_list, n_sec, spline_cache = memo
 
         # Get display style settings
         style = self.proteinStyle
@@ -465,6 +364,18 @@ class ProteinChunks(ChunkDisplayMode):
         gleSetJoinStyle(TUBE_JN_ANGLE | TUBE_NORM_PATH_EDGE \
                         | TUBE_JN_CAP | TUBE_CONTOUR_CLOSED )
 
+        if style == PROTEIN_STYLE_TUBE or \
+           style == PROTEIN_STYLE_LADDER or \
+           style == PROTEIN_STYLE_ZIGZAG or \
+           style == PROTEIN_STYLE_FLAT_RIBBON or \
+           style == PROTEIN_STYLE_SOLID_RIBBON or \
+           style == PROTEIN_STYLE_SIMPLE_CARTOONS or \
+           style == PROTEIN_STYLE_FANCY_CARTOONS:
+            # All of these styles use the same interpolated cubic spline
+            # that connects alpha carbon atoms; make it for all secondary
+            # structure elements at once.
+            tubes = self._get_tubes(chunk, memo)
+
         # Iterate over consecutive secondary structure elements.
         current_sec = 0
         for sec, secondary in structure:
@@ -555,112 +466,26 @@ class ProteinChunks(ChunkDisplayMode):
                     # All of these styles use the same interpolated cubic spline
                     # that connects alpha carbon atoms.
 
-                    # The following lists store positions, colors, radii and
-                    # peptide bond vectors for consecutive main chain
-                    # positions.
-
-                    tube_pos = []
-                    tube_col = []
-                    tube_rad = []
-                    tube_dpos = []
-
-                    # Fill-in the position, color, radius and peptide position
-                    # lists.
-
-                    for n in range( 2, n_atoms-2 ):
-                        pos00, ss00, a00, idx00, dpos00, cbpos00 = sec[n - 2]
-                        pos0, ss0, aa0, idx0, dpos0, cbpos0 = sec[n - 1]
-                        pos1, ss1, aa1, idx1, dpos1, cbpos1 = sec[n]
-                        pos2, ss2, aa2, idx2, dpos2, cbpos2 = sec[n + 1]
-                        pos22, ss22, aa22, idx22, dpos22, cbpos22 = sec[n + 2]
-
-                        color = self._get_aa_color(chunk,
-                                                   idx1,
-                                                   total_length,
-                                                   ss1,
-                                                   aa1,
-                                                   current_sec,
-                                                   n_sec)
-
-                        rad = 0.25 * scaleFactor
-                        if style == PROTEIN_STYLE_TUBE and \
-                           scaling == 1:
-                            if secondary > 0:
-                                rad *= 2.0
-
-                        if n == 2:
-                            if pos0:
-                                tube_pos.append(pos00)
-                                tube_col.append(V(color))
-                                tube_rad.append(rad)
-                                tube_dpos.append(dpos1)
-                                tube_pos.append(pos0)
-                                tube_col.append(V(color))
-                                tube_rad.append(rad)
-                                tube_dpos.append(dpos1)
-
-                        if style == PROTEIN_STYLE_LADDER:
+                    # The smooth tube (or, for simple cartoon helices, the
+                    # polycylinder) connecting this element's alpha carbons.
+                    tube_pos, tube_col, tube_rad, tube_dpos = tubes[current_sec]
+
+                    if style == PROTEIN_STYLE_LADDER:
+                        for n in range( 2, n_atoms-2 ):
+                            pos1, ss1, aa1, idx1, dpos1, cbpos1 = sec[n]
+                            color = self._get_aa_color(chunk,
+                                                       idx1,
+                                                       total_length,
+                                                       ss1,
+                                                       aa1,
+                                                       current_sec,
+                                                       n_sec)
+                            rad = 0.25 * scaleFactor
                             drawcylinder(color, pos1, cbpos1, rad * 0.75)
                             drawsphere(color, cbpos1, rad * 1.5, 2)
 
-                        if pos1:
-                            tube_pos.append(pos1)
-                            tube_col.append(V(color))
-                            tube_rad.append(rad)
-                            tube_dpos.append(dpos1)
-
-                        if n == n_atoms - 3:
-                            if pos2:
-                                tube_pos.append(pos2)
-                                tube_col.append(V(color))
-                                tube_rad.append(rad)
-                                tube_dpos.append(dpos1)
-                                tube_pos.append(pos22)
-                                tube_col.append(V(color))
-                                tube_rad.append(rad)
-                                tube_dpos.append(dpos1)
-
-                    # For smoothed helices we need to add virtual atoms
-                    # located approximately at the centers of peptide bonds
-                    # but slightly moved away from the helix axis.
-
-                    new_tube_pos = []
-                    new_tube_col = []
-                    new_tube_rad = []
-                    new_tube_dpos = []
-                    if smooth and \
-                       secondary == 1:
-                        for p in range(len(tube_pos)):
-                            new_tube_pos.append(tube_pos[p])
-                            new_tube_col.append(tube_col[p])
-                            new_tube_rad.append(tube_rad[p])
-                            new_tube_dpos.append(tube_dpos[p])
-
-                            if p > 1 and p < len(tube_pos) - 3:
-                                pv = tube_pos[p-1] - tube_pos[p]
-                                nv = tube_pos[p+2] - tube_pos[p+1]
-                                mi = 0.5 * (tube_pos[p+1] + tube_pos[p])
-                                # The coefficient below was handpicked to make
-                                # the helices approximately round.
-                                mi -= 0.75 * norm(nv+pv)
-                                new_tube_pos.append(mi)
-                                new_tube_col.append(0.5*(tube_col[p]+tube_col[p+1]))
-                                new_tube_rad.append(0.5*(tube_rad[p]+tube_rad[p+1]))
-                                new_tube_dpos.append(0.5*(tube_dpos[p]+tube_dpos[p+1]))
-
-                        tube_pos = new_tube_pos
-                        tube_col = new_tube_col
-                        tube_rad = new_tube_rad
-                        tube_dpos = new_tube_dpos
-
                     if secondary != 1 or \
                        style != PROTEIN_STYLE_SIMPLE_CARTOONS:
-                        tube_pos, tube_col, tube_rad, tube_dpos = make_tube(
-                            tube_pos,
-                            tube_col,
-                            tube_rad,
-                            tube_dpos,
-                            resolution=resolution)
 
                         if style == PROTEIN_STYLE_ZIGZAG or \
                            style == PROTEIN_STYLE_FLAT_RIBBON or \
@@ -1002,6 +827,159 @@ class ProteinChunks(ChunkDisplayMode):
             # by "secondary structure elements order").
             current_sec += 1
 
+    def _get_tube(self, chunk, sec, secondary, current_sec, total_length,
+                  n_sec):
+        """
+        Returns the positions, colors, radii and peptide bond vectors
+        of the polycylinder connecting the alpha carbon atoms of a secondary
+        structure element, to be interpolated by make_tubes.
+
+        @param sec: the secondary structure element (from the memo)
+
+        @param secondary: its secondary structure type
+
+        @param current_sec: its index in the memo's list of elements
+
+        @return: tuple of (positions, colors, radii, dpos) lists
+        """
+        style = self.proteinStyle
+        scaleFactor = self.proteinStyleScaleFactor
+        scaling = self.proteinStyleScaling
+        smooth = self.proteinStyleSmooth
+
+        n_atoms = len(sec)
+
+        # The following lists store positions, colors, radii and
+        # peptide bond vectors for consecutive main chain
+        # positions.
+
+        tube_pos = []
+        tube_col = []
+        tube_rad = []
+        tube_dpos = []
+
+        # Fill-in the position, color, radius and peptide position
+        # lists.
+
+        for n in range( 2, n_atoms-2 ):
+            pos00, ss00, a00, idx00, dpos00, cbpos00 = sec[n - 2]
+            pos0, ss0, aa0, idx0, dpos0, cbpos0 = sec[n - 1]
+            pos1, ss1, aa1, idx1, dpos1, cbpos1 = sec[n]
+            pos2, ss2, aa2, idx2, dpos2, cbpos2 = sec[n + 1]
+            pos22, ss22, aa22, idx22, dpos22, cbpos22 = sec[n + 2]
+
+            color = self._get_aa_color(chunk,
+                                       idx1,
+                                       total_length,
+                                       ss1,
+                                       aa1,
+                                       current_sec,
+                                       n_sec)
+
+            rad = 0.25 * scaleFactor
+            if style == PROTEIN_STYLE_TUBE and \
+               scaling == 1:
+                if secondary > 0:
+                    rad *= 2.0
+
+            if n == 2:
+                if pos0:
+                    tube_pos.append(pos00)
+                    tube_col.append(V(color))
+                    tube_rad.append(rad)
+                    tube_dpos.append(dpos1)
+                    tube_pos.append(pos0)
+                    tube_col.append(V(color))
+                    tube_rad.append(rad)
+                    tube_dpos.append(dpos1)
+
+            if pos1:
+                tube_pos.append(pos1)
+                tube_col.append(V(color))
+                tube_rad.append(rad)
+                tube_dpos.append(dpos1)
+
+            if n == n_atoms - 3:
+                if pos2:
+                    tube_pos.append(pos2)
+                    tube_col.append(V(color))
+                    tube_rad.append(rad)
+                    tube_dpos.append(dpos1)
+                    tube_pos.append(pos22)
+                    tube_col.append(V(color))
+                    tube_rad.append(rad)
+                    tube_dpos.append(dpos1)
+
+        # For smoothed helices we need to add virtual atoms
+        # located approximately at the centers of peptide bonds
+        # but slightly moved away from the helix axis.
+
+        new_tube_pos = []
+        new_tube_col = []
+        new_tube_rad = []
+        new_tube_dpos = []
+        if smooth and \
+           secondary == 1:
+            for p in range(len(tube_pos)):
+                new_tube_pos.append(tube_pos[p])
+                new_tube_col.append(tube_col[p])
+                new_tube_rad.append(tube_rad[p])
+                new_tube_dpos.append(tube_dpos[p])
+
+                if p > 1 and p < len(tube_pos) - 3:
+                    pv = tube_pos[p-1] - tube_pos[p]
+                    nv = tube_pos[p+2] - tube_pos[p+1]
+                    mi = 0.5 * (tube_pos[p+1] + tube_pos[p])
+                    # The coefficient below was handpicked to make
+                    # the helices approximately round.
+                    mi -= 0.75 * norm(nv+pv)
+                    new_tube_pos.append(mi)
+                    new_tube_col.append(0.5*(tube_col[p]+tube_col[p+1]))
+                    new_tube_rad.append(0.5*(tube_rad[p]+tube_rad[p+1]))
+                    new_tube_dpos.append(0.5*(tube_dpos[p]+tube_dpos[p+1]))
+
+            tube_pos = new_tube_pos
+            tube_col = new_tube_col
+            tube_rad = new_tube_rad
+            tube_dpos = new_tube_dpos
+
+        return (tube_pos, tube_col, tube_rad, tube_dpos)
+
+    def _get_tubes(self, chunk, memo):
+        """
+        Returns a list of the tubes drawn along the secondary structure
+        elements in memo (by the styles which use the spline connecting
+        alpha carbon atoms), made all at once by the memo's SplineTubeCache.
+        Each tube is a tuple of (positions, colors, radii, dpos) lists, or None
+        for elements too short to draw.
+        """
+        structure, total_length, ca_list, n_sec, spline_cache = memo
+
+        tubes = []
+        splined = [] # indices in tubes of the tubes to interpolate
+        current_sec = 0
+        for sec, secondary in structure:
+            if len(sec) >= 3:
+                tubes.append(self._get_tube(chunk,
+                                            sec,
+                                            secondary,
+                                            current_sec,
+                                            total_length,
+                                            n_sec))
+                # Simple cartoon helices are drawn as straight cylinders.
+                if secondary != 1 or \
+                   self.proteinStyle != PROTEIN_STYLE_SIMPLE_CARTOONS:
+                    splined.append(current_sec)
+            else:
+                tubes.append(None)
+            current_sec += 1
+
+        new_tubes = spline_cache.make_tubes([tubes[i] for i in splined],
+                                            resolution=self.proteinStyleQuality)
+        for i, tube in zip(splined, new_tubes):
+            tubes[i] = tube
+        return tubes
+
     def drawchunk_selection_frame(self, glpane, chunk, selection_frame_color, memo, highlighted):
         """
         Given the same arguments as drawchunk, plus selection_frame_color,
@@ -1465,6 +1443,14 @@ class ProteinChunks(ChunkDisplayMode):
 
                 sec = []
 
-        return (structure, n_ca, ca_list, n_sec)
+        # Tubes made by drawchunk are kept in spline_cache, along with those
+        # kept from the previous memo, which may still be the same.
+        old_memo = self.old_memo(chunk)
+        if old_memo is not None and len(old_memo) > 4:
+            spline_cache = SplineTubeCache(old_memo[4])
+        else:
+            spline_cache = SplineTubeCache()
+
+        return (structure, n_ca, ca_list, n_sec, spline_cache)
 
 ChunkDisplayMode.register_display_mode_class(ProteinChunks)
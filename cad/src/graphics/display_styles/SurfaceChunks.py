@@ -25,13 +25,15 @@ import foundation.env as env
 from graphics.drawing.CS_draw_primitives import drawsurface
 from graphics.drawing.CS_draw_primitives import drawsurface_wireframe
 from graphics.drawing.shape_vertices import getSphereTriangles
-from geometry.VQT import V, cross
+from geometry.VQT import V, A, cross
 from utilities.Log import greenmsg
 from graphics.display_styles.displaymodes import ChunkDisplayMode
 
 from utilities.constants import ave_colors
 from utilities.constants import diTrueCPK
 from utilities.prefs_constants import atomHighlightColor_prefs_key
+from utilities.GlobalPreferences import debug_pref_vectorized_surface
+from graphics.display_styles.surface_mesh import compute_surface
 
 _psurface_import_worked = False
 
@@ -503,7 +505,7 @@ class SurfaceChunks(ChunkDisplayMode):
         """
         if not chunk.atoms:
             return
-        pos, radius, color, tm, nm = memo
+        pos, radius, color, tm, nm = memo[:5]
         if highlighted:
             color = ave_colors(0.5, color, env.prefs[chunkHighlightColor_prefs_key]) #e should the caller compute this somehow?
         # THIS IS WHERE OLEKSANDR SHOULD CALL HIS NEW CODE TO RENDER THE SURFACE (NOT CYLINDER).
@@ -526,7 +528,7 @@ class SurfaceChunks(ChunkDisplayMode):
         """
         if not chunk.atoms:
             return
-        pos, radius, color, tm, nm = memo
+        pos, radius, color, tm, nm = memo[:5]
         color = selection_frame_color
         # make it a little bigger than the sphere itself
         alittle = 0.01
@@ -556,9 +558,6 @@ class SurfaceChunks(ChunkDisplayMode):
         If the real work can depend on more than chunk's ordinary appearance can, the access would need to be in drawchunk;
         otherwise it could be in drawchunk or in this method compute_memo.
         """
-        # for this example, we'll turn the chunk axes into a cylinder.
-        # Since chunk.axis is not always one of the vectors chunk.evecs (actually chunk.poly_evals_evecs_axis[2]),
-        # it's best to just use the axis and center, then recompute a bounding cylinder.
         if not chunk.atoms:
             return None
 
@@ -570,97 +569,146 @@ class SurfaceChunks(ChunkDisplayMode):
         _report_psurface_import_status() # prints only once per session
 
         if _psurface_import_worked: # cpp surface stuff
-            center = chunk.center
-            bcenter = chunk.abs_to_base(center)
-            rad = 0.0
-            margin = 0
-            radiuses = []
-            spheres = []
-            atoms = []
-            coltypes = []
-            for a in chunk.atoms.values():
-                col = a.drawing_color()
-                ii = 0
-                for ic in range(len(coltypes)):
-                    ct = coltypes[ic]
-                    if ct == col:
-                        break;
-                    ii += 1
-                if ii >= len(coltypes):
-                    coltypes.append(col);
-                atoms.append(ii)
-                dispjunk, ra = a.howdraw(diTrueCPK)
-                if ra > margin : margin = ra
-                radiuses.append(ra)
-                p = a.posn() - center
-                spheres.append(p)
-                r = p[0]**2+p[1]**2+p[2]**2
-                if r > rad: rad = r
-            rad = sqrt(rad)
-            radius = rad + margin
-            cspheres = []
-            from utilities.debug_prefs import debug_pref, Choice_boolean_True
-            use_colors = debug_pref("surface: use colors?", Choice_boolean_True) #bruce 060927 (old code had 0 for use_colors)
-            for i in range(len(spheres)):
-                st = spheres[i] / radius
-                rt = radiuses[i] / radius
-                # cspheres.append((st[0],st[1],st[2],rt,use_colors))
-                cspheres.append((st[0],st[1],st[2],rt,atoms[i]))
-            #cspheres.append((-0.3,0,0,0.3,1))
-            #cspheres.append((0.3,0,0,0.3,2))
-            color = chunk.drawing_color()
-            if color is None:
-                color = V(0.5,0.5,0.5)
-            #  create surface
-            level = 3
-            if rad > 6 : level = 4
-            ps = psurface
-            # 0 - sphere triangles
-            # 1 - torus rectangles
-            # 2 - omega rectangles
-            method = 2
-            ((em,pm,am), nm) = ps.CreateSurface(cspheres, level, method)
-            cm = []
-            if True: # True for color
-                for i in range(len(am)):
-                    cm.append(coltypes[am[i]])
-            else:
-                for i in range(len(am)):
-                    cm.append((0.5,0.5,0.5))
-            tm = (em,pm,cm)
+            memo = self._compute_memo_using_psurface(chunk)
         else : # python surface stuff
-            center = chunk.center
-            bcenter = chunk.abs_to_base(center)
-            rad = 0.0
-            s = Surface()
-            margin = 0
-            for a in chunk.atoms.values():
-                dispjunk, ra = a.howdraw(diTrueCPK)
-                if ra > margin : margin = ra
-                s.radiuses.append(ra)
-                p = a.posn() - center
-                s.spheres.append(Triple(p[0], p[1], p[2]))
-                r = p[0]**2+p[1]**2+p[2]**2
-                if r > rad: rad = r
-            rad = sqrt(rad)
-            radius = rad + margin
-            for i in range(len(s.spheres)):
-                s.spheres[i] /= radius
-                s.radiuses[i] /= radius
-            color = chunk.drawing_color()
-            if color is None:
-                color = V(0.5,0.5,0.5)
-            #  create surface
-            level = 3
-            if rad > 6 : level = 4
-            ts = getSphereTriangles(level)
-            #ts = s.TorusTriangles(0.7, 0.3, 20)
-            tm = s.SurfaceTriangles(ts)
-            nm = s.SurfaceNormals()
+            memo = self.compute_memo_from_inputs( self.memo_inputs(chunk))
 
         QApplication.restoreOverrideCursor() # Restore the cursor. Mark 060621.
         env.history.message(self.cmdname + "Done.") # Mark 060621.
 
+        return memo
+
+    def _compute_memo_using_psurface(self, chunk):
+        center = chunk.center
+        bcenter = chunk.abs_to_base(center)
+        rad = 0.0
+        margin = 0
+        radiuses = []
+        spheres = []
+        atoms = []
+        coltypes = []
+        for a in chunk.atoms.values():
+            col = a.drawing_color()
+            ii = 0
+            for ic in range(len(coltypes)):
+                ct = coltypes[ic]
+                if ct == col:
+                    break;
+                ii += 1
+            if ii >= len(coltypes):
+                coltypes.append(col);
+            atoms.append(ii)
+            dispjunk, ra = a.howdraw(diTrueCPK)
+            if ra > margin : margin = ra
+            radiuses.append(ra)
+            p = a.posn() - center
+            spheres.append(p)
+            r = p[0]**2+p[1]**2+p[2]**2
+            if r > rad: rad = r
+        rad = sqrt(rad)
+        radius = rad + margin
+        cspheres = []
+        from utilities.debug_prefs import debug_pref, Choice_boolean_True
+        use_colors = debug_pref("surface: use colors?", Choice_boolean_True) #bruce 060927 (old code had 0 for use_colors)
+        for i in range(len(spheres)):
+            st = spheres[i] / radius
+            rt = radiuses[i] / radius
+            # cspheres.append((st[0],st[1],st[2],rt,use_colors))
+            cspheres.append((st[0],st[1],st[2],rt,atoms[i]))
+        #cspheres.append((-0.3,0,0,0.3,1))
+        #cspheres.append((0.3,0,0,0.3,2))
+        color = chunk.drawing_color()
+        if color is None:
+            color = V(0.5,0.5,0.5)
+        #  create surface
+        level = 3
+        if rad > 6 : level = 4
+        ps = psurface
+        # 0 - sphere triangles
+        # 1 - torus rectangles
+        # 2 - omega rectangles
+        method = 2
+        ((em,pm,am), nm) = ps.CreateSurface(cspheres, level, method)
+        cm = []
+        if True: # True for color
+            for i in range(len(am)):
+                cm.append(coltypes[am[i]])
+        else:
+            for i in range(len(am)):
+                cm.append((0.5,0.5,0.5))
+        tm = (em,pm,cm)
+        return (bcenter, radius, color, tm, nm)
+
+    # compute_memo is split into these parts (when not using psurface)
+    # so most of it can run in a worker thread [bruce 090327]
+
+    compute_memo_in_background = not _psurface_import_worked
+
+    def memo_inputs(self, chunk):
+        """
+        Return what compute_memo_from_inputs needs to know about chunk.
+        """
+        if not chunk.atoms:
+            return None
+        atlist = chunk.atlist
+        radii = A([a.howdraw(diTrueCPK)[1] for a in atlist])
+        color = chunk.drawing_color()
+        if debug_pref_vectorized_surface():
+            # (this works in chunk-relative coordinates, so the surface
+            #  needn't be recomputed when the chunk moves as a whole)
+            old_memo = self.old_memo(chunk)
+            old_state = None
+            if old_memo is not None and len(old_memo) > 5:
+                old_state = old_memo[5]
+            return (True, A(chunk.basepos), radii, color, atlist, old_state)
+        center = chunk.center
+        positions = A([a.posn() - center for a in atlist])
+        bcenter = chunk.abs_to_base(center)
+        return (False, positions, radii, color, bcenter, None)
+
+    def compute_memo_from_inputs(self, inputs):
+        """
+        Compute our memo from what memo_inputs returned.
+        """
+        if inputs is None:
+            return None
+        vectorized, positions, radii, color, other, old_state = inputs
+        if color is None:
+            color = V(0.5,0.5,0.5)
+        if vectorized:
+            bcenter, radius, tm, nm, state = compute_surface(positions, radii,
+                                                             other, old_state)
+            return (bcenter, radius, color, tm, nm, state)
+        bcenter = other
+        return self._compute_memo_using_Surface(positions, radii, bcenter, color)
+
+    def _compute_memo_using_Surface(self, positions, radii, bcenter, color):
+        """
+        [the original python surface code, which loops over every atom
+         for every mesh vertex; see surface_mesh.py for what replaced it]
+        """
+        rad = 0.0
+        s = Surface()
+        margin = 0
+        for p, ra in zip(positions, radii):
+            if ra > margin : margin = ra
+            s.radiuses.append(ra)
+            s.spheres.append(Triple(p[0], p[1], p[2]))
+            r = p[0]**2+p[1]**2+p[2]**2
+            if r > rad: rad = r
+        rad = sqrt(rad)
+        radius = rad + margin
+        for i in range(len(s.spheres)):
+            s.spheres[i] /= radius
+            s.radiuses[i] /= radius
+        #  create surface
+        level = 3
+        if rad > 6 : level = 4
+        ts = getSphereTriangles(level)
+        #ts = s.TorusTriangles(0.7, 0.3, 20)
+        tm = s.SurfaceTriangles(ts)
+        nm = s.SurfaceNormals()
+
         return (bcenter, radius, color, tm, nm)
 
     pass # end of class SurfaceChunks
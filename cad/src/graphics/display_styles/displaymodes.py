@@ -217,18 +217,67 @@ class ChunkDisplayMode(DisplayMode):
         # since that is drawn outside the display list and the chunk might get
         # drawn selected many times without having to remake the display list.
 
+        our_key_in_chunk, memo_validity_data = self._memo_key(chunk)
+            # if memo_validity_data differs from when the memo was computed,
+            # the following calls compute_memo
+        memo = chunk.find_or_recompute_memo(
+                         our_key_in_chunk,
+                         memo_validity_data,
+                         self.compute_memo )
+        return memo
+
+    def _memo_key(self, chunk): #bruce 090325 split this out of getmemo
+        """
+        Return the address of our memo in chunk, and the data which must
+        remain the same for it to remain valid.
+        """
         our_key_in_chunk = id(self)
             # safer than using mmp_code, in case a developer reloads the class
             # at runtime and the memo algorithm changed
         counter = chunk.changeapp_counter()
         memo_validity_data = (counter,)
             # a tuple of everything which has to remain the same, for the memo
-            # data to remain valid; if invalid, the following calls compute_memo
-        memo = chunk.find_or_recompute_memo(
-                         our_key_in_chunk,
-                         memo_validity_data,
-                         self.compute_memo )
-        return memo
+            # data to remain valid
+        return our_key_in_chunk, memo_validity_data
+
+    # Subclasses can let most of compute_memo run in a worker thread
+    # (see RemakeScheduler) by setting compute_memo_in_background and
+    # splitting compute_memo into memo_inputs, which runs in the main
+    # thread and returns whatever the memo depends on (copied if the model
+    # might modify it in place), and compute_memo_from_inputs, which must
+    # use only those inputs (not OpenGL, Qt, env.prefs, self's attributes,
+    # or the model). [bruce 090325]
+
+    compute_memo_in_background = False
+
+    def memo_inputs(self, chunk):
+        return chunk
+
+    def compute_memo_from_inputs(self, inputs):
+        return self.compute_memo(inputs)
+
+    def old_memo(self, chunk): #bruce 090327
+        """
+        Return the last memo we computed for chunk, even if it's no longer
+        valid, or None. (For use by memo_inputs, to let
+        compute_memo_from_inputs reuse parts of it.)
+        """
+        address, memo_validity_data_junk = self._memo_key(chunk)
+        return chunk.old_memo(address)
+
+    def _f_memo_is_valid(self, chunk):
+        """
+        [private method for use only by RemakeScheduler]
+        """
+        return chunk.memo_is_valid( *self._memo_key(chunk) )
+
+    def _f_set_memo(self, chunk, memo):
+        """
+        [private method for use only by RemakeScheduler]
+        """
+        address, memo_validity_data = self._memo_key(chunk)
+        chunk.store_memo(address, memo_validity_data, memo)
+        return
 
     pass # end of class ChunkDisplayMode
 
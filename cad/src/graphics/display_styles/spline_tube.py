@@ -0,0 +1,335 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+spline_tube.py -- array-based Catmull-Rom spline interpolation of the
+smooth tubes drawn by the ProteinChunks and DnaCylinderChunks display
+styles, and a cache of the tubes made for each chunk.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+The tubes are the same as those formerly made one interpolated point at
+a time by ProteinChunks.make_tube and DnaCylinderChunks._make_curved_strand
+(each of which called a copy of compute_spline four times per point), but
+all the points of all the tubes passed to one call are computed together,
+with one whole-array operation per term of the spline. Since those are
+the same floating point operations, done in the same order, the results
+are identical.
+
+Nothing here uses OpenGL, Qt or the model, so this can be used (e.g.
+benchmarked, see spline_tube_benchmark.py) without a GL context.
+"""
+
+from Numeric import array, take, repeat, reshape, arange
+from Numeric import Float, Int
+
+# How many more memos (see SplineTubeCache.__init__) a cached tube is kept
+# for, after the last memo which used it.
+_KEPT_GENERATIONS = 4
+
+def compute_spline(data, idx, t):
+    """
+    Implements a Catmull-Rom spline. Interpolates between data[idx] and
+    data[idx+1] using data[idx-1], data[idx], data[idx+1] and data[idx+2]
+    points.
+
+    @param data: list of data points to interpolate. it needs to have at least
+    data points, otherwise will cause an exception
+
+    @param idx: index of data points to be interpolated between
+    @type idx: int
+
+    @param t: interpolation ratio (0.0 <= t <= 1.0)
+    @type t: float
+
+    @note: _compute_splines does the same for many values of idx and t at
+    once, and must be kept in sync with this.
+    """
+    t2 = t*t
+    t3 = t2*t
+    x0 = data[idx-1]
+    x1 = data[idx]
+    x2 = data[idx+1]
+    x3 = data[idx+2]
+    res = 0.5 * ((2.0 * x1) +
+                 t * (-x0 + x2) +
+                 t2 * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3) +
+                 t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
+    return res
+
+def _compute_splines(data, indices, ts):
+    """
+    Return an array of compute_spline(data, idx, t) for corresponding
+    elements idx and t of indices and ts, where data is an array of
+    points (or of numbers).
+    """
+    if len(data.shape) > 1:
+        # make each t multiply a whole point (or whatever each element
+        # of data is; e.g. ProteinChunks' colors are 1 by 3 arrays)
+        ts = reshape(ts, (len(ts),) + (1,) * (len(data.shape) - 1))
+    t = ts
+    t2 = t*t
+    t3 = t2*t
+    x0 = take(data, indices - 1)
+    x1 = take(data, indices)
+    x2 = take(data, indices + 1)
+    x3 = take(data, indices + 2)
+    res = 0.5 * ((2.0 * x1) +
+                 t * (-x0 + x2) +
+                 t2 * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3) +
+                 t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
+    return res
+
+def _tube_samples(n, resolution):
+    """
+    Return (segments, counts, ms) for the points make_tubes interpolates
+    along a tube of n > 3 points: the spline segment indices, how many
+    points are interpolated on each, and the position on each segment of
+    each point (to be multiplied by 1.0 / resolution), as lists.
+    """
+    first_start = int(resolution / 2 - 1)
+    last_end = int(resolution / 2 + 1)
+    full_end = int(resolution) #@@@
+    if n == 4:
+        ms = range(first_start, last_end)
+        counts = [last_end - first_start]
+    else:
+        ms = range(first_start, full_end) + \
+             range(full_end) * (n - 5) + \
+             range(last_end)
+        counts = [full_end - first_start] + \
+                 [full_end] * (n - 5) + \
+                 [last_end]
+    # the tube ends at the end of the last interpolated segment
+    ms.append(last_end)
+    counts[-1] += 1
+    return range(1, n - 2), counts, ms
+
+def _tube_arrays(tubes):
+    """
+    Return the points, colors, radii and dpos of those tubes with more
+    than 3 points (the only ones make_tubes interpolates), each
+    concatenated into one array.
+    """
+    points = []
+    colors = []
+    radii = []
+    dpos = []
+    for tube_points, tube_colors, tube_radii, tube_dpos in tubes:
+        if len(tube_points) > 3:
+            points.extend(tube_points)
+            colors.extend(tube_colors)
+            radii.extend(tube_radii)
+            dpos.extend(tube_dpos)
+    return (array(points, Float), array(colors, Float),
+            array(radii, Float), array(dpos, Float))
+
+def make_tubes(tubes, resolution = 3, _arrays = None):
+    """
+    Converts polycylinder tubes into smooth, curved tubes using spline
+    interpolation of their points, colors, radii and dpos vectors.
+
+    @param tubes: a list of tubes, each a tuple (points, colors, radii, dpos)
+                  of lists of the same length, as for make_tube.
+
+    @param resolution: specifies a number of points intepolated in-between
+                       two consecutive input points
+    @type resolution: integer
+
+    @return: a list of (points, colors, radii, dpos) tuples, each what
+             make_tube would return for the corresponding tube.
+    """
+    if _arrays is None:
+        _arrays = _tube_arrays(tubes)
+    points, colors, radii, dpos = _arrays
+    segments = []
+    counts = []
+    ms = []
+    sizes = [] # number of interpolated points for each tube, or None
+    offset = 0
+    for tube in tubes:
+        n = len(tube[0])
+        if n > 3:
+            tube_segments, tube_counts, tube_ms = _tube_samples(n, resolution)
+            segments.extend([offset + p for p in tube_segments])
+            counts.extend(tube_counts)
+            ms.extend(tube_ms)
+            sizes.append(len(tube_ms))
+            offset += n
+        else:
+            sizes.append(None)
+    if ms:
+        indices = repeat(array(segments, Int), array(counts, Int))
+        ts = (1.0/float(resolution)) * array(ms, Float)
+        new_points = _compute_splines(points, indices, ts)
+        new_colors = _compute_splines(colors, indices, ts)
+        new_radii = _compute_splines(radii, indices, ts).tolist()
+        new_dpos = _compute_splines(dpos, indices, ts)
+    res = []
+    start = 0
+    for tube, size in zip(tubes, sizes):
+        if size is None:
+            # if not enough points, the tube is unchanged
+            res.append(tube)
+            continue
+        end = start + size
+        res.append((list(new_points[start:end]),
+                    list(new_colors[start:end]),
+                    new_radii[start:end],
+                    list(new_dpos[start:end])))
+        start = end
+    return res
+
+def make_tube(points, colors, radii, dpos, resolution=3):
+    """
+    Converts a polycylinder tube into a smooth, curved tube using spline
+    interpolation of points, colors and radii.
+
+    If there is not enough data points, returns the original lists.
+    Thus, it can be used in the following way:
+
+    pos, col, rad, dpos = make_tube(pos, col, rad, dpos, resolution)
+
+    Assumes that len(points) == len(colors) == len(radii)
+
+    @param points: consecutive points to be interpolated
+    @type points: list of V or list of float[3]
+
+    @param colors: colors corresponding to the points
+    @type colors: list of colors
+
+    @param radii: radii correspoding to individual points
+    @type radii: list of radii
+
+    @param dpos: dpos vectors correspoding to individual points
+    @type dpos: list of dpos vectors
+
+    @param resolution: specifies a number of points intepolated in-between
+    two consecutive input points
+    @type resolution: integer
+
+    @return: tuple of interpolated (points, colors, radii, dpos)
+
+    @see: make_tubes, which does this for many tubes at once.
+    """
+    return make_tubes([(points, colors, radii, dpos)], resolution)[0]
+
+def make_curved_strand(points, colors, radii, _arrays = None):
+    """
+    Converts a polycylinder tube to a smooth, curved tube
+    by spline interpolating of points, colors and radii, with four
+    interpolated points per segment and extrapolated points at both ends
+    (as used for DNA strands).
+
+    Assumes that len(points) == len(colors) == len(radii)
+
+    @param points: consecutive points to be interpolated
+    @type points: list of V or list of float[3]
+
+    @param colors: colors corresponding to the points
+    @type colors: list of colors
+
+    @param radii: radii correspoding to individual points
+    @type radii: list of radii
+
+    @return: tuple of interpolated (points, colors, radii)
+    """
+    n = len(points)
+    if n <= 3:
+        # if not enough points, just return the initial lists
+        return (points, colors, radii)
+    if _arrays is None:
+        _arrays = (array(points, Float), array(colors, Float),
+                   array(radii, Float))
+    points, colors, radii = _arrays
+    # Assume that the spline resolution equals 4; the last point is at
+    # the end of the last segment.
+    indices = repeat(arange(1, n - 2), [4] * (n - 4) + [5])
+    ts = 0.25 * array(range(4) * (n - 3) + [4], Float)
+    new_points = list(_compute_splines(points, indices, ts))
+    new_colors = list(_compute_splines(colors, indices, ts))
+    new_radii = _compute_splines(radii, indices, ts).tolist()
+    # Add terminal positions.
+    new_points.insert(0, 3.0 * new_points[0] \
+                      - 3.0 * new_points[1] \
+                      + new_points[2])
+    new_points.append(3.0 * new_points[-1] \
+                      - 3.0 * new_points[-2] \
+                      + new_points[-3])
+    new_colors.insert(0, new_colors[0])
+    new_colors.append(new_colors[-1])
+    new_radii.insert(0, new_radii[0])
+    new_radii.append(new_radii[-1])
+    return (new_points, new_colors, new_radii)
+
+class SplineTubeCache:
+    """
+    Remembers the tubes made by make_tubes and make_curved_strand for one
+    chunk, keyed by their arguments (which depend on the chunk's atom
+    positions and on whichever style settings affect the tubes), so that
+    remaking the chunk's memo or display list without changing those
+    (e.g. after selecting the chunk, or after changing a style setting and
+    then changing it back) doesn't make them again.
+
+    A display style keeps one of these in each chunk's memo. The lists
+    returned are new, but the points, colors and vectors in them are shared
+    with the cached tubes, so they must not be modified in place.
+    """
+    def __init__(self, old_cache = None):
+        """
+        @param old_cache: the cache from the chunk's previous memo, if any.
+                          Tubes from it which were used by any of the last
+                          few memos are kept.
+        """
+        self._entries = {} # key -> [generation last used, result]
+        if old_cache is None:
+            self._generation = 0
+        else:
+            self._generation = old_cache._generation + 1
+            oldest = self._generation - _KEPT_GENERATIONS
+            for key, entry in old_cache._entries.iteritems():
+                if entry[0] >= oldest:
+                    self._entries[key] = entry
+        return
+
+    def _lookup(self, key, compute):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [self._generation, compute()]
+            self._entries[key] = entry
+        entry[0] = self._generation
+        return entry[1]
+
+    def make_tubes(self, tubes, resolution = 3):
+        """
+        Return make_tubes(tubes, resolution), remembering it.
+        """
+        arrays = _tube_arrays(tubes)
+        key = ('tubes', resolution, tuple([len(tube[0]) for tube in tubes])) + \
+              tuple([a.tostring() for a in arrays])
+        cached = self._lookup(key, lambda: make_tubes(tubes, resolution,
+                                                      arrays))
+        res = []
+        for tube, new_tube in zip(tubes, cached):
+            if len(tube[0]) > 3:
+                res.append(tuple([list(data) for data in new_tube]))
+            else:
+                # not part of key, so not necessarily the same as new_tube
+                res.append(tube)
+        return res
+
+    def make_curved_strand(self, points, colors, radii):
+        """
+        Return make_curved_strand(points, colors, radii), remembering it.
+        """
+        if len(points) <= 3:
+            return (points, colors, radii)
+        arrays = (array(points, Float), array(colors, Float),
+                  array(radii, Float))
+        key = ('strand',) + tuple([a.tostring() for a in arrays])
+        res = self._lookup(key, lambda: make_curved_strand(points, colors,
+                                                           radii, arrays))
+        return tuple([list(data) for data in res])
+
+    pass
+
+# end
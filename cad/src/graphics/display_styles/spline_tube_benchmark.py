@@ -0,0 +1,246 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+spline_tube_benchmark.py -- time making the smooth tubes drawn by the
+ProteinChunks and DnaCylinderChunks display styles, using spline_tube.py
+and (for part of the model) the code it replaced, without a GL context.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py graphics/display_styles/spline_tube_benchmark.py [nresidues [nbasepairs]]
+
+A made-up protein of nresidues residues (default 100000), in secondary
+structure elements of 4 to 15 residues, has the tubes along all its
+elements made at the default Protein display style quality, as
+ProteinChunks.drawchunk makes them (one call of make_tubes per chunk of
+_RESIDUES_PER_CHUNK residues); then again by a SplineTubeCache, both
+for a chunk's first memo and for its next one (as after selecting it).
+Likewise for the strands of a made-up DNA duplex of nbasepairs base
+pairs (default 50000), in chunks of _BASES_PER_CHUNK bases, using
+make_curved_strand.
+
+The code which made one interpolated point at a time is timed for the
+first _MAX_RESIDUES_FOR_OLD_CODE residues or base pairs, and its time for
+the whole model is estimated from that. The tubes it makes are compared
+with the new ones (they should be identical).
+"""
+
+import sys
+import time
+import random
+from math import sin, cos, sqrt
+
+from Numeric import array, Float
+
+from graphics.display_styles.spline_tube import compute_spline
+from graphics.display_styles.spline_tube import make_tubes
+from graphics.display_styles.spline_tube import make_curved_strand
+from graphics.display_styles.spline_tube import SplineTubeCache
+
+# 2 * the default value of proteinStyleQuality_prefs_key
+_RESOLUTION = 20
+
+_RESIDUES_PER_CHUNK = 1000
+
+_BASES_PER_CHUNK = 20
+
+_MAX_RESIDUES_FOR_OLD_CODE = 5000
+
+def V(*v):
+    # like geometry.VQT.V, which can't be imported without Qt
+    return array(v, Float)
+
+def _make_tube_one_point_at_a_time(points, colors, radii, dpos, resolution):
+    """
+    Make a tube the way ProteinChunks.make_tube did before spline_tube.py.
+    """
+    n = len(points)
+    if n <= 3:
+        return (points, colors, radii, dpos)
+    new_points = []
+    new_colors = []
+    new_radii = []
+    new_dpos = []
+    ir = 1.0/float(resolution)
+    for p in range (1, n-2):
+        start_spline = 0
+        end_spline = int(resolution)
+        if p == 1:
+            start_spline = int(resolution / 2 - 1)
+        if p == n-3:
+            end_spline = int(resolution / 2 + 1)
+        for m in range (start_spline, end_spline):
+            t = ir * m
+            new_points.append(compute_spline(points, p, t))
+            new_colors.append(compute_spline(colors, p, t))
+            new_radii.append(compute_spline(radii, p, t))
+            new_dpos.append(compute_spline(dpos, p, t))
+    t = ir * (m + 1)
+    new_points.append(compute_spline(points, p, t))
+    new_colors.append(compute_spline(colors, p, t))
+    new_radii.append(compute_spline(radii, p, t))
+    new_dpos.append(compute_spline(dpos, p, t))
+    return (new_points, new_colors, new_radii, new_dpos)
+
+def _make_curved_strand_one_point_at_a_time(points, colors, radii):
+    """
+    Make a strand tube the way DnaCylinderChunks._make_curved_strand did
+    before spline_tube.py.
+    """
+    n = len(points)
+    if n <= 3:
+        return (points, colors, radii)
+    new_points = [None]
+    new_colors = [None]
+    new_radii = [None]
+    for p in range (1, n-2):
+        for m in range (0, 4):
+            t = 0.25 * m
+            new_points.append(compute_spline(points, p, t))
+            new_colors.append(compute_spline(colors, p, t))
+            new_radii.append(compute_spline(radii, p, t))
+    new_points.append(compute_spline(points, p, 1.0))
+    new_colors.append(compute_spline(colors, p, 1.0))
+    new_radii.append(compute_spline(radii, p, 1.0))
+    new_points[0] = 3.0 * new_points[1] - 3.0 * new_points[2] + new_points[3]
+    new_points.append(3.0 * new_points[-1] - 3.0 * new_points[-2] +
+                      new_points[-3])
+    new_colors[0] = new_colors[1]
+    new_colors.append(new_colors[-1])
+    new_radii[0] = new_radii[1]
+    new_radii.append(new_radii[-1])
+    return (new_points, new_colors, new_radii)
+
+def _made_up_protein(nresidues):
+    """
+    Return a list of chunks, each a list of the tubes (before
+    interpolation) of its secondary structure elements.
+    """
+    random.seed(0)
+    chunks = []
+    tubes = []
+    i = 0
+    while i < nresidues:
+        length = min(random.randint(4, 15), nresidues - i)
+        color = array(random.choice([(1.0, 0.0, 0.0), (0.0, 1.0, 0.0),
+                                 (0.0, 0.0, 1.0)]), Float)
+        points = []
+        dpos = []
+        # include the dummy positions at both ends
+        for k in range(i - 2, i + length + 2):
+            points.append(V(1.5 * k, 2.3 * sin(k), 2.3 * cos(k)))
+            dpos.append(V(0.1, cos(k), -sin(k)) / sqrt(1.01))
+        tubes.append((points, [color] * len(points),
+                      [0.25] * len(points), dpos))
+        i += length
+        if i % _RESIDUES_PER_CHUNK < length or i == nresidues:
+            chunks.append(tubes)
+            tubes = []
+    return chunks
+
+def _made_up_dna(nbasepairs):
+    """
+    Return a list of strand chunks, each a tuple (points, colors, radii)
+    including the dummy positions at both ends.
+    """
+    chunks = []
+    for strand in (0, 1):
+        for start in range(0, nbasepairs, _BASES_PER_CHUNK):
+            n = min(_BASES_PER_CHUNK, nbasepairs - start)
+            points = [V(3.4 * k, 10.0 * sin(0.6 * k + 2.4 * strand),
+                        10.0 * cos(0.6 * k + 2.4 * strand))
+                      for k in range(start - 1, start + n + 1)]
+            colors = [V(0.2, 0.4, 0.6 + 0.01 * strand)] * len(points)
+            chunks.append((points, colors, [1.0] * len(points)))
+    return chunks
+
+def _max_difference(tubes1, tubes2):
+    diff = 0.0
+    for tube1, tube2 in zip(tubes1, tubes2):
+        for data1, data2 in zip(tube1, tube2):
+            d = max(abs(array(data1, Float) - array(data2, Float)).flat)
+            diff = max(diff, d)
+    return diff
+
+def _time(func):
+    t0 = time.time()
+    res = func()
+    return res, time.time() - t0
+
+def _run_protein(nresidues):
+    chunks = _made_up_protein(nresidues)
+    print "protein: %d residues in %d chunks, resolution %d" % \
+          (nresidues, len(chunks), _RESOLUTION)
+
+    old_tubes = []
+    nold = 0
+    t0 = time.time()
+    for tubes in chunks:
+        for tube in tubes:
+            old_tubes.append(_make_tube_one_point_at_a_time(
+                *(tube + (_RESOLUTION,))))
+            nold += len(tube[0]) - 4
+        if nold >= _MAX_RESIDUES_FOR_OLD_CODE:
+            break
+    t_old = (time.time() - t0) * nresidues / nold
+
+    new_tubes, t_new = _time(lambda: [make_tubes(tubes, _RESOLUTION)
+                                      for tubes in chunks])
+    caches = [SplineTubeCache() for tubes in chunks]
+    junk, t_first = _time(lambda: [cache.make_tubes(tubes, _RESOLUTION)
+                                   for cache, tubes in zip(caches, chunks)])
+    caches = [SplineTubeCache(cache) for cache in caches]
+    junk, t_next = _time(lambda: [cache.make_tubes(tubes, _RESOLUTION)
+                                  for cache, tubes in zip(caches, chunks)])
+    all_new_tubes = []
+    for tubes in new_tubes:
+        all_new_tubes.extend(tubes)
+    _report(t_old, t_new, t_first, t_next,
+            _max_difference(old_tubes, all_new_tubes[:len(old_tubes)]))
+    return
+
+def _run_dna(nbasepairs):
+    chunks = _made_up_dna(nbasepairs)
+    print "DNA: %d base pairs in %d strand chunks" % (nbasepairs, len(chunks))
+
+    nchunks = 2 * _MAX_RESIDUES_FOR_OLD_CODE / _BASES_PER_CHUNK
+    old_tubes, t_old = _time(
+        lambda: [_make_curved_strand_one_point_at_a_time(*chunk)
+                 for chunk in chunks[:nchunks]])
+    t_old *= float(len(chunks)) / min(nchunks, len(chunks))
+
+    new_tubes, t_new = _time(lambda: [make_curved_strand(*chunk)
+                                      for chunk in chunks])
+    caches = [SplineTubeCache() for chunk in chunks]
+    junk, t_first = _time(lambda: [cache.make_curved_strand(*chunk)
+                                   for cache, chunk in zip(caches, chunks)])
+    caches = [SplineTubeCache(cache) for cache in caches]
+    junk, t_next = _time(lambda: [cache.make_curved_strand(*chunk)
+                                  for cache, chunk in zip(caches, chunks)])
+    _report(t_old, t_new, t_first, t_next,
+            _max_difference(old_tubes, new_tubes[:len(old_tubes)]))
+    return
+
+def _report(t_old, t_new, t_first, t_next, diff):
+    print "  one point at a time (estimated): %.2f sec" % t_old
+    print "  make_tubes or make_curved_strand: %.2f sec (%.1fx)" % \
+          (t_new, t_old / t_new)
+    print "  SplineTubeCache, first memo: %.2f sec, next memo: %.2f sec" % \
+          (t_first, t_next)
+    print "  largest difference from the old code's tubes: %g" % diff
+    return
+
+if __name__ == '__main__':
+    args = sys.argv[2:] # sys.argv[1] is this file, when run by ExecSubDir.py
+    nresidues = 100000
+    nbasepairs = 50000
+    if args:
+        nresidues = int(args[0])
+    if args[1:]:
+        nbasepairs = int(args[1])
+    _run_protein(nresidues)
+    _run_dna(nbasepairs)
+
+# end
@@ -0,0 +1,92 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+surface_benchmark.py -- time computing SurfaceChunks surfaces, using
+surface_mesh.py and (for small chunks) the original Surface class,
+without a GL context.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py graphics/display_styles/surface_benchmark.py [natoms ...]
+
+For each number of atoms (default 1000, 10000 and 50000), a made-up
+roughly spherical chunk of that many atoms, 1.5 Angstroms apart, has
+its surface computed from scratch; then again with no atoms changed
+(as after a change to its color); then with 1% of its atoms moved a
+little. For chunks of up to 1000 atoms, the original Surface code is
+also timed.
+"""
+
+import sys
+import time
+import random
+
+from Numeric import array, Float
+
+from graphics.display_styles.surface_mesh import compute_surface
+
+_SPACING = 1.5
+
+_MAX_ATOMS_FOR_OLD_CODE = 1000
+
+def _made_up_chunk(natoms):
+    """
+    Return positions and radii for natoms atoms filling a ball.
+    """
+    random.seed(0)
+    positions = []
+    k = 0
+    while len(positions) < natoms:
+        k += 1
+        positions = []
+        for x in range(-k, k + 1):
+            for y in range(-k, k + 1):
+                for z in range(-k, k + 1):
+                    if x * x + y * y + z * z <= k * k:
+                        positions.append((x * _SPACING + random.uniform(-0.1, 0.1),
+                                          y * _SPACING + random.uniform(-0.1, 0.1),
+                                          z * _SPACING + random.uniform(-0.1, 0.1)))
+    positions = positions[:natoms]
+    radii = [random.choice((1.2, 1.5, 1.7)) for pos in positions]
+    return array(positions, Float), array(radii, Float)
+
+def _time_old_code(positions, radii):
+    from graphics.display_styles.SurfaceChunks import SurfaceChunks
+    center = sum(positions) / len(positions)
+    t0 = time.time()
+    SurfaceChunks._compute_memo_using_Surface.im_func(
+        None, positions - center, radii, center, (0.5, 0.5, 0.5))
+    return time.time() - t0
+
+def _run(sizes):
+    compute_surface(*_made_up_chunk(10)) # make the sphere meshes
+    atlist = object() # stands for chunk.atlist, which is compared by identity
+    for natoms in sizes:
+        positions, radii = _made_up_chunk(natoms)
+        t0 = time.time()
+        memo = compute_surface(positions, radii, atlist)
+        t1 = time.time()
+        memo = compute_surface(positions, radii, atlist, memo[-1])
+        t2 = time.time()
+        moved = positions.copy()
+        for i in range(0, natoms, 100):
+            moved[i] = moved[i] + (0.2, -0.1, 0.1)
+        compute_surface(moved, radii, atlist, memo[-1])
+        t3 = time.time()
+        print "%d atoms: from scratch %.3f sec, unchanged %.3f sec, " \
+              "1%% moved %.3f sec" % (natoms, t1 - t0, t2 - t1, t3 - t2)
+        if natoms <= _MAX_ATOMS_FOR_OLD_CODE:
+            print "  original Surface code: %.3f sec" % \
+                  _time_old_code(positions, radii)
+    return
+
+if __name__ == '__main__':
+    args = sys.argv[2:] # sys.argv[1] is this file, when run by ExecSubDir.py
+    if args:
+        _run(map(int, args))
+    else:
+        _run([1000, 10000, 50000])
+
+# end
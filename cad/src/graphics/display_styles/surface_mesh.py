@@ -0,0 +1,285 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+surface_mesh.py -- array-based computation of the surface meshes drawn
+by the SurfaceChunks display style.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+This computes the same surface as class Surface in SurfaceChunks.py
+(a sphere mesh around the chunk, each of whose vertices is moved along
+its normal according to the "omega function" of the atom spheres at that
+vertex), but with whole-array operations:
+
+- the sphere mesh for each level of detail, with its duplicate vertices
+  merged and its vertex normals, is computed once per session;
+
+- the omega function at each vertex only looks at the atoms close enough
+  to that vertex to have the largest value there (found using a CellList),
+  rather than at every atom;
+
+- the result is kept (in a SurfaceState, which SurfaceChunks keeps in its
+  memo), and when the memo is recomputed for the same atoms in the same
+  place (e.g. after a change to the chunk's color, or after moving the
+  whole chunk, since this works in chunk-relative coordinates), or with
+  only some of them moved (but not so far that the surface's bounding
+  sphere would need to be much different), the omega function is only
+  recomputed at the vertices where the atoms which changed had, or now
+  have, the largest value.
+
+Nothing here uses OpenGL, Qt or the model, so this can run in a worker
+thread (see RemakeScheduler).
+"""
+
+from Numeric import array, zeros, take, put, add, sqrt, argsort, reshape
+from Numeric import compress, concatenate, transpose, nonzero, greater
+from Numeric import not_equal, equal, absolute, maximum, arange
+from Numeric import Float, Int
+
+from geometry.CellList import CellList
+from graphics.drawing.shape_vertices import getSphereTriangles
+
+# Mesh vertices closer than this (squared) are merged, as in
+# Surface.Duplicate.
+_DUPLICATE_DIST2 = 0.0000001
+
+# Cell size used for finding duplicate mesh vertices (on the unit sphere).
+_DUPLICATE_CELLSIZE = 0.01
+
+# Surface.SurfaceTriangles never moves a vertex by less than this value
+# of the omega function.
+_OMEGA_MIN = -2.0
+
+# Spheres whose omega at a vertex is within this of the largest one there
+# are treated as possibly being the largest one (see _changed_vertices).
+_OMEGA_TOLERANCE = 1e-9
+
+# How far from each vertex omega first looks for spheres, as a multiple
+# of the largest sphere radius.
+_FIRST_CUTOFF = 3.0
+
+# The bounding sphere of a changed chunk's atoms is reused (so only the
+# vertices affected by changed atoms need new omega values) if it still encloses
+# them, and a new one would not be smaller than this fraction of it.
+_MIN_RADIUS_FRACTION = 0.9
+
+_sphere_meshes = {} # level -> (points, trias, normals)
+
+def sphere_mesh(level):
+    """
+    Return (points, trias, normals) for a unit sphere mesh made by
+    getSphereTriangles(level), where points is an (N,3) array of its
+    vertices (with duplicates merged), trias is a (T,3) array of
+    indices into points of the corners of each triangle, and normals
+    is an (N,3) array of unnormalized vertex normals.
+    """
+    mesh = _sphere_meshes.get(level)
+    if mesh is None:
+        corners = array(getSphereTriangles(level), Float)
+        points, trias = merge_duplicate_points(reshape(corners, (-1, 3)))
+        mesh = (points, trias, vertex_normals(points, trias))
+        _sphere_meshes[level] = mesh
+    return mesh
+
+def merge_duplicate_points(corners):
+    """
+    Given an (3T,3) array of the corners of T triangles, return
+    (points, trias), where points are the distinct corners (in order of
+    first appearance), and trias is a (T,3) array of the indices into
+    points of each triangle's corners.
+    """
+    n = len(corners)
+    i, j, dist2 = CellList(corners, _DUPLICATE_CELLSIZE).pairs_within(
+        sqrt(_DUPLICATE_DIST2))
+    rep = arange(n) # the first corner at the same place as each corner
+    if len(i):
+        # i < j; write smaller i last, so each j gets the smallest one
+        order = argsort(-i)
+        put(rep, take(j, order, 0), take(i, order, 0))
+        rep = take(rep, rep, 0)
+    first = equal(rep, arange(n))
+    new_index = add.accumulate(first) - 1
+    points = compress(first, corners, 0)
+    trias = reshape(take(new_index, rep, 0), (-1, 3))
+    return points, trias
+
+def vertex_normals(points, trias):
+    """
+    Return an array of the sum of the (unnormalized) normals of the
+    triangles around each point, as in Surface.SurfaceNormals.
+    Every point must be a corner of some triangle.
+    """
+    p0 = take(points, trias[:, 0], 0)
+    v0 = take(points, trias[:, 1], 0) - p0
+    v1 = take(points, trias[:, 2], 0) - p0
+    normals = transpose(array([v0[:, 1] * v1[:, 2] - v0[:, 2] * v1[:, 1],
+                               v0[:, 2] * v1[:, 0] - v0[:, 0] * v1[:, 2],
+                               v0[:, 0] * v1[:, 1] - v0[:, 1] * v1[:, 0]]))
+    indices = concatenate((trias[:, 0], trias[:, 1], trias[:, 2]))
+    order = argsort(indices)
+    sorted_indices = take(indices, order, 0)
+    sums = add.accumulate(
+        take(concatenate((normals, normals, normals)), order, 0))
+    # each point's sum is the change in sums over its run of indices
+    ends = nonzero(not_equal(sorted_indices[1:], sorted_indices[:-1]))
+    ends = concatenate((ends, [len(indices) - 1]))
+    assert len(ends) == len(points)
+    run_sums = take(sums, ends, 0)
+    return concatenate((run_sums[:1], run_sums[1:] - run_sums[:-1]))
+
+def _largest_values(q, s, n):
+    """
+    Return an array of n values, each the largest s[k] for which q[k] is
+    its index, or _OMEGA_MIN if that's larger or there is none.
+    """
+    res = zeros((n,), Float) + _OMEGA_MIN
+    larger = greater(s, _OMEGA_MIN)
+    q = compress(larger, q, 0)
+    s = compress(larger, s, 0)
+    # write larger values last, so each index gets the largest one
+    order = argsort(s)
+    put(res, take(q, order, 0), take(s, order, 0))
+    return res
+
+def _reach(om, rmax):
+    """
+    Return how far (as an array, for an array of omega values om) a
+    sphere of radius no larger than rmax can be from a vertex and still
+    have omega larger than om there.
+    """
+    return sqrt(rmax * rmax - 2 * rmax * om)
+
+def omega(vertices, centers, radii):
+    """
+    Return an array of the values of the omega function (as computed by
+    Surface.Predicate, but no less than the smallest value
+    Surface.SurfaceTriangles uses) of the spheres with the given centers
+    and radii, at each of the given vertices.
+    """
+    n = len(vertices)
+    res = zeros((n,), Float) + _OMEGA_MIN
+    if not n or not len(centers):
+        return res
+    # Look for spheres close to each vertex first, and only look farther
+    # for the vertices at which a farther sphere could have a larger value
+    # than the largest one found. (Vertices outside all the spheres, as
+    # they are before SurfaceTriangles moves them, are rarely affected by
+    # spheres much farther away than the closest ones.)
+    rmax = maximum.reduce(radii)
+    max_cutoff = _reach(_OMEGA_MIN, rmax)
+    cutoff = min(max_cutoff, _FIRST_CUTOFF * rmax)
+    todo = arange(n)
+    while 1:
+        q, i, dist2 = CellList(centers, cutoff).near_pairs(
+            take(vertices, todo, 0), cutoff)
+        r = take(radii, i, 0)
+        found = _largest_values(q, (r * r - dist2) / (r + r), len(todo))
+        put(res, todo, found)
+        if cutoff >= max_cutoff:
+            break
+        todo = compress(greater(_reach(found, rmax), cutoff), todo, 0)
+        if not len(todo):
+            break
+        cutoff = min(max_cutoff, 2 * cutoff)
+    return res
+
+def _changed_vertices(vertices, om, centers, radii):
+    """
+    Return an array of the indices of the vertices at which omega (whose
+    values are om) would be different if the spheres with the given
+    centers and radii were added or removed.
+    """
+    rmax = maximum.reduce(radii)
+    cutoff = _reach(_OMEGA_MIN, rmax)
+    q, i, dist2 = CellList(vertices, cutoff).near_pairs(centers, cutoff)
+    r = take(radii, q, 0)
+    s = (r * r - dist2) / (r + r)
+    # (a removed sphere matters if omega is its value, an added one if
+    #  its value is larger)
+    matters = greater(s, take(om, i, 0) - _OMEGA_TOLERANCE)
+    changed = zeros((len(vertices),), Int)
+    put(changed, compress(matters, i, 0), 1)
+    return nonzero(changed)
+
+class SurfaceState:
+    """
+    What compute_surface needs to remember about a chunk's surface in
+    order to recompute only part of it later.
+    """
+    def __init__(self, atlist, positions, radii, center, radius, level, om):
+        self.atlist = atlist # only compared by identity
+        self.positions = positions
+        self.radii = radii
+        self.center = center
+        self.radius = radius
+        self.level = level
+        self.omega = om
+        return
+    pass
+
+def compute_surface(positions, radii, atlist = None, old_state = None):
+    """
+    Compute a surface around the atom spheres with the given positions
+    (an (N,3) array, in chunk-relative coordinates) and radii (an (N,)
+    array).
+
+    If old_state is the SurfaceState returned for an earlier call with
+    the same atlist (which is only compared by identity), and its
+    bounding sphere can be reused, only recompute omega near the atoms
+    whose positions or radii changed since then.
+
+    @return: (center, radius, tm, nm, state), where center and radius
+             (in chunk-relative coordinates) give the bounding sphere
+             that the mesh's unit sphere coordinates are relative to,
+             tm and nm are the mesh triangles and normals in the format
+             returned by Surface.SurfaceTriangles and Surface.SurfaceNormals
+             (see drawsurface), and state is a new SurfaceState.
+    """
+    n = len(positions)
+    center = add.reduce(positions) / n
+    rel = positions - center
+    rad = sqrt(maximum.reduce(add.reduce(rel * rel, 1)))
+    margin = maximum.reduce(radii)
+    radius = rad + margin
+    level = 3
+    if rad > 6:
+        level = 4
+    changed = None # indices of changed atoms, if only they need redoing
+    if old_state is not None and atlist is not None and \
+       old_state.atlist is atlist and len(old_state.positions) == n:
+        rel = positions - old_state.center
+        old_rad = sqrt(maximum.reduce(add.reduce(rel * rel, 1)))
+        if old_rad + margin <= old_state.radius and \
+           radius >= _MIN_RADIUS_FRACTION * old_state.radius:
+            center = old_state.center
+            radius = old_state.radius
+            level = old_state.level
+            moved = add.reduce(absolute(positions - old_state.positions), 1)
+            changed = nonzero(greater(moved, 0) +
+                              not_equal(radii, old_state.radii))
+    points, trias, normals = sphere_mesh(level)
+    centers = (positions - center) / radius
+    scaled_radii = radii / radius
+    if changed is None:
+        om = omega(points, centers, scaled_radii)
+    else:
+        om = array(old_state.omega)
+        if len(changed):
+            old_centers = (take(old_state.positions, changed, 0) - center) / radius
+            redo = _changed_vertices(
+                points, om,
+                concatenate((take(centers, changed, 0), old_centers)),
+                concatenate((take(scaled_radii, changed, 0),
+                             take(old_state.radii, changed, 0) / radius)))
+            if len(redo):
+                put(om, redo, omega(take(points, redo, 0),
+                                    centers, scaled_radii))
+    state = SurfaceState(atlist, positions, radii, center, radius, level, om)
+    # move each vertex inwards along its normal, as in SurfaceTriangles
+    lengths = sqrt(add.reduce(normals * normals, 1))
+    surface_points = points + reshape(0.5 * om / lengths, (-1, 1)) * normals
+    nm = map(tuple, vertex_normals(surface_points, trias).tolist())
+    tm = (map(tuple, trias.tolist()), map(tuple, surface_points.tolist()), [])
+    return center, radius, tm, nm, state
+
+# end
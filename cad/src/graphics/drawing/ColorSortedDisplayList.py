@@ -468,8 +468,22 @@ class ColorSortedDisplayList:    #Russ 080225: Added.
         . color is a list of components: [R, G, B].
         . glname comes from the _gl_name_stack.
         """
+        self.addSpheres([center], radius, color, glname)
+        return
+
+    def addSpheres(self, centers, radii, colors, glnames): #bruce 090325
+        """
+        Like addSphere, but for a whole batch of spheres at once, which is
+        much faster than adding them one at a time.
+
+        . centers is a list of VQT points, or an (N,3) array.
+        . radii, colors and glnames may each be a single value for all the
+          spheres, or a list (or array) of one value per sphere.
+
+        See GLSphereBuffer.addSpheres for details.
+        """
         self.spheres += drawing_globals.sphereShaderGlobals.primitiveBuffer.addSpheres(
-            [center], radius, color, self.transform_id(), glname)
+            centers, radii, colors, self.transform_id(), glnames)
         self._clear_derived_primitive_caches()
         return
 
@@ -483,8 +497,21 @@ class ColorSortedDisplayList:    #Russ 080225: Added.
         . color is a list of components: [R, G, B] or [R, G, B, A].
         . glname comes from the _gl_name_stack.
         """
+        self.addCylinders([endpts], radii, color, glname)
+        return
+
+    def addCylinders(self, endpts, radii, colors, glnames): #bruce 090325
+        """
+        Like addSpheres, but for cylinders.
+
+        . endpts is a list of tuples of two VQT points, or an (N,2,3) array.
+        . radii, colors and glnames are as for addSpheres, except that
+          radii may also be tuples of two radii for taper (or an (N,2) array).
+
+        See GLCylinderBuffer.addCylinders for details.
+        """
         self.cylinders += drawing_globals.cylinderShaderGlobals.primitiveBuffer.addCylinders(
-            [endpts], radii, color, self.transform_id(), glname)
+            endpts, radii, colors, self.transform_id(), glnames)
         self._clear_derived_primitive_caches()
         return
 
@@ -83,6 +83,7 @@ from OpenGL.GL import GL_TRUE
 
 from geometry.VQT import A
 
+from Numeric import concatenate, reshape, ones, Float
 
 from utilities.debug import print_compact_stack
 
@@ -123,6 +124,34 @@ _the_fake_GLPane = _fake_GLPane()
     # as of 090304 we use this as the non-sorting value of
     # ColorSorter.glpane, rather than None like before
 
+def _batch_values(values, n): #bruce 090325
+    """
+    Return a list (or array) of n values for a batch of primitives, given
+    one value for all of them (None, a number, or a tuple) or a list or
+    array of n values.
+    """
+    if values is None or type(values) in (type(()), type(0), type(0L),
+                                          type(0.0)):
+        return n * [values]
+    assert len(values) == n
+    return values
+
+def _colors_with_opacity(colors, opacity): #bruce 090325
+    """
+    Given one color, or a list or array of colors (all with the same number
+    of components), return the same with opacity added to whichever colors
+    lack it. One color is returned as a tuple, and several as an array.
+    """
+    colors = A(colors)
+    if len(colors.shape) == 1:
+        if len(colors) == 3:
+            return (colors[0], colors[1], colors[2], opacity)
+        return tuple(colors)
+    if colors.shape[1] == 3:
+        colors = concatenate((colors, opacity * ones((len(colors), 1), Float)),
+                             1)
+    return colors
+
 class ColorSorter:
     """
     State Sorter specializing in color (really any object that can be
@@ -202,6 +231,9 @@ class ColorSorter:
         ColorSorter._cur_shapelist = None
         ColorSorter.sphereLevel = -1
 
+        ColorSorter._batched_spheres = None # see start_batch
+        ColorSorter._batched_cylinders = None
+
         return
 
     _init_state = staticmethod(_init_state)
@@ -229,6 +261,8 @@ class ColorSorter:
         state.sorted_by_color = ColorSorter.sorted_by_color
         state._cur_shapelist = ColorSorter._cur_shapelist
         state.sphereLevel = ColorSorter.sphereLevel
+        state._batched_spheres = ColorSorter._batched_spheres
+        state._batched_cylinders = ColorSorter._batched_cylinders
 
         ColorSorter._suspended_states += [state]
         ColorSorter._init_state()
@@ -255,6 +289,8 @@ class ColorSorter:
             ColorSorter.sorted_by_color = state.sorted_by_color
             ColorSorter._cur_shapelist = state._cur_shapelist
             ColorSorter.sphereLevel = state.sphereLevel
+            ColorSorter._batched_spheres = state._batched_spheres
+            ColorSorter._batched_cylinders = state._batched_cylinders
             pass
         else:
             #bruce 090220 guess precaution
@@ -469,7 +505,11 @@ class ColorSorter:
                 lcolor = color
                 pass
 
-            if sphereBatches and ColorSorter._parent_csdl: # Russ 080925: Added.
+            if sphereBatches and ColorSorter._batched_spheres is not None:
+                # added to the CSDL by finish_batch
+                ColorSorter._batched_spheres.append(
+                    (lcolor, pos, radius, ColorSorter._gl_name_stack[-1]))
+            elif sphereBatches and ColorSorter._parent_csdl: # Russ 080925: Added.
                 # Collect lists of primitives in the CSDL, rather than sending
                 # them down through the ColorSorter schedule methods into DLs.
                 assert ColorSorter.sorting # since _parent_csdl is present
@@ -494,6 +534,77 @@ class ColorSorter:
     schedule_sphere = staticmethod(schedule_sphere)
 
 
+    def _batching_into_csdl(shader_wanted, shader_available): #bruce 090325
+        """
+        Would a batch of primitives scheduled now go straight into the
+        current CSDL as shader primitives, given the methods which say
+        whether the shader for that kind of primitive is desired and
+        available?
+        """
+        csdl = ColorSorter._parent_csdl
+        return (csdl and
+                not csdl.reentrant and
+                not (ColorSorter.glpane.glprefs.use_c_renderer and
+                     ColorSorter.sorting) and
+                ColorSorter._permit_shaders and
+                shader_wanted() and
+                shader_available())
+
+    _batching_into_csdl = staticmethod(_batching_into_csdl)
+
+
+    def schedule_spheres(colors, centers, radii, detailLevel,
+                         opacity = 1.0, glnames = None):
+        """
+        Schedule a batch of spheres for rendering, like calling
+        schedule_sphere for each one (inside pushName/popName of its glname,
+        if glnames are given), but much faster when sphere shaders are being
+        used to collect the spheres into a CSDL, since they are then stored
+        in its primitive buffer with whole-array operations. [bruce 090325]
+
+        @param colors: one color for all the spheres, or a list or array
+            of one color per sphere.
+
+        @param centers: a list of points, or an (N,3) array.
+
+        @param radii: one radius for all the spheres, or a list or array
+            of one radius per sphere.
+
+        @param glnames: None (to use the current glname, as schedule_sphere
+            does), or one glname for all the spheres, or a list or array of
+            one glname per sphere. (Zero is not allowed, as for pushName.)
+        """
+        n = len(centers)
+        if not n:
+            return
+        colors = _colors_with_opacity(colors, opacity)
+        if ColorSorter._batching_into_csdl(
+            ColorSorter.glpane.glprefs.sphereShader_desired,
+            drawing_globals.sphereShader_available ):
+            assert ColorSorter.sorting # since _parent_csdl is present
+            if glnames is None:
+                glnames = ColorSorter._gl_name_stack[-1]
+            ColorSorter._parent_csdl.addSpheres(centers, radii, colors, glnames)
+            return
+        # Otherwise schedule them one at a time.
+        if type(colors) != type(()):
+            colors = map(tuple, colors)
+        colors = _batch_values(colors, n)
+        radii = _batch_values(radii, n)
+        glnames = _batch_values(glnames, n)
+        for i in range(n):
+            if glnames[i] is not None:
+                ColorSorter.pushName(glnames[i])
+            ColorSorter.schedule_sphere(colors[i], centers[i], radii[i],
+                                        detailLevel, opacity)
+            if glnames[i] is not None:
+                ColorSorter.popName()
+            continue
+        return
+
+    schedule_spheres = staticmethod(schedule_spheres)
+
+
     def schedule_wiresphere(color, pos, radius, detailLevel = 1):
         """
         Schedule a wiresphere for rendering whenever ColorSorter thinks is
@@ -590,7 +701,12 @@ class ColorSorter:
                                 ColorSorter.glpane.glprefs.cylinderShader_desired() and
                                 drawing_globals.cylinderShader_available()
                               )
-            if cylinderBatches and ColorSorter._parent_csdl:
+            if cylinderBatches and ColorSorter._batched_cylinders is not None:
+                # added to the CSDL by finish_batch
+                ColorSorter._batched_cylinders.append(
+                    (lcolor, pos1, pos2, radius,
+                     ColorSorter._gl_name_stack[-1]))
+            elif cylinderBatches and ColorSorter._parent_csdl:
                 # Note: capped is not used; a test indicates it's always on
                 # (at least in the tapered case). [bruce 090225 comment]
                 assert ColorSorter.sorting # since _parent_csdl is present
@@ -609,6 +725,121 @@ class ColorSorter:
     schedule_cylinder = staticmethod(schedule_cylinder)
 
 
+    def schedule_cylinders(colors, pos1s, pos2s, radii, capped = 0,
+                           opacity = 1.0, glnames = None):
+        """
+        Schedule a batch of cylinders for rendering, like calling
+        schedule_cylinder for each one; see schedule_spheres for details.
+        [bruce 090325]
+
+        @param pos1s: axis endpoints 1, a list of points or an (N,3) array.
+
+        @param pos2s: axis endpoints 2, likewise.
+
+        @param radii: one radius for all the cylinders, or a list or array
+            of one radius per cylinder. As for schedule_cylinder, each
+            radius can be a tuple of two radii for a tapered cylinder.
+        """
+        n = len(pos1s)
+        assert len(pos2s) == n
+        if not n:
+            return
+        colors = _colors_with_opacity(colors, opacity)
+        if ColorSorter._batching_into_csdl(
+            ColorSorter.glpane.glprefs.cylinderShader_desired,
+            drawing_globals.cylinderShader_available ):
+            assert ColorSorter.sorting # since _parent_csdl is present
+            if glnames is None:
+                glnames = ColorSorter._gl_name_stack[-1]
+            endpts = reshape(concatenate((A(pos1s), A(pos2s)), 1), (n, 2, 3))
+            ColorSorter._parent_csdl.addCylinders(endpts, radii, colors,
+                                                  glnames)
+            return
+        # Otherwise schedule them one at a time.
+        if type(colors) != type(()):
+            colors = map(tuple, colors)
+        colors = _batch_values(colors, n)
+        radii = _batch_values(radii, n)
+        glnames = _batch_values(glnames, n)
+        for i in range(n):
+            if glnames[i] is not None:
+                ColorSorter.pushName(glnames[i])
+            radius = radii[i]
+            if type(radius) not in (type(()), type(0.0)):
+                # an int, or a row or element of an array
+                if len(A(radius).shape):
+                    radius = tuple(radius)
+                else:
+                    radius = float(radius)
+            ColorSorter.schedule_cylinder(colors[i], pos1s[i], pos2s[i],
+                                          radius, capped, opacity)
+            if glnames[i] is not None:
+                ColorSorter.popName()
+            continue
+        return
+
+    schedule_cylinders = staticmethod(schedule_cylinders)
+
+
+    def start_batch(): #bruce 090325
+        """
+        Until finish_batch is called, collect the spheres and cylinders
+        scheduled one at a time (by schedule_sphere and schedule_cylinder)
+        which would go straight into the current CSDL as shader primitives,
+        rather than adding each one to it when it's scheduled. Other
+        primitives are scheduled as usual.
+
+        This lets code which draws one model object at a time, like
+        ChunkDrawer._standard_draw_atoms, add all the spheres and cylinders
+        of a chunk with one call each of schedule_spheres and
+        schedule_cylinders. (Tapered cylinders are not collected.)
+
+        Does nothing unless schedule_spheres or schedule_cylinders would
+        add a batch of primitives to the current CSDL (so when there is no
+        CSDL, or it's reentrant, or the shaders are not being used, every
+        primitive is scheduled when its schedule method is called).
+        """
+        assert ColorSorter._batched_spheres is None
+        assert ColorSorter._batched_cylinders is None
+        if ColorSorter._batching_into_csdl(
+            ColorSorter.glpane.glprefs.sphereShader_desired,
+            drawing_globals.sphereShader_available ):
+            ColorSorter._batched_spheres = []
+        if ColorSorter._batching_into_csdl(
+            ColorSorter.glpane.glprefs.cylinderShader_desired,
+            drawing_globals.cylinderShader_available ):
+            ColorSorter._batched_cylinders = []
+        return
+
+    start_batch = staticmethod(start_batch)
+
+    def finish_batch(detailLevel): #bruce 090325
+        """
+        Schedule the spheres and cylinders collected since start_batch,
+        using schedule_spheres and schedule_cylinders (so each glname is the
+        one which was current when that primitive was scheduled), and stop
+        collecting them.
+
+        @param detailLevel: passed to schedule_spheres (which doesn't use it
+            for shader spheres).
+        """
+        spheres = ColorSorter._batched_spheres
+        cylinders = ColorSorter._batched_cylinders
+        ColorSorter._batched_spheres = None
+        ColorSorter._batched_cylinders = None
+        if spheres:
+            colors, centers, radii, glnames = map(list, zip(*spheres))
+            ColorSorter.schedule_spheres(colors, centers, radii, detailLevel,
+                                         glnames = glnames)
+        if cylinders:
+            colors, pos1s, pos2s, radii, glnames = map(list, zip(*cylinders))
+            ColorSorter.schedule_cylinders(colors, pos1s, pos2s, radii,
+                                           glnames = glnames)
+        return
+
+    finish_batch = staticmethod(finish_batch)
+
+
     def _schedule_tapered_cylinder(color, pos1, pos2, radius, capped = 0, opacity = 1.0):
         """
         Schedule a tapered cylinder for rendering whenever ColorSorter thinks is
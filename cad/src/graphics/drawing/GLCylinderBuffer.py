@@ -24,6 +24,8 @@ from graphics.drawing.GLPrimitiveBuffer import GLPrimitiveBuffer, HunkBuffer
 
 from geometry.VQT import V, A
 
+import numpy
+
 
 class GLCylinderBuffer(GLPrimitiveBuffer):
     """
@@ -56,16 +58,18 @@ class GLCylinderBuffer(GLPrimitiveBuffer):
 
     def addCylinders(self, endpts, radii, colors, transform_ids, glnames):
         """
-        Cylinder endpts must be a list of tuples of 2 VQT points.
+        Cylinder endpts must be a list of tuples of 2 VQT points, or an
+        (N,2,3) array.
 
-        Lists or single values may be given for the attributes of the cylinders
-        (radii, colors, transform_ids, and selection glnames).  A single value
-        is replicated for the whole batch.  The lengths of attribute lists must
-        match the endpoints list.
+        Lists (or arrays) or single values may be given for the attributes of
+        the cylinders (radii, colors, transform_ids, and selection glnames).  A
+        single value is replicated for the whole batch.  The lengths of
+        attribute lists must match the endpoints list.
 
         radii and colors are required.  Cylinder radii are single numbers
-        (untapered) or tuples of 2 numbers (tapered).  Colors are tuples of
-        components: (R, G, B) or (R, G, B, A).
+        (untapered) or tuples of 2 numbers (tapered); a list of radii may
+        contain either, or be an (N,) or (N,2) array.  Colors are tuples of
+        components: (R, G, B) or (R, G, B, A), or an (N,3) or (N,4) array.
 
         transform_ids may be None for endpts in global modeling coordinates.
 
@@ -74,72 +78,88 @@ class GLCylinderBuffer(GLPrimitiveBuffer):
         objects in a global object dictionary
 
         The return value is a list of allocated primitive IDs for the cylinders.
+
+        All the cylinders are stored with whole-array operations, as in
+        GLSphereBuffer.addSpheres. [bruce 090325]
         """
         nCylinders = len(endpts)
+        newIDs = self.newPrimitives(nCylinders)
+        if not nCylinders:
+            return newIDs
 
-        for endptTuple in endpts:
-            assert type(endptTuple) == type(())
-            assert len(endptTuple) == 2
-
-        if type(radii) == type(()):
-            # A tuple of two numbers.
-            assert len(radii) == 2
-            radii = (float(radii[0]), float(radii[1]))
-        elif type(radii) != type([]):
-            # Not a list, better be a single number.
-            radii = (float(radii), float(radii))
-
-        if type(radii) == type([]):
-            assert len(radii) == nCylinders
-        else:
-            radii = nCylinders * [radii]
+        if transform_ids is None:
+            # This bypasses transform logic in the shader for these cylinders.
+            transform_ids = -1
             pass
 
-        if type(colors) == type([]):
-            assert len(colors) == nCylinders
-            colors = [self.color4(colors) for color in colors]
-        else:
-            colors = nCylinders * [self.color4(colors)]
-            pass
+        if nCylinders == 1:
+            # Adding one cylinder at a time is still common (e.g. from
+            # ColorSorter.schedule_cylinder), so do it without array setup.
+            newID = newIDs[0]
+            endpt2 = endpts[0]
+            if type(radii) == type(()):
+                radius2 = radii
+            elif type(radii) == type([]):
+                radius2 = radii[0]
+            else:
+                radius2 = self.first_value(radii, 0)
+            if len(numpy.shape(radius2)):
+                radius0, radius1 = radius2
+            else:
+                radius0 = radius1 = radius2
+            self.endptRad0Hunks.setData(
+                newID, (endpt2[0][0], endpt2[0][1], endpt2[0][2], radius0))
+            self.endptRad1Hunks.setData(
+                newID, (endpt2[1][0], endpt2[1][1], endpt2[1][2], radius1))
+            self.colorHunks.setData(newID,
+                                    self.color4(self.first_value(colors, 1)))
+            if self.transform_id_Hunks:
+                self.transform_id_Hunks.setData(
+                    newID, self.first_value(transform_ids, 0))
+            self.glname_color_Hunks.setData(
+                newID, self.glname_color(self.first_value(glnames, 0)))
+            return newIDs
 
-        if type(transform_ids) == type([]):
-            assert len(transform_ids) == nCylinders
-        else:
-            if transform_ids is None:
-                 # This bypasses transform logic in the shader for this cylinder.
-                transform_ids = -1
-                pass
-            transform_ids = nCylinders * [transform_ids]
-            pass
+        endpts = numpy.asarray(endpts, dtype = numpy.float32)
+        assert endpts.shape == (nCylinders, 2, 3)
 
-        if type(glnames) == type([]):
-            assert len(glnames) == nCylinders
+        if type(radii) == type(()):
+            # A tuple of two numbers.
+            assert len(radii) == 2
+            radii2 = numpy.resize(numpy.asarray(radii, dtype = numpy.float32),
+                                  (nCylinders, 2))
+        elif type(radii) == type([]) and \
+             [radius for radius in radii if type(radius) == type(())]:
+            # A list of tapered (and maybe also untapered) radii.
+            radii2 = numpy.array(
+                [(type(radius) == type(())) and radius or (radius, radius)
+                 for radius in radii], dtype = numpy.float32)
         else:
-            if glnames is None:
-                glnames = 0
+            radii = numpy.asarray(radii, dtype = numpy.float32)
+            if radii.ndim == 2:
+                radii2 = radii
+            else:
+                radii2 = numpy.empty((nCylinders, 2), dtype = numpy.float32)
+                radii2[:, 0] = radii2[:, 1] = self.value_array(radii,
+                                                               nCylinders)
                 pass
-            glnames = nCylinders * [glnames]
             pass
-
-        newIDs = self.newPrimitives(nCylinders)
-        for (newID, endpt2, radius2, color, transform_id, glname) in \
-            zip(newIDs, endpts, radii, colors, transform_ids, glnames):
-
-            # Combine each center and radius into one vertex attribute.
-            endptRad0 = V(endpt2[0][0], endpt2[0][1], endpt2[0][2], radius2[0])
-            endptRad1 = V(endpt2[1][0], endpt2[1][1], endpt2[1][2], radius2[1])
-            self.endptRad0Hunks.setData(newID, endptRad0)
-            self.endptRad1Hunks.setData(newID, endptRad1)
-            self.colorHunks.setData(newID, color)
-            if self.transform_id_Hunks:
-                self.transform_id_Hunks.setData(newID, transform_id)
-            # Break the glname into RGBA pixel color components, 0.0 to 1.0 .
-            # (Per-vertex attributes are all multiples (1-4) of Float32.)
-            ##rgba = [(glname >> bits & 0xff) / 255.0 for bits in range(24,-1,-8)]
-            ## Temp fix: Ignore the last byte, which always comes back 255 on Windows.
-            rgba = [(glname >> bits & 0xff) / 255.0 for bits in range(16,-1,-8)]+[0.0]
-            self.glname_color_Hunks.setData(newID, rgba)
-            continue
+        assert radii2.shape == (nCylinders, 2)
+
+        # Combine each endpoint and radius into one vertex attribute.
+        endptRads = numpy.empty((nCylinders, 2, 4), dtype = numpy.float32)
+        endptRads[:, :, :3] = endpts
+        endptRads[:, :, 3] = radii2
+        self.endptRad0Hunks.setDataRange(newIDs, endptRads[:, 0])
+        self.endptRad1Hunks.setDataRange(newIDs, endptRads[:, 1])
+
+        self.colorHunks.setDataRange(newIDs,
+                                     self.color4_array(colors, nCylinders))
+        if self.transform_id_Hunks:
+            self.transform_id_Hunks.setDataRange(
+                newIDs, self.value_array(transform_ids, nCylinders))
+        self.glname_color_Hunks.setDataRange(
+            newIDs, self.glname_color_array(glnames, nCylinders))
 
         return newIDs
 
@@ -248,8 +248,14 @@ class GLPrimitiveBuffer(object):
         # when this GLPrimitiveBuffer was last flushed to graphics card RAM.
         self.flushed = drawing_constants.NO_EVENT_YET
 
-        # Fill in shared data in the graphics card RAM.
-        self._setupSharedVertexData()
+        # Shared data in the graphics card RAM is filled in by
+        # _setupSharedVertexData, but not until we're first drawn, so that
+        # primitives can be allocated and filled in without a GL context
+        # (e.g. by a CSDL being rebuilt in a test or benchmark).
+        # [bruce 090325]
+        self.nIndices = len(indexBlock) * len(indexBlock[0])
+        self.hunkVertVBO = None
+        self.hunkIndexIBO = None
 
         # Cached info for blocks of transforms.
         # Transforms here are lists (or Numpy arrays) of 16 numbers.
@@ -269,30 +275,113 @@ class GLPrimitiveBuffer(object):
             pass
         return color
 
+    def color4_array(self, colors, n):
+        """
+        Return an (n,4) float32 array of RGBA colors for n primitives, given
+        a single color or a sequence or array of n colors, each with 3 or 4
+        components (an opacity of 1.0 is added to colors that lack one).
+        """
+        colors = numpy.asarray(colors, dtype = numpy.float32)
+        if colors.ndim == 1:
+            colors = colors.reshape((1, -1)).repeat(n, 0)
+        assert colors.shape[0] == n
+        if colors.shape[1] == 3:
+            colors = numpy.concatenate(
+                (colors, numpy.ones((n, 1), dtype = numpy.float32)), 1)
+        assert colors.shape == (n, 4)
+        return colors
+
+    def value_array(self, values, n):
+        """
+        Return an (n,) float32 array of a per-primitive value (like a radius or
+        a transform_id), given a single value or a sequence or array of n of
+        them.
+        """
+        values = numpy.asarray(values, dtype = numpy.float32)
+        if values.ndim == 0:
+            values = values.reshape((1,)).repeat(n)
+        assert values.shape == (n,)
+        return values
+
+    def glname_color(self, glname):
+        """
+        Return the RGBA color (a list) which encodes the given glname (or None)
+        for mouseover drawing.
+        """
+        if glname is None:
+            glname = 0
+        # Break the glname into RGBA pixel color components, 0.0 to 1.0 .
+        # (Per-vertex attributes are all multiples (1-4) of Float32.)
+        ##rgba = [(glname >> bits & 0xff) / 255.0 for bits in range(24,-1,-8)]
+        ## Temp fix: Ignore the last byte, which always comes back 255 on Windows.
+        return [(glname >> bits & 0xff) / 255.0 for bits in range(16,-1,-8)]+[0.0]
+
+    def first_value(self, values, ndim): #bruce 090325
+        """
+        Given the values of some attribute for a batch of primitives,
+        as a single value with ndim dimensions (e.g. 0 for a radius, 1 for
+        a color), or a list or array of one value per primitive, return the
+        value for the first primitive.
+
+        (This lets subclasses add one primitive at a time quickly, without
+        the array setup that pays off for larger batches.)
+        """
+        if values is None or type(values) in (type(0), type(0L), type(0.0),
+                                              type(())):
+            # (the common case, tested quickly; as before, a tuple is
+            #  a single value, e.g. a color)
+            return values
+        if len(numpy.shape(values)) > ndim:
+            return values[0]
+        return values
+
+    def glname_color_array(self, glnames, n):
+        """
+        Return an (n,4) float32 array of the RGBA colors which encode the given
+        glnames (a single glname or None, or a sequence or array of n of them)
+        for mouseover drawing.
+        """
+        if glnames is None or type(glnames) in (type(0), type(0L)):
+            return self.color4_array(self.glname_color(glnames), n)
+        glnames = numpy.asarray(glnames, dtype = numpy.uint32)
+        assert glnames.shape == (n,)
+        # (This does the same thing as glname_color, for each glname.)
+        rgba = numpy.zeros((n, 4), dtype = numpy.float32)
+        for column, bits in enumerate(range(16, -1, -8)):
+            rgba[:, column] = (glnames >> bits) & 0xff
+        rgba[:, :3] /= 255.0
+        return rgba
+
     def newPrimitives(self, n):
         """
         Allocate a group of primitives. Returns a list of n IDs.
         """
-        primIDs = []
-        for i in range(n):
-            # Take ones from the free list first.
-            if len(self.freePrimSlotIDs):
-                primID = self.freePrimSlotIDs.pop()
-            else:
-                # Allocate a new one.
-                primID = self.nPrims     # ID is a zero-origin subscript.
-                self.nPrims += 1        # nPrims is a counter.
-
-                # Allocate another set of hunks if the new ID has passed a hunk
-                # boundary.
-                if (primID + HUNK_SIZE) / HUNK_SIZE > self.nHunks:
-                    for buffer in self.hunkBuffers:
-                        buffer.addHunk()
-                        continue
-                    self.nHunks += 1
-                pass
-            primIDs += [primID]
-            continue
+        # Take ones from the free list first (most recently freed first).
+        nFree = min(n, len(self.freePrimSlotIDs))
+        if nFree:
+            primIDs = self.freePrimSlotIDs[-nFree:]
+            primIDs.reverse()
+            del self.freePrimSlotIDs[-nFree:]
+        else:
+            primIDs = []
+
+        # Allocate the rest as new ones, with contiguous IDs (which lets
+        # HunkBuffer.setDataRange store their data with slices).
+        nNew = n - nFree
+        if nNew:
+            primIDs += range(self.nPrims, self.nPrims + nNew)
+                # IDs are zero-origin subscripts.
+            self.nPrims += nNew         # nPrims is a counter.
+
+            # Allocate more sets of hunks if the new IDs have passed hunk
+            # boundaries.
+            while self.nPrims > self.nHunks * HUNK_SIZE:
+                for buffer in self.hunkBuffers:
+                    buffer.addHunk()
+                    continue
+                self.nHunks += 1
+                continue
+            pass
         return primIDs
 
     def releasePrimitives(self, idList):
@@ -325,7 +414,6 @@ class GLPrimitiveBuffer(object):
         draw individual primitives, we set up a single array containing a Hunk's
         worth of the index block length constant and use it for each Hunk draw.
         """
-        self.nIndices = len(self.indexBlock) * len(self.indexBlock[0])
         indexOffset = 0
         # (May cache these someday.  No need now since they don't change.)
         Py_iboIndices = []
@@ -372,6 +460,10 @@ class GLPrimitiveBuffer(object):
 
         If no drawIndex is given, the whole array is drawn.
         """
+        if self.hunkVertVBO is None:
+            # First draw; now we have a GL context.
+            self._setupSharedVertexData()
+
         self.shader.setActive(True)                # Turn on the chosen shader.
 
         glEnableClientState(GL_VERTEX_ARRAY)
@@ -502,16 +594,22 @@ class HunkBuffer:
 
         self.hunks = []
 
-        # Look up the location of the named generic vertex attribute in the
-        # previously linked shader program object.
-        self.attribLocation = shader.attributeLocation(attribName)
-
-        # Cache the Python data that will be sent to the graphics card RAM.
-        # Internally, the data is a list, block-indexed by primitive ID, but
-        # replicated in block sublists by a factor of self.nVertices to match
-        # the vertex buffer.  What reaches the attribute VBO is automatically
-        # flattened into a sequence.
-        self.data = []
+        # The location of the named generic vertex attribute in the previously
+        # linked shader program object is looked up when first needed, in
+        # bindHunk, so that data can be stored here without a GL context.
+        self.shader = shader
+        self.attribLocation = None
+
+        # Cache the data that will be sent to the graphics card RAM.
+        # Internally, the data is a float32 array, block-indexed by primitive
+        # ID, but replicated in blocks by a factor of self.nVertices to match
+        # the vertex buffer, i.e. of shape (capacity, nVertices, nCoords).
+        # Only the first self.nData blocks are in use; the capacity grows
+        # by doubling. What reaches the attribute VBO is a flattened slice.
+        # (This used to be a list of lists, one per primitive, which was
+        # slow to fill in and to convert for the VBO. [bruce 090325])
+        self.data = numpy.zeros((0, nVertices, nCoords), dtype = numpy.float32)
+        self.nData = 0
 
         return
 
@@ -524,14 +622,32 @@ class HunkBuffer:
         return
 
     def bindHunk(self, hunkNumber):
+        if self.attribLocation is None:
+            self.attribLocation = self.shader.attributeLocation(self.attribName)
         glEnableVertexAttribArrayARB(self.attribLocation)
-        self.hunks[hunkNumber].VBO.bind()
+        self.hunks[hunkNumber].get_VBO().bind()
         glVertexAttribPointerARB(self.attribLocation, self.nCoords,
                                  GL_FLOAT, 0, 0, None)
         return
 
     def unbindHunk(self):
-        glDisableVertexAttribArrayARB(self.attribLocation)
+        if self.attribLocation is not None:
+            glDisableVertexAttribArrayARB(self.attribLocation)
+        return
+
+    def _ensureData(self, nData):
+        """
+        Make sure there are at least nData blocks of data in use, growing the
+        data array if necessary.
+        """
+        if nData > len(self.data):
+            capacity = max(nData, 2 * len(self.data), HUNK_SIZE)
+            data = numpy.zeros((capacity, self.nVertices, self.nCoords),
+                               dtype = numpy.float32)
+            data[:self.nData] = self.data[:self.nData]
+            self.data = data
+            pass
+        self.nData = max(self.nData, nData)
         return
 
     def setData(self, primID, value):
@@ -543,31 +659,51 @@ class HunkBuffer:
         value - The new data.
         """
 
-        # Internally, the data is a list, block-indexed by primitive ID, but
-        # replicated in block sublists by a factor of self.nVertices to match
-        # the vertex buffer size.  What reaches the attribute VBO is
-        # automatically flattened into a sequence of floats.
-        replicatedValue = self.nVertices * [value]
-
-        if primID >= len(self.data):
-            assert primID == len(self.data)
-            self.data += [replicatedValue]
+        if primID >= self.nData:
+            assert primID == self.nData
+            self._ensureData(primID + 1)
         else:
             assert primID >= 0
-            self.data[primID] = replicatedValue
-            pass
+        # (The value is replicated for all self.nVertices of the block.)
+        self.data[primID] = value
         self.changedRange(primID, primID+1)
         return
 
+    def setDataRange(self, primIDs, values): #bruce 090325
+        """
+        Like setData for each of a list of primitive IDs (as returned by
+        GLPrimitiveBuffer.newPrimitives) and a corresponding (n, nCoords)
+        array of values (or an (n,) array when nCoords is 1), but much faster.
+        """
+        n = len(primIDs)
+        if not n:
+            return
+        if n == 1:
+            # (common, when primitives are added one at a time)
+            self.setData(primIDs[0], values[0])
+            return
+        values = numpy.asarray(values, dtype = numpy.float32)
+        values = values.reshape((n, 1, self.nCoords))
+            # (broadcast over the self.nVertices of each block)
+        primIDs = numpy.asarray(primIDs)
+        lowID = int(primIDs.min())
+        highID = int(primIDs.max()) + 1
+        assert lowID >= 0 and lowID <= self.nData
+        self._ensureData(highID)
+        if highID - lowID == n and (numpy.diff(primIDs) == 1).all():
+            # The usual case: newly allocated IDs, in order.
+            self.data[lowID:highID] = values
+        else:
+            self.data[primIDs] = values
+        self.changedRange(lowID, highID)
+        return
+
     def getData(self, primID): #bruce 090223
         """
         Inverse of setData. The ID must always be within the array.
         """
-        assert 0 <= primID < len(self.data)
-        return self.data[primID][0]
-
-    # Maybe a range setter would be useful, too:
-    # def setDataRange(self, primLow, primHigh, valueList):
+        assert 0 <= primID < self.nData
+        return self.data[primID][0].tolist()
 
     def changedRange(self, chgLowID, chgHighID):
         """
@@ -617,16 +753,27 @@ class Hunk:
         self.hunkNumber = hunkNumber
         self.nCoords = nCoords
 
-        self.VBO = GLBufferObject(
-            GL_ARRAY_BUFFER_ARB,
-            # Per-vertex attributes are all multiples (1-4) of Float32.
-            HUNK_SIZE * self.nVertices * self.nCoords * BYTES_PER_FLOAT,
-            GL_STATIC_DRAW)
+        # The VBO is allocated by get_VBO when first needed (while drawing),
+        # so hunks can be added and filled in without a GL context.
+        self.VBO = None
 
         # Low- and high-water marks to optimize for sending a range of data.
         self.unchanged()
         return
 
+    def get_VBO(self):
+        """
+        Return our Buffer Object in graphics card RAM, allocating it if
+        necessary (which requires a current GL context).
+        """
+        if self.VBO is None:
+            self.VBO = GLBufferObject(
+                GL_ARRAY_BUFFER_ARB,
+                # Per-vertex attributes are all multiples (1-4) of Float32.
+                HUNK_SIZE * self.nVertices * self.nCoords * BYTES_PER_FLOAT,
+                GL_STATIC_DRAW)
+        return self.VBO
+
     def unchanged(self):
         """
         Mark a Hunk as unchanged.  (Empty or flushed.)
@@ -668,14 +815,16 @@ class Hunk:
         Update a changed range of the data that applies to this hunk, sending it
         to the Buffer Object in graphics card RAM.
 
-        allData - List of data blocks for the whole hunk-list.  We'll extract
+        allData - Array of data blocks for the whole hunk-list.  We'll extract
         just the part relevant to the changed part of this particular hunk.
 
-        Internally, the data is a list, block-indexed by primitive ID, but
-        replicated in block sublists by a factor of self.nVertices to match the
-        vertex buffer size.  What reaches the attribute VBO is automatically
-        flattened into a sequence.
+        Internally, the data is a float32 array, block-indexed by primitive ID,
+        but replicated in blocks by a factor of self.nVertices to match the
+        vertex buffer size.  What reaches the attribute VBO is a contiguous
+        slice of it.
         """
+        VBO = self.get_VBO()
+
         rangeSize = self.high - self.low
         assert rangeSize >= 0
         if rangeSize == 0:
@@ -685,17 +834,20 @@ class Hunk:
         lowID = (self.hunkNumber * HUNK_SIZE) + self.low
         highID = (self.hunkNumber * HUNK_SIZE) + self.high
 
-        # Send all or part of the Python data to C.
-        C_data = numpy.array(allData[lowID:highID], dtype=numpy.float32)
+        # Send all or part of the data to the graphics card.
+        # (A slice of whole blocks of a C-contiguous array is contiguous,
+        #  so this doesn't copy it.)
+        C_data = numpy.ascontiguousarray(allData[lowID:highID],
+                                         dtype = numpy.float32)
 
         if rangeSize == HUNK_SIZE:
             # Special case to send the whole Hunk's worth of data.
-            self.VBO.updateAll(C_data)
+            VBO.updateAll(C_data)
         else:
             # Send a portion of the HunkBuffer, with byte offset within the VBO.
             # (Per-vertex attributes are all multiples (1-4) of Float32.)
             offset = self.low * self.nVertices * self.nCoords * BYTES_PER_FLOAT
-            self.VBO.update(offset, C_data)
+            VBO.update(offset, C_data)
             pass
 
         self.unchanged()             # Now we're in sync.
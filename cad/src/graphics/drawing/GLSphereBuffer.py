@@ -22,6 +22,8 @@ from graphics.drawing.GLPrimitiveBuffer import GLPrimitiveBuffer, HunkBuffer
 
 from geometry.VQT import V, A
 
+import numpy
+
 
 class GLSphereBuffer(GLPrimitiveBuffer):
     """
@@ -50,15 +52,15 @@ class GLSphereBuffer(GLPrimitiveBuffer):
 
     def addSpheres(self, centers, radii, colors, transform_ids, glnames):
         """
-        Sphere centers must be a list of VQT points.
+        Sphere centers must be a list of VQT points, or an (N,3) array.
 
-        Lists or single values may be given for the attributes of the spheres
-        (radii, colors, transform_ids, and selection glnames).  A single value
-        is replicated for the whole batch.  The lengths of attribute lists must
-        match the center points list.
+        Lists (or arrays) or single values may be given for the attributes of
+        the spheres (radii, colors, transform_ids, and selection glnames).  A
+        single value is replicated for the whole batch.  The lengths of
+        attribute lists must match the center points list.
 
         radii and colors are required.  Radii are numbers.  Colors are tuples of
-        components: (R, G, B) or (R, G, B, A).
+        components: (R, G, B) or (R, G, B, A), or an (N,3) or (N,4) array.
 
         transform_ids may be None for centers in global modeling coordinates.
 
@@ -67,58 +69,50 @@ class GLSphereBuffer(GLPrimitiveBuffer):
         objects in a global object dictionary
 
         The return value is a list of allocated primitive IDs for the spheres.
+
+        All the spheres are stored with whole-array operations, so adding many
+        at once is much faster than adding them one at a time, and needs no
+        GL context. [bruce 090325]
         """
         nSpheres = len(centers)
+        newIDs = self.newPrimitives(nSpheres)
+        if not nSpheres:
+            return newIDs
 
-        if type(radii) == type([]):
-            assert len(radii) == nSpheres
-        else:
-            radii = nSpheres * [float(radii)]
-            pass
-
-        if type(colors) == type([]):
-            assert len(colors) == nSpheres
-            colors = [self.color4(colors) for color in colors]
-        else:
-            colors = nSpheres * [self.color4(colors)]
-            pass
-
-        if type(transform_ids) == type([]):
-            assert len(transform_ids) == nSpheres
-        else:
-            if transform_ids is None:
-                 # This bypasses transform logic in the shader for this sphere.
-                transform_ids = -1
-                pass
-            transform_ids = nSpheres * [transform_ids]
-            pass
-
-        if type(glnames) == type([]):
-            assert len(glnames) == nSpheres
-        else:
-            if glnames is None:
-                glnames = 0
-                pass
-            glnames = nSpheres * [glnames]
+        if transform_ids is None:
+            # This bypasses transform logic in the shader for these spheres.
+            transform_ids = -1
             pass
 
-        newIDs = self.newPrimitives(nSpheres)
-        for (newID, ctr, radius, color, transform_id, glname) in \
-            zip(newIDs, centers, radii, colors, transform_ids, glnames):
-
-            # Combine the center and radius into one vertex attribute.
-            ctrRad = V(ctr[0], ctr[1], ctr[2], radius)
-            self.ctrRadHunks.setData(newID, ctrRad)
-            self.colorHunks.setData(newID, color)
+        if nSpheres == 1:
+            # Adding one sphere at a time is still common (e.g. from
+            # ColorSorter.schedule_sphere), so do it without array setup.
+            newID = newIDs[0]
+            ctr = centers[0]
+            radius = self.first_value(radii, 0)
+            self.ctrRadHunks.setData(newID, (ctr[0], ctr[1], ctr[2], radius))
+            self.colorHunks.setData(newID,
+                                    self.color4(self.first_value(colors, 1)))
             if self.transform_id_Hunks:
-                self.transform_id_Hunks.setData(newID, transform_id)
-            # Break the glname into RGBA pixel color components, 0.0 to 1.0 .
-            # (Per-vertex attributes are all multiples (1-4) of Float32.)
-            ##rgba = [(glname >> bits & 0xff) / 255.0 for bits in range(24,-1,-8)]
-            ## Temp fix: Ignore the last byte, which always comes back 255 on Windows.
-            rgba = [(glname >> bits & 0xff) / 255.0 for bits in range(16,-1,-8)]+[0.0]
-            self.glname_color_Hunks.setData(newID, rgba)
-            continue
+                self.transform_id_Hunks.setData(
+                    newID, self.first_value(transform_ids, 0))
+            self.glname_color_Hunks.setData(
+                newID, self.glname_color(self.first_value(glnames, 0)))
+            return newIDs
+
+        # Combine the centers and radii into one vertex attribute.
+        ctrRads = numpy.empty((nSpheres, 4), dtype = numpy.float32)
+        ctrRads[:, :3] = numpy.asarray(centers, dtype = numpy.float32)
+        ctrRads[:, 3] = self.value_array(radii, nSpheres)
+        self.ctrRadHunks.setDataRange(newIDs, ctrRads)
+
+        self.colorHunks.setDataRange(newIDs,
+                                     self.color4_array(colors, nSpheres))
+        if self.transform_id_Hunks:
+            self.transform_id_Hunks.setDataRange(
+                newIDs, self.value_array(transform_ids, nSpheres))
+        self.glname_color_Hunks.setDataRange(
+            newIDs, self.glname_color_array(glnames, nSpheres))
 
         return newIDs
 
@@ -0,0 +1,120 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+primitive_benchmark.py -- time filling in the shader primitives of
+ColorSortedDisplayLists, one at a time and in batches, without a GL context.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py graphics/drawing/primitive_benchmark.py [natoms]
+
+A made-up model of natoms atoms (default 100000) in chunks of 100, with
+a bond from each atom to the next one in its chunk, is "drawn" into one
+CSDL per chunk, as spheres and cylinders, the way a ChunkDrawer rebuilds
+its CSDL when shaders are in use -- first with CSDL.addSphere and
+addCylinder for each atom and bond, then with addSpheres and addCylinders
+once per chunk. Each kind of rebuild is done twice, since the second time
+reuses the primitive IDs the first one freed.
+
+Only the CPU-side primitive buffer arrays are filled in; the primitive
+buffers don't allocate VBOs or send anything to the graphics card until
+they're first drawn, so this doesn't need a GL context.
+
+The time per rebuild is printed, scaled to 100k atoms.
+"""
+
+import sys
+import time
+import random
+
+from Numeric import array, Float
+
+import graphics.drawing.drawing_globals as drawing_globals
+from graphics.drawing.ColorSortedDisplayList import ColorSortedDisplayList
+
+_ATOMS_PER_CHUNK = 100
+
+class _FakeShader(object):
+    """
+    Just enough of a GLShaderObject to fill in a primitive buffer.
+    """
+    error = False
+    def supports_transforms(self):
+        return False
+    pass
+
+def _setup_primitive_buffers():
+    """
+    Give the sphere and cylinder ShaderGlobals fresh primitive buffers,
+    as _try_shader_init would, but using a fake shader.
+    """
+    for shaderGlobals in (drawing_globals.sphereShaderGlobals,
+                          drawing_globals.cylinderShaderGlobals):
+        shaderGlobals.shader = _FakeShader()
+        shaderGlobals.primitiveBuffer = \
+            shaderGlobals.get_primitiveBuffer_class()(shaderGlobals)
+    return
+
+def _make_chunks(natoms):
+    """
+    Return a list of (centers, radii, colors, glnames) for made-up chunks.
+    """
+    random.seed(0)
+    chunks = []
+    glname = 1
+    for start in range(0, natoms, _ATOMS_PER_CHUNK):
+        n = min(_ATOMS_PER_CHUNK, natoms - start)
+        centers = array([(random.uniform(0, 100),
+                          random.uniform(0, 100),
+                          random.uniform(0, 100)) for i in range(n)], Float)
+        radii = [random.choice((0.5, 0.7, 0.8)) for i in range(n)]
+        colors = [random.choice(((0.4, 0.4, 0.4), (1.0, 0.0, 0.0),
+                                 (0.0, 0.0, 1.0))) for i in range(n)]
+        glnames = range(glname, glname + n)
+        glname += n
+        chunks.append((centers, radii, colors, glnames))
+    return chunks
+
+def _rebuild_one_at_a_time(csdls, chunks):
+    for csdl, (centers, radii, colors, glnames) in zip(csdls, chunks):
+        csdl._clearPrimitives()
+        for i in range(len(centers)):
+            csdl.addSphere(centers[i], radii[i], colors[i], glnames[i])
+        for i in range(len(centers) - 1):
+            csdl.addCylinder((centers[i], centers[i + 1]), 0.25,
+                             colors[i], glnames[i])
+    return
+
+def _rebuild_batched(csdls, chunks):
+    for csdl, (centers, radii, colors, glnames) in zip(csdls, chunks):
+        csdl._clearPrimitives()
+        csdl.addSpheres(centers, radii, colors, glnames)
+        csdl.addCylinders(zip(centers[:-1], centers[1:]), 0.25,
+                          colors[:-1], glnames[:-1])
+    return
+
+def _run(natoms):
+    chunks = _make_chunks(natoms)
+    print "%d atoms in %d chunks" % (natoms, len(chunks))
+    scale = 100000.0 / natoms
+    for name, rebuild in (("one at a time", _rebuild_one_at_a_time),
+                          ("batched", _rebuild_batched)):
+        _setup_primitive_buffers()
+        csdls = [ColorSortedDisplayList() for chunk in chunks]
+        for label in ("new IDs", "reused IDs"):
+            t0 = time.time()
+            rebuild(csdls, chunks)
+            t = time.time() - t0
+            print "  %-13s (%s): %.3f sec per 100k atoms" % \
+                  (name, label, t * scale)
+    return
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        _run(int(sys.argv[1]))
+    else:
+        _run(100000)
+
+# end
@@ -85,6 +85,9 @@ from graphics.model_drawing.TransformedDisplayListsDrawer import TransformedDisp
 _DRAW_EXTERNAL_BONDS = True # Debug/test switch.
     # note: there is a similar constant _DRAW_BONDS in CS_workers.py.
 
+_REMAKE_DEFERRED = ('remake deferred',) # a true value for ChunkDrawer.havelist
+    # which never equals havelist_data
+
 # ==
 
 class ChunkDrawer(TransformedDisplayListsDrawer):
@@ -128,6 +131,12 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
 
     _last_drawn_transform_value = (None, None)
 
+    _stale_displist_ok = False
+        # whether self.displist, even when invalid, still draws only atoms
+        # and bonds which exist in self._chunk, so it can keep being drawn
+        # until it's remade in a later frame (see RemakeScheduler)
+        # [bruce 090325]
+
     def __init__(self, chunk):
         """
         """
@@ -151,12 +160,39 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
         # display lists, whether or not that's the current style.
         if not self.glpane or \
            self._chunk.get_dispdef(self.glpane) == style:
-            self.invalidate_display_lists()
+            self.invalidate_display_lists_for_appearance()
+        return
+
+    def invalidate_display_lists(self): #bruce 090325
+        """
+        [extends superclass method]
+        """
+        self._stale_displist_ok = False
+        TransformedDisplayListsDrawer.invalidate_display_lists(self)
+        return
+
+    def invalidate_display_lists_for_appearance(self): #bruce 090325
+        """
+        Like invalidate_display_lists, but for changes (e.g. of display style)
+        which don't change which atoms and bonds self._chunk has, so our old
+        display lists can keep being drawn until they're remade.
+        """
+        stale_displist_ok = self._stale_displist_ok
+        TransformedDisplayListsDrawer.invalidate_display_lists(self)
+        self._stale_displist_ok = stale_displist_ok
         return
 
         #### REVIEW: all comments about track_inval, havelist, changeapp,
         # and whether the old code did indeed do changeapp and thus gl_update_something.
 
+    def _immediately_deallocate_displists(self): #bruce 090325
+        """
+        [extends superclass method]
+        """
+        self._stale_displist_ok = False
+        TransformedDisplayListsDrawer._immediately_deallocate_displists(self)
+        return
+
     def _ok_to_deallocate_displist(self): #bruce 071103
         """
         Say whether it's ok to deallocate self's OpenGL display list
@@ -486,6 +522,8 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
 
                 draw_outside = [] # csdls to draw outside local coords
 
+                remake_deferred = False # set below if we'll draw old lists
+
                 if self.havelist == havelist_data:
                     # self.displist is still valid -- just draw it (regardless
                     # of wantlist). This is done below, outside local coords,
@@ -512,6 +550,22 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
                     ##e in future we might also record eltprefs, matprefs,
                     ##drawLevel (since they're stored in .havelist)
 
+                    if wantlist and self._stale_displist_ok:
+                        # maybe leave the remake for a later frame
+                        # [bruce 090325]
+                        remake_deferred = \
+                            glpane.remake_scheduler.defer_remake(
+                                self._chunk, delegate_draw_chunk and hd or None)
+                    pass
+
+                if remake_deferred:
+                    # draw our old display lists (unchanged, as if valid;
+                    # the extra ones are drawn below)
+                    self.havelist = _REMAKE_DEFERRED
+                        # (so the counter above is not incremented again
+                        #  until another invalidation)
+                    draw_outside += [self.displist]
+                elif self.havelist != havelist_data:
                     self.havelist = 0 #bruce 051209: this is now needed
                     self.extra_displists = {} # we'll make new ones as needed
                     if wantlist:
@@ -550,7 +604,11 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
                             # since not drawing now
                         draw_outside += [self.displist]
 
-                        self.end_tracking_usage( match_checking_code, self.invalidate_display_lists )
+                        self.end_tracking_usage( match_checking_code,
+                                 self.invalidate_display_lists_for_appearance )
+                            # (what's tracked is the prefs we used, whose
+                            #  changes don't change our atoms or bonds)
+                            # [bruce 090325]
                         self.havelist = havelist_data
                             # we always set self.havelist, even if an exception
                             # happened, so it doesn't keep happening with every
@@ -558,6 +616,7 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
                             # to remake the display list to contain only a
                             # known-safe thing, like a bbox and an indicator of
                             # the bug.)
+                        self._stale_displist_ok = True
                     pass # end of "remake self.displist" case
 
                 # we still need to draw_outside below, but first,
@@ -578,7 +637,12 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
                 # [bruce 090224]
 
                 # draw the extra_displists, remaking as needed if wantlist
+                # (but not if our main display list's remake was deferred,
+                #  since they're made with it)
                 for extra_displist in self.extra_displists.itervalues():
+                    if remake_deferred:
+                        draw_outside += [extra_displist.csdl]
+                        continue
                     extra_displist.draw_but_first_recompile_if_needed(
                         glpane,
                         selected = self._chunk.picked,
@@ -1117,6 +1181,11 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
 
         bondcolor = atomcolor # never changed below
 
+        ColorSorter.start_batch()
+            # when using shaders, collect the atom spheres and bond
+            # cylinders drawn below, and add them to our CSDL all at once
+            # (in finish_batch, below)
+
         for atom in self._chunk.atoms.itervalues():
             #bruce 050513 using itervalues here (probably safe, speed is needed)
             try:
@@ -1202,6 +1271,10 @@ class ChunkDrawer(TransformedDisplayListsDrawer):
                     pass
                 else:
                     print "Source of current atom:", atom_source
+            continue
+        ColorSorter.finish_batch(drawLevel)
+            # (no try/finally needed, since exceptions from drawing each
+            #  atom and its bonds are caught above)
         return # from _standard_draw_atoms (submethod of _draw_for_main_display_list)
 
     def overdraw_hotspot(self, glpane, disp): #bruce 050131
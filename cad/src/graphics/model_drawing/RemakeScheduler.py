@@ -0,0 +1,265 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+RemakeScheduler.py -- spread the remaking of many invalid chunk display
+lists over several frames, computing some of their data in worker threads
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+When many chunks' display lists are invalidated at once (e.g. by a change
+of display style), remaking them all in the next frame can freeze the GUI
+for seconds. When debug_pref_progressive_displist_remakes is enabled, each
+GLPane's RemakeScheduler gives each frame a time budget for remakes. Once
+that's used up, chunks whose old display lists still show only atoms and
+bonds which exist keep drawing them, and the scheduler asks for another
+frame, until all are remade. Each remake still happens within one frame,
+so a chunk never shows a partly remade display list -- its new CSDL
+replaces the old one all at once.
+
+Chunks drawn in whole-chunk display styles which split compute_memo into
+a part which gathers its inputs (in the main thread) and a GL-independent
+part which computes from them (see ChunkDisplayMode.memo_inputs) have the
+latter done by a WorkerPool, while their old display lists are drawn.
+Other remakes can't run in other threads, since drawing atoms and bonds
+uses OpenGL and the global state of ColorSorter, and (given the Python
+global interpreter lock) only work which releases it (like large Numeric
+operations) can actually run in parallel with the GUI anyway.
+
+See remake_benchmark.py for a way to time this without a GUI.
+"""
+
+import time
+import threading
+import Queue
+
+from utilities.debug import print_compact_traceback
+
+from utilities.GlobalPreferences import debug_pref_progressive_displist_remakes
+from utilities.GlobalPreferences import debug_pref_displist_remake_msec_per_frame
+from utilities.GlobalPreferences import debug_pref_displist_remake_threads
+
+_FAILED = object() # result of a memo job which raised an exception
+
+# ==
+
+class WorkerPool(object):
+    """
+    A pool of daemon threads which run GL-independent jobs. Each job has
+    a key and a token; a job supersedes any uncollected job with the same
+    key, whose result is then discarded. Results are only seen when the
+    main thread calls self.collect().
+
+    With no threads, jobs are run when submitted (useful for testing and
+    benchmarking, and as a fallback).
+    """
+    def __init__(self, nthreads):
+        self.nthreads = nthreads
+        self._threads = []
+        self._jobs = Queue.Queue()
+        self._results = Queue.Queue()
+        self._pending = {} # maps key to token, for uncollected jobs
+        return
+
+    def submit(self, key, token, func, *args):
+        """
+        Arrange for func(*args) to be called (in a worker thread, so it
+        must not use OpenGL, Qt, or anything the main thread might be
+        modifying) and for its result to be returned by a later call of
+        self.collect(), unless another job with the same key is submitted
+        before then.
+        """
+        self._pending[key] = token
+        if not self.nthreads:
+            self._results.put( self._run(key, token, func, args) )
+            return
+        if not self._threads:
+            for i in range(self.nthreads):
+                thread = threading.Thread(target = self._worker,
+                                          name = "WorkerPool-%d" % i)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        self._jobs.put( (key, token, func, args) )
+        return
+
+    def is_pending(self, key, token):
+        """
+        Is a job with this key and token submitted but not yet collected?
+        """
+        return key in self._pending and self._pending[key] == token
+
+    def npending(self):
+        return len(self._pending)
+
+    def collect(self):
+        """
+        Return a list of (key, token, result) for all jobs which finished
+        since the last call and were not superseded. The result of a job
+        which raised an exception (already printed) is _FAILED.
+        """
+        res = []
+        while 1:
+            try:
+                key, token, result = self._results.get_nowait()
+            except Queue.Empty:
+                break
+            if not self.is_pending(key, token):
+                continue # superseded
+            del self._pending[key]
+            res.append( (key, token, result) )
+        return res
+
+    def wait(self):
+        """
+        Wait until all submitted jobs have finished.
+        """
+        self._jobs.join()
+        return
+
+    def shutdown(self):
+        """
+        Make our threads exit once they finish the jobs already submitted.
+        Results not yet collected are discarded.
+        """
+        for thread in self._threads:
+            self._jobs.put(None)
+        self._threads = []
+        self._pending = {}
+        return
+
+    def _worker(self):
+        while 1:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                key, token, func, args = job
+                self._results.put( self._run(key, token, func, args) )
+            finally:
+                self._jobs.task_done()
+        pass
+
+    def _run(self, key, token, func, args):
+        try:
+            result = func(*args)
+        except:
+            print_compact_traceback("exception in %r job for %r ignored: " %
+                                    (func, key))
+            result = _FAILED
+        return key, token, result
+
+    pass
+
+# ==
+
+class RemakeScheduler(object):
+    """
+    Decide, for one GLPane, which invalid chunk display lists to remake
+    in each frame. (See module docstring for details.)
+
+    GLPane_drawingset_methods calls begin_frame and end_frame around each
+    frame which can remake display lists; ChunkDrawer.draw calls
+    defer_remake.
+    """
+    _progressive = False
+    _deadline = 0.0
+
+    def __init__(self):
+        self._pool = None
+        self._chunks = {} # maps key of pending memo job to its chunk
+        self._ready = {} # maps key to (chunk, token, memo) for finished jobs
+        self._nremakes = 0 # remakes in this frame
+        self._ndeferred = 0 # deferred remakes in this frame
+        return
+
+    def begin_frame(self, permit_deferral = True):
+        """
+        @param permit_deferral: if False, don't defer any remakes in this
+                                frame, regardless of prefs
+        """
+        self._progressive = permit_deferral and \
+                            debug_pref_progressive_displist_remakes()
+        msec = debug_pref_displist_remake_msec_per_frame()
+        self._deadline = time.time() + msec / 1000.0
+        self._nremakes = 0
+        self._ndeferred = 0
+        nthreads = debug_pref_displist_remake_threads()
+        if not self._progressive:
+            nthreads = 0
+        if self._pool and self._pool.nthreads != nthreads:
+            self._pool.shutdown()
+            self._pool = None
+            self._chunks = {}
+        if nthreads and not self._pool:
+            self._pool = WorkerPool(nthreads)
+        # Results not used in the last frame are discarded; their chunks
+        # weren't drawn then, and will resubmit their jobs if necessary.
+        self._ready = {}
+        if self._pool:
+            for key, token, memo in self._pool.collect():
+                chunk = self._chunks.pop(key)
+                self._ready[key] = (chunk, token, memo)
+        return
+
+    def end_frame(self):
+        """
+        @return: whether some remakes were deferred or are waiting for
+                 worker threads, so another frame is needed soon
+        """
+        return bool(self._ndeferred or (self._pool and self._pool.npending()))
+
+    def defer_remake(self, chunk, hd):
+        """
+        Say whether chunk's invalid display lists should be remade in this
+        frame (return False), or their old contents drawn instead (return
+        True), in which case another frame will be requested.
+
+        Only call this when the old contents are still ok to draw.
+
+        @param hd: chunk's whole-chunk display mode handler, or None
+        """
+        if not self._progressive:
+            return False
+        if hd is not None and hd.compute_memo_in_background and self._pool:
+            if not self._memo_ready(chunk, hd):
+                self._ndeferred += 1
+                return True
+        if self._nremakes and time.time() > self._deadline:
+            # (we always permit one remake per frame, so we make progress
+            #  even when other drawing uses up the time)
+            self._ndeferred += 1
+            return True
+        self._nremakes += 1
+        return False
+
+    def _memo_ready(self, chunk, hd):
+        """
+        Return True if hd's memo for chunk is valid, or can be stored now
+        from a finished job, or should be computed in the main thread after
+        all; otherwise make sure a job is computing it and return False.
+        """
+        if hd._f_memo_is_valid(chunk):
+            return True
+        key = (id(chunk), id(hd))
+        token = chunk.changeapp_counter()
+        if self._ready.has_key(key):
+            chunk1, token1, memo = self._ready.pop(key)
+            if chunk1 is chunk and token1 == token:
+                if memo is not _FAILED:
+                    hd._f_set_memo(chunk, memo)
+                return True
+        if self._pool.is_pending(key, token):
+            return False
+        try:
+            inputs = hd.memo_inputs(chunk)
+        except:
+            print_compact_traceback("exception in %r.memo_inputs(%r) ignored: " %
+                                    (hd, chunk))
+            return True
+        self._chunks[key] = chunk
+        self._pool.submit(key, token, hd.compute_memo_from_inputs, inputs)
+        return False
+
+    pass
+
+# end
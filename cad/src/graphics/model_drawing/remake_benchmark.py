@@ -0,0 +1,132 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+remake_benchmark.py -- time remaking many chunks' CSDLs at once, with and
+without debug_pref_progressive_displist_remakes, and computing whole-chunk
+display style data in a WorkerPool, without a GL context.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py graphics/model_drawing/remake_benchmark.py [natoms]
+
+A made-up model of natoms atoms (default 100000) in chunks of 100 is
+"drawn" into one CSDL per chunk (as in primitive_benchmark.py), as if all
+their display lists had just been invalidated, in as many frames as
+RemakeScheduler decides to spread the remakes over. The number of frames,
+the longest frame (which is how long the GUI would freeze), and the total
+time are printed for each setting of the pref.
+
+Then the GL-independent part of CylinderChunks.compute_memo is run for
+every chunk, in a WorkerPool with various numbers of threads. (Since it's
+mostly Python code, more threads don't make it faster; the point of the
+pool is to keep that work out of the frames.)
+"""
+
+import sys
+import time
+
+from Numeric import array
+
+import foundation.env as env
+
+from utilities.debug_prefs import debug_pref_object
+from utilities.GlobalPreferences import debug_pref_progressive_displist_remakes
+from utilities.GlobalPreferences import debug_pref_displist_remake_msec_per_frame
+
+from graphics.drawing.ColorSortedDisplayList import ColorSortedDisplayList
+import graphics.drawing.primitive_benchmark as primitive_benchmark
+
+from graphics.model_drawing.RemakeScheduler import RemakeScheduler
+from graphics.model_drawing.RemakeScheduler import WorkerPool
+
+def _set_pref(name, value):
+    prefs_key = debug_pref_object(name).prefs_key
+    old = env.prefs[prefs_key]
+    env.prefs[prefs_key] = value
+    return prefs_key, old
+
+def _time_frames(csdls, chunks, progressive):
+    """
+    Remake all the CSDLs, in frames chosen by a RemakeScheduler.
+    Return the number of frames, the longest frame time, and the total time.
+    """
+    prefs_key, old = _set_pref(
+        "GLPane: spread display list remakes over frames?", progressive)
+    try:
+        scheduler = RemakeScheduler()
+        invalid = zip(csdls, chunks)
+        frames = []
+        while invalid:
+            t0 = time.time()
+            scheduler.begin_frame()
+            still_invalid = []
+            for item in invalid:
+                if scheduler.defer_remake(item, None):
+                    still_invalid.append(item)
+                else:
+                    primitive_benchmark._rebuild_batched([item[0]], [item[1]])
+            scheduler.end_frame()
+            invalid = still_invalid
+            frames.append(time.time() - t0)
+    finally:
+        env.prefs[prefs_key] = old
+    return len(frames), max(frames), sum(frames)
+
+def _memo_inputs(chunks):
+    """
+    Return inputs for CylinderChunks.compute_memo_from_inputs for each chunk.
+    """
+    res = []
+    for centers, radii, colors, glnames in chunks:
+        center = sum(centers) / len(centers)
+        axis = centers[-1] - centers[0]
+        res.append( (axis, centers - center, center, array(colors[0])) )
+    return res
+
+def _time_pool(hd, inputs, nthreads):
+    pool = WorkerPool(nthreads)
+    t0 = time.time()
+    for i in range(len(inputs)):
+        pool.submit(i, 0, hd.compute_memo_from_inputs, inputs[i])
+    t1 = time.time()
+    pool.wait()
+    results = pool.collect()
+    t2 = time.time()
+    pool.shutdown()
+    assert len(results) == len(inputs)
+    return t1 - t0, t2 - t0
+
+def _run(natoms):
+    from graphics.display_styles.displaymodes import get_display_mode_handler
+    import graphics.display_styles.CylinderChunks # registers 'cyl'
+
+    debug_pref_progressive_displist_remakes() # register them,
+    debug_pref_displist_remake_msec_per_frame() # so debug_pref_object works
+
+    chunks = primitive_benchmark._make_chunks(natoms)
+    print "%d atoms in %d chunks" % (natoms, len(chunks))
+    for progressive in (False, True):
+        primitive_benchmark._setup_primitive_buffers()
+        csdls = [ColorSortedDisplayList() for chunk in chunks]
+        primitive_benchmark._rebuild_batched(csdls, chunks) # "old" contents
+        nframes, longest, total = _time_frames(csdls, chunks, progressive)
+        print "  progressive %-5s: %d frames, longest %.3f sec, total %.3f sec" \
+              % (progressive, nframes, longest, total)
+
+    hd = get_display_mode_handler('cyl')
+    inputs = _memo_inputs(chunks)
+    for nthreads in (0, 1, 2, 4):
+        t_submit, t_done = _time_pool(hd, inputs, nthreads)
+        print "  cylinder memos, %d threads: submitted in %.3f sec, " \
+              "all done in %.3f sec" % (nthreads, t_submit, t_done)
+    return
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        _run(int(sys.argv[1]))
+    else:
+        _run(100000)
+
+# end
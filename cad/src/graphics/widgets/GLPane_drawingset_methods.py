@@ -21,6 +21,8 @@ import foundation.env as env
 
 from graphics.drawing.DrawingSetCache import DrawingSetCache
 
+from graphics.model_drawing.RemakeScheduler import RemakeScheduler
+
 from graphics.widgets.GLPane_csdl_collector import GLPane_csdl_collector
 from graphics.widgets.GLPane_csdl_collector import fake_GLPane_csdl_collector
 
@@ -53,8 +55,27 @@ class GLPane_drawingset_methods(object):
 
     _always_remake_during_movies = False # True in some subclasses
 
+    _permit_deferred_remakes = True # False in some subclasses
+        # (whether RemakeScheduler can leave some display list remakes
+        #  for later frames, which it asks for by calling self.gl_update)
+
     _remake_display_lists = True # might change at start and end of each frame
 
+    _remake_scheduler = None # allocated on demand
+
+    def __get_remake_scheduler(self): #bruce 090325
+        """
+        get method for self.remake_scheduler property:
+
+        Initialize self._remake_scheduler if necessary, and return it.
+        It decides which invalid chunk display lists to remake in each frame.
+        """
+        if not self._remake_scheduler:
+            self._remake_scheduler = RemakeScheduler()
+        return self._remake_scheduler
+
+    remake_scheduler = property(__get_remake_scheduler)
+
     def __get_csdl_collector(self):
         """
         get method for self.csdl_collector property:
@@ -156,6 +177,10 @@ class GLPane_drawingset_methods(object):
         self._remake_display_lists = self._compute_remake_display_lists_now()
             # note: this affects how we use both debug_prefs, below.
 
+        if self._remake_display_lists:
+            self.remake_scheduler.begin_frame(
+                permit_deferral = self._permit_deferred_remakes ) #bruce 090325
+
         res = False # return value, modified below
 
         cache = None # set to actual DrawingSetCache if we find or make one
@@ -347,6 +372,11 @@ class GLPane_drawingset_methods(object):
         """
         # as of 090317, defined and used only in this class; will be refactored
 
+        if self._remake_display_lists and self.remake_scheduler.end_frame():
+            # some chunks drew old display lists, to be remade in later
+            # frames [bruce 090325]
+            self.gl_update()
+
         self._remake_display_lists = self._compute_remake_display_lists_now()
 
         if not error:
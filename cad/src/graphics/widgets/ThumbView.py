@@ -107,6 +107,10 @@ class ThumbView(GLPane_minimal):
 
     _always_remake_during_movies = True #bruce 090224
 
+    _permit_deferred_remakes = False #bruce 090325
+        # (our models are small, and our gl_update calls updateGL,
+        #  which would redraw right away, inside the current redraw)
+
     # default values of subclass-specific constants
 
     permit_draw_bond_letters = False #bruce 071023, overrides superclass
@@ -115,6 +115,7 @@ class BorrowerChunk(Chunk):
                 print "%r: borrowing %r from another borrowerchunk %r is not supported" % (self, atom, mol)
                     # whether it might work, I have no idea
             harmedmols[id(mol)] = mol
+            mol._f_sync_atom_posns() #bruce 090326 (needed before atom leaves mol)
             # inline part of mol.delatom(atom):
             #e do this later: mol.invalidate_atom_lists()
             _changed_parent_Atoms[key] = atom
@@ -175,6 +176,7 @@ class BorrowerChunk(Chunk):
         """
         #e this has bugs if we added atoms to self -- that's not supported (#e could override addatom to support it)
         origmols = self.origmols
+        self._f_sync_atom_posns() #bruce 090326 (needed before atoms leave self)
         for key, atom in self.atoms.iteritems():
             _changed_parent_Atoms[key] = atom
             origmol = origmols[key]
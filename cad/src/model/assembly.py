@@ -180,6 +180,14 @@ class Assembly( StateMixin, Assembly_API):
     _view_change_indicator = 0 # also includes changing current part, glpane display mode
         # [mostly nim as of 060228, 080805]
 
+    _nonatom_change_indicator = 0 #bruce 090316
+        # like _model_change_indicator, but not altered by model changes
+        # which are reported as only affecting atoms (e.g. atom positions),
+        # and also altered by all selection changes; used by Undo to decide
+        # whether it can get all changes from the global changedicts for
+        # atoms and bonds, rather than by scanning all nodes. Not included
+        # in all_change_indicators().
+
     def all_change_indicators(self): #bruce 060227; 071116 & 080805, revised docstring  ### TODO: fix docstring after tests
         """
         Return a tuple of all our change indicators which relate to undoable
@@ -224,6 +232,16 @@ class Assembly( StateMixin, Assembly_API):
         """
         return self._model_change_indicator, self._selection_change_indicator, self._view_change_indicator
 
+    def nonatom_change_indicator(self): #bruce 090316
+        """
+        Return a value which changes whenever undoable state other than
+        the state of atoms and bonds (and chunks' sets of atoms) might have
+        changed.
+
+        @see: _nonatom_change_indicator, all_change_indicators
+        """
+        return self._nonatom_change_indicator
+
     def model_change_indicator(self): #bruce 080731
         """
         @see: all_change_indicators
@@ -1493,6 +1511,7 @@ class Assembly( StateMixin, Assembly_API):
         if self._suspend_noticing_changes:
             return
         self._selection_change_indicator = env.change_counter_for_changed_objects()
+        self._nonatom_change_indicator = self._selection_change_indicator
         return
 
     def changed_view(self): #bruce 060129 ###@@@ not yet called enough
@@ -1515,7 +1534,7 @@ class Assembly( StateMixin, Assembly_API):
         """
         return self._modified
 
-    def changed(self): # by analogy with other methods this would be called changed_model(), but we won't rename it [060227]
+    def changed(self, atoms_layer_only = False): # by analogy with other methods this would be called changed_model(), but we won't rename it [060227]
         """
         Record the fact that this Assembly (or something it contains)
         has been changed, in the sense that saving it into a file would
@@ -1532,6 +1551,12 @@ class Assembly( StateMixin, Assembly_API):
         from lower-level methods than it is now, making complete coverage
         easier. #e]
            See also: changed_selection, changed_view.
+
+        @param atoms_layer_only: caller promises that the only undoable state
+                                 that changed is in atoms or bonds (e.g.
+                                 atom positions), so Undo needn't rescan
+                                 all nodes to find the changes.
+                                 [bruce 090316]
         """
         # bruce 050107 added this method; as of now, all method names (in all
         # classes) of the form 'changed' or 'changed_xxx' (for any xxx) are
@@ -1555,6 +1580,8 @@ class Assembly( StateMixin, Assembly_API):
             pass
 
         self._model_change_indicator = newc
+        if not atoms_layer_only:
+            self._nonatom_change_indicator = newc
             ###e should optimize by feeding new value from changed children (mainly Nodes) only when needed
             ##e will also change this in some other routine which is run for changes that are undoable but won't set _modified flag
 
@@ -1368,7 +1368,13 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
         # array element, even though this was part of a longer array, so it
         # always got two refs to the same mutable data (which compared equal)!
         #bruce 060308 rewrote the following
-        res = + self._posn
+        mol = self.molecule
+        if mol is not None and mol._pending_atom_posns is not None:
+            # our chunk was moved, and hasn't stored our new position in
+            # self._posn yet [bruce 090326]
+            res = mol._f_pending_atom_posn(self)
+        else:
+            res = + self._posn
         try:
             #bruce 060208: try to protect callers against almost-overflowing values stored by buggy code
             # (see e.g. bugs 1445, 1459)
@@ -1455,6 +1461,9 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
         return # from setposn
 
     def _f_setposn_no_chunk_or_bond_invals(self, pos): #bruce 060308 (private for Chunk and Atom)
+        mol = self.molecule
+        if mol is not None and mol._pending_atom_posns is not None:
+            mol._f_sync_atom_posns() # so it won't overwrite pos later
         self._posn = + pos
         _changed_posn_Atoms[self.key] = self #bruce 060322
         if self.jigs: #bruce 050718 added this, for bonds code
@@ -3053,9 +3062,9 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
         return
 
     def writepdb(self, file, atomSerialNumber, chainId):
-        # REFACTORING DESIRED: most of this ought to be split out
-        # into a helper function or wrapper class in files_pdb.py.
-        # (And similarly with writepov, writemdl, writemmp, etc.)
+        # REFACTORING DESIRED: writepov, writemdl, writemmp, etc. ought to
+        # be split out into helper functions or wrapper classes in the files
+        # modules, as this was into PdbRecordWriter in files_pdb.py.
         # [bruce 080122 comment]
         """
         Write a PDB ATOM record for this atom into I{file}.
@@ -3070,64 +3079,16 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
                         documentation for the ATOM record more information.
         @type  chainId: str
 
-        @note: If you edit the ATOM record, be sure to to test QuteMolX.
+        @note: If you edit the ATOM record (in _PLAIN_ATOM_RECORD_FORMAT in
+               files_pdb.py), be sure to to test QuteMolX.
 
         @see: U{B{ATOM Record Format}<http://www.wwpdb.org/documentation/format23/sect9.html#ATOM>}
+        @see: PdbRecordWriter.add_plain_atom, which formats the record.
         """
-        space = " "
-        # Begin ATOM record ----------------------------------
-        # Column 1-6: "ATOM  " (str)
-        atomRecord = "ATOM  "
-        # Column 7-11: Atom serial number (int)
-        atomRecord += "%5d" % atomSerialNumber
-        # Column 12: Whitespace (str)
-        atomRecord += "%1s" % space
-        # Column 13-16 Atom name (str)
-        # piotr 080711 : Changed atom name alignment to start from column 14.
-        # This should make our files more compatible with software that
-        # is very strict about PDB format compliance.
-        atomRecord += " %-3s" % self.element.symbol
-        # Column 17: Alternate location indicator (str) *unused*
-        atomRecord += "%1s" % space
-        # Column 18-20: Residue name - unused (str)
-        atomRecord += "%3s" % space
-        # Column 21: Whitespace (str)
-        atomRecord += "%1s" % space
-        # Column 22: Chain identifier - single letter (str)
-        # This has been tested with 35 chunks and still works in QuteMolX.
-        atomRecord += "%1s" % chainId.upper()
-        # Column 23-26: Residue sequence number (int) *unused*.
-        # piotr 080711: Use "1" as a residue number, as certain programs
-        # may have difficulties readin the file if this field is empty.
-        atomRecord += "%4d" % int(1)
-        # Column 27: Code for insertion of residues (AChar) *unused*
-        atomRecord += "%1s" % space
-        # Column 28-30: Whitespace (str)
-        atomRecord += "%3s" % space
-        # Get atom XYZ coordinate
-        _xyz = self.posn()
-        # Column 31-38: X coord in Angstroms (float 8.3)
-        atomRecord += "%8.3f" % float(_xyz[0])
-        # Column 39-46: Y coord in Angstroms (float 8.3)
-        atomRecord += "%8.3f" % float(_xyz[1])
-        # Column 47-54: Z coord in Angstroms (float 8.3)
-        atomRecord += "%8.3f" % float(_xyz[2])
-        # Column 55-60: Occupancy (float 6.2) *unused*
-        atomRecord += "%6s" % space
-        # Column 61-66: Temperature factor. (float 6.2) *unused*
-        atomRecord += "%6s" % space
-        # Column 67-76: Whitespace (str)
-        atomRecord += "%10s" % space
-        # Column 77-78: Element symbol, right-justified (str) *unused*
-        # piotr 080711: Output the element symbol here, as well (but
-        # truncate it to two characters).
-        atomRecord += "%2s" % self.element.symbol[:2].upper()
-        # Column 79-80: Charge on the atom (str) *unused*
-        atomRecord += "%2s\n" % space
-        # End ATOM record ----------------------------------
-
-        file.write(atomRecord)
-
+        from files.pdb.files_pdb import PdbRecordWriter
+        writer = PdbRecordWriter(file)
+        writer.add_plain_atom(self, atomSerialNumber, chainId)
+        writer.flush()
         return
 
     def writemdl(self, alist, f, dispdef, col):
@@ -84,6 +84,8 @@ from Numeric import compress
 from Numeric import nonzero
 from Numeric import take
 from Numeric import argmax
+from Numeric import zeros
+from Numeric import Int
 
 from OpenGL.GL import glPushMatrix
 from OpenGL.GL import glTranslatef
@@ -113,9 +115,12 @@ from utilities.debug import safe_repr
 from utilities import debug_flags
 
 from utilities.GlobalPreferences import pref_show_node_color_in_MT
+from utilities.GlobalPreferences import debug_pref_bvh_picking
+from utilities.GlobalPreferences import debug_pref_lazy_chunk_atom_posns
 from utilities.icon_utilities import imagename_to_pixmap
 
 from geometry.BoundingBox import BBox
+from geometry.BVH import BVH
 from geometry.VQT import V, Q, A, vlen
 
 import foundation.env as env
@@ -124,6 +129,7 @@ from foundation.NodeWithAtomContents import NodeWithAtomContents
 from foundation.inval import InvalMixin
 from foundation.state_constants import S_REF, S_CHILDREN_NOT_DATA
 from foundation.undo_archive import set_undo_nullMol
+from foundation.undo_archive import register_pre_scan_updater
 
 from graphics.display_styles.displaymodes import get_display_mode_handler
 from graphics.drawables.Selobj import Selobj_API
@@ -134,6 +140,7 @@ from model.elements import PeriodicTable
 from model.elements import Singlet
 from model.ExternalBondSet import ExternalBondSet
 from model.global_model_changedicts import _changed_parent_Atoms
+from model.global_model_changedicts import _changed_posn_Atoms
 
 from model.Chunk_Dna_methods import Chunk_Dna_methods
 from graphics.model_drawing.ChunkDrawer import ChunkDrawer
@@ -145,6 +152,13 @@ from commands.ChunkProperties.ChunkProp import ChunkProp
 
 _inval_all_bonds_counter = 1 # private global counter [bruce 050516]
 
+# maps id(chunk) to chunk, for chunks with _pending_atom_posns [bruce 090326]
+_chunks_with_pending_atom_posns = {}
+
+# Chunks with fewer atoms than this are checked atom by atom in
+# findAtomUnderMouse, rather than using self.atom_pick_bvh.
+_MIN_ATOMS_FOR_PICK_BVH = 200
+
 # == some debug code is near end of file
 
 
@@ -284,6 +298,13 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
     _f_lost_externs = False
     _f_gained_externs = False
 
+    # When not None, this is (atlist, atpos) from the last time all our
+    # atoms were moved at once (by a rigid motion or set_atom_posns);
+    # those atoms' _posn attrs have not yet been set from atpos (except for
+    # atoms in jigs), and atom.posn() gets their positions from it instead.
+    # See _set_atom_posns_from_atpos and _f_sync_atom_posns. [bruce 090326]
+    _pending_atom_posns = None
+
     # Set this to True if any of the atoms in this chunk have their
     # overlayText set to anything other than None.  This keeps us from
     # having to test that for every single atom in every single chunk
@@ -578,6 +599,37 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
             memoplace['memo'] = memo
         return memoplace['memo']
 
+    def memo_is_valid(self, address, memo_validity_data): #bruce 090325
+        """
+        Would find_or_recompute_memo, given these arguments, return
+        an existing memo without recomputing it?
+        """
+        memoplace = self._memo_dict.get(address)
+        return memoplace is not None and \
+               memoplace.get('memo_validity_data') == memo_validity_data
+
+    def store_memo(self, address, memo_validity_data, memo): #bruce 090325
+        """
+        Store memo (computed elsewhere, e.g. by a worker thread) as if
+        find_or_recompute_memo had computed it with these arguments.
+        """
+        memoplace = self._memo_dict.setdefault(address, {})
+        memoplace['memo_validity_data'] = memo_validity_data
+        memoplace['memo'] = memo
+        return
+
+    def old_memo(self, address): #bruce 090327
+        """
+        Return the memo last stored at address (by find_or_recompute_memo
+        or store_memo), even if it's no longer valid, or None if there is
+        none. (This lets a memo be recomputed incrementally from the old
+        one.)
+        """
+        memoplace = self._memo_dict.get(address)
+        if memoplace is None:
+            return None
+        return memoplace.get('memo')
+
     def changeapp_counter(self):
         """
         #doc
@@ -1169,6 +1221,24 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         self.invalidate_atom_lists()
         return
 
+    def addatoms(self, atoms):
+        """
+        Private method;
+        like addatom, for a list of new atoms, but doing the invalidations
+        in self only once. (Useful when reading files, or otherwise making
+        many atoms at once.)
+        """
+        selfatoms = self.atoms
+        for atom in atoms:
+            # inlined addatom
+            assert atom.molecule is None or atom.molecule is _nullMol
+            atom.molecule = self
+            _changed_parent_Atoms[atom.key] = atom
+            atom.index = -1 # illegal value
+            selfatoms[atom.key] = atom
+        self.invalidate_atom_lists()
+        return
+
     def delatom(self, atom):
         """
         Private method;
@@ -1221,8 +1291,13 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         # I'm not 100% sure that's ok, but I can't see a problem in the method
         # and I didn't find a bug in testing. [bruce 060409]
 
+        if self._pending_atom_posns is not None:
+            # (do this before atoms can leave self [bruce 090326])
+            self._f_sync_atom_posns()
+
         self._drawer.invalidate_display_lists()
         self.haveradii = 0
+        self._f_invalidate_part_pick_bvh()
         self._f_lost_externs = True
         self._f_gained_externs = True
 
@@ -1325,10 +1400,24 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         # recode in a new Pyrex ChunkBase. Some code is copied from
         # now-obsolete setatomposn; some of its comments might apply here as
         # well.
-        self.changed()
+        self.changed(atoms_layer_only = True)
+            # (this lets Undo get the changes from _changed_posn_Atoms alone)
         self._drawer.invalidate_display_lists()
         self.invalidate_attr('atpos') #e should optim this
             ##k verify this also invals basepos, or add that to the arg of this call
+        self._f_invalidate_part_pick_bvh()
+        return
+
+    def _f_invalidate_part_pick_bvh(self): #bruce 090311
+        """
+        [friend method for Chunk and Part]
+        Our position, bounding box, atoms or their selection radii might
+        have changed, so our part's chunk_pick_bvh (which finds the chunks
+        a line of sight might hit) might no longer be correct.
+        """
+        part = self.part
+        if part is not None and part.__dict__.has_key('chunk_pick_bvh'):
+            part.invalidate_attr('chunk_pick_bvh')
         return
 
     # for __getattr__, validate_attr, invalidate_attr, etc, see InvalMixin
@@ -1418,6 +1507,7 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         self._drawer.invalidate_display_lists()
         self._f_lost_externs = self._f_gained_externs = True
         self.haveradii = 0
+        self._f_invalidate_part_pick_bvh()
         self.invalidate_attrs(['atlist', 'externs']) # invalidates everything, I think
         assert not self.valid_attrs(), \
                "full_inval_and_update forgot to invalidate something: %r" % self.valid_attrs()
@@ -1497,9 +1587,16 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
 ##                print "fyi: _recompute_atpos sees %r already existing" % attr
 
         atlist = self.atlist # might call _recompute_atlist
-        atpos = map( lambda atom: atom.posn(), atlist )
+        pending = self._pending_atom_posns
+        if pending is not None and pending[0] is atlist:
+            # our atoms' positions are all in this array already
+            # [bruce 090326]
+            atpos = + pending[1]
+        else:
+            if pending is not None:
+                self._f_sync_atom_posns() # (probably never happens)
+            atpos = self._gather_atom_posns(atlist)
             # atpos, basepos, and atlist must be in same order
-        atpos = A(atpos)
         # we must invalidate or fix self.atpos when any of our atoms' positions is changed!
         self.atpos = atpos
 
@@ -1550,6 +1647,23 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
     # (but not average_position, that has its own recompute method):
     _recompute_basepos   = _recompute_atpos
 
+    def _gather_atom_posns(self, atlist): #bruce 090326 split out of _recompute_atpos
+        """
+        [private helper for _recompute_atpos]
+        Return an array of the positions of the atoms in atlist,
+        which must have no pending positions (see _pending_atom_posns).
+        """
+        # Copying _posn directly (rather than calling atom.posn() for each
+        # atom) is several times faster; the overflow check atom.posn()
+        # does for each atom is done for the whole array, and only if that
+        # fails do we use atom.posn() to find and fix the bad positions.
+        atpos = A([atom._posn for atom in atlist])
+        try:
+            atpos * 1000
+        except:
+            atpos = A([atom.posn() for atom in atlist])
+        return atpos
+
     def _changed_basecenter_or_quat_while_atoms_fixed(self):
         """
         [private method]
@@ -1621,6 +1735,7 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         bondpoints), plus a fudge factor to account for atom radii.
         """
         self.bbox = BBox(self.atpos)
+        self._f_invalidate_part_pick_bvh()
 
     # Center.
 
@@ -1898,10 +2013,13 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         #  user event handlers, so most of the Node changing methods that
         #  ought to do them probably don't do them.]
         self.changed() # Node method
+        self._f_invalidate_part_pick_bvh()
 
         # imitate the recomputes done by _recompute_atpos
         self.atpos = self.basecenter + self.quat.rot(self.basepos) # inlines base_to_abs
         self._set_atom_posns_from_atpos( self.atpos) #bruce 060308
+            # (as of 090326 this usually just stores self.atpos for our atoms
+            #  to get their positions from later)
         # no change in atlist; no change needed in our atoms' .index attributes
         # no change here in basepos or bbox (if caller changed them, it should
         # call changed_attr itself, or it should invalidate bbox itself);
@@ -1928,8 +2046,86 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         assert self.__dict__.has_key('atlist')
         atlist = self.atlist
         assert len(atlist) == len(atpos)
-        for i in xrange(len(atlist)):
-            atlist[i]._f_setposn_no_chunk_or_bond_invals( atpos[i] )
+        if not debug_pref_lazy_chunk_atom_posns():
+            if self._pending_atom_posns is not None:
+                self._f_sync_atom_posns()
+            for i in xrange(len(atlist)):
+                atlist[i]._f_setposn_no_chunk_or_bond_invals( atpos[i] )
+            return
+        # Don't set each atom's _posn now, just remember the new positions
+        # for atom.posn() to return and for _f_sync_atom_posns to store
+        # later (often after many more moves). That's safe since every
+        # change to our atoms or their positions syncs them first, as does
+        # Undo before it scans them (which is why we record the change in
+        # _changed_posn_Atoms now). [bruce 090326]
+        self._pending_atom_posns = (atlist, atpos)
+        _chunks_with_pending_atom_posns[id(self)] = self
+        _changed_posn_Atoms.update(self.atoms)
+        # Atoms in jigs have to be moved now, since jig.moved_atom might
+        # need their new positions (or even move other atoms, which syncs
+        # all of ours).
+        for atom in [atom for atom in atlist if atom.jigs]:
+            atom._posn = + atpos[atom.index]
+            for jig in atom.jigs[:]:
+                jig.moved_atom(atom)
+        return
+
+    def _f_pending_atom_posn(self, atom): #bruce 090326
+        """
+        [friend method for Atom.posn]
+        Return (a copy of) atom's position from our _pending_atom_posns,
+        which must not be None.
+        """
+        atlist, atpos = self._pending_atom_posns
+        i = atom.index
+        if 0 <= i < len(atlist) and atlist[i] is atom:
+            return + atpos[i]
+        # atom must have joined self since our atoms moved (though the
+        # code that added it should have synced that)
+        self._f_sync_atom_posns()
+        return + atom._posn
+
+    def _f_sync_atom_posns(self): #bruce 090326
+        """
+        [friend method for Atom, Chunk, and sync_all_pending_atom_posns]
+        If our atoms have new positions they don't yet know about
+        (see _set_atom_posns_from_atpos), store them in their _posn attrs.
+        This does no invalidations (they were done when they moved).
+        """
+        pending = self._pending_atom_posns
+        if pending is None:
+            return
+        self._pending_atom_posns = None
+        _chunks_with_pending_atom_posns.pop(id(self), None)
+        atlist, atpos = pending
+        for atom, pos in zip(atlist, atpos):
+            atom._posn = + pos # copy, so it's not a view into atpos
+        return
+
+    def set_atom_posns(self, posns): #bruce 090326
+        """
+        Public method:
+        set the absolute positions of all our atoms at once, from posns,
+        a sequence of positions in the same order as self.atlist,
+        and do the same invalidations as if each atom's setposn method
+        had been called, but only once per chunk (much faster than calling
+        setposn for each atom, e.g. when showing a movie frame or the result
+        of a minimization).
+        """
+        atlist = self.atlist
+        posns = A(posns) # (also copies it, since we'll own it)
+        assert len(posns) == len(atlist)
+        if not len(atlist):
+            return
+        self._set_atom_posns_from_atpos(posns)
+        self.changed_atom_posn()
+        # do what setposn's calls of bond.setup_invalidate would do
+        self._invalidate_internal_bonds()
+        for bond in self.externs:
+            bond.setup_invalidate()
+        for atom in atlist:
+            if atom._f_checks_neighbor_geom and atom._f_valid_neighbor_geom:
+                atom._f_invalidate_neighbor_geom()
         return
 
     def applyToPoint(self, point): #bruce 090223
@@ -2057,10 +2253,12 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         self.display = disp
 
         # part of inlined self.changeapp(1) (not all is needed):
-        self._drawer.invalidate_display_lists()
+        self._drawer.invalidate_display_lists_for_appearance()
+            # (our old display lists can be drawn until they're remade)
             #### TODO: optim: cache DLs for at least one old display style,
             # to speed up changing back to prior style
         self.haveradii = 0
+        self._f_invalidate_part_pick_bvh()
         self.changed()
         return
 
@@ -2143,6 +2341,7 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         if atoms: #bruce 041207 added this arg and its effect
             self.haveradii = 0 # invalidate self.sel_radii_squared
             # (using self.invalidate_attr would be too slow)
+            self._f_invalidate_part_pick_bvh()
 ### REVIEW my removal of the following code (now that invalidate_display_lists does track_inval):
 # the best test would be, does something that calls changeapp and nothing else
 # do a gl_update? I'm not sure what op does that, so leave this here until
@@ -2455,6 +2654,34 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
     # and many other bugs (mostly never reported). [bruce 041214]
     # (We should use this in extrude, too! #e)
 
+    _inputs_for_atom_pick_bvh = ['basepos']
+    def _recompute_atom_pick_bvh(self):
+        """
+        Recompute self.atom_pick_bvh, a BVH (see geometry/BVH.py) over our
+        atom positions in our local coordinates (self.basepos, so its
+        indices are those of self.atlist), used by findAtomUnderMouse to
+        find the atoms near a line of sight without transforming all of
+        self.atpos. Since it's in local coordinates, moving or rotating
+        self as a unit doesn't invalidate it.
+        """
+        basepos = self.basepos
+        self.atom_pick_bvh = BVH(basepos, basepos)
+
+    def _atom_indices_near_line(self, point, direction, radius):
+        """
+        Return an array of the indices (in self.atlist) of our atoms which
+        might be within radius of the line through point in direction
+        (in absolute coordinates), or None if it's better to check all our
+        atoms (since there are not many).
+        """
+        if len(self.atoms) < _MIN_ATOMS_FOR_PICK_BVH or \
+           not debug_pref_bvh_picking():
+            return None
+        bvh = self.atom_pick_bvh # might recompute basepos, basecenter, quat
+        local_point = self.quat.unrot(point - self.basecenter)
+        local_direction = self.quat.unrot(direction)
+        return bvh.line_query(local_point, local_direction, radius)
+
     def findAtomUnderMouse( self, point, matrix, **kws):
         """
         [Public method, but for a more convenient interface see its caller:]
@@ -2485,18 +2712,10 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
             return []
         #e Someday also check self.bbox as a speedup -- but that might be slower
         #  when there are only a few atoms.
+        # [bruce 090311: for large chunks, we now only look at the atoms
+        #  self.atom_pick_bvh finds near the line of sight; see below.]
         atpos = self.atpos # a Numeric array; might be recomputed here
 
-        # assume line of sight hits water surface (parallel to screen) at point
-        # (though the docstring doesn't mention this assumption since it is
-        #  probably not required as long as z direction == glpane.out);
-        # transform array of atom centers (xy parallel to water, z towards user).
-        v = dot( atpos - point, matrix)
-
-        # compute xy distances-squared between line of sight and atom centers
-        r_xy_2 = v[:,0]**2 + v[:,1]**2
-        ## r_xy = sqrt(r_xy_2) # not needed
-
         # Select atoms which are hit by the line of sight (as array of indices).
         # See comments in _findAtomUnderMouse_Numeric_stuff for more details.
         # (Optimize for the slowest case: lots of atoms, most fail lineofsight
@@ -2519,6 +2738,7 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
 
         radii_2 = self.get_sel_radii_squared() # might be recomputed now
         assert len(radii_2) == len(self.atoms)
+        max_radius_2 = self._max_sel_radius_squared
         selatom = self.assy.o.selatom
         unpatched_seli_radius2 = None
         if selatom is not None and selatom.molecule is self:
@@ -2526,12 +2746,47 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
             seli = selatom.index
             unpatched_seli_radius2 = radii_2[seli]
             radii_2[seli] = selatom.highlighting_radius() ** 2
+            max_radius_2 = max(max_radius_2, radii_2[seli])
             # (note: selatom is drawn even if "invisible")
             if unpatched_seli_radius2 > 0.0:
                 kws['alt_radii'] = [(seli, unpatched_seli_radius2)]
         try:
+            if max_radius_2 < 0.0:
+                # no atoms are visible
+                indices = zeros((0,), Int)
+            else:
+                indices = self._atom_indices_near_line(
+                    point, matrix[:, 2], Numeric.sqrt(max_radius_2))
+            if indices is None:
+                atpos_1 = atpos
+                radii_2_1 = radii_2
+            else:
+                # only consider the atoms the line of sight might hit;
+                # the indices passed to the subroutine (including those in
+                # alt_radii) are then indices into indices
+                atpos_1 = take(atpos, indices, 0)
+                radii_2_1 = take(radii_2, indices)
+                kws['atom_indices'] = indices
+                alt_radii = []
+                for ind, rad2 in kws.get('alt_radii', ()):
+                    found = nonzero(indices == ind)
+                    if len(found):
+                        alt_radii.append((found[0], rad2))
+                if kws.has_key('alt_radii'):
+                    kws['alt_radii'] = alt_radii
+
+            # assume line of sight hits water surface (parallel to screen) at point
+            # (though the docstring doesn't mention this assumption since it is
+            #  probably not required as long as z direction == glpane.out);
+            # transform array of atom centers (xy parallel to water, z towards user).
+            v = dot( atpos_1 - point, matrix)
+
+            # compute xy distances-squared between line of sight and atom centers
+            r_xy_2 = v[:,0]**2 + v[:,1]**2
+            ## r_xy = sqrt(r_xy_2) # not needed
+
             # note: kws here might include alt_radii as produced above
-            res = self._findAtomUnderMouse_Numeric_stuff( v, r_xy_2, radii_2, **kws)
+            res = self._findAtomUnderMouse_Numeric_stuff( v, r_xy_2, radii_2_1, **kws)
         except:
             print_compact_traceback("bug in _findAtomUnderMouse_Numeric_stuff: ")
             res = []
@@ -2542,11 +2797,17 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
     def _findAtomUnderMouse_Numeric_stuff(self, v, r_xy_2, radii_2,
                                           far_cutoff = None,
                                           near_cutoff = None,
-                                          alt_radii = ()
+                                          alt_radii = (),
+                                          atom_indices = None
                                          ):
         """
         private helper routine for findAtomUnderMouse
+
+        @param atom_indices: if provided, v, r_xy_2 and radii_2 are only for
+                             the atoms in self.atlist with these indices
         """
+        if not len(v):
+            return []
         ## removed support for backs_ok, since atom backs are not drawn
         p1 = (r_xy_2 <= radii_2) # indices of candidate atoms
         if not p1: # i.e. if p1 is an array of all false/0 values [bruce 050516 guess/comment]
@@ -2623,6 +2884,8 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
             if closest_z < far_cutoff:
                 return []
 
+        if atom_indices is not None:
+            closest_z_ind = atom_indices[ closest_z_ind ]
         atom = self.atlist[ closest_z_ind ]
 
         return [(closest_z, atom)] # from _findAtomUnderMouse_Numeric_stuff
@@ -2649,9 +2912,21 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
                 print_compact_traceback("bug in %r.compute_sel_radii_squared(), using []: " % self)
                 res = [] #e len(self.atoms) copies of something would be better
             self.sel_radii_squared_private = res
+            if len(res):
+                self._max_sel_radius_squared = Numeric.maximum.reduce(res)
+            else:
+                self._max_sel_radius_squared = -1.0
             self.haveradii = (disp, eltprefs, radiusprefs)
         return self.sel_radii_squared_private
 
+    def max_sel_radius(self):
+        """
+        Return the largest selection radius of our atoms (see
+        get_sel_radii_squared), or 0.0 if none are visible.
+        """
+        self.get_sel_radii_squared()
+        return Numeric.sqrt(max(self._max_sel_radius_squared, 0.0))
+
     def compute_sel_radii_squared(self):
         lis = map( lambda atom: atom.selradius_squared(), self.atlist )
         if not lis:
@@ -3129,6 +3404,7 @@ class Chunk(Chunk_Dna_methods, Chunk_mmp_methods,
         # effectively inlines hopmol and its delatom and addatom;
         # no need to find and hop singlet neighbors of atoms in mol
         # since they were already in mol anyway.
+        mol._f_sync_atom_posns() #bruce 090326
         for atom in mol.atoms.values():
             # should be a method in atom:
             atom.index = -1
@@ -3255,6 +3531,19 @@ def _get_nullMol():
 
 _nullMol = None
 
+def sync_all_pending_atom_posns(): #bruce 090326
+    """
+    Store the positions of all atoms whose chunks were moved as a whole
+    (see Chunk._set_atom_posns_from_atpos) into those atoms' _posn attrs.
+    Called before Undo scans or restores atom positions.
+    """
+    while _chunks_with_pending_atom_posns:
+        junk, chunk = _chunks_with_pending_atom_posns.popitem()
+        chunk._f_sync_atom_posns()
+    return
+
+register_pre_scan_updater( sync_all_pending_atom_posns)
+
 def _make_nullMol(): #bruce 060331 split out and revised this, to mitigate bugs similar to bug 1796
     """
     [private]
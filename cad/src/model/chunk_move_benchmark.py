@@ -0,0 +1,118 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+chunk_move_benchmark.py -- time moving many small chunks, and setting all
+their atom positions at once, with and without
+debug_pref_lazy_chunk_atom_posns.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py model/chunk_move_benchmark.py [natoms]
+
+A made-up model of natoms atoms (default 100000) in chunks of 10 (in an
+Assembly with no GUI, though Qt is still needed to make chunk icons) is
+moved and rotated as a whole, chunk by chunk, several times, as when
+dragging a selection of many chunks; then each atom's position is asked
+for once, as it might be by an operation which follows the drag.
+
+Then all the atoms are given new positions (as when showing a movie frame),
+using Chunk.set_atom_posns, and for comparison, Atom.setposn.
+
+The times are printed for each setting of the pref.
+"""
+
+import sys
+import time
+import random
+
+from PyQt4.Qt import QApplication
+
+import foundation.env as env
+
+from utilities.debug_prefs import debug_pref_object
+from utilities.GlobalPreferences import debug_pref_lazy_chunk_atom_posns
+from utilities.icon_utilities import initialize_icon_utilities
+
+from geometry.VQT import V, Q
+
+_ATOMS_PER_CHUNK = 10
+_NMOVES = 10
+
+def _make_chunks(assy, natoms):
+    from model.chunk import Chunk
+    from model.chem import Atom
+    random.seed(0)
+    chunks = []
+    for start in range(0, natoms, _ATOMS_PER_CHUNK):
+        chunk = Chunk(assy, "chunk-%d" % start)
+        x0, y0, z0 = [random.uniform(0, 100) for i in range(3)]
+        for i in range(min(_ATOMS_PER_CHUNK, natoms - start)):
+            Atom('C', V(x0 + 1.5 * i, y0, z0), chunk)
+        assy.part.addmol(chunk)
+        chunk.atpos # as if drawn once before the move
+        chunks.append(chunk)
+    return chunks
+
+def _time_moves(chunks):
+    t0 = time.time()
+    q = Q(V(0, 0, 1), 0.01)
+    for i in range(_NMOVES):
+        for chunk in chunks:
+            chunk.move(V(0.1, 0, 0))
+            chunk.rot(q)
+    t1 = time.time()
+    for chunk in chunks:
+        for atom in chunk.atoms.itervalues():
+            atom.posn()
+    t2 = time.time()
+    return t1 - t0, t2 - t1
+
+def _time_set_posns(chunks):
+    posns = [chunk.atpos + V(0, 0.1, 0) for chunk in chunks]
+    t0 = time.time()
+    for chunk, atpos in zip(chunks, posns):
+        chunk.set_atom_posns(atpos)
+    t1 = time.time()
+    for chunk, atpos in zip(chunks, posns):
+        atlist = chunk.atlist
+        for i in range(len(atlist)):
+            atlist[i].setposn(atpos[i])
+    t2 = time.time()
+    return t1 - t0, t2 - t1
+
+def _run(natoms):
+    from model.assembly import Assembly
+    debug_pref_lazy_chunk_atom_posns() # register it, so debug_pref_object works
+    prefs_key = debug_pref_object(
+        "Chunk: store moved atom positions lazily?").prefs_key
+    old = env.prefs[prefs_key]
+
+    assy = Assembly(None)
+    chunks = _make_chunks(assy, natoms)
+    print "%d atoms in %d chunks" % (natoms, len(chunks))
+    try:
+        for lazy in (False, True):
+            env.prefs[prefs_key] = lazy
+            t_moves, t_posns = _time_moves(chunks)
+            print "  lazy %-5s: %d moves and rotations of each chunk %.3f sec, " \
+                  "then posn() of each atom %.3f sec" % \
+                  (lazy, _NMOVES, t_moves, t_posns)
+            t_bulk, t_each = _time_set_posns(chunks)
+            print "  lazy %-5s: set_atom_posns %.3f sec, " \
+                  "setposn of each atom %.3f sec" % (lazy, t_bulk, t_each)
+    finally:
+        env.prefs[prefs_key] = old
+    return
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv) # needed for chunk icons
+    initialize_icon_utilities()
+    args = sys.argv[2:] # sys.argv[1] is this file, when run by ExecSubDir.py
+    if args:
+        _run(int(args[0]))
+    else:
+        _run(100000)
+
+# end
@@ -32,6 +32,10 @@ TODO: make this directly accessible as one or more user operations.
 # perhaps plus some extra too-long bonds at the end, if permitted by valence.
 
 import math
+import heapq
+
+from Numeric import array, take, compress, sqrt, Float
+from Numeric import less, greater, logical_and, logical_or
 
 from geometry.VQT import vlen
 from geometry.VQT import atom_angle_radians
@@ -40,11 +44,14 @@ import foundation.env as env
 
 from model.bonds import bond_atoms_faster
 from geometry.NeighborhoodGenerator import NeighborhoodGenerator
+from geometry.CellList import CellList
 
 from model.bond_constants import atoms_are_bonded # was: from bonds import bonded
 from model.bond_constants import V_SINGLE
 from model.bond_constants import bond_params
 
+from utilities.debug_prefs import debug_pref, Choice_boolean_True
+
 # constants; angles are in radians
 
 degrees = math.pi / 180
@@ -400,6 +407,174 @@ def make_bonds(atmlist, bondtyp = V_SINGLE):
 
 # ==
 
+def make_bonds_bulk(atmlist, bondtyp = V_SINGLE):
+    """
+    Make the same bonds as make_bonds, by the same greedy algorithm, but
+    score all candidate pairs at once using arrays, and use a heap rather
+    than a sorted linked list for the greedy acceptance pass.
+       Per-element quantities (max and min bonds, ideal bond lengths,
+    electronegativity) are looked up once per element or element pair,
+    rather than once per candidate pair. The initial angle cost is only
+    computed (in Python) for pairs in which one of the atoms already has
+    real neighbors, since it's 0 otherwise. A pair's cost is only
+    recomputed when it reaches the head of the heap after either of its
+    atoms has gained a bond since the pair was last scored.
+       Return the number of bonds created.
+    """
+    atoms = [atm for atm in atmlist
+             if not atm.is_singlet() and bondable_atm(atm)]
+    n = len(atoms)
+    if n < 2:
+        return 0
+
+    # per-element tables, indexed by a small integer code per element
+    codes = {}
+    samples = [] # one atom of each element, for the per-element functions
+    atom_codes = []
+    for atm in atoms:
+        code = codes.get(atm.element)
+        if code is None:
+            code = codes[atm.element] = len(samples)
+            samples.append(atm)
+        atom_codes.append(code)
+    ne = len(samples)
+    maxbonds = [max_atom_bonds(atm) for atm in samples]
+    minbonds = [min_atom_bonds(atm) for atm in samples]
+    eneg = [(atm.element.symbol in _enegs) for atm in samples]
+    ideal = [idealBondLength(atm1, atm2)
+             for atm1 in samples
+             for atm2 in samples]
+
+    # per-atom state, kept up to date as we make bonds
+    neighbors = [atm.realNeighbors() for atm in atoms]
+    stamps = [0] * n # incremented whenever an atom gets a new bond
+
+    # candidate pairs and their distances
+    maxBondLength = 2.0
+    positions = [atm.posn() for atm in atoms]
+    i, j, dist2 = CellList(positions, maxBondLength).pairs_within()
+    if not len(i):
+        return 0
+    codes_i = take(array(atom_codes), i, 0)
+    codes_j = take(array(atom_codes), j, 0)
+    pair_codes = codes_i * ne + codes_j
+    best = take(array(ideal, Float), pair_codes, 0)
+    # avoid ZeroDivision from pondering a He-He bond; such pairs are
+    # rejected below, since their ratio is left huge
+    ok = greater(best, 0.0)
+    dist = sqrt(dist2)
+    ratio = dist / (best + (1 - ok)) + (1 - ok) * 1e10
+
+    # distance cost (see max_dist_ratio and atm_distance_cost)
+    nbonds = array([len(nn) for nn in neighbors])
+    hungry = less(nbonds, take(array(minbonds), array(atom_codes), 0))
+    pair_hungry = logical_or(take(hungry, i, 0), take(hungry, j, 0))
+    max_ratio = (MAX_DIST_RATIO_NON_HUNGRY +
+                 pair_hungry * (MAX_DIST_RATIO_HUNGRY - MAX_DIST_RATIO_NON_HUNGRY))
+    short = less(ratio, 1.0)
+    dist_cost = (short * ratio * 0.01 +
+                 (1 - short) * (0.01 + DIST_COST_FACTOR * (ratio - 1.0) ** 2))
+
+    # element cost (see bond_element_cost)
+    eneg = array(eneg)
+    elt_cost = logical_and(take(eneg, codes_i, 0),
+                           take(eneg, codes_j, 0)) * 1.0
+
+    keep = less(ratio, max_ratio)
+    cost = dist_cost + elt_cost
+    candidates = compress(keep, array([i, j]), 1)
+    cost = compress(keep, cost, 0).tolist()
+    dist = compress(keep, dist, 0).tolist()
+    pair_codes = compress(keep, pair_codes, 0).tolist()
+    heap = zip(cost, candidates[0].tolist(), candidates[1].tolist(),
+               dist, pair_codes, [0] * len(cost))
+
+    def angle_cost(i1, i2, dist, ratio):
+        # see atm_angle_cost
+        accept = dist < ANGLE_ACCEPT_DIST
+        atm1 = atoms[i1]
+        atm2 = atoms[i2]
+        sum = 0.0
+        for atm in neighbors[i1]:
+            cost = bond_angle_cost( atm_angle(atm, atm1, atm2), accept, ratio)
+            if cost is None:
+                return None
+            sum += cost
+        for atm in neighbors[i2]:
+            cost = bond_angle_cost( atm_angle(atm, atm2, atm1), accept, ratio)
+            if cost is None:
+                return None
+            sum += cost
+        return sum
+
+    def rescore(i1, i2, dist, pair_code):
+        # see bond_cost; the pair is known not to be bonded, and its
+        # ideal bond length is known to be nonzero
+        n1 = len(neighbors[i1])
+        n2 = len(neighbors[i2])
+        c1 = atom_codes[i1]
+        c2 = atom_codes[i2]
+        if n1 >= maxbonds[c1] or n2 >= maxbonds[c2]:
+            return None
+        ratio = dist / ideal[pair_code]
+        if n1 < minbonds[c1] or n2 < minbonds[c2]:
+            max_ratio = MAX_DIST_RATIO_HUNGRY
+        else:
+            max_ratio = MAX_DIST_RATIO_NON_HUNGRY
+        if not (ratio < max_ratio):
+            return None
+        if ratio < 1.0:
+            dc = ratio * 0.01
+        else:
+            dc = 0.01 + DIST_COST_FACTOR * (ratio - 1.0) ** 2
+        ac = angle_cost(i1, i2, dist, ratio)
+        if ac is None:
+            return None
+        return ac + dc + (eneg[c1] and eneg[c2] and 1.0 or 0.0)
+
+    # pairs involving atoms with existing real neighbors need their
+    # angle costs, and might already be bonded (rare for bondless input)
+    if filter(None, neighbors):
+        for k in range(len(heap)):
+            junk, i1, i2, d, pc, junk2 = heap[k]
+            if neighbors[i1] or neighbors[i2]:
+                if atoms_are_bonded(atoms[i1], atoms[i2]):
+                    c = None
+                else:
+                    c = rescore(i1, i2, d, pc)
+                heap[k] = (c, i1, i2, d, pc, 0)
+        heap = [entry for entry in heap if entry[0] is not None]
+
+    heapq.heapify(heap)
+    res = 0
+    while heap:
+        cost, i1, i2, d, pc, stamp = heapq.heappop(heap)
+        if stamp != stamps[i1] + stamps[i2]:
+            # one of the atoms got a new bond since this cost was computed,
+            # so it might have increased (never decreased, see make_bonds)
+            cost = rescore(i1, i2, d, pc)
+            if cost is None:
+                continue
+            if heap and heap[0][0] < cost:
+                heapq.heappush(heap,
+                               (cost, i1, i2, d, pc, stamps[i1] + stamps[i2]))
+                continue
+        bond_atoms_faster(atoms[i1], atoms[i2], bondtyp)
+        neighbors[i1].append(atoms[i2])
+        neighbors[i2].append(atoms[i1])
+        stamps[i1] += 1
+        stamps[i2] += 1
+        res += 1
+    return res
+
+def _use_bulk_bond_inference():
+    res = debug_pref("bond inference: score candidate bonds in bulk?",
+                     Choice_boolean_True,
+                     prefs_key = True)
+    return res
+
+# ==
+
 def inferBonds(mol): # [probably by Will; TODO: needs docstring]
 
     #bruce 071030 moved this from bonds.py to bonds_from_atoms.py
@@ -410,19 +585,15 @@ def inferBonds(mol): # [probably by Will; TODO: needs docstring]
     singlets = filter(lambda a: a.is_singlet(), mol.atoms.values())
     removable = { }
     sngen = NeighborhoodGenerator(singlets, maxBondLength)
-    for sing1 in singlets:
-        key1 = sing1.key
-        pos1 = sing1.posn()
-        for sing2 in sngen.region(pos1):
-            key2 = sing2.key
-            dist = vlen(pos1 - sing2.posn())
-            if key1 != key2:
-                removable[key1] = sing1
-                removable[key2] = sing2
+    for sing1, sing2, dist in sngen.pairs():
+        removable[sing1.key] = sing1
+        removable[sing2.key] = sing2
     for badGuy in removable.values():
         badGuy.kill()
-    from operations.bonds_from_atoms import make_bonds
-    make_bonds(mol.atoms.values())
+    if _use_bulk_bond_inference():
+        make_bonds_bulk(mol.atoms.values())
+    else:
+        make_bonds(mol.atoms.values())
     return
 
 # ==
@@ -469,7 +640,10 @@ def remake_bonds_in_selection( glpane ):
         atm.set_atomtype(atm.element.atomtypes[0]) ###k this might remake singlets if it changes atomtype
         #e future optim: revise above to also destroy singlets and bonds to them
         # (btw I think make_bonds doesn't make any singlets as it runs)
-    n_bonds_made = make_bonds(atmlist)
+    if _use_bulk_bond_inference():
+        n_bonds_made = make_bonds_bulk(atmlist)
+    else:
+        n_bonds_made = make_bonds(atmlist)
         #e it would be nice to figure out how many of these are the same as the ones we destroyed, etc
     for atm in atmlist:
         atm.remake_bondpoints()
@@ -10,10 +10,17 @@ History:
 
 090112 renamed from move_alist_and_snuggle, moved into new file from chem.py
 
+090327 added BulkAtomMover, which moves the atoms one chunk at a time
+
 """
 
+from Numeric import array, take, put, add, arange, sqrt, reshape, equal
+from Numeric import Int
+
 from geometry.VQT import A
 
+from utilities.GlobalPreferences import debug_pref_move_atoms_by_chunk
+
 def move_atoms_and_normalize_bondpoints(alist, newPositions):
     """
     Move the atoms in alist to the new positions in the given array or sequence
@@ -26,12 +33,22 @@ def move_atoms_and_normalize_bondpoints(alist, newPositions):
               (see snuggle docstring for details, re bug 1239).
 
     @warning: I'm not sure this does all required invals; doesn't do gl_update.
+
+    @see: BulkAtomMover, which this uses, and which callers that move the
+          same atoms many times (e.g. for movie frames) should use directly.
     """
     #bruce 051221 split this out of class Movie so its bug1239 fix can be used
     # in jig_Gamess. [later: Those callers have duplicated code which should be
     # cleaned up.]
     #bruce 090112 renamed from move_alist_and_snuggle
     #todo: refile into a new file in operations package
+    BulkAtomMover(alist).move_atoms(newPositions) #bruce 090327
+    return
+
+def _move_atoms_one_at_a_time(alist, newPositions):
+    """
+    [private helper for BulkAtomMover]
+    """
     assert len(alist) == len(newPositions)
     singlets = []
     for a, newPos in zip(alist, newPositions):
@@ -54,4 +71,161 @@ def move_atoms_and_normalize_bondpoints(alist, newPositions):
         a.snuggle() # includes a.setposn
     return
 
+# ==
+
+class BulkAtomMover(object): #bruce 090327
+    """
+    Move the atoms in a fixed list to new positions given as arrays in the
+    same order, as move_atoms_and_normalize_bondpoints does, but setting
+    each chunk's atom positions all at once (see Chunk.set_atom_posns), so
+    invalidations are done once per chunk rather than once per atom.
+
+    The grouping of our atoms by chunk is found when first needed, and
+    reused for each later call of move_atoms (e.g. for each movie frame)
+    until some chunk's atoms change.
+    """
+    def __init__(self, alist):
+        self.alist = list(alist)
+        self._groups = None
+        return
+
+    def move_atoms(self, newPositions):
+        """
+        Move our atoms to the positions in newPositions (an array or
+        sequence of positions, in the same order as our atoms), then
+        correct the positions of bondpoints as Atom.snuggle would.
+        Do all required invals, but no gl_update.
+        """
+        alist = self.alist
+        assert len(alist) == len(newPositions)
+        if not debug_pref_move_atoms_by_chunk():
+            _move_atoms_one_at_a_time(alist, newPositions)
+            return
+        if not alist:
+            return
+        if not self._groups_are_valid():
+            self._find_groups()
+        newPositions = A(newPositions) # (copies it, since we modify it)
+        pam_singlets = self._normalize_bondpoints(newPositions)
+        for chunk, atlist, alist_indices, atlist_indices in self._groups:
+            if len(atlist_indices) == len(atlist):
+                # all of chunk's atoms are moving
+                # (atlist_indices are then in order, so we needn't use them)
+                posns = take(newPositions, alist_indices, 0)
+            else:
+                posns = + chunk.atpos
+                put(posns,
+                    add.outer(atlist_indices * 3, arange(3)).flat,
+                    take(newPositions, alist_indices, 0).flat)
+            chunk.set_atom_posns(posns)
+        for i in self._loose_indices:
+            # atoms not in a live chunk; move them as before
+            # (they might be killed, and they're not singlets we correct)
+            alist[i].setposn(newPositions[i])
+        for a in pam_singlets:
+            a.snuggle() # might also reposition other bondpoints on a PAM atom
+        return
+
+    def _groups_are_valid(self):
+        if self._groups is None:
+            return False
+        for chunk, atlist, alist_indices, atlist_indices in self._groups:
+            if chunk.atlist is not atlist:
+                # (chunk's atoms changed, since it makes a new atlist then)
+                return False
+        return True
+
+    def _find_groups(self):
+        """
+        Set self._groups to a list of (chunk, atlist, alist_indices,
+        atlist_indices), where chunk.atlist[atlist_indices[k]] is
+        self.alist[alist_indices[k]], sorted by atlist_indices.
+        Set self._loose_indices to the indices of our atoms in no
+        live chunk, and self._singlet_indices to the indices of our
+        bondpoints.
+        """
+        groups = {} # maps id(chunk) to (chunk, atlist, list of (atlist index, alist index))
+        loose = []
+        singlets = []
+        for i in range(len(self.alist)):
+            atom = self.alist[i]
+            if atom.is_singlet():
+                singlets.append(i)
+            chunk = atom.molecule
+            if chunk is None or not chunk.atoms.has_key(atom.key):
+                # killed, or in no chunk (e.g. _nullMol)
+                loose.append(i)
+                continue
+            group = groups.get(id(chunk))
+            if group is None:
+                group = groups[id(chunk)] = (chunk, chunk.atlist, [])
+                    # (getting chunk.atlist sets atom.index for its atoms)
+            group[2].append( (atom.index, i) )
+        self._groups = []
+        for chunk, atlist, pairs in groups.itervalues():
+            pairs.sort()
+            atlist_indices = array([j for (j, i) in pairs], Int)
+            alist_indices = array([i for (j, i) in pairs], Int)
+            self._groups.append( (chunk, atlist, alist_indices, atlist_indices) )
+        self._loose_indices = loose
+        self._singlet_indices = singlets
+        return
+
+    def _normalize_bondpoints(self, newPositions):
+        """
+        Modify newPositions to correct the positions of our bondpoints
+        as Atom.snuggle would, assuming all our atoms are being moved to
+        newPositions, except for bondpoints on PAM atoms, which we return
+        as a list for the caller to snuggle after moving all the atoms.
+        """
+        alist = self.alist
+        indices = []
+        other_posns = []
+        rcovalents = []
+        pam_singlets = []
+        for i in self._singlet_indices:
+            a = alist[i]
+            if not a.bonds:
+                continue # killed (see comment in Atom.snuggle)
+            other = a.bonds[0].other(a)
+            if other.element.pam:
+                pam_singlets.append(a)
+                continue
+            j = self._index_of(other)
+            if j is None:
+                other_posns.append(other.posn()) # not being moved
+            else:
+                other_posns.append(newPositions[j])
+            indices.append(i)
+            rcovalents.append(other.atomtype.rcovalent)
+        if not indices:
+            return pam_singlets
+        indices = array(indices, Int)
+        other_posns = A(other_posns)
+        # same computation as in Atom.snuggle, for all the bondpoints at once
+        # (norm of a zero vector is zero, as in VQT.norm)
+        vecs = take(newPositions, indices, 0) - other_posns
+        lengths = sqrt(add.reduce(vecs * vecs, 1))
+        lengths = lengths + equal(lengths, 0)
+        scale = A(rcovalents) / lengths
+        posns = other_posns + vecs * reshape(scale, (len(indices), 1))
+        put(newPositions,
+            add.outer(indices * 3, arange(3)).flat,
+            posns.flat)
+        return pam_singlets
+
+    def _index_of(self, atom):
+        """
+        Return the index of atom in self.alist, or None if it's not there.
+        """
+        try:
+            index_of_key = self._index_of_key
+        except AttributeError:
+            index_of_key = self._index_of_key = {}
+            for i in range(len(self.alist)):
+                index_of_key[self.alist[i].key] = i
+        return index_of_key.get(atom.key)
+
+    pass
+
 # end
@@ -229,10 +229,70 @@ def export_command_table_cmd(glpane, _might_reload = True): #bruce 080721, unfin
 
 # ==
 
+def _peak_rss_kbytes():
+    """
+    Return this process's peak resident set size so far, in kilobytes,
+    or 0 if we can't find out.
+    """
+    try:
+        import resource
+        res = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except:
+        # e.g. no resource module on Windows
+        return 0
+    if sys.platform == 'darwin':
+        res /= 1024 # reported in bytes on Mac, kilobytes on Linux
+    return res
+
+def benchmark_readmmp_cmd(glpane):
+    """
+    Read the current model's mmp file (as saved on disk) into scratch
+    Groups of the current assembly, using the streaming mmp reader and then
+    the old one, and print the lines per second and the growth of peak RSS
+    for each. (Peak RSS never shrinks, so the reader run second only shows
+    growth if it needs more memory than the first one.)
+    """
+    import time
+    from files.mmp.files_mmp import _readmmp
+    assy = glpane.assy
+    filename = assy.filename
+    if not filename or not filename.endswith(".mmp") or \
+       not os.path.exists(filename):
+        print "benchmark_readmmp_cmd: current model has no saved mmp file"
+        return
+    file1 = open(filename, "rU")
+    nlines = 0
+    for line in file1:
+        nlines += 1
+    file1.close()
+    print "reading %r (%d lines):" % (filename, nlines)
+    for streaming in (True, False):
+        rss0 = _peak_rss_kbytes()
+        assy.assy_valid = False # disable updaters, as readmmp does
+        try:
+            t0 = time.time()
+            ok, grouplist, atoms = _readmmp(assy, filename, True,
+                                            streaming = streaming)
+            duration = time.time() - t0
+        finally:
+            assy.assy_valid = True
+        rss1 = _peak_rss_kbytes()
+        print "  %s reader: %s, %d atoms, %.2f sec, %d lines/sec, " \
+              "peak RSS grew by %d KB" % \
+              (streaming and "streaming" or "old", ok, len(atoms), duration,
+               nlines / max(duration, 1e-6), rss1 - rss0)
+        for group in grouplist or ():
+            group.kill()
+        continue
+    return
+
+# ==
+
 def initialize(): # called from startup_misc.py
     if EndUser.enableDeveloperFeatures():
         register_debug_menu_command( "Import all source files", import_all_modules_cmd )
         register_debug_menu_command( "Export command table", export_command_table_cmd )
+        register_debug_menu_command( "Benchmark mmp reading", benchmark_readmmp_cmd )
     return
 
 # end
@@ -21,6 +21,8 @@ from utilities.constants import diINVISIBLE, diDEFAULT
 from model.global_model_changedicts import _changed_picked_Atoms
 from model.chunk import Chunk
 from model.elements import Singlet
+from model.elements import PeriodicTable
+from model.chem import Atom
 from geometry.VQT import V, A, norm, cross
 from Numeric import dot, transpose
 import foundation.env as env
@@ -29,6 +31,8 @@ from utilities.debug import print_compact_traceback
 from utilities import debug_flags
 from platform_dependent.PlatformDependent import fix_plurals
 from utilities.GlobalPreferences import permit_atom_chunk_coselection
+from utilities.GlobalPreferences import debug_pref_bvh_picking
+from geometry.BVH import BVH
 from utilities.icon_utilities import geticon
 
 from dna.model.DnaGroup import DnaGroup
@@ -124,6 +128,9 @@ def renameableLeafNode(obj, groups_renameable = False): # probably by Mark
 
     return True
 
+# number of chunks per leaf of Part.chunk_pick_bvh
+_CHUNK_PICK_BVH_LEAFSIZE = 4
+
 class ops_select_Mixin:
     """
     Mixin class for providing selection methods to class L{Part}.
@@ -825,11 +832,18 @@ class ops_select_Mixin:
     def findpick(self, p1, v1, r=None):
         distance = 1000000
         atom = None
-        for mol in self.molecules:
+        for mol in self._chunks_near_line(p1, v1, r or 0.0):
             if mol.hidden:
                 continue
             disp = mol.get_dispdef()
-            for a in mol.atoms.itervalues():
+            indices = mol._atom_indices_near_line(p1, v1,
+                                                  r or mol.max_sel_radius())
+            if indices is None:
+                atoms = mol.atoms.itervalues()
+            else:
+                atlist = mol.atlist
+                atoms = [atlist[i] for i in indices]
+            for a in atoms:
                 if not a.visible(disp):
                     continue
                 dist = a.checkpick(p1, v1, disp, r, None)
@@ -904,8 +918,14 @@ class ops_select_Mixin:
             # (water_cutoff and cutoffs[1] or None) doesn't work!
         else:
             far_cutoff = None
+        selatom = self.o.selatom
+        if selatom is not None:
+            # (it might be drawn larger than its chunk's selection radii)
+            margin = selatom.highlighting_radius()
+        else:
+            margin = 0.0
         z_atom_pairs = []
-        for mol in self.molecules:
+        for mol in self._chunks_near_line(point, z, margin):
             if mol.hidden:
                 continue
             pairs = mol.findAtomUnderMouse(point, matrix, \
@@ -919,6 +939,60 @@ class ops_select_Mixin:
             return None
         return res
 
+    # == finding the chunks near a line of sight [bruce 090311]
+
+    _inputs_for_chunk_pick_bvh = ['molecules']
+    def _recompute_chunk_pick_bvh(self):
+        """
+        Recompute self.chunk_pick_bvh, which is (chunks, bvh, radii_key),
+        where chunks are those of self.molecules which have atoms, bvh is a
+        BVH (see geometry/BVH.py) over their bounding boxes, each expanded
+        by the largest selection radius of its atoms, and radii_key is
+        self._pick_radii_key() (the global settings those radii depend on).
+
+        Besides changes to self.molecules, this is invalidated by
+        Chunk._f_invalidate_part_pick_bvh whenever a chunk moves or its
+        atoms or their radii change.
+        """
+        chunks = []
+        lo = []
+        hi = []
+        for mol in self.molecules:
+            if not mol.atoms:
+                continue
+            radius = mol.max_sel_radius()
+            bbox_hi, bbox_lo = mol.bbox.data
+            chunks.append(mol)
+            lo.append(bbox_lo - radius)
+            hi.append(bbox_hi + radius)
+        self.chunk_pick_bvh = (chunks,
+                               BVH(lo, hi, _CHUNK_PICK_BVH_LEAFSIZE),
+                               self._pick_radii_key())
+        return
+
+    def _pick_radii_key(self):
+        glpane = self.assy.o
+        return (glpane.displayMode,
+                getattr(glpane, 'lastNonReducedDisplayMode', None),
+                PeriodicTable.rvdw_change_counter,
+                Atom.selradius_prefs_values())
+
+    def _chunks_near_line(self, point, direction, margin = 0.0):
+        """
+        Return a list of the chunks in self which have any atoms whose
+        selection radius (plus margin) might reach the line through point
+        in the given direction (or all our chunks, if
+        debug_pref_bvh_picking is off). (Hidden chunks are included.)
+        """
+        if not debug_pref_bvh_picking():
+            return self.molecules
+        chunks, bvh, radii_key = self.chunk_pick_bvh
+        if radii_key != self._pick_radii_key():
+            # some chunks' radii might have changed
+            self.invalidate_attr('chunk_pick_bvh')
+            chunks, bvh, radii_key = self.chunk_pick_bvh
+        return [chunks[i] for i in bvh.line_query(point, direction, margin)]
+
     #bruce 041214 renamed and rewrote the following pick_event methods, as part of
     # fixing bug 235 (and perhaps some unreported bugs).
     # I renamed them to distinguish them from the many other "pick" (etc) methods
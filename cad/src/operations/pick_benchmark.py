@@ -0,0 +1,143 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+pick_benchmark.py -- time Part.findAtomUnderMouse and Part.findpick
+on a model, with and without debug_pref_bvh_picking, without a GUI.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py operations/pick_benchmark.py file.mmp [rays.txt]
+
+The rays are lines of sight, one per line of rays.txt, each given as six
+numbers: a point the eye is at, and a direction from it into the model
+(in model coordinates). With no rays file, rays through random atoms
+of the model (plus some random misses) are made up.
+
+Each ray is replayed with the BVH debug_pref off and then on, and the
+atoms found both ways are compared, since they should be the same.
+"""
+
+import sys
+import time
+import random
+
+from geometry.VQT import V, A, norm
+
+import foundation.env as env
+
+from utilities.debug_prefs import debug_pref_object
+from utilities.GlobalPreferences import debug_pref_bvh_picking
+
+_FAR = 1000.0 # Angstroms from the eye to the far end of each ray
+
+class _FakeGLPane(object):
+    """
+    Just enough of a GLPane for findAtomUnderMouse, whose "mouse events"
+    are the (eye, direction) pairs of the rays being replayed.
+    """
+    selatom = None
+    def __init__(self, displayMode):
+        self.displayMode = displayMode
+        self.lastNonReducedDisplayMode = displayMode
+        self.up = V(0, 1, 0)
+    def mousepoints(self, event, just_beyond = 0.0):
+        eye, direction = event
+        # pick an up vector not parallel to the line of sight
+        self.up = V(0, 1, 0)
+        if abs(direction[1]) > 0.9:
+            self.up = V(1, 0, 0)
+        return eye, eye + direction * _FAR
+    def gl_update(self):
+        pass
+    pass
+
+def _read_rays(filename):
+    rays = []
+    for line in open(filename):
+        fields = line.split()
+        if len(fields) != 6:
+            continue
+        nums = map(float, fields)
+        rays.append( (A(nums[:3]), norm(A(nums[3:]))) )
+    return rays
+
+def _random_rays(part, count):
+    atoms = []
+    for mol in part.molecules:
+        atoms.extend(mol.atoms.itervalues())
+    rays = []
+    random.seed(0)
+    for i in range(count):
+        direction = norm(V(random.gauss(0, 1),
+                           random.gauss(0, 1),
+                           random.gauss(0, 1)))
+        if atoms and i % 4:
+            target = atoms[random.randrange(len(atoms))].posn()
+            target = target + V(random.uniform(-1, 1),
+                                random.uniform(-1, 1),
+                                random.uniform(-1, 1))
+        else:
+            target = V(random.uniform(-50, 50),
+                       random.uniform(-50, 50),
+                       random.uniform(-50, 50))
+        rays.append( (target - direction * (_FAR / 2), direction) )
+    return rays
+
+def _replay(part, rays, use_bvh):
+    prefs_key = debug_pref_object("Use BVH to find atom under mouse?").prefs_key
+    old = env.prefs[prefs_key]
+    env.prefs[prefs_key] = use_bvh
+    try:
+        t0 = time.time()
+        under_mouse = [part.findAtomUnderMouse(ray, singlet_ok = True)
+                       for ray in rays]
+        t1 = time.time()
+        picked = [part.findpick(eye, direction) for eye, direction in rays]
+        t2 = time.time()
+    finally:
+        env.prefs[prefs_key] = old
+    return under_mouse, picked, t1 - t0, t2 - t1
+
+def _time_picking(filename, raysfile = None):
+    from model.assembly import Assembly
+    from files.mmp.files_mmp import readmmp
+    from utilities.constants import diDEFAULT
+
+    debug_pref_bvh_picking() # register it, so debug_pref_object works
+    assy = Assembly(None)
+    assy.set_glpane(_FakeGLPane(diDEFAULT))
+    readmmp(assy, filename, isInsert = True)
+    part = assy.part
+    natoms = sum([len(mol.atoms) for mol in part.molecules])
+    if raysfile:
+        rays = _read_rays(raysfile)
+    else:
+        rays = _random_rays(part, 1000)
+    print "%s: %d chunks, %d atoms, %d rays" % \
+          (filename, len(part.molecules), natoms, len(rays))
+    results = {}
+    for use_bvh in (False, True):
+        # the first replay of each kind also times building what it caches
+        for label in ("cold", "warm"):
+            under_mouse, picked, t_under, t_pick = \
+                         _replay(part, rays, use_bvh)
+            print "bvh %-5s %s: findAtomUnderMouse %.3f sec, " \
+                  "findpick %.3f sec" % (use_bvh, label, t_under, t_pick)
+        results[use_bvh] = (under_mouse, picked)
+    mismatches = 0
+    for old, new in zip(results[False][0] + results[False][1],
+                        results[True][0] + results[True][1]):
+        if old is not new:
+            mismatches += 1
+    print "%d of %d results differ" % (mismatches, 2 * len(rays))
+    return
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print "usage: %s file.mmp [rays.txt]" % sys.argv[0]
+        sys.exit(1)
+    _time_picking(*sys.argv[1:])
+
+# end
@@ -14,16 +14,16 @@ Some parts rewritten by Bruce circa 050427.
 """
 
 import os, sys
-from struct import unpack
 from PyQt4.Qt import Qt, qApp, QApplication, QCursor, SIGNAL
 from utilities.Log import redmsg, orangemsg, greenmsg
 from geometry.VQT import A
 from foundation.state_utils import IdentityCopyMixin
-from operations.move_atoms_and_normalize_bondpoints import move_atoms_and_normalize_bondpoints
+from operations.move_atoms_and_normalize_bondpoints import BulkAtomMover
 from utilities import debug_flags
 from platform_dependent.PlatformDependent import fix_plurals
 from utilities.debug import print_compact_stack, print_compact_traceback
 from files.dpb_trajectory.moviefile import MovieFile #e might be renamed, creation API revised, etc
+from files.dpb_trajectory.moviefile import moviefile_natoms_and_nframes
 
 import foundation.env as env
 
@@ -236,6 +236,7 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         # bruce 050324 added these:
         self.alist = None # list of atoms for which this movie was made, if this has yet been defined
         self.alist_and_moviefile = None #bruce 050427: hold checked correspondence between alist and moviefile, if we have one
+        self._alist_and_bulk_atom_mover = (None, None) #bruce 090327, for moveAtoms
         self.debug_dump("end of init")
         return
 
@@ -305,6 +306,7 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         # it should be revised to work either way and _close if necessary.
         # for now, just break cycles.
         self.win = self.assy = self.part = self.alist = self.fileobj = None
+        self._alist_and_bulk_atom_mover = (None, None)
         del self.fileobj # obs attrname
         del self.part
 
@@ -662,10 +664,10 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         # Writes the POV-Ray series starting at the current frame until the last frame,
         # skipping frames if "Skip" (on the dashboard) is != 0.  Mark 050908
         nfiles = 0
-        for i in range(self.currentFrame,
-                       self.totalFramesActual+1,
-                       self.propMgr.frameSkipSpinBox.value()):
-            self.alist_and_moviefile.play_frame(i)
+        for i in self.alist_and_moviefile.play_frames(
+                                    self.currentFrame,
+                                    self.totalFramesActual+1,
+                                    self.propMgr.frameSkipSpinBox.value()):
             filename = "%s.%06d.pov" % (name,i)
             # For 100s of files, printing a history message for each file is undesired.
             # Instead, I include a summary message below. Fixes bug 953.  Mark 051119.
@@ -1110,7 +1112,14 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
             print msg
             raise ValueError, msg
                 #bruce 060108 reviewed/revised all 2 calls, added this exception to preexisting noop/errorprint (untested)
-        move_atoms_and_normalize_bondpoints(self.alist, newPositions) #bruce 051221 fixed bug 1239 in this function, then split it out
+        #bruce 051221 fixed bug 1239 in move_atoms_and_normalize_bondpoints,
+        # then split it out; bruce 090327 replaced that with a BulkAtomMover,
+        # kept for the next call (e.g. the next frame of realtime minimize)
+        alist, mover = self._alist_and_bulk_atom_mover
+        if alist is not self.alist:
+            mover = BulkAtomMover(self.alist)
+            self._alist_and_bulk_atom_mover = (self.alist, mover)
+        mover.move_atoms(newPositions)
         self.glpane.gl_update()
         return
 
@@ -1143,6 +1152,7 @@ class MovableAtomList: #bruce 050426 splitting this out of class Movie... except
         self.alist = list(alist) # use A()?
             # is alist a public attribute? (if so, no need for methods to prune its atoms by part or killedness, etc)
         self.natoms = len(self.alist)
+        self._mover = BulkAtomMover(self.alist) #bruce 090327
 
     def get_sim_posns(self): #bruce 060111 renamed and revised this from get_posns, for use in approximate fix of bug 1297
         # note: this method is no longer called as of bruce 060112, but its comments are relevant and are referred to
@@ -1184,7 +1194,9 @@ class MovableAtomList: #bruce 050426 splitting this out of class Movie... except
         # atoms
         #bruce 060111 comment: should probably be renamed set_sim_posns
         # since it corrects singlet posns
-        move_atoms_and_normalize_bondpoints(self.alist, newposns)
+        #bruce 090327: now this sets each chunk's atom positions at once,
+        # doing invals once per chunk (see BulkAtomMover)
+        self._mover.move_atoms(newposns)
 
     set_posns_no_inval = set_posns #e for now... later this can be faster, and require own/release around it
 
@@ -1207,6 +1219,7 @@ class MovableAtomList: #bruce 050426 splitting this out of class Movie... except
 
     def destroy(self):
         self.alist = None
+        self._mover = None
 
     pass # end of class MovableAtomList
 
@@ -1286,6 +1299,7 @@ class alist_and_moviefile:
         if ref_frame:
             n, frame_n = ref_frame
             self.moviefile.donate_immutable_cached_frame( n, frame_n)
+            self.moviefile.maybe_build_keyframe_index()
 #bruce 060108 commenting out all sets of self.current_frame to avoid confusion, since nothing uses it;
 # but I suggest leaving the commented-out code around until the next major rewrite.
 ##            self.current_frame = n
@@ -1335,6 +1349,21 @@ class alist_and_moviefile:
             ## self.pause() ###k guess -- since we presumably hit the end... maybe return errcode instead, let caller decide??
             return False
         pass
+    def play_frames(self, start, stop, step = 1):
+        """
+        Generate the frame numbers start, start + step, etc (while less than
+        stop, and within the moviefile), setting atoms to positions in each
+        frame before it's generated. This is much faster than calling
+        play_frame for each one.
+        """
+        mf = self.moviefile
+        ma = self.movable_atoms
+        n = start
+        for frame_n in mf.frames(start, stop, step):
+            ma.set_posns(frame_n)
+            yield n
+            n += step
+        return
     def get_totalFramesActual(self):
         return self.moviefile.get_totalFramesActual()
     def close_file(self):
@@ -1400,17 +1429,10 @@ def _checkMovieFile(part, filename): #bruce 050913 removed history arg since all
             env.history.message(msg)
         return 2
 
-    # start of code that should be moved into moviefile.py and merged with similar code there
-    filesize = os.path.getsize(filename) - 4
-
-    fp = open(filename,'rb')
-
-    # Read header (4 bytes) from file containing the number of frames in the movie.
-    nframes = unpack('i',fp.read(4))[0]
-    fp.close()
-
-    natoms = int(filesize/(nframes*3))
-    # end of code that should be moved into moviefile.py
+    natoms_and_nframes = moviefile_natoms_and_nframes(filename)
+    if natoms_and_nframes is None:
+        return 2 # (it printed an error message)
+    natoms, nframes = natoms_and_nframes
 
     kluge_ensure_natoms_correct( part)
 
@@ -1422,7 +1444,7 @@ def _checkMovieFile(part, filename): #bruce 050913 removed history arg since all
         if print_errors:
             msg = redmsg("Movie file [" + filename + "] not valid for the current part.")
             env.history.message(msg)
-            msg = redmsg("Movie is for %d frames, size is %d, natoms %d" % (nframes, filesize, natoms))
+            msg = redmsg("Movie is for %d frames, size is %d, natoms %d" % (nframes, os.path.getsize(filename), natoms))
             env.history.message(msg)
             msg = redmsg("Current part has %d atoms" % (part.natoms))
             env.history.message(msg)
@@ -0,0 +1,151 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+"""
+movie_benchmark.py -- time showing movie frames and reading minimize
+results, with and without debug_pref_move_atoms_by_chunk.
+
+@version: $Id$
+@copyright: 2009 Nanorex, Inc.  See LICENSE file for details.
+
+Usage:
+
+  ./ExecSubDir.py simulation/movie_benchmark.py [natoms]
+
+A made-up model of natoms atoms (default 200000) in chunks of 100, each
+a chain of carbon atoms ending in a bondpoint (in an Assembly with no GUI,
+though Qt is still needed to make chunk icons), is given the positions in
+several made-up movie frames by MovableAtomList.set_posns, as when playing
+a movie; the frames per second are printed. Then the positions in an XYZ
+file are read by readxyz and given to the atoms, as after Minimize.
+
+Both are done for each setting of the pref, and the resulting atom
+positions are compared.
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from PyQt4.Qt import QApplication
+
+import foundation.env as env
+
+from utilities.debug_prefs import debug_pref_object
+from utilities.GlobalPreferences import debug_pref_move_atoms_by_chunk
+from utilities.icon_utilities import initialize_icon_utilities
+
+from geometry.VQT import V, A, vlen
+
+_ATOMS_PER_CHUNK = 100
+
+_NFRAMES = 5
+
+class _FakeGLPane(object):
+    def gl_update(self):
+        pass
+    pass
+
+def _make_model(natoms):
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom
+    from model.bonds import bond_atoms
+    assy = Assembly(None)
+    assy.set_glpane(_FakeGLPane())
+    random.seed(0)
+    alist = []
+    for start in range(0, natoms, _ATOMS_PER_CHUNK):
+        chunk = Chunk(assy, "chunk-%d" % start)
+        x0, y0, z0 = [random.uniform(0, 500) for i in range(3)]
+        prev = None
+        n = min(_ATOMS_PER_CHUNK, natoms - start)
+        for i in range(n):
+            if i == n - 1 and prev is not None:
+                atom = Atom('X', V(x0 + 1.5 * i, y0, z0), chunk)
+            else:
+                atom = Atom('C', V(x0 + 1.5 * i, y0, z0), chunk)
+            if prev is not None:
+                bond_atoms(prev, atom)
+            alist.append(atom)
+            prev = atom
+        assy.part.addmol(chunk)
+    return assy, alist
+
+def _made_up_frames(alist, nframes):
+    posns = A([atom.posn() for atom in alist])
+    frames = []
+    for i in range(nframes):
+        jiggle = A([(random.uniform(-0.1, 0.1),
+                     random.uniform(-0.1, 0.1),
+                     random.uniform(-0.1, 0.1)) for atom in alist])
+        frames.append(posns + jiggle)
+    return frames
+
+def _write_xyz(alist, posns):
+    fd, filename = tempfile.mkstemp(suffix = ".xyz")
+    file = os.fdopen(fd, "w")
+    file.write("%d\nRMS=0.1\n" % len(alist))
+    for atom, (x, y, z) in zip(alist, posns):
+        file.write("%s %f %f %f\n" % (atom.element.symbol, x, y, z))
+    file.close()
+    return filename
+
+def _time_frames(assy, alist, frames):
+    from simulation.movie import MovableAtomList
+    movable_atoms = MovableAtomList(assy, alist)
+    t0 = time.time()
+    for frame in frames:
+        movable_atoms.set_posns(frame)
+        movable_atoms.update_displays()
+    return len(frames) / (time.time() - t0)
+
+def _time_minimize_result(alist, xyzfile):
+    from simulation.runSim import readxyz
+    from operations.move_atoms_and_normalize_bondpoints import \
+         move_atoms_and_normalize_bondpoints
+    t0 = time.time()
+    newPositions = readxyz(xyzfile, alist)
+    t1 = time.time()
+    move_atoms_and_normalize_bondpoints(alist, newPositions)
+    t2 = time.time()
+    return t1 - t0, t2 - t1
+
+def _run(natoms):
+    debug_pref_move_atoms_by_chunk() # register it, so debug_pref_object works
+    prefs_key = debug_pref_object(
+        "Simulation: move atoms one chunk at a time?").prefs_key
+    old = env.prefs[prefs_key]
+
+    assy, alist = _make_model(natoms)
+    print "%d atoms in %d chunks" % (natoms, len(assy.part.molecules))
+    frames = _made_up_frames(alist, _NFRAMES)
+    xyzfile = _write_xyz(alist, _made_up_frames(alist, 1)[0])
+    results = {}
+    try:
+        for by_chunk in (False, True):
+            env.prefs[prefs_key] = by_chunk
+            fps = _time_frames(assy, alist, frames)
+            t_read, t_move = _time_minimize_result(alist, xyzfile)
+            print "  by chunk %-5s: %.2f frames per second; " \
+                  "minimize result read in %.3f sec, applied in %.3f sec" % \
+                  (by_chunk, fps, t_read, t_move)
+            results[by_chunk] = [atom.posn() for atom in alist]
+    finally:
+        env.prefs[prefs_key] = old
+        os.remove(xyzfile)
+    maxdiff = max([vlen(p1 - p2)
+                   for p1, p2 in zip(results[False], results[True])])
+    print "largest difference in final atom positions: %g" % maxdiff
+    return
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv) # needed for chunk icons
+    initialize_icon_utilities()
+    args = sys.argv[2:] # sys.argv[1] is this file, when run by ExecSubDir.py
+    if args:
+        _run(int(args[0]))
+    else:
+        _run(200000)
+
+# end
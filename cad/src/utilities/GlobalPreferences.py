@@ -17,6 +17,7 @@ the kinds of things in it so far -- bruce 080220 comment]
 
 from utilities.prefs_constants import permit_atom_chunk_coselection_prefs_key
 from utilities.debug_prefs import debug_pref, Choice_boolean_False, Choice_boolean_True
+from utilities.debug_prefs import Choice
 from utilities.debug import print_compact_traceback
 
 import sys
@@ -234,6 +235,213 @@ def debug_pref_read_new_display_names(): #bruce 080328
 debug_pref_write_new_display_names()
 debug_pref_read_new_display_names()
 
+def debug_pref_read_mmp_streaming():
+    """
+    If enabled, read mmp files in large blocks rather than all at once,
+    and create each run of atoms (with its bonds) in one batch.
+    """
+    res = debug_pref("mmp format: streaming reader?",
+                     Choice_boolean_True, # use False to compare old reading code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_read_mmp_streaming()
+
+def debug_pref_use_mmp_cache():
+    """
+    If enabled, save a binary cache of each mmp file read by the streaming
+    reader (in ~/Nanorex/MmpCache), and use it instead of parsing the text
+    when the same file is read again.
+    """
+    res = debug_pref("mmp format: use binary cache?",
+                     Choice_boolean_False,
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_use_mmp_cache()
+
+def debug_pref_dna_generator_templates():
+    """
+    If enabled, the DNA duplex generators read each base-pair mmp file
+    only once per session, and make all the base-pairs of a new duplex
+    by copying that template, rather than reading the file once per
+    base-pair.
+    """
+    res = debug_pref("DNA: generate duplexes from cached templates?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_dna_generator_templates()
+
+def debug_pref_indexed_crossover_site_search():
+    """
+    If enabled, the Make Crossovers command finds crossover sites using
+    CrossoverSite_Finder, which indexes the DNA segments spatially and
+    keeps its results for segments which didn't change, rather than
+    comparing the strand atoms of every pair of segments on every update.
+    """
+    res = debug_pref("Make Crossovers: indexed crossover site search?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_indexed_crossover_site_search()
+
+def debug_pref_bvh_picking():
+    """
+    If enabled, finding the atom under the mouse (and findpick) only looks
+    at the chunks, and the atoms in large chunks, which bounding volume
+    hierarchies find near the line of sight, rather than at every atom.
+    """
+    res = debug_pref("Use BVH to find atom under mouse?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_bvh_picking()
+
+def debug_pref_columnar_undo_snapshots():
+    """
+    If enabled, Undo snapshots store some atom attributes (_posn, element,
+    atomtype, molecule) in columns indexed by objkey rather than in dicts,
+    and checkpoints diff and store atom positions with array operations.
+    (Only affects snapshots made after the undo stack is next cleared,
+    e.g. when a file is opened.)
+    """
+    res = debug_pref("Undo: columnar atom snapshots?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_columnar_undo_snapshots()
+
+def debug_pref_undo_skip_unchanged_node_scan():
+    """
+    If enabled, Undo checkpoints after changes which were reported as only
+    affecting atoms (e.g. dragging atoms) don't rescan all the nodes in the
+    model, but get all the changes from the global changedicts.
+    """
+    res = debug_pref("Undo: only scan changed atoms when possible?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_undo_skip_unchanged_node_scan()
+
+def debug_pref_progressive_displist_remakes():
+    """
+    If enabled, when many chunk display lists need remaking at once, only
+    as many are remade in each frame as fit in a time budget
+    (debug_pref_displist_remake_msec_per_frame); the others keep drawing
+    their old contents (when those are still valid to draw) until they're
+    remade in later frames. See RemakeScheduler for details.
+    """
+    res = debug_pref("GLPane: spread display list remakes over frames?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_progressive_displist_remakes()
+
+def debug_pref_displist_remake_msec_per_frame():
+    """
+    The time budget per frame for remaking chunk display lists,
+    when debug_pref_progressive_displist_remakes is enabled.
+    """
+    res = debug_pref("GLPane: msec per frame for display list remakes",
+                     Choice([50, 100, 200, 500], defaultValue = 100),
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_displist_remake_msec_per_frame()
+
+def debug_pref_displist_remake_threads():
+    """
+    The number of worker threads which compute data for whole-chunk
+    display styles which permit that (see ChunkDisplayMode.memo_inputs),
+    when debug_pref_progressive_displist_remakes is enabled.
+    0 means compute it during the remake, as before.
+    """
+    res = debug_pref("GLPane: threads for display style data",
+                     Choice([0, 1, 2, 4], defaultValue = 2),
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_displist_remake_threads()
+
+def debug_pref_lazy_chunk_atom_posns():
+    """
+    If enabled, moving, rotating or otherwise setting all the atom positions
+    of a chunk at once only stores the new positions as an array in the
+    chunk; each atom's own position is stored from that array when next
+    needed (see Chunk._f_sync_atom_posns), rather than one atom at a time
+    during the move.
+    """
+    res = debug_pref("Chunk: store moved atom positions lazily?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_lazy_chunk_atom_posns()
+
+def debug_pref_move_atoms_by_chunk():
+    """
+    If enabled, new atom positions from the simulator (movie frames,
+    minimize results) are given to each chunk all at once (see
+    BulkAtomMover), rather than to one atom at a time.
+    """
+    res = debug_pref("Simulation: move atoms one chunk at a time?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_move_atoms_by_chunk()
+
+def debug_pref_indexed_fuse_search():
+    """
+    If enabled, Fuse Chunks (and the DNA generators) find bondable pairs
+    of bondpoints, and overlapping atoms, using FuseCandidate_Finder, which
+    indexes the chunks being searched spatially and keeps that index while
+    they don't change, rather than comparing every atom pair of every
+    pair of chunks.
+    """
+    res = debug_pref("Fuse Chunks: indexed fuse candidate search?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_indexed_fuse_search()
+
+def debug_pref_vectorized_surface():
+    """
+    If enabled, the SurfaceChunks display style (when psurface is not
+    available) computes surfaces using surface_mesh.py, which uses
+    whole-array operations, only looks at the atoms near each mesh vertex,
+    and reuses the old surface of a chunk whose atoms didn't all change,
+    rather than looping over every atom for every mesh vertex.
+    """
+    res = debug_pref("SurfaceChunks: vectorized surface?",
+                     Choice_boolean_True, # use False to compare old code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_vectorized_surface()
+
 # ==
 
 def use_frustum_culling(): #piotr 080401
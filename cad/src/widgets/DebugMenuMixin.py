@@ -491,6 +491,7 @@ sim_params_set = False
 
 _sim_param_table = [
     ("debug_flags", INT),
+    ("ThreadCount", INT),
     # ("IterPerFrame", INT),
     # ("NumFrames", INT),
     # ("DumpAsText", BOOLEAN),
@@ -508,6 +509,7 @@ _sim_param_table = [
 
 sim_param_values = {
     "debug_flags": 0,
+    "ThreadCount": 1,
     # "IterPerFrame": 10,
     # "NumFrames": 100,
     # "DumpAsText": False,
@@ -0,0 +1,47 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+from geometry.BVH import BVH
+from Numeric import array, Float
+
+
+def lineDistance2(point, direction, p):
+    """Return the squared distance of p from the line through point."""
+    d = p - point
+    t = sum(d * direction) / sum(direction * direction)
+    e = d - t * direction
+    return sum(e * e)
+
+
+class BVHTestCase(unittest.TestCase):
+    """Unit tests for the linear bounding volume hierarchy in BVH.py"""
+
+    def setUp(self):
+        random.seed(0)
+        self.points = array([(random.uniform(-20, 20),
+                              random.uniform(-20, 20),
+                              random.uniform(-20, 20))
+                             for i in range(1000)], Float)
+        self.bvh = BVH(self.points, self.points, 8)
+
+    def testLineQuery(self):
+        for trial in range(20):
+            point = array([random.uniform(-20, 20) for i in range(3)])
+            direction = array([random.gauss(0, 1) for i in range(3)])
+            if trial == 0:
+                direction = array([0.0, 0.0, 1.0]) # axis-aligned
+            got = dict([(k, 1) for k in
+                        self.bvh.line_query(point, direction, 1.5).tolist()])
+            for k in range(len(self.points)):
+                if lineDistance2(point, direction, self.points[k]) < 1.5 ** 2:
+                    assert got.has_key(k), "missed item %d" % k
+
+    def testEmpty(self):
+        bvh = BVH([], [])
+        assert len(bvh) == 0
+        assert len(bvh.line_query((0, 0, 0), (1, 0, 0), 1.0)) == 0
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,83 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+from geometry.CellList import CellList
+from Numeric import array, Float
+
+
+def bruteForcePairs(points, cutoff):
+    """Return the set of (i, j), i < j, of points closer than cutoff."""
+    pairs = { }
+    for i in range(len(points)):
+        for j in range(i + 1, len(points)):
+            d = points[i] - points[j]
+            if d[0] * d[0] + d[1] * d[1] + d[2] * d[2] < cutoff * cutoff:
+                pairs[(i, j)] = 1
+    return pairs
+
+
+class CellListTestCase(unittest.TestCase):
+    """Unit tests for the array-backed cell list in CellList.py"""
+
+    def setUp(self):
+        random.seed(0)
+        self.points = array([(random.uniform(-8, 8),
+                              random.uniform(-8, 8),
+                              random.uniform(-8, 8))
+                             for i in range(500)], Float)
+        self.cells = CellList(self.points, 2.0)
+
+    def testPairsWithin(self):
+        i, j, dist2 = self.cells.pairs_within()
+        got = dict([(pair, 1) for pair in zip(i.tolist(), j.tolist())])
+        assert len(got) == len(i), "duplicate pairs"
+        assert got == bruteForcePairs(self.points, 2.0)
+
+    def testRegion(self):
+        center = self.points[7]
+        got = self.cells.region(center, 1.5)
+        got.sort()
+        expected = [k for k in range(len(self.points))
+                    if sum((self.points[k] - center) ** 2) < 1.5 ** 2]
+        assert got == expected
+
+    def testMoveAndDiscard(self):
+        points = self.points.copy()
+        for k in range(0, len(points), 3):
+            points[k] = points[k] + 3.0
+            self.cells.move(k, points[k])
+        self.cells.discard(4)
+        i, j, dist2 = self.cells.pairs_within()
+        got = dict([(pair, 1) for pair in zip(i.tolist(), j.tolist())])
+        expected = bruteForcePairs(points, 2.0)
+        for pair in expected.keys():
+            if 4 in pair:
+                del expected[pair]
+        assert got == expected
+        assert len(self.cells) == len(points) - 1
+
+    def testNearPairs(self):
+        queries = [(random.uniform(-12, 12),
+                    random.uniform(-12, 12),
+                    random.uniform(-12, 12))
+                   for i in range(200)] + [(100.0, -100.0, 3.0)]
+        for cutoff in (2.0, 0.7):
+            q, i, dist2 = self.cells.near_pairs(queries, cutoff)
+            got = dict([(pair, 1) for pair in zip(q.tolist(), i.tolist())])
+            assert len(got) == len(q), "duplicate pairs"
+            expected = { }
+            for k in range(len(queries)):
+                for m in range(len(self.points)):
+                    d = self.points[m] - queries[k]
+                    if d[0] * d[0] + d[1] * d[1] + d[2] * d[2] <= cutoff ** 2:
+                        expected[(k, m)] = 1
+            assert got == expected
+        # the sorted points are redone after a move
+        self.cells.move(3, queries[0])
+        q, i, dist2 = self.cells.near_pairs(queries[:1], 0.1)
+        assert 3 in i.tolist()
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
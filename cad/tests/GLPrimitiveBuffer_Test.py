@@ -0,0 +1,107 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+import numpy
+from graphics.drawing.GLPrimitiveBuffer import HUNK_SIZE
+from graphics.drawing.GLSphereBuffer import GLSphereBuffer
+from graphics.drawing.GLCylinderBuffer import GLCylinderBuffer
+
+
+class _FakeShader:
+    """Just enough of a GLShaderObject to fill in primitive buffers."""
+    def supports_transforms(self):
+        return True
+    def attributeLocation(self, name):
+        raise AssertionError("needs a GL context")
+
+
+class _FakeShaderGlobals:
+    """Just enough of a ShaderGlobals to make primitive buffers."""
+    shader = _FakeShader()
+    billboardVerts = [[-1.0, -1.0, 0.0], [1.0, -1.0, 0.0],
+                      [1.0, 1.0, 0.0], [-1.0, 1.0, 0.0]]
+    billboardIndices = [[0, 1, 2, 3]]
+    shaderCubeVerts = billboardVerts
+    shaderCubeIndices = billboardIndices
+
+
+class GLPrimitiveBufferTestCase(unittest.TestCase):
+    """Unit tests for filling in GLPrimitiveBuffers without a GL context"""
+
+    def setUp(self):
+        random.seed(0)
+        n = HUNK_SIZE + 100 # so the batch spans two hunks
+        self.centers = [(random.uniform(-20, 20),
+                         random.uniform(-20, 20),
+                         random.uniform(-20, 20)) for i in range(n)]
+        self.radii = [random.uniform(0.5, 2) for i in range(n)]
+        self.colors = [(random.random(), random.random(), random.random())
+                       for i in range(n)]
+        self.glnames = [random.randrange(1, 1 << 24) for i in range(n)]
+
+    def _buffer_data(self, buffer):
+        return [hunkBuffer.data[:hunkBuffer.nData]
+                for hunkBuffer in buffer.hunkBuffers]
+
+    def testBatchMatchesOneAtATime(self):
+        one = GLSphereBuffer(_FakeShaderGlobals())
+        for args in zip(self.centers, self.radii, self.colors, self.glnames):
+            center, radius, color, glname = args
+            one.addSpheres([center], radius, color, 3, glname)
+        batch = GLSphereBuffer(_FakeShaderGlobals())
+        ids = batch.addSpheres(numpy.array(self.centers), self.radii,
+                               numpy.array(self.colors), 3, self.glnames)
+        self.assertEqual(ids, range(len(self.centers)))
+        self.assertEqual(batch.nHunks, 2)
+        for data1, data2 in zip(self._buffer_data(one),
+                                self._buffer_data(batch)):
+            self.assert_(numpy.all(data1 == data2))
+
+    def testSphereData(self):
+        buffer = GLSphereBuffer(_FakeShaderGlobals())
+        ids = buffer.addSpheres(self.centers, self.radii, self.colors,
+                                None, self.glnames)
+        for i in (0, 17, len(ids) - 1):
+            center, radius = buffer.grab_untransformed_data(ids[i])
+            for x, y in zip(center, self.centers[i]):
+                self.assertAlmostEqual(x, y, 4)
+            self.assertAlmostEqual(radius, self.radii[i], 5)
+            color = buffer.colorHunks.getData(ids[i])
+            self.assertAlmostEqual(color[3], 1.0)
+            rgba = buffer.glname_color_Hunks.getData(ids[i])
+            glname = 0
+            for component in rgba[:3]:
+                glname = (glname << 8) + int(round(component * 255))
+            self.assertEqual(glname, self.glnames[i])
+            self.assertEqual(rgba[3], 0.0)
+            self.assertEqual(buffer.transform_id_Hunks.getData(ids[i]), [-1])
+
+    def testReuseFreedPrimitives(self):
+        buffer = GLSphereBuffer(_FakeShaderGlobals())
+        ids = buffer.addSpheres(self.centers[:10], 1.0, (1, 0, 0), None, 1)
+        buffer.releasePrimitives(ids[2:5])
+        newIDs = buffer.addSpheres(self.centers[:5], 2.0, (0, 1, 0), None, 2)
+        self.assertEqual(sorted(newIDs), [2, 3, 4, 10, 11])
+        self.assertEqual(buffer.nPrims, 12)
+        for primID in newIDs:
+            self.assertEqual(buffer.ctrRadHunks.getData(primID)[3], 2.0)
+        self.assertEqual(buffer.ctrRadHunks.getData(0)[3], 1.0)
+
+    def testTaperedCylinders(self):
+        buffer = GLCylinderBuffer(_FakeShaderGlobals())
+        endpts = zip(self.centers[:-1], self.centers[1:])
+        radii = [(r, r / 2) for r in self.radii[:-1]]
+        ids = buffer.addCylinders(endpts, radii, self.colors[:-1], None,
+                                  self.glnames[:-1])
+        i = 42
+        point0, radius0, point1, radius1 = \
+                buffer.grab_untransformed_data(ids[i])
+        for x, y in zip(point1, self.centers[i + 1]):
+            self.assertAlmostEqual(x, y, 4)
+        self.assertAlmostEqual(radius0, self.radii[i], 5)
+        self.assertAlmostEqual(radius1, self.radii[i] / 2, 5)
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,143 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+from StringIO import StringIO
+from Numeric import array, Float
+from files.pdb.files_pdb import writepdb_atom, PdbRecordWriter
+import files.pdb.files_pdb as files_pdb
+from model.chem import Atom
+
+
+class FakeElement:
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+
+class FakeAtom:
+    """Just enough of an Atom for writing its PDB ATOM record."""
+
+    def __init__(self, symbol, posn):
+        self.element = FakeElement(symbol)
+        self._posn = array(posn, Float)
+
+    def posn(self):
+        return + self._posn
+
+
+ATOMS = [FakeAtom("C", (1.0, 2.0, 3.0)),
+         FakeAtom("N", (-999.9996, 0.0005, 12345.678)),
+         FakeAtom("Ax3", (-0.0004, 1.2345, -1.2355)),
+         FakeAtom("Ss5", (9999.999, -999.999, 0.1))]
+
+# (atomName, chainId, resId, resName, hetatm, occup, temp)
+ATOM_FIELDS = [("C", "A", "   1 ", "   ", True, 1.0, 0.0),
+               ("CA", "b", "12 ", "ALA", False, 0.5, 12.25),
+               ("HD21", "Z", "9999A", "ASN", False, 1.0, 99.99),
+               ("OXTXX", "1", "1", "GLY", True, 0.0, -1.0)]
+
+# The records for each atom with each of ATOM_FIELDS, as written by
+# writepdb_atom before it used PdbRecordWriter (numbers too wide for their
+# columns overflow them).
+ATOM_RECORDS = [
+    'HETATM    1  C       A   1       1.000   2.000   3.000  1.00  0.00           C  \n',
+    'ATOM      2  CA  ALA B  12       1.000   2.000   3.000  0.50 12.25           C  \n',
+    'ATOM      3 HD21 ASN Z9999A      1.000   2.000   3.000  1.00 99.99           C  \n',
+    'HETATM    4  OXT GLY 1    1      1.000   2.000   3.000  0.00 -1.00           C  \n',
+    'HETATM    5  C       A   1    -1000.000   0.00112345.678  1.00  0.00           N  \n',
+    'ATOM      6  CA  ALA B  12    -1000.000   0.00112345.678  0.50 12.25           N  \n',
+    'ATOM      7 HD21 ASN Z9999A   -1000.000   0.00112345.678  1.00 99.99           N  \n',
+    'HETATM    8  OXT GLY 1    1   -1000.000   0.00112345.678  0.00 -1.00           N  \n',
+    'HETATM    9  C       A   1      -0.000   1.234  -1.236  1.00  0.00          Ax  \n',
+    'ATOM     10  CA  ALA B  12      -0.000   1.234  -1.236  0.50 12.25          Ax  \n',
+    'ATOM     11 HD21 ASN Z9999A     -0.000   1.234  -1.236  1.00 99.99          Ax  \n',
+    'HETATM   12  OXT GLY 1    1     -0.000   1.234  -1.236  0.00 -1.00          Ax  \n',
+    'HETATM   13  C       A   1    9999.999-999.999   0.100  1.00  0.00          Ss  \n',
+    'ATOM     14  CA  ALA B  12    9999.999-999.999   0.100  0.50 12.25          Ss  \n',
+    'ATOM     15 HD21 ASN Z9999A   9999.999-999.999   0.100  1.00 99.99          Ss  \n',
+    'HETATM   16  OXT GLY 1    1   9999.999-999.999   0.100  0.00 -1.00          Ss  \n']
+
+# The records for each atom with chainIds "A" and "a", starting with serial
+# number 99998, as written by Atom.writepdb before it used PdbRecordWriter.
+PLAIN_ATOM_RECORDS = [
+    'ATOM  99998  C       A   1       1.000   2.000   3.000                       C  \n',
+    'ATOM  99999  C       A   1       1.000   2.000   3.000                       C  \n',
+    'ATOM  100000  N       A   1    -1000.000   0.00112345.678                       N  \n',
+    'ATOM  100001  N       A   1    -1000.000   0.00112345.678                       N  \n',
+    'ATOM  100002  Ax3     A   1      -0.000   1.234  -1.236                      AX  \n',
+    'ATOM  100003  Ax3     A   1      -0.000   1.234  -1.236                      AX  \n',
+    'ATOM  100004  Ss5     A   1    9999.999-999.999   0.100                      SS  \n',
+    'ATOM  100005  Ss5     A   1    9999.999-999.999   0.100                      SS  \n']
+
+
+class PdbRecordWriterTestCase(unittest.TestCase):
+    """Unit tests for PdbRecordWriter in files_pdb.py, which writes the
+    records of writepdb_atom, Atom.writepdb and writepdb's CONECT records"""
+
+    def testAtomRecords(self):
+        new = StringIO()
+        writer = PdbRecordWriter(new)
+        serial = 1
+        for atom in ATOMS:
+            for fields in ATOM_FIELDS:
+                writer.add_atom(atom, serial, *fields)
+                serial += 1
+        writer.flush()
+        assert new.getvalue() == "".join(ATOM_RECORDS)
+
+    def testWritepdbAtom(self):
+        serial = 1
+        for atom in ATOMS:
+            for fields in ATOM_FIELDS:
+                file = StringIO()
+                writepdb_atom(atom, file, serial, *fields)
+                assert file.getvalue() == ATOM_RECORDS[serial - 1]
+                serial += 1
+
+    def testPlainAtomRecords(self):
+        new = StringIO()
+        writer = PdbRecordWriter(new)
+        serial = 99998
+        for atom in ATOMS:
+            for chainId in "Aa":
+                writer.add_plain_atom(atom, serial, chainId,
+                                      atom.posn().tolist())
+                serial += 1
+        writer.flush()
+        assert new.getvalue() == "".join(PLAIN_ATOM_RECORDS)
+
+    def testAtomWritepdb(self):
+        file = StringIO()
+        serial = 99998
+        for atom in ATOMS:
+            for chainId in "Aa":
+                Atom.writepdb.im_func(atom, file, serial, chainId)
+                serial += 1
+        assert file.getvalue() == "".join(PLAIN_ATOM_RECORDS)
+
+    def testConectAndBlocks(self):
+        old = StringIO()
+        new = StringIO()
+        old_size = files_pdb._RECORD_BLOCK_SIZE
+        files_pdb._RECORD_BLOCK_SIZE = 3
+        try:
+            writer = PdbRecordWriter(new)
+            for i in range(10):
+                serials = range(i + 1, 2 * i + 3)
+                old.write("CONECT")
+                for serial in serials:
+                    old.write("%5d" % serial)
+                old.write("\n")
+                writer.add_conect(serials)
+                old.write("TER   %5d          %1s\n" % (i, "A"))
+                writer.add_record("TER   %5d          %1s\n" % (i, "A"))
+            # everything but the last partial block was already written
+            assert new.getvalue() == old.getvalue()[:len(new.getvalue())]
+            assert new.getvalue().count("\n") == 18
+            writer.flush()
+        finally:
+            files_pdb._RECORD_BLOCK_SIZE = old_size
+        assert new.getvalue() == old.getvalue()
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
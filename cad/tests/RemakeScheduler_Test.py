@@ -0,0 +1,75 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import foundation.env as env
+from utilities.debug_prefs import debug_pref_object
+from utilities.GlobalPreferences import debug_pref_progressive_displist_remakes
+from graphics.model_drawing.RemakeScheduler import WorkerPool, RemakeScheduler
+from graphics.model_drawing.RemakeScheduler import _FAILED
+
+
+def _square(x):
+    return x * x
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+    """Unit tests for WorkerPool"""
+
+    def testThreads(self):
+        pool = WorkerPool(2)
+        for i in range(20):
+            pool.submit(i, "token", _square, i)
+        pool.wait()
+        results = pool.collect()
+        pool.shutdown()
+        self.assertEqual(sorted(results),
+                         [(i, "token", i * i) for i in range(20)])
+        self.assertEqual(pool.npending(), 0)
+
+    def testSupersededJob(self):
+        pool = WorkerPool(0)
+        pool.submit("key", 1, _square, 2)
+        pool.submit("key", 2, _square, 3)
+        self.assert_(pool.is_pending("key", 2))
+        self.assertFalse(pool.is_pending("key", 1))
+        self.assertEqual(pool.collect(), [("key", 2, 9)])
+        self.assertEqual(pool.collect(), [])
+
+    def testFailedJob(self):
+        pool = WorkerPool(0)
+        pool.submit("key", 1, _square, None)
+        self.assertEqual(pool.collect(), [("key", 1, _FAILED)])
+
+
+class RemakeSchedulerTestCase(unittest.TestCase):
+    """Unit tests for RemakeScheduler"""
+
+    def setUp(self):
+        debug_pref_progressive_displist_remakes() # register it
+        self.prefs_key = debug_pref_object(
+            "GLPane: spread display list remakes over frames?").prefs_key
+        self.old = env.prefs[self.prefs_key]
+
+    def tearDown(self):
+        env.prefs[self.prefs_key] = self.old
+
+    def _deferrals(self, progressive, permit_deferral = True):
+        env.prefs[self.prefs_key] = progressive
+        scheduler = RemakeScheduler()
+        scheduler.begin_frame(permit_deferral = permit_deferral)
+        scheduler._deadline = 0 # as if the time budget was used up
+        res = [scheduler.defer_remake(None, None) for i in range(3)]
+        return res, scheduler.end_frame()
+
+    def testProgressive(self):
+        # one remake is always permitted, so there's progress
+        self.assertEqual(self._deferrals(True), ([False, True, True], True))
+
+    def testNotProgressive(self):
+        self.assertEqual(self._deferrals(False), ([False, False, False], False))
+        self.assertEqual(self._deferrals(True, permit_deferral = False),
+                         ([False, False, False], False))
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,68 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import os
+import tempfile
+from Numeric import zeros, Int
+from files.dpb_trajectory.moviefile import MovieFile
+from files.dpb_trajectory.moviefile import _write_new_format_moviefile
+
+NATOMS = 2
+
+
+def writeMovie(nframes, key_interval):
+    """Write a new-format movie in which every coordinate of frame n
+    is 0.01 * n, as the simulator would with -N -K<key_interval>."""
+    filename = tempfile.mktemp(".dpb")
+    _write_new_format_moviefile(filename, zeros((NATOMS * 3,), Int),
+                                ["\x01" * (NATOMS * 3)] * nframes,
+                                key_interval)
+    return filename
+
+
+class NewFormatMovieFileTestCase(unittest.TestCase):
+    """Unit tests for reading the key and delta records of new-format
+    movie files, as written by writeNewFrame and writeNewOutputTrailer
+    in sim/src/writemovie.c"""
+
+    def checkMovie(self, nframes, key_interval, key_frames):
+        filename = writeMovie(nframes, key_interval)
+        try:
+            movie = MovieFile(filename)
+            assert movie.get_totalFramesActual() == nframes
+            assert movie.filereader.key_frame_indices == key_frames
+            for n in range(nframes + 1):
+                if movie.filereader.has_deltas:
+                    shown = n
+                else:
+                    # frames without records show the last key frame
+                    # before them
+                    shown = max([k for k in key_frames if k <= n])
+                frame = movie.ref_to_transient_frame_n(n)
+                assert frame.shape == (NATOMS, 3)
+                for x in frame.flat:
+                    assert abs(x - 0.01 * shown) < 1e-9
+            played = list(movie.frames())
+            assert len(played) == nframes + 1
+            for n in range(nframes + 1):
+                diff = played[n] - movie.copy_of_frame(n)
+                assert max(abs(diff).flat) < 1e-9
+            movie.destroy()
+        finally:
+            os.remove(filename)
+
+    def testDeltaRecords(self):
+        # a key record after every KeyRecordInterval + 2 delta records
+        self.checkMovie(10, 3, [0, 5, 10])
+        self.checkMovie(12, 3, [0, 5, 10, 12])
+
+    def testKeyRecordsOnly(self):
+        # no delta records when KeyRecordInterval <= 1; a key record every
+        # KeyRecordInterval + 2 frames, and one more for the last frame
+        self.checkMovie(10, 1, [0, 3, 6, 9, 10])
+        self.checkMovie(12, 1, [0, 3, 6, 9, 12])
+        self.checkMovie(4, -1, [0, 1, 2, 3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,94 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import os
+import tempfile
+import files.pdb.pdb_cards as pdb_cards
+from files.pdb.pdb_cards import read_pdb_cards
+
+
+CARDS = [
+    "HEADER    TEST\n",
+    "ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00  0.00           N\n",
+    "ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00  0.00           C\n",
+    "HETATM    3 ZZ   UNK B  12    -999.000-100.000   0.500  1.00  0.00\n",
+    "TER       4      UNK B  12\n",
+    "ATOM      4  O   HOH C   5       1.000   2.000   3.000  1.00  0.00           O\n",
+    "CONECT    1    2\n",
+    "MASTER        0    0    0    0    0    0    0    0    4    0    1    0\n",
+    ]
+
+
+def guessElement(key, name_field, symbol_field):
+    """Guess by the first letter of the atom name; only 'ZZ' is unknown."""
+    name = name_field.strip()
+    if name == "ZZ":
+        return "C", False
+    return name[0], True
+
+
+class PdbCardsTestCase(unittest.TestCase):
+    """Unit tests for the batched PDB card reader in pdb_cards.py"""
+
+    def setUp(self):
+        self.writeFile(CARDS)
+
+    def writeFile(self, cards):
+        self.filename = tempfile.mktemp(".pdb")
+        f = open(self.filename, "w")
+        f.writelines(cards)
+        f.close()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def read(self, progress_callback = None):
+        return list(read_pdb_cards(self.filename, guessElement,
+                                   progress_callback))
+
+    def testOrder(self):
+        items = self.read()
+        keys = [key for key, data in items]
+        assert keys == ["header", "atoms", "ter", "atoms", "conect", "master"]
+        assert items[2][1] == CARDS[4]
+
+    def testFields(self):
+        cards = self.read()[1][1]
+        assert len(cards) == 3
+        assert cards.keys == ["atom", "atom", "hetatm"]
+        assert cards.serials == [1, 2, 3]
+        assert cards.positions.tolist()[1] == [11.639, 6.071, -5.147]
+        # adjacent coordinate fields with no space between them
+        assert cards.positions.tolist()[2] == [-999.0, -100.0, 0.5]
+        assert cards.names == ["N", "CA", "ZZ"]
+        assert cards.residue_names == ["ALA", "ALA", "UNK"]
+        assert cards.chain_ids == ["A", "A", "B"]
+        assert cards.residue_ids == ["1 ", "1 ", "12 "]
+        assert cards.alt_locs == [" ", " ", " "]
+        assert cards.elements == ["N", "C", "C"]
+        assert cards.known == [True, True, False]
+
+    def testBatches(self):
+        # runs of atom cards are split between batches, but nothing is lost
+        os.remove(self.filename)
+        self.writeFile(CARDS[:2] * 1000)
+        old_size = pdb_cards._BATCH_SIZE
+        pdb_cards._BATCH_SIZE = 1
+        try:
+            positions = []
+            calls = []
+            def progress_callback(position, size):
+                calls.append((position, size))
+            for key, data in self.read(progress_callback):
+                if key == "atoms":
+                    positions.extend(data.positions.tolist())
+        finally:
+            pdb_cards._BATCH_SIZE = old_size
+        assert len(positions) == 1000
+        assert len(calls) > 1
+        size = os.path.getsize(self.filename)
+        assert calls[-1] == (size, size)
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,137 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+from Numeric import array, Float
+from graphics.display_styles.spline_tube import compute_spline
+from graphics.display_styles.spline_tube import make_tube, make_tubes
+from graphics.display_styles.spline_tube import make_curved_strand
+from graphics.display_styles.spline_tube import SplineTubeCache
+
+
+def makeTubeOnePointAtATime(points, colors, radii, dpos, resolution):
+    """make_tube as it was written before spline_tube.py"""
+    n = len(points)
+    if n <= 3:
+        return (points, colors, radii, dpos)
+    new = ([], [], [], [])
+    ir = 1.0/float(resolution)
+    for p in range(1, n-2):
+        start_spline = 0
+        end_spline = int(resolution)
+        if p == 1:
+            start_spline = int(resolution / 2 - 1)
+        if p == n-3:
+            end_spline = int(resolution / 2 + 1)
+        for m in range(start_spline, end_spline):
+            for data, new_data in zip((points, colors, radii, dpos), new):
+                new_data.append(compute_spline(data, p, ir * m))
+    for data, new_data in zip((points, colors, radii, dpos), new):
+        new_data.append(compute_spline(data, p, ir * (m + 1)))
+    return new
+
+
+def makeCurvedStrandOnePointAtATime(points, colors, radii):
+    """DnaCylinderChunks._make_curved_strand as it was written before
+    spline_tube.py"""
+    n = len(points)
+    if n <= 3:
+        return (points, colors, radii)
+    new = ([None], [None], [None])
+    for p in range(1, n-2):
+        for m in range(0, 4):
+            for data, new_data in zip((points, colors, radii), new):
+                new_data.append(compute_spline(data, p, 0.25 * m))
+    for data, new_data in zip((points, colors, radii), new):
+        new_data.append(compute_spline(data, p, 1.0))
+    new_points, new_colors, new_radii = new
+    new_points[0] = 3.0 * new_points[1] - 3.0 * new_points[2] + new_points[3]
+    new_points.append(3.0 * new_points[-1] - 3.0 * new_points[-2]
+                      + new_points[-3])
+    new_colors[0] = new_colors[1]
+    new_colors.append(new_colors[-1])
+    new_radii[0] = new_radii[1]
+    new_radii.append(new_radii[-1])
+    return new
+
+
+def randomTube(n):
+    def point():
+        return array([random.uniform(-10, 10) for i in range(3)], Float)
+    return ([point() for i in range(n)],
+            [point() for i in range(n)],
+            [random.uniform(0, 2) for i in range(n)],
+            [point() for i in range(n)])
+
+
+def sameData(data1, data2):
+    """Are these lists of points (or numbers) exactly equal?"""
+    return array(data1, Float).tolist() == array(data2, Float).tolist()
+
+
+class SplineTubeTestCase(unittest.TestCase):
+    """Unit tests for spline_tube.py, which must make the same tubes as
+    the code it replaced"""
+
+    def setUp(self):
+        random.seed(0)
+
+    def testMakeTube(self):
+        for resolution in (2, 3, 4, 7, 20):
+            for n in (0, 3, 4, 5, 6, 17):
+                tube = randomTube(n)
+                new = make_tube(*(tube + (resolution,)))
+                old = makeTubeOnePointAtATime(*(tube + (resolution,)))
+                for new_data, old_data in zip(new, old):
+                    assert sameData(new_data, old_data)
+
+    def testMakeTubes(self):
+        tubes = [randomTube(n) for n in (5, 2, 4, 30, 0, 9)]
+        new = make_tubes(tubes, 6)
+        assert len(new) == len(tubes)
+        for tube, new_tube in zip(tubes, new):
+            old_tube = makeTubeOnePointAtATime(*(tube + (6,)))
+            for new_data, old_data in zip(new_tube, old_tube):
+                assert sameData(new_data, old_data)
+
+    def testColorShapes(self):
+        # ProteinChunks' colors are V(color) for a color tuple, i.e. 1 by 3
+        points, colors, radii, dpos = randomTube(7)
+        colors = [array([tuple(color)], Float) for color in colors]
+        new = make_tube(points, colors, radii, dpos, 4)
+        old = makeTubeOnePointAtATime(points, colors, radii, dpos, 4)
+        assert new[1][0].shape == (1, 3)
+        assert sameData(new[1], old[1])
+
+    def testMakeCurvedStrand(self):
+        for n in (2, 4, 5, 12):
+            points, colors, radii, dpos = randomTube(n)
+            new = make_curved_strand(points, colors, radii)
+            old = makeCurvedStrandOnePointAtATime(points, colors, radii)
+            for new_data, old_data in zip(new, old):
+                assert len(new_data) == len(old_data)
+                assert sameData(new_data, old_data)
+
+    def testCache(self):
+        tubes = [randomTube(n) for n in (6, 3, 8)]
+        cache = SplineTubeCache()
+        first = cache.make_tubes(tubes, 4)
+        # the same tubes again (in the next memo) are reused
+        cache = SplineTubeCache(cache)
+        again = cache.make_tubes(tubes, 4)
+        assert again[0][0][0] is first[0][0][0]
+        # but not after any point moves
+        tubes[2][0][5] = tubes[2][0][5] + 0.001
+        moved = cache.make_tubes(tubes, 4)
+        assert moved[0][0][0] is not first[0][0][0]
+        assert sameData(moved[2][0], make_tubes(tubes, 4)[2][0])
+        # short tubes are always returned as given
+        assert moved[1] is tubes[1]
+        # tubes not used by the last few memos are dropped
+        for i in range(10):
+            cache = SplineTubeCache(cache)
+        assert cache.make_tubes(tubes, 4)[0][0][0] is not moved[0][0][0]
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,221 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+from Numeric import array, Float
+from foundation.state_constants import _UNSET_
+from foundation.state_utils import AtomColumn, PosnColumn, PosnDiff
+from foundation.state_utils import StateSnapshot, DiffObj
+from foundation.state_utils import apply_and_reverse_diff
+from utilities.Comparison import same_vals
+
+POSN = ('_posn', 'Atom') # an attrcode
+
+MAXKEY = 40
+
+
+def randomPosn():
+    return array((random.uniform(-10, 10), random.uniform(-10, 10),
+                  random.uniform(-10, 10)), Float)
+
+
+def randomValue(posns):
+    if posns and random.random() < 0.9:
+        return randomPosn()
+    return random.choice(["C", "N", None, 3])
+
+
+def sameItems(items1, items2):
+    """are the lists of (key, value) pairs the same, ignoring order?"""
+    items1 = list(items1)
+    items2 = list(items2)
+    items1.sort()
+    items2.sort()
+    if len(items1) != len(items2):
+        return False
+    for (key1, val1), (key2, val2) in zip(items1, items2):
+        if key1 != key2 or not same_vals(val1, val2):
+            return False
+    return True
+
+
+def checkLikeDict(attrdict, d):
+    """assert that attrdict has the same contents as the dict d, as seen
+    through each of the dict methods StateSnapshot and DiffObj callers
+    use"""
+    assert len(attrdict) == len(d)
+    assert sameItems(attrdict.items(), d.items())
+    assert sameItems(attrdict.iteritems(), d.items())
+    keys = d.keys()
+    keys.sort()
+    for keys1 in (attrdict.keys(), list(attrdict.iterkeys()), list(attrdict)):
+        keys1.sort()
+        assert keys1 == keys
+    assert sameItems(zip(attrdict.keys(), attrdict.values()), d.items())
+    assert sameItems(zip(attrdict.iterkeys(), attrdict.itervalues()),
+                     d.items())
+    for key in range(MAXKEY + 5):
+        assert attrdict.has_key(key) == d.has_key(key)
+        assert (key in attrdict) == (key in d)
+        assert same_vals(attrdict.get(key), d.get(key))
+        assert same_vals(attrdict.get(key, _UNSET_), d.get(key, _UNSET_))
+        if d.has_key(key):
+            assert same_vals(attrdict[key], d[key])
+        else:
+            try:
+                attrdict[key]
+            except KeyError:
+                pass
+            else:
+                assert 0, "no KeyError for %r" % key
+    return
+
+
+def randomEdits(attrdict, d, posns, nedits):
+    """make the same random edits to attrdict and the dict d"""
+    for i in range(nedits):
+        key = random.randint(0, MAXKEY)
+        choice = random.random()
+        if choice < 0.5:
+            val = randomValue(posns)
+            attrdict[key] = val
+            d[key] = val
+        elif choice < 0.6:
+            # storing _UNSET_ in a column removes the key
+            attrdict[key] = _UNSET_
+            d.pop(key, None)
+        elif choice < 0.75:
+            if d.has_key(key):
+                val = d.pop(key)
+                assert same_vals(attrdict.pop(key), val)
+            else:
+                assert attrdict.pop(key, "dflt") == "dflt"
+        elif choice < 0.85:
+            if d.has_key(key):
+                del d[key]
+                del attrdict[key]
+        elif choice < 0.95:
+            val = randomValue(posns)
+            assert same_vals(attrdict.setdefault(key, val),
+                             d.setdefault(key, val))
+        else:
+            other = {}
+            for j in range(3):
+                other[random.randint(0, MAXKEY)] = randomValue(posns)
+            attrdict.update(other)
+            d.update(other)
+        continue
+    return
+
+
+class StateUtilsColumnTestCase(unittest.TestCase):
+    """Unit tests for the columnar undo snapshot attrdicts in
+    state_utils.py (AtomColumn, PosnColumn and PosnDiff), which must
+    act like the dicts they replace"""
+
+    def setUp(self):
+        random.seed(0)
+
+    def testAtomColumn(self):
+        column = AtomColumn()
+        d = {}
+        for i in range(50):
+            randomEdits(column, d, False, 10)
+            checkLikeDict(column, d)
+        column.clear()
+        checkLikeDict(column, {})
+
+    def testPosnColumn(self):
+        column = PosnColumn()
+        d = {}
+        for i in range(50):
+            randomEdits(column, d, True, 10)
+            checkLikeDict(column, d)
+        # positions are copied when stored and when returned
+        posn = randomPosn()
+        saved = + posn
+        column[0] = posn
+        posn[0] += 1.0
+        column.get(0)[1] += 1.0
+        column[0][2] += 1.0
+        assert same_vals(column[0], saved)
+        column.clear()
+        checkLikeDict(column, {})
+
+    def testPosnDiff(self):
+        diff = PosnDiff()
+        d = {}
+        for i in range(50):
+            for j in range(5):
+                key = random.randint(0, MAXKEY)
+                if random.random() < 0.2:
+                    val = _UNSET_
+                else:
+                    val = randomValue(True)
+                diff[key] = val
+                d[key] = val
+            if i % 10 == 0:
+                other = PosnDiff()
+                other._store_many(array([MAXKEY + 1, 3]),
+                                  array([randomPosn(), randomPosn()]),
+                                  array([0, 1]))
+                diff.update(other)
+                d.update(dict(other.items()))
+            checkLikeDict(diff, d)
+        keys, posns = diff.set_posns()
+        assert sameItems(zip(keys, posns),
+                         [(key, val) for key, val in d.items()
+                          if val is not _UNSET_])
+
+    def testDiffAndApply(self):
+        # diff a snapshot of 100 atoms against a state in which some were
+        # moved, some killed and some added, the way
+        # modify_and_diff_snap_for_changed_objects does; compare it with the
+        # diff of the same snapshot stored in a dict, then apply and reverse
+        # the diff, the way undo and redo do
+        old = {}
+        for key in range(100):
+            old[key] = randomPosn()
+        new = dict(old)
+        for key in random.sample(range(100), 30):
+            new[key] = randomPosn() # moved
+        new[50] = old[50] + 0.0 # same position, not a change
+        killed = random.sample(range(50) + range(51, 100), 10)
+        for key in killed:
+            del new[key]
+        for key in range(100, 120):
+            new[key] = randomPosn() # added
+
+        snap = StateSnapshot()
+        snap.attrdicts[POSN] = column = PosnColumn()
+        column.update(old)
+        diff = PosnDiff()
+        living = [key for key in new.keys() if key not in killed]
+        column.diff_and_store(living, [new[key] for key in living], diff)
+        for key in killed:
+            oldval = column.pop(key, _UNSET_)
+            diff[key] = oldval
+
+        expected = {}
+        for key in range(120):
+            if not same_vals(old.get(key, _UNSET_), new.get(key, _UNSET_)):
+                expected[key] = old.get(key, _UNSET_)
+        checkLikeDict(column, new)
+        checkLikeDict(diff, expected)
+
+        diffobj = DiffObj({POSN: diff})
+        apply_and_reverse_diff(diffobj, snap) # undo
+        checkLikeDict(column, old)
+        apply_and_reverse_diff(diffobj, snap) # redo
+        checkLikeDict(column, new)
+        checkLikeDict(diff, expected)
+
+        # the same diff of a snapshot stored in a dict
+        snap = StateSnapshot()
+        snap.attrdicts[POSN] = d = dict(new)
+        apply_and_reverse_diff(diffobj, snap)
+        assert sameItems(d.items(), old.items())
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
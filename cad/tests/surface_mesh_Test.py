@@ -0,0 +1,101 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+from Numeric import array, zeros, add, maximum, Float
+from graphics.display_styles.surface_mesh import compute_surface
+from graphics.display_styles.surface_mesh import sphere_mesh, omega
+
+
+def randomAtoms(n, spread):
+    positions = array([(random.gauss(0, spread),
+                        random.gauss(0, spread),
+                        random.gauss(0, spread))
+                       for i in range(n)], Float)
+    radii = array([random.choice([1.2, 1.5, 1.7]) for i in range(n)], Float)
+    return positions, radii
+
+
+def bruteForceOmega(points, centers, radii):
+    """omega at each point, looking at every sphere"""
+    res = zeros((len(points),), Float) - 2.0
+    for center, r in zip(centers, radii):
+        d = points - center
+        res = maximum(res, (r * r - add.reduce(d * d, 1)) / (r + r))
+    return res
+
+
+def fullOmega(state, positions, radii):
+    """omega recomputed at every vertex of state's mesh, in state's
+    bounding sphere"""
+    points = sphere_mesh(state.level)[0]
+    return omega(points, (positions - state.center) / state.radius,
+                 radii / state.radius)
+
+
+def maxDifference(a, b):
+    return maximum.reduce(abs(a - b))
+
+
+class SurfaceMeshTestCase(unittest.TestCase):
+    """Unit tests for surface_mesh.py, whose incremental updates must
+    give the same surface as computing it again from scratch"""
+
+    def setUp(self):
+        random.seed(0)
+
+    def testOmega(self):
+        for n, spread in ((1, 1.0), (200, 3.0), (500, 10.0)):
+            positions, radii = randomAtoms(n, spread)
+            points = sphere_mesh(3)[0]
+            centers = positions / 20.0
+            assert maxDifference(omega(points, centers, radii / 20.0),
+                                 bruteForceOmega(points, centers,
+                                                 radii / 20.0)) == 0.0
+
+    def testIncrementalUpdate(self):
+        atlist = [] # (only compared by identity)
+        base_positions, base_radii = randomAtoms(300, 6.0)
+        base_state = compute_surface(base_positions, base_radii, atlist)[4]
+        reused = 0
+        for case in range(20):
+            positions = array(base_positions)
+            radii = array(base_radii)
+            for k in random.sample(range(len(positions)), case + 1):
+                positions[k] += (random.uniform(-0.5, 0.5),
+                                 random.uniform(-0.5, 0.5),
+                                 random.uniform(-0.5, 0.5))
+                if case % 5 == 0:
+                    radii[k] = random.choice([1.2, 1.5, 1.7])
+            state = compute_surface(positions, radii, atlist, base_state)[4]
+            if state.center is base_state.center:
+                # only the vertices near changed atoms were redone
+                reused += 1
+            assert maxDifference(state.omega,
+                                 fullOmega(state, positions, radii)) == 0.0
+        assert reused >= 15
+
+    def testUnchanged(self):
+        atlist = []
+        positions, radii = randomAtoms(100, 4.0)
+        first = compute_surface(positions, radii, atlist)
+        again = compute_surface(array(positions), radii, atlist, first[4])
+        assert again[2] == first[2] and again[3] == first[3]
+
+    def testNewBoundingSphere(self):
+        atlist = []
+        positions, radii = randomAtoms(100, 4.0)
+        state = compute_surface(positions, radii, atlist)[4]
+        # an atom moved outside the old bounding sphere
+        positions = array(positions)
+        positions[0] += (30.0, 0.0, 0.0)
+        res = compute_surface(positions, radii, atlist, state)
+        assert res[4].center is not state.center
+        assert res[2] == compute_surface(positions, radii)[2]
+        # a different list of atoms
+        res = compute_surface(positions, radii, [], res[4])
+        assert res[2] == compute_surface(positions, radii)[2]
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -0,0 +1,156 @@
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+import unittest
+import random
+from types import InstanceType
+from Numeric import array, Float, Int
+from foundation.state_constants import _UNSET_
+from foundation.state_utils import PosnDiff, DiffObj, UndoSpillFile
+import foundation.undo_archive as undo_archive
+from foundation.undo_archive import AssyUndoArchive
+from utilities.prefs_constants import undoStackMemoryLimit_prefs_key
+
+POSN = ('_posn', 'Atom') # an attrcode
+
+NATOMS = 2000
+
+
+def makePosnDiff(natoms):
+    """a PosnDiff like one made after moving natoms atoms (and killing a
+    few), whose positions are near each other, as in a real model"""
+    keys = array(random.sample(range(3 * natoms), natoms), Int)
+    posns = []
+    x = y = z = 0.0
+    for i in range(natoms):
+        x += random.uniform(-1.5, 1.5)
+        y += random.uniform(-1.5, 1.5)
+        z += random.uniform(-1.5, 1.5)
+        posns.append((x, y, z))
+    unset = array([random.random() < 0.05 for i in range(natoms)], Int)
+    diff = PosnDiff()
+    diff._store_many(keys, array(posns, Float), unset)
+    return diff
+
+
+def arrayBytes(diff):
+    """the exact contents of diff's arrays (which unpacks it, if needed)"""
+    diff._compact()
+    return (diff._keys.tostring(), diff._posns.tostring(),
+            diff._unset.tostring())
+
+
+class FakeStatePlace:
+    def __init__(self, diff):
+        self.diff_and_place = (diff, None)
+
+
+class FakeCheckpoint:
+    def __init__(self, diff):
+        self.state = FakeStatePlace(diff)
+
+
+class FakeEnv:
+    def __init__(self, megabytes):
+        self.prefs = {undoStackMemoryLimit_prefs_key: megabytes}
+
+
+class UndoMemoryBudgetTestCase(unittest.TestCase):
+    """Unit tests for compressing and spilling old undo diffs to keep
+    within the undo memory budget (PosnDiff.pack and spill, UndoSpillFile,
+    and AssyUndoArchive._enforce_undo_memory_budget)"""
+
+    def setUp(self):
+        random.seed(0)
+        self.env = undo_archive.env
+
+    def tearDown(self):
+        undo_archive.env = self.env
+
+    def testSpillAndRestore(self):
+        spillfile = UndoSpillFile()
+        diffs = [makePosnDiff(NATOMS) for i in range(3)]
+        diffs[1][7] = _UNSET_ # a value stored one at a time
+        saved = [(arrayBytes(diff), diff.items()) for diff in diffs]
+        ram = diffs[0].RAM_usage_guess()
+        diffs[0].pack()
+        assert diffs[0].RAM_usage_guess() < ram
+        for diff, (data, items) in zip(diffs, saved):
+            diff.spill(spillfile)
+            assert diff.RAM_usage_guess() < 200
+            assert len(diff) == len(items)
+        assert spillfile.size() == \
+               sum([diff.spilled_size() for diff in diffs]) > 0
+        # restore them in a different order than they were spilled
+        for i in (1, 0, 2):
+            assert arrayBytes(diffs[i]) == saved[i][0]
+            assert diffs[i].spilled_size() == 0
+            assert len(diffs[i].items()) == len(saved[i][1])
+        # all the data was read back, so the file was truncated
+        assert spillfile.size() == 0
+        spillfile.close()
+
+    def testSpillDiffObj(self):
+        spillfile = UndoSpillFile()
+        posndiff = makePosnDiff(NATOMS)
+        saved = arrayBytes(posndiff)
+        other = {(1, 2, 3): 'C'} # not a position diff
+        diff = DiffObj({POSN: posndiff, ('element', 'Atom'): other})
+        ram = diff.RAM_usage_guess()
+        diff.spill(spillfile)
+        assert diff.RAM_usage_guess() < ram / 10
+        assert diff.spilled_size() == spillfile.size() > 0
+        assert diff.attrdicts[('element', 'Atom')] is other
+        assert arrayBytes(diff.attrdicts[POSN]) == saved
+        spillfile.close()
+
+    def testEnforceBudget(self):
+        # 12 diffs of about 80000 bytes each, within a budget of half a
+        # megabyte (under which the newest 4 diffs still fit)
+        undo_archive.env = FakeEnv(0.5)
+        budget = 0.5 * 1024 * 1024
+        archive = InstanceType(AssyUndoArchive)
+        archive._spillfile = UndoSpillFile()
+        archive._filled_cps = []
+        cps = []
+        saved = []
+        for i in range(12):
+            diff = makePosnDiff(NATOMS)
+            saved.append(arrayBytes(diff))
+            cp = FakeCheckpoint(DiffObj({POSN: diff}))
+            cps.append(cp)
+            archive._filled_cps.append(undo_archive.weakref.ref(cp))
+            archive._enforce_undo_memory_budget()
+            per_cp, total_ram, total_spilled, filesize = \
+                    archive.undo_memory_usage()
+            assert len(per_cp) == i + 1
+            assert total_ram <= budget
+            assert total_spilled == filesize
+        assert [cp for cp, ram, spilled in per_cp] == cps[::-1]
+        # newest first: 4 untouched diffs, then packed ones, then spilled ones
+        states = []
+        for cp in cps[::-1]:
+            posndiff = cp.state.diff_and_place[0].attrdicts[POSN]
+            if posndiff._spilled is not None:
+                states.append(2)
+            elif posndiff._packed is not None:
+                states.append(1)
+            else:
+                states.append(0)
+        assert states[:4] == [0, 0, 0, 0]
+        assert 1 in states and states[-1] == 2
+        sorted_states = states[:]
+        sorted_states.sort()
+        assert states == sorted_states
+        # a checkpoint which no longer exists is forgotten
+        del cps[0], cp, per_cp
+        assert len(archive.undo_memory_usage()[0]) == 11
+        # all the diffs are restored exactly when they're next needed
+        for cp, data in zip(cps, saved[1:]):
+            assert arrayBytes(cp.state.diff_and_place[0].attrdicts[POSN]) \
+                   == data
+        assert archive.undo_memory_usage()[2] == 0
+        archive._spillfile.close()
+
+
+if __name__ == "__main__":
+    unittest.main() # Run all tests whose names begin with 'test'
@@ -21,17 +21,31 @@
  option to suppress the input scanning and status printing.  This
  will restart the queue runner if it happens to have exited.
 
+ When several .mmp files are found at once, the parameters given for
+ the first one can be reused for all of them, so hundreds of variant
+ parts can be submitted with one set of answers.
+
  The queue runner process is started with 'batchsim --run-queue'.  It
  exits immediately if there is already a queue runner process.
- Otherwise, it scans the QUEUE directory and finds the first job.
- This is moved to the RUN directory, and the job's 'run' file is
- executed.  When it exits, the job directory is moved to the OUTPUT
- directory, and the queue runner scans the QUEUE directory again.
- When it finds nothing in the QUEUE directory, it exits.
+ Otherwise, it scans the QUEUE directory and finds the first jobs.
+ Each is moved to the CURRENT directory, and the job's 'run' file is
+ executed in a child process.  Up to one job per processor runs at
+ once (or the number given with '--jobs N').  When a job exits, the
+ time it took is recorded in the file 'timing' in its directory, the
+ job directory (with its trace, movie and xyz output files) is moved to
+ the OUTPUT directory, and the queue runner scans the QUEUE directory
+ again.  When it finds nothing in the QUEUE directory and all its jobs
+ have finished, it exits.
+
+ The status report shows the progress of each executing job (read
+ from its trace file), the output files and run time of each completed
+ job, and the throughput in jobs per hour.  Use 'batchsim --watch' to
+ repeat the report every few seconds while jobs are executing.
 """
 
 import sys
 import os
+import re
 import time
 import fcntl
 
@@ -92,12 +106,22 @@ def askFloat(question, default):
             print
             print "reply was not a float: " + reply.strip()
 
+def processorCount():
+    try:
+        return max(1, int(os.sysconf("SC_NPROCESSORS_ONLN")))
+    except (AttributeError, ValueError, OSError):
+        return 1
+
 def runJob(jobNumber):
-    queuePath = os.path.join(QUEUE, jobNumber)
+    """
+      Run the job in CURRENT/jobNumber (in this process, which must be
+      a child of the queue runner, since this redirects stdin, stdout
+      and stderr), record its timing, and move it to OUTPUT.
+    """
     currentPath = os.path.join(CURRENT, jobNumber)
     outputPath = os.path.join(OUTPUT, jobNumber)
-    os.rename(queuePath, currentPath)
     os.chdir(currentPath)
+    startTime = time.time()
 
     childStdin = open("/dev/null")
     childStdout = open("stdout", 'w')
@@ -109,6 +133,7 @@ def runJob(jobNumber):
     os.dup2(childStderr.fileno(), 2)
     childStderr.close()
 
+    status = 0
     run = open("run")
     for command in run:
         status = os.system(command)
@@ -116,13 +141,38 @@ def runJob(jobNumber):
             print >>sys.stderr, "command: %s\nexited with status: %d" % (command, status)
             break
 
+    timing = open("timing", 'w')
+    print >>timing, "start %f" % startTime
+    print >>timing, "end %f" % time.time()
+    print >>timing, "status %d" % status
+    timing.close()
+
     os.close(0)
     os.close(1)
     os.close(2)
     os.chdir("/")
     os.rename(currentPath, outputPath)
 
-def processQueue():
+def startJob(jobNumber):
+    """
+      Move the job from QUEUE to CURRENT, and start a child process to
+      run it.  Return the child's process id.
+    """
+    os.rename(os.path.join(QUEUE, jobNumber), os.path.join(CURRENT, jobNumber))
+    pid = os.fork()
+    if (pid):
+        return pid
+    try:
+        runJob(jobNumber)
+    finally:
+        os._exit(0)
+
+def queuedJobs():
+    fileList = os.listdir(QUEUE)
+    fileList.sort()
+    return [jobNumber for jobNumber in fileList if jobNumber.isdigit()]
+
+def processQueue(maxJobs):
     # First, we move anything from the current directory into output,
     # and consider those jobs to have failed.  The processQueue that
     # started these should have moved them to output itself, so
@@ -140,23 +190,26 @@ def processQueue():
             os.rename(jobPath, os.path.join(OUTPUT, jobNumber))
 
     # Now, we check to see if there's anything in the queue directory.
-    # If so, we move the first job to current, and execute it's run
-    # file.  Move the results to the output directory and scan again
-    # after the run file completes.
+    # If so, we start the first jobs (up to maxJobs at once), each of
+    # which moves itself to current, executes its run file, and moves
+    # its results to the output directory.  Scan again whenever a job
+    # completes.
 
+    running = {} # pid -> jobNumber
     while (True):
-        gotOne = False
-        fileList = os.listdir(QUEUE)
-        fileList.sort()
-        for jobNumber in fileList:
-            if (jobNumber.isdigit()):
-                gotOne = True
-                runJob(jobNumber)
-                break
-        if (not gotOne):
+        if (len(running) < maxJobs):
+            for jobNumber in queuedJobs()[:maxJobs - len(running)]:
+                running[startJob(jobNumber)] = jobNumber
+        if (not running):
+            break
+        try:
+            pid, status = os.wait()
+        except OSError:
             break
+        if (pid in running):
+            del running[pid]
 
-def runQueue():
+def runQueue(maxJobs):
     # fork and lock, exiting immediately if another process has the lock
     pid = os.fork()
     if (pid):
@@ -172,12 +225,65 @@ def runQueue():
             fcntl.flock(lockFD, fcntl.LOCK_EX | fcntl.LOCK_NB)
         except IOError:
             os._exit(0)
-        processQueue()
+        processQueue(maxJobs)
         os._exit(0)
 
+def askCommands():
+    """
+      Ask the user for simulation parameters, and return the list of
+      commands to put in a job's run file, with %(baseName)s and
+      %(fileName)s in place of the job's file names.
+    """
+    commands = []
+    minimize = ask("[M]inimize or [D]ynamics", "D").strip().lower()
+    if (minimize.startswith("m")):
+
+        end_rms = askFloat("Ending force threshold (pN)", 50.0)
+        useGromacs = ask("Use [G]romacs (required for DNA) or [N]D-1 (required for double bonds)", "G").strip().lower()
+        if (useGromacs.startswith("g")):
+            hasPAM = ask("Does your model contain PAM atoms (DNA)? (Y/N)", "Y").strip().lower()
+            hasPAM = hasPAM.startswith("y")
+            if (hasPAM):
+                vdwCutoffRadius = 2
+            else:
+                vdwCutoffRadius = -1
+            doNS = ask("Enable neighbor searching? [Y]es (more accurate)/[N]o (faster)", "N").strip().lower()
+            if (doNS.startswith("y")):
+                neighborSearching = 1
+            else:
+                neighborSearching = 0
+            commands.append("simulator -m --min-threshold-end-rms=%f --trace-file %%(baseName)s-trace.txt --write-gromacs-topology %%(baseName)s --path-to-cpp /usr/bin/cpp --system-parameters %s/control/sim-params.txt --vdw-cutoff-radius %f --neighbor-searching %d %%(fileName)s" \
+                            % (end_rms, baseDirectory, vdwCutoffRadius, neighborSearching))
+
+            commands.append("grompp -f %(baseName)s.mdp -c %(baseName)s.gro -p %(baseName)s.top -n %(baseName)s.ndx -o %(baseName)s.tpr -po %(baseName)s-out.mdp")
+
+            if (hasPAM):
+                tableFile = "%s/control/yukawa.xvg" % baseDirectory
+                table = "-table %s -tablep %s" % (tableFile, tableFile)
+            else:
+                table = ""
+
+            commands.append("mdrun -s %%(baseName)s.tpr -o %%(baseName)s.trr -e %%(baseName)s.edr -c %%(baseName)s.xyz-out.gro -g %%(baseName)s.log %s" \
+                            % table)
+        else:
+            commands.append("simulator -m --system-parameters %s/control/sim-params.txt --output-format-3 --min-threshold-end-rms=%f --trace-file %%(baseName)s-trace.txt %%(fileName)s" \
+                            % (baseDirectory, end_rms))
+    else:
+        temp = askInt("Temperature in Kelvins", 300)
+        stepsPerFrame = askInt("Steps per frame", 10)
+        frames = askInt("Frames", 900)
+        print
+        print "temp %d steps %d frames %d" % (temp, stepsPerFrame, frames)
+
+        commands.append("simulator  --system-parameters %s/control/sim-params.txt --temperature=%d --iters-per-frame=%d --num-frames=%d --trace-file %%(baseName)s-trace.txt %%(fileName)s" \
+                        % (baseDirectory, temp, stepsPerFrame, frames))
+    return commands
+
 def scanInput():
     fileList = os.listdir(INPUT)
     fileList.sort()
+    mmpFiles = [fileName for fileName in fileList if fileName.endswith(".mmp")]
+    commands = None
     for fileName in fileList:
         if (fileName.endswith(".mmp")):
             baseName = fileName[:-4]
@@ -186,62 +292,91 @@ def scanInput():
             dirInQueue = os.path.join(QUEUE, nextJobNumber())
             os.mkdir(dirInQueue)
             os.rename(os.path.join(INPUT, fileName), os.path.join(dirInQueue, fileName))
-            runFile = open(os.path.join(dirInQueue, "run"), 'w')
 
-            minimize = ask("[M]inimize or [D]ynamics", "D").strip().lower()
-            if (minimize.startswith("m")):
-
-                end_rms = askFloat("Ending force threshold (pN)", 50.0)
-                useGromacs = ask("Use [G]romacs (required for DNA) or [N]D-1 (required for double bonds)", "G").strip().lower()
-                if (useGromacs.startswith("g")):
-                    hasPAM = ask("Does your model contain PAM atoms (DNA)? (Y/N)", "Y").strip().lower()
-                    hasPAM = hasPAM.startswith("y")
-                    if (hasPAM):
-                        vdwCutoffRadius = 2
-                    else:
-                        vdwCutoffRadius = -1
-                    doNS = ask("Enable neighbor searching? [Y]es (more accurate)/[N]o (faster)", "N").strip().lower()
-                    if (doNS.startswith("y")):
-                        neighborSearching = 1
-                    else:
-                        neighborSearching = 0
-                    print >>runFile, "simulator -m --min-threshold-end-rms=%f --trace-file %s-trace.txt --write-gromacs-topology %s --path-to-cpp /usr/bin/cpp --system-parameters %s/control/sim-params.txt --vdw-cutoff-radius %f --neighbor-searching %d %s" \
-                          % (end_rms, baseName, baseName, baseDirectory, vdwCutoffRadius, neighborSearching, fileName)
-
-                    print >>runFile, "grompp -f %s.mdp -c %s.gro -p %s.top -n %s.ndx -o %s.tpr -po %s-out.mdp" \
-                          % (baseName, baseName, baseName, baseName, baseName, baseName)
-
-                    if (hasPAM):
-                        tableFile = "%s/control/yukawa.xvg" % baseDirectory
-                        table = "-table %s -tablep %s" % (tableFile, tableFile)
-                    else:
-                        table = ""
-
-                    print >>runFile, "mdrun -s %s.tpr -o %s.trr -e %s.edr -c %s.xyz-out.gro -g %s.log %s" \
-                          % (baseName, baseName, baseName, baseName, baseName, table)
-                else:
-                    print >>runFile, "simulator -m --system-parameters %s/control/sim-params.txt --output-format-3 --min-threshold-end-rms=%f --trace-file %s-trace.txt %s" \
-                          % (baseDirectory, end_rms, baseName, fileName)
+            if (commands is None):
+                newCommands = askCommands()
+                mmpFiles.remove(fileName)
+                if (mmpFiles):
+                    reuse = ask("Use the same parameters for the other %d .mmp files? (Y/N)" % len(mmpFiles), "Y").strip().lower()
+                    if (reuse.startswith("y")):
+                        commands = newCommands
             else:
-                temp = askInt("Temperature in Kelvins", 300)
-                stepsPerFrame = askInt("Steps per frame", 10)
-                frames = askInt("Frames", 900)
-                print
-                print "temp %d steps %d frames %d" % (temp, stepsPerFrame, frames)
+                newCommands = commands
 
-                print >>runFile, "simulator  --system-parameters %s/control/sim-params.txt --temperature=%d --iters-per-frame=%d --num-frames=%d --trace-file %s-trace.txt %s" \
-                      % (baseDirectory, temp, stepsPerFrame, frames, baseName, fileName)
+            runFile = open(os.path.join(dirInQueue, "run"), 'w')
+            for command in newCommands:
+                print >>runFile, command % {'baseName': baseName, 'fileName': fileName}
+            runFile.close()
         else:
             print "ignoring " + os.path.join(INPUT, fileName)
 
-def showOneJob(dirName, jobNumber):
+OUTPUT_EXTENSIONS = (".dpb", ".xyz", ".gro", ".trr", ".edr", "-trace.txt")
+
+def readTiming(dirName):
+    """
+      Return (start, end, status) from the timing file in a completed
+      job's directory, or None if it has none.
+    """
+    try:
+        timing = {}
+        for line in open(os.path.join(dirName, "timing")):
+            key, value = line.split()
+            timing[key] = float(value)
+        return timing["start"], timing["end"], int(timing["status"])
+    except (IOError, ValueError, KeyError):
+        return None
+
+def traceProgress(dirName):
+    """
+      Return a description of the progress of the job in dirName, from
+      the number of data lines in its trace file so far (one per frame,
+      for dynamics) and the number of frames requested in its run file.
+    """
+    traceFiles = [fileName for fileName in os.listdir(dirName)
+                  if fileName.endswith("-trace.txt")]
+    if (not traceFiles):
+        return "starting"
+    frames = 0
+    lastLine = ""
+    for line in open(os.path.join(dirName, traceFiles[0])):
+        if (line.strip() and not line.startswith("#")):
+            frames += 1
+            lastLine = line.strip()
+    try:
+        match = re.search(r"--num-frames=(\d+)", open(os.path.join(dirName, "run")).read())
+    except IOError:
+        match = None
+    if (match):
+        progress = "frame %d of %s" % (frames, match.group(1))
+    else:
+        progress = "%d trace lines" % frames
+    if (lastLine):
+        progress += ", last: " + lastLine[:60]
+    return progress
+
+def showOneJob(dirName, jobNumber, details = None):
     fileList = os.listdir(dirName)
     fileList.sort()
     for fileName in fileList:
         if (fileName.endswith(".mmp")):
             print "    %s %s" % (jobNumber, fileName)
-
-def showJobsInDirectory(dirName, header):
+    if (details == "progress"):
+        print "          %s" % traceProgress(dirName)
+    elif (details == "results"):
+        timing = readTiming(dirName)
+        if (timing):
+            start, end, status = timing
+            if (status):
+                result = "FAILED (status %d)" % status
+            else:
+                result = "ok"
+            print "          %s in %.1f sec" % (result, end - start)
+        outputs = [fileName for fileName in fileList
+                   if fileName.endswith(OUTPUT_EXTENSIONS)]
+        if (outputs):
+            print "          output: %s" % " ".join(outputs)
+
+def showJobsInDirectory(dirName, header, details = None):
     gotOne = False
     fileList = os.listdir(dirName)
     fileList.sort()
@@ -250,12 +385,37 @@ def showJobsInDirectory(dirName, header):
             if (not gotOne):
                 print header
                 gotOne = True
-            showOneJob(os.path.join(dirName, jobNumber), jobNumber)
+            showOneJob(os.path.join(dirName, jobNumber), jobNumber, details)
+
+def showThroughput():
+    """
+      Print the throughput of the completed jobs which have timing
+      files, in jobs per hour, and their mean time per job.
+    """
+    timings = []
+    for jobNumber in os.listdir(OUTPUT):
+        if (jobNumber.isdigit()):
+            timing = readTiming(os.path.join(OUTPUT, jobNumber))
+            if (timing):
+                timings.append(timing)
+    if (not timings):
+        return
+    firstStart = min([start for start, end, status in timings])
+    lastEnd = max([end for start, end, status in timings])
+    totalTime = 0.0
+    for start, end, status in timings:
+        totalTime += end - start
+    print
+    print "%d timed jobs completed in %.1f sec: %.1f jobs/hour, %.1f sec/job" \
+          % (len(timings), lastEnd - firstStart,
+             len(timings) * 3600.0 / max(lastEnd - firstStart, 1e-3),
+             totalTime / len(timings))
 
 def showStatus():
     showJobsInDirectory(QUEUE, "\nJobs queued for later processing:\n")
-    showJobsInDirectory(CURRENT, "\nCurrently executing job:\n")
-    showJobsInDirectory(OUTPUT, "\nCompleted jobs:\n")
+    showJobsInDirectory(CURRENT, "\nCurrently executing jobs:\n", "progress")
+    showJobsInDirectory(OUTPUT, "\nCompleted jobs:\n", "results")
+    showThroughput()
     gotProcess = False
     ps = os.popen("ps ax")
     header = ps.readline()
@@ -272,6 +432,18 @@ def showStatus():
         print
         print "No simulator processes running."
 
+def watchStatus(interval = 10):
+    """
+      Show the status every interval seconds, until no jobs are
+      queued or executing.
+    """
+    while (True):
+        showStatus()
+        print
+        if (not queuedJobs() and not [jobNumber for jobNumber in os.listdir(CURRENT) if jobNumber.isdigit()]):
+            break
+        time.sleep(interval)
+
 def makeDirectory(path):
     if (os.access(path, os.W_OK)):
         return
@@ -282,12 +454,21 @@ def main():
     makeDirectory(QUEUE)
     makeDirectory(CURRENT)
     makeDirectory(OUTPUT)
-    if (len(sys.argv) > 1 and sys.argv[1] == '--run-queue'):
-        runQueue()
+    args = sys.argv[1:]
+    maxJobs = processorCount()
+    if ('--jobs' in args):
+        i = args.index('--jobs')
+        maxJobs = max(1, int(args[i + 1]))
+        del args[i:i + 2]
+    if (args == ['--run-queue']):
+        runQueue(maxJobs)
+    elif (args == ['--watch']):
+        runQueue(maxJobs)
+        watchStatus()
     else:
         print
         scanInput()
-        runQueue()
+        runQueue(maxJobs)
         showStatus()
         print
 
@@ -75,6 +75,16 @@ double VanDerWaalsCutoffFactor;
 int EnableElectrostatic;
 int NeighborSearching;
 
+// Skin distance (pm) of the Verlet neighbor lists used to find van
+// der Waals and electrostatic interactions.  With 0, the wrapped grid
+// in updateVanDerWaals() is used instead.
+double VerletSkin;
+
+// Number of threads calculateGradient() divides the force terms
+// among.  With 1, they are all evaluated in order in the calling
+// thread.
+int ThreadCount;
+
 // these are not reset by reinit_globals, but rather in
 // readBondTableOverlay.
 int LoadedSystemParameters;
@@ -178,6 +188,8 @@ reinit_globals(void)
 
     EnableElectrostatic = 1;
     NeighborSearching = 1;
+    ThreadCount = 1;
+    VerletSkin = 0.0;
     
     OutputFile = NULL;
     TraceFile = NULL;
@@ -217,6 +229,15 @@ constrainGlobals()
     if (VanDerWaalsCutoffFactor > 10.0) {
         VanDerWaalsCutoffFactor = 10.0;
     }
+    if (VerletSkin < 0.0) {
+        VerletSkin = 0.0;
+    }
+    if (ThreadCount < 1) {
+        ThreadCount = 1;
+    }
+    if (ThreadCount > MAX_THREAD_COUNT) {
+        ThreadCount = MAX_THREAD_COUNT;
+    }
 
     ThermostatG1 = (1.01 - 0.27 * ThermostatGamma) * 1.4 * sqrt(ThermostatGamma);
 }
@@ -246,6 +267,12 @@ printGlobals()
     write_traceline("# VanDerWaalsCutoffFactor: %f\n", VanDerWaalsCutoffFactor);
     write_traceline("# EnableElectrostatic: %d\n", EnableElectrostatic);
     write_traceline("# NeighborSearching: %d\n", NeighborSearching);
+    if (ThreadCount > 1) {
+        write_traceline("# ThreadCount: %d\n", ThreadCount);
+    }
+    if (VerletSkin > 0.0) {
+        write_traceline("# VerletSkin: %f\n", VerletSkin);
+    }
     write_traceline("# ThermostatGamma: %f\n", ThermostatGamma);
     write_traceline("# UseAMBER: %d\n", UseAMBER);
     if (SystemParametersFileName != NULL && LoadedSystemParameters) {
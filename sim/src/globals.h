@@ -50,6 +50,10 @@ extern double VanDerWaalsCutoffRadius;
 extern double VanDerWaalsCutoffFactor;
 extern int EnableElectrostatic;
 extern int NeighborSearching;
+extern double VerletSkin;
+
+#define MAX_THREAD_COUNT 64
+extern int ThreadCount;
 extern int TimeReversal;
 extern double ThermostatGamma;
 extern double ThermostatG1;
@@ -380,6 +380,10 @@ minimizeStructure(struct part *part)
 	initial->coordinate[j++] = part->positions[i].y;
 	initial->coordinate[j++] = part->positions[i].z;
     }
+    // the jig degrees of freedom (rotary motor angles, etc) start at zero
+    for (; j<coordinateCount + jigDegreesOfFreedom; j++) {
+        initial->coordinate[j] = 0.0;
+    }
 
     // To compare the torsion gradient code to the results of a
     // numerical differentiation, put the following lines in an .mmp
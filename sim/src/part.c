@@ -176,12 +176,22 @@ destroyPart(struct part *p)
         if (v != NULL) {
             // v->a1 and v->a2 already freed
             // v->parameters still held by vdw hashtable
-            free(v);
+            // dynamic vdw's found by the Verlet lists are freed below
+            if (p->verletVanDerWaals == NULL || i < p->num_static_vanDerWaals) {
+                free(v);
+            }
             p->vanDerWaals[i] = NULL;
         }
     }
     destroyAccumulator(p->vanDerWaals);
     p->vanDerWaals = NULL;
+
+    destroyAccumulator(p->verletVanDerWaals);
+    p->verletVanDerWaals = NULL;
+    destroyAccumulator(p->verletElectrostatic);
+    p->verletElectrostatic = NULL;
+    destroyAccumulator(p->verletPositions);
+    p->verletPositions = NULL;
     
     // nothing in a stretch needs freeing
     destroyAccumulator(p->stretches);
@@ -993,6 +1003,286 @@ verifyVanDerWaals(struct part *p, struct xyz *positions)
     free(seen); // yes, alloca would work here too.
 }
 
+// Verlet neighbor lists, used instead of the grid below when
+// VerletSkin > 0.
+//
+// Every pair of atoms closer than its cutoff distance plus VerletSkin
+// is put on the lists.  The lists stay valid (contain every pair
+// within its cutoff) until some atom has moved more than half the
+// skin since they were built, and are only rebuilt then.  Pairs which
+// are on the lists but beyond their cutoff contribute nothing, as the
+// potential and gradient tables end at the cutoff.
+//
+// The pairs are kept in two flat arrays, p->verletVanDerWaals and
+// p->verletElectrostatic, and the dynamic entries of p->vanDerWaals
+// and p->electrostatic point into them, so the code which evaluates
+// the interactions doesn't need to know which method found them.
+//
+// To find the pairs, atoms are sorted by the cell (of a cubic grid
+// covering just the atoms' bounding box) they fall in, and each run
+// of atoms in one cell is paired with itself and with the runs in
+// the 13 neighboring cells which follow it.
+
+struct verletCellEntry 
+{
+    int cell;
+    int atom;
+};
+
+static int
+compareVerletCellEntries(const void *e1, const void *e2)
+{
+    const struct verletCellEntry *c1 = (const struct verletCellEntry *)e1;
+    const struct verletCellEntry *c2 = (const struct verletCellEntry *)e2;
+
+    if (c1->cell != c2->cell) {
+        return c1->cell < c2->cell ? -1 : 1;
+    }
+    return c1->atom < c2->atom ? -1 : (c1->atom > c2->atom ? 1 : 0);
+}
+
+// Index of the first entry at or after start whose cell is >= cell.
+static int
+findVerletCell(struct verletCellEntry *entries, int start, int count, int cell)
+{
+    int hi = count;
+    int mid;
+
+    while (start < hi) {
+        mid = (start + hi) / 2;
+        if (entries[mid].cell < cell) {
+            start = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return start;
+}
+
+static void
+addVerletPair(struct part *p, struct atom *a1, struct atom *a2, struct xyz *positions)
+{
+    struct atom *swap;
+    struct vanDerWaals *vdw;
+    struct electrostatic *es;
+    struct vanDerWaalsParameters *parameters;
+    struct xyz dr;
+    double drSquared;
+    double cutoff;
+    double coulombK;
+
+    if (a1->index > a2->index) {
+        swap = a1;
+        a1 = a2;
+        a2 = swap;
+    }
+    if (isBondedToSame(a1, a2)) {
+        return;
+    }
+    dr = vdif(positions[a1->index], positions[a2->index]);
+    drSquared = vdot(dr, dr);
+
+    cutoff = (a1->type->vanDerWaalsRadius * 100.0 +
+              a2->type->vanDerWaalsRadius * 100.0)
+        * VanDerWaalsCutoffFactor + VerletSkin;
+    if (drSquared < cutoff * cutoff) {
+        parameters = getVanDerWaalsTable(a1->type->protons, a2->type->protons);
+        if (parameters != NULL) {
+            p->num_verletVanDerWaals++;
+            p->verletVanDerWaals = (struct vanDerWaals *)
+                accumulator(p->verletVanDerWaals,
+                            sizeof(struct vanDerWaals) * p->num_verletVanDerWaals, 0);
+            vdw = &p->verletVanDerWaals[p->num_verletVanDerWaals - 1];
+            vdw->a1 = a1;
+            vdw->a2 = a2;
+            vdw->parameters = parameters;
+        }
+    }
+
+    if (EnableElectrostatic && a1->isCharged && a2->isCharged) {
+        coulombK = COULOMB * a1->type->charge * a2->type->charge / DielectricConstant;
+        cutoff = fabs(coulombK) / MinElectrostaticSensitivity + VerletSkin;
+        if (drSquared < cutoff * cutoff) {
+            p->num_verletElectrostatic++;
+            p->verletElectrostatic = (struct electrostatic *)
+                accumulator(p->verletElectrostatic,
+                            sizeof(struct electrostatic) * p->num_verletElectrostatic, 0);
+            es = &p->verletElectrostatic[p->num_verletElectrostatic - 1];
+            es->a1 = a1;
+            es->a2 = a2;
+            es->parameters = getElectrostaticParameters(a1->type->protons, a2->type->protons);
+        }
+    }
+}
+
+static void
+buildVerletLists(struct part *p, struct xyz *positions)
+{
+    int i;
+    int j;
+    int k;
+    int n;
+    int count;
+    int dx;
+    int dy;
+    int dz;
+    int cx;
+    int cy;
+    int cz;
+    int ny;
+    int nz;
+    int runStart;
+    int runEnd;
+    int otherStart;
+    int otherEnd;
+    int otherCell;
+    double cellSize;
+    double cutoff;
+    double numCells;
+    struct xyz lo;
+    struct xyz hi;
+    struct atom *a;
+    struct verletCellEntry *entries;
+
+    // the cells must be at least as large as the longest cutoff
+    cellSize = 2.0 * p->maxVanDerWaalsRadius * VanDerWaalsCutoffFactor;
+    if (EnableElectrostatic && p->num_charged_atoms > 0) {
+        cutoff = COULOMB * p->maxParticleCharge * p->maxParticleCharge /
+            DielectricConstant / MinElectrostaticSensitivity;
+        if (cutoff > cellSize) {
+            cellSize = cutoff;
+        }
+    }
+    cellSize += VerletSkin;
+
+    entries = (struct verletCellEntry *)allocate(sizeof(struct verletCellEntry) * p->num_atoms);
+    NULLPTR(entries);
+    vsetc(lo, 0.0);
+    vsetc(hi, 0.0);
+    count = 0;
+    for (i=0; i<p->num_atoms; i++) {
+        if (p->atoms[i]->type->vanDerWaalsRadius <= 0.0) {
+            continue;
+        }
+        if (count == 0) {
+            lo = hi = positions[i];
+        } else {
+            vmin(lo, positions[i]);
+            vmax(hi, positions[i]);
+        }
+        entries[count++].atom = i;
+    }
+
+    // Grow the cells if needed, so that cell numbers (which include
+    // an empty border of cells) fit in an int.
+    while (1) {
+        numCells = (floor((hi.x - lo.x) / cellSize) + 3.0) *
+            (floor((hi.y - lo.y) / cellSize) + 3.0) *
+            (floor((hi.z - lo.z) / cellSize) + 3.0);
+        if (numCells < 1e9) {
+            break;
+        }
+        cellSize *= 2.0;
+    }
+    ny = (int)floor((hi.y - lo.y) / cellSize) + 3;
+    nz = (int)floor((hi.z - lo.z) / cellSize) + 3;
+    for (k=0; k<count; k++) {
+        i = entries[k].atom;
+        cx = (int)floor((positions[i].x - lo.x) / cellSize) + 1;
+        cy = (int)floor((positions[i].y - lo.y) / cellSize) + 1;
+        cz = (int)floor((positions[i].z - lo.z) / cellSize) + 1;
+        entries[k].cell = (cx * ny + cy) * nz + cz;
+    }
+    qsort(entries, count, sizeof(struct verletCellEntry), compareVerletCellEntries);
+
+    p->num_verletVanDerWaals = 0;
+    p->num_verletElectrostatic = 0;
+    for (runStart=0; runStart<count; runStart=runEnd) {
+        runEnd = runStart + 1;
+        while (runEnd < count && entries[runEnd].cell == entries[runStart].cell) {
+            runEnd++;
+        }
+        // pairs within this cell
+        for (j=runStart; j<runEnd; j++) {
+            a = p->atoms[entries[j].atom];
+            for (k=j+1; k<runEnd; k++) {
+                addVerletPair(p, a, p->atoms[entries[k].atom], positions); BAIL();
+            }
+        }
+        // pairs with the 13 neighboring cells which follow this one
+        for (dx=0; dx<=1; dx++) {
+            for (dy=(dx ? -1 : 0); dy<=1; dy++) {
+                for (dz=(dx || dy ? -1 : 1); dz<=1; dz++) {
+                    otherCell = entries[runStart].cell + (dx * ny + dy) * nz + dz;
+                    otherStart = findVerletCell(entries, runEnd, count, otherCell);
+                    otherEnd = otherStart;
+                    while (otherEnd < count && entries[otherEnd].cell == otherCell) {
+                        otherEnd++;
+                    }
+                    for (j=runStart; j<runEnd; j++) {
+                        a = p->atoms[entries[j].atom];
+                        for (k=otherStart; k<otherEnd; k++) {
+                            addVerletPair(p, a, p->atoms[entries[k].atom], positions); BAIL();
+                        }
+                    }
+                }
+            }
+        }
+    }
+    free(entries);
+
+    // point the dynamic interactions at the new lists
+    n = p->num_static_vanDerWaals + p->num_verletVanDerWaals;
+    p->vanDerWaals = (struct vanDerWaals **)
+        accumulator(p->vanDerWaals, sizeof(struct vanDerWaals *) * n, 0);
+    for (k=0; k<p->num_verletVanDerWaals; k++) {
+        p->vanDerWaals[p->num_static_vanDerWaals + k] = &p->verletVanDerWaals[k];
+    }
+    p->num_vanDerWaals = n;
+    p->start_vanDerWaals_free_scan = n;
+
+    n = p->num_verletElectrostatic;
+    p->electrostatic = (struct electrostatic **)
+        accumulator(p->electrostatic, sizeof(struct electrostatic *) * n, 0);
+    for (k=0; k<n; k++) {
+        p->electrostatic[k] = &p->verletElectrostatic[k];
+    }
+    p->num_electrostatic = n;
+    p->start_electrostatic_free_scan = n;
+
+    // remember where the atoms were
+    p->verletPositions = (struct xyz *)
+        accumulator(p->verletPositions, sizeof(struct xyz) * p->num_atoms, 0);
+    for (i=0; i<p->num_atoms; i++) {
+        p->verletPositions[i] = positions[i];
+    }
+    p->num_verletBuilds++;
+}
+
+// Rebuild the Verlet lists if they have never been built, or if any
+// atom has moved more than half the skin since they were.
+static void
+updateVerletLists(struct part *p, struct xyz *positions)
+{
+    int i;
+    struct xyz dr;
+    double limitSquared;
+
+    if (p->verletPositions != NULL) {
+        limitSquared = VerletSkin * VerletSkin * 0.25;
+        for (i=0; i<p->num_atoms; i++) {
+            dr = vdif(positions[i], p->verletPositions[i]);
+            if (vdot(dr, dr) > limitSquared) {
+                break;
+            }
+        }
+        if (i >= p->num_atoms) {
+            return;
+        }
+    }
+    buildVerletLists(p, positions);
+}
+
 // All of space is divided into a cubic grid with each cube being
 // GRID_SPACING pm on a side.  Every GRID_OCCUPANCY cubes in each
 // direction there is a bucket.  Every GRID_SIZE buckets the grid
@@ -1070,6 +1360,18 @@ updateVanDerWaals(struct part *p, void *validity, struct xyz *positions)
 
     // wware 060109  python exception handling
     NULLPTR(p);
+    if (VerletSkin > 0.0 && p->num_atoms > 0) {
+        // Checking whether the lists need rebuilding is cheap, so we
+        // always check, rather than trusting validity.  (It's the
+        // address of a minimizer configuration, which may be reused
+        // by a later configuration with different positions.)
+        NULLPTR(positions);
+        updateVerletLists(p, positions); BAIL();
+        if (DEBUG(D_VERIFY_VDW)) { // -D13
+            verifyVanDerWaals(p, positions); BAIL();
+        }
+        return;
+    }
     if (validity && p->vanDerWaals_validity == validity) {
 	return;
     }
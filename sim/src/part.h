@@ -437,6 +437,17 @@ struct part
     int num_electrostatic;
     int start_electrostatic_free_scan;
     struct electrostatic **electrostatic;
+
+    // Verlet neighbor lists (used when VerletSkin > 0).  The dynamic
+    // entries of vanDerWaals and electrostatic point into these.
+    int num_verletVanDerWaals;
+    struct vanDerWaals *verletVanDerWaals;
+    int num_verletElectrostatic;
+    struct electrostatic *verletElectrostatic;
+
+    // atom positions when the Verlet lists were last built
+    struct xyz *verletPositions;
+    int num_verletBuilds;
     
     int num_stretches;
     struct stretch *stretches;
@@ -2,6 +2,20 @@
 
 #include "simulator.h"
 
+#ifndef WIN32
+#include <pthread.h>
+
+// Protects the state shared by the gradient threads (see
+// calculateGradientThreaded), including ExcessiveEnergyWarningThisFrame
+// and the warnings counted in it.
+static pthread_mutex_t gradientLock = PTHREAD_MUTEX_INITIALIZER;
+#define LOCK_GRADIENT() pthread_mutex_lock(&gradientLock)
+#define UNLOCK_GRADIENT() pthread_mutex_unlock(&gradientLock)
+#else
+#define LOCK_GRADIENT()
+#define UNLOCK_GRADIENT()
+#endif
+
 #define ALMOST_ZERO 0.0001
 
 static char const rcsid[] = "$Id$";
@@ -57,6 +71,16 @@ setRUnit(struct xyz *position, struct bond *b, double *pr)
   b->valid = validSerial;
 }
 
+// the same r as setRUnit() computes, without changing the bond.
+static double
+bondLength(struct xyz *position, struct bond *b)
+{
+  struct xyz rv;
+
+  vsub2(rv, position[b->a2->index], position[b->a1->index]);
+  return sqrt(vdot(rv, rv));
+}
+
 
 // note: the first two parameters are only used for error processing...
 // result in aJ (1e-18 J)
@@ -176,8 +200,10 @@ stretchGradient(struct part *p, struct stretch *stretch, struct bondStretch *str
       (k < stretchType->minPhysicalTableIndex ||
        k > stretchType->maxPhysicalTableIndex))
     {
+      LOCK_GRADIENT();
       WARNING2("excessive energy on %s bond at iteration %d -- further warnings suppressed", stretchType->bondName, Iteration);
       ExcessiveEnergyWarningThisFrame++;
+      UNLOCK_GRADIENT();
     }
   if (k < 0) {
     if (DEBUG(D_TABLE_BOUNDS) && stretch) { // -D0
@@ -207,7 +233,7 @@ stretchGradient(struct part *p, struct stretch *stretch, struct bondStretch *str
 }
 
 static void
-stretchGradientPart(struct part *p, struct xyz *position, struct xyz *force)
+stretchGradientPart(struct part *p, struct xyz *position, struct xyz *force, int first, int last)
 {
   int j;
   double gradient;
@@ -216,13 +242,18 @@ stretchGradientPart(struct part *p, struct xyz *position, struct xyz *force)
   struct xyz f;
   double r;
     
-  for (j=0; j<p->num_stretches; j++) {
+  for (j=first; j<last; j++) {
     stretch = &p->stretches[j];
     bond = stretch->b;
 
-    // we presume here that rUnit is invalid, and we need r anyway
-    setRUnit(position, bond, &r);
-    BAIL();
+    // we presume here that rUnit is invalid, and we need r anyway,
+    // unless calculateGradientThreaded() has already set it.
+    if (bond->valid == validSerial) {
+      r = bondLength(position, bond);
+    } else {
+      setRUnit(position, bond, &r);
+      BAIL();
+    }
 
     gradient = stretchGradient(p, stretch, stretch->stretchType, r);
     CHECKNAN(gradient);
@@ -315,7 +346,7 @@ bendPotentialPart(struct part *p, struct xyz *position)
 }
 
 static void
-bendGradientPart(struct part *p, struct xyz *position, struct xyz *force)
+bendGradientPart(struct part *p, struct xyz *position, struct xyz *force, int first, int last)
 {
   int j;
   struct xyz v1;
@@ -333,7 +364,7 @@ bendGradientPart(struct part *p, struct xyz *position, struct xyz *force)
   struct xyz axis;
     
   /* now the forces for each bend */
-  for (j=0; j<p->num_bends; j++) {
+  for (j=first; j<last; j++) {
     bend = &p->bends[j];
 
     bond1 = bend->b1;
@@ -472,7 +503,7 @@ torsionPotentialPart(struct part *p, struct xyz *position)
 }
 
 static void
-torsionGradientPart(struct part *p, struct xyz *position, struct xyz *force)
+torsionGradientPart(struct part *p, struct xyz *position, struct xyz *force, int first, int last)
 {
   int d;
   int i;
@@ -523,7 +554,7 @@ torsionGradientPart(struct part *p, struct xyz *position, struct xyz *force)
   struct xyza *gradient;
   struct xyz *grad;
     
-  for (j=0; j<p->num_torsions; j++) {
+  for (j=first; j<last; j++) {
     torsion = &p->torsions[j];
 
     vsub2(va, position[torsion->aa->index], position[torsion->a1->index]);
@@ -749,7 +780,7 @@ outOfPlanePotentialPart(struct part *p, struct xyz *position)
 #define BALANCED_OOP_GRADIENT
 
 static void
-outOfPlaneGradientPart(struct part *p, struct xyz *position, struct xyz *force)
+outOfPlaneGradientPart(struct part *p, struct xyz *position, struct xyz *force, int first, int last)
 {
   int j;
   double rSquared;
@@ -780,7 +811,7 @@ outOfPlaneGradientPart(struct part *p, struct xyz *position, struct xyz *force)
 #endif
 #endif
     
-  for (j=0; j<p->num_outOfPlanes; j++) {
+  for (j=first; j<last; j++) {
     outOfPlane = &p->outOfPlanes[j];
 
     // v1_2 and v1_3 are vectors in the plane of the outer triangle (1-2-3)
@@ -976,8 +1007,10 @@ vanDerWaalsGradient(struct part *p, struct vanDerWaals *vdw, struct vanDerWaalsP
       !ExcessiveEnergyWarning &&
       k < parameters->minPhysicalTableIndex)
   {
+    LOCK_GRADIENT();
     WARNING2("excessive energy in %s vdw at iteration %d -- further warnings suppressed", parameters->vdwName, Iteration);
     ExcessiveEnergyWarningThisFrame++;
+    UNLOCK_GRADIENT();
   }
 
   if (k < 0) {
@@ -997,7 +1030,7 @@ vanDerWaalsGradient(struct part *p, struct vanDerWaals *vdw, struct vanDerWaalsP
 }
 
 static void
-vdwGradientPart(struct part *p, struct xyz *position, struct xyz *force)
+vdwGradientPart(struct part *p, struct xyz *position, struct xyz *force, int first, int last)
 {
   int j;
   double rSquared;
@@ -1008,7 +1041,7 @@ vdwGradientPart(struct part *p, struct xyz *position, struct xyz *force)
   double r;
     
   /* do the van der Waals/London forces */
-  for (j=0; j<p->num_vanDerWaals; j++) {
+  for (j=first; j<last; j++) {
     vdw = p->vanDerWaals[j];
 
     // The vanDerWaals array changes over time, and might have
@@ -1137,8 +1170,10 @@ electrostaticGradient(struct part *p, struct electrostatic *es, struct electrost
       !ExcessiveEnergyWarning &&
       k < parameters->minPhysicalTableIndex)
   {
+    LOCK_GRADIENT();
     WARNING2("excessive energy in %s es at iteration %d -- further warnings suppressed", parameters->electrostaticName, Iteration);
     ExcessiveEnergyWarningThisFrame++;
+    UNLOCK_GRADIENT();
   }
 
   if (k < 0) {
@@ -1158,7 +1193,7 @@ electrostaticGradient(struct part *p, struct electrostatic *es, struct electrost
 }
 
 static void
-electrostaticGradientPart(struct part *p, struct xyz *position, struct xyz *force)
+electrostaticGradientPart(struct part *p, struct xyz *position, struct xyz *force, int first, int last)
 {
   int j;
   double rSquared;
@@ -1169,7 +1204,7 @@ electrostaticGradientPart(struct part *p, struct xyz *position, struct xyz *forc
   double r;
     
   /* do the Coulomb forces */
-  for (j=0; j<p->num_electrostatic; j++) {
+  for (j=first; j<last; j++) {
     es = p->electrostatic[j];
 
     // The electrostatic array changes over time, and might have
@@ -1243,46 +1278,290 @@ calculatePotential(struct part *p, struct xyz *position)
   return potential;
 }
 
-// result placed in force is in pN (1e-12 J/m)
-void
-calculateGradient(struct part *p, struct xyz *position, struct xyz *force)
-{
-  int j;
+// The start of range number index, when n items are divided into
+// count contiguous ranges of (nearly) equal size.
+#define THREAD_RANGE_START(n, index, count) ((int)(((long)(n) * (index)) / (count)))
 
-  validSerial++;
-    
-  /* clear force vectors */
-  for (j=0; j<p->num_atoms; j++) {
-    vsetc(force[j], 0.0);
-  }
-  
+// Evaluate this thread's share of each kind of force term, adding
+// the results into force.  The terms of each kind are divided into
+// count contiguous ranges, and this thread does range number index.
+static void
+gradientTerms(struct part *p, struct xyz *position, struct xyz *force, int index, int count)
+{
   if (!DEBUG(D_SKIP_STRETCH)) { // -D6
-    stretchGradientPart(p, position, force);
+    stretchGradientPart(p, position, force,
+                        THREAD_RANGE_START(p->num_stretches, index, count),
+                        THREAD_RANGE_START(p->num_stretches, index + 1, count));
     BAIL();
   }
 
   if (!DEBUG(D_SKIP_BEND)) { // -D7
-    bendGradientPart(p, position, force);
+    bendGradientPart(p, position, force,
+                     THREAD_RANGE_START(p->num_bends, index, count),
+                     THREAD_RANGE_START(p->num_bends, index + 1, count));
     BAIL();
   }
 
   if (!DEBUG(D_SKIP_TORSION)) { // -D16
-    torsionGradientPart(p, position, force);
+    torsionGradientPart(p, position, force,
+                        THREAD_RANGE_START(p->num_torsions, index, count),
+                        THREAD_RANGE_START(p->num_torsions, index + 1, count));
     BAIL();
   }
 
   if (!DEBUG(D_SKIP_OUT_OF_PLANE)) { // -D17
-    outOfPlaneGradientPart(p, position, force);
+    outOfPlaneGradientPart(p, position, force,
+                           THREAD_RANGE_START(p->num_outOfPlanes, index, count),
+                           THREAD_RANGE_START(p->num_outOfPlanes, index + 1, count));
     BAIL();
   }
 
   if (!DEBUG(D_SKIP_VDW)) { // -D9
-    vdwGradientPart(p, position, force);
+    vdwGradientPart(p, position, force,
+                    THREAD_RANGE_START(p->num_vanDerWaals, index, count),
+                    THREAD_RANGE_START(p->num_vanDerWaals, index + 1, count));
     BAIL();
   }
 
   if (!DEBUG(D_SKIP_ELECTROSTATIC)) { // -D9
-    electrostaticGradientPart(p, position, force);
+    electrostaticGradientPart(p, position, force,
+                              THREAD_RANGE_START(p->num_electrostatic, index, count),
+                              THREAD_RANGE_START(p->num_electrostatic, index + 1, count));
     BAIL();
   }
 }
+
+#ifndef WIN32
+
+// Threaded gradient evaluation, used when ThreadCount > 1.
+//
+// The calling thread and ThreadCount-1 worker threads each evaluate
+// a contiguous range of each kind of force term.  The calling thread
+// adds its forces directly into the result, and each worker into a
+// force array of its own.  Then each thread sums the worker arrays
+// into a range of atoms of the result, always in order of thread
+// index, so the result for a given ThreadCount doesn't depend on
+// which thread finishes first.  It differs from the serial result
+// only by the order in which the force on each atom is summed.
+//
+// The worker threads are started the first time they are needed,
+// and kept (waiting on gradientStart) until ThreadCount changes.
+
+#define GRADIENT_TERMS  1
+#define GRADIENT_REDUCE 2
+#define GRADIENT_EXIT   3
+
+struct gradientThread 
+{
+  pthread_t thread;
+  int index;
+  int generation;     // of the last phase this thread started
+  struct xyz *force;  // this thread's forces, NULL for the calling thread
+};
+
+static pthread_cond_t gradientStart = PTHREAD_COND_INITIALIZER;
+static pthread_cond_t gradientFinish = PTHREAD_COND_INITIALIZER;
+
+static struct gradientThread *gradientThreads = NULL;
+static int gradientThreadCount = 0; // including the calling thread
+static int gradientGeneration = 0;  // incremented to start each phase
+static int gradientPhase;
+static int gradientBusy;            // workers which haven't finished this phase
+
+// arguments of the current calculateGradient() call
+static struct part *gradientPartArg;
+static struct xyz *gradientPositionArg;
+static struct xyz *gradientForceArg;
+
+static void
+doGradientPhase(struct gradientThread *t)
+{
+  struct part *p = gradientPartArg;
+  struct xyz *force;
+  int j;
+  int k;
+  int first;
+  int last;
+
+  switch (gradientPhase) {
+  case GRADIENT_TERMS:
+    force = gradientForceArg;
+    if (t->force != NULL) {
+      force = t->force;
+      for (j=0; j<p->num_atoms; j++) {
+        vsetc(force[j], 0.0);
+      }
+    }
+    gradientTerms(p, gradientPositionArg, force, t->index, gradientThreadCount);
+    break;
+  case GRADIENT_REDUCE:
+    first = THREAD_RANGE_START(p->num_atoms, t->index, gradientThreadCount);
+    last = THREAD_RANGE_START(p->num_atoms, t->index + 1, gradientThreadCount);
+    for (k=1; k<gradientThreadCount; k++) {
+      force = gradientThreads[k].force;
+      for (j=first; j<last; j++) {
+        vadd(gradientForceArg[j], force[j]);
+      }
+    }
+    break;
+  }
+}
+
+static void *
+gradientWorker(void *arg)
+{
+  struct gradientThread *t = (struct gradientThread *)arg;
+
+  while (1) {
+    pthread_mutex_lock(&gradientLock);
+    while (gradientGeneration == t->generation) {
+      pthread_cond_wait(&gradientStart, &gradientLock);
+    }
+    t->generation = gradientGeneration;
+    pthread_mutex_unlock(&gradientLock);
+    if (gradientPhase == GRADIENT_EXIT) {
+      return NULL;
+    }
+    doGradientPhase(t);
+    pthread_mutex_lock(&gradientLock);
+    if (--gradientBusy == 0) {
+      pthread_cond_signal(&gradientFinish);
+    }
+    pthread_mutex_unlock(&gradientLock);
+  }
+}
+
+// Run one phase in every thread, returning when all have finished.
+static void
+runGradientPhase(int phase)
+{
+  pthread_mutex_lock(&gradientLock);
+  gradientPhase = phase;
+  gradientBusy = gradientThreadCount - 1;
+  gradientGeneration++;
+  pthread_cond_broadcast(&gradientStart);
+  pthread_mutex_unlock(&gradientLock);
+
+  if (phase == GRADIENT_EXIT) {
+    return;
+  }
+  gradientThreads[0].generation = gradientGeneration;
+  doGradientPhase(&gradientThreads[0]);
+
+  pthread_mutex_lock(&gradientLock);
+  while (gradientBusy > 0) {
+    pthread_cond_wait(&gradientFinish, &gradientLock);
+  }
+  pthread_mutex_unlock(&gradientLock);
+}
+
+static void
+stopGradientThreads(void)
+{
+  int k;
+
+  if (gradientThreadCount > 1) {
+    runGradientPhase(GRADIENT_EXIT);
+    for (k=1; k<gradientThreadCount; k++) {
+      pthread_join(gradientThreads[k].thread, NULL);
+    }
+  }
+  for (k=1; k<gradientThreadCount; k++) {
+    free(gradientThreads[k].force);
+  }
+  free(gradientThreads);
+  gradientThreads = NULL;
+  gradientThreadCount = 0;
+}
+
+// returns non-zero if ThreadCount threads are ready to use.
+static int
+startGradientThreads(void)
+{
+  int k;
+
+  if (gradientThreadCount == ThreadCount) {
+    return 1;
+  }
+  stopGradientThreads();
+  gradientThreads = (struct gradientThread *)allocate(sizeof(struct gradientThread) * ThreadCount);
+  gradientThreadCount = 1;
+  gradientThreads[0].index = 0;
+  gradientThreads[0].force = NULL;
+  for (k=1; k<ThreadCount; k++) {
+    gradientThreads[k].index = k;
+    gradientThreads[k].generation = gradientGeneration;
+    gradientThreads[k].force = NULL;
+    if (pthread_create(&gradientThreads[k].thread, NULL, gradientWorker, &gradientThreads[k])) {
+      WARNING1("could not start gradient thread %d, using one thread", k);
+      stopGradientThreads();
+      ThreadCount = 1;
+      return 0;
+    }
+    gradientThreadCount++;
+  }
+  return 1;
+}
+
+static void
+calculateGradientThreaded(struct part *p, struct xyz *position, struct xyz *force)
+{
+  int j;
+  int k;
+
+  if (!startGradientThreads()) {
+    gradientTerms(p, position, force, 0, 1);
+    return;
+  }
+  for (k=1; k<gradientThreadCount; k++) {
+    gradientThreads[k].force = (struct xyz *)accumulator(gradientThreads[k].force, sizeof(struct xyz) * p->num_atoms, 0);
+  }
+
+  // Bends share bonds, so set every bond's rUnit here, rather than
+  // letting the threads race to do it.
+  for (j=0; j<p->num_bonds; j++) {
+    setRUnit(position, p->bonds[j], NULL);
+  }
+
+  gradientPartArg = p;
+  gradientPositionArg = position;
+  gradientForceArg = force;
+  runGradientPhase(GRADIENT_TERMS);
+  BAIL();
+  runGradientPhase(GRADIENT_REDUCE);
+}
+
+#else
+
+static void
+calculateGradientThreaded(struct part *p, struct xyz *position, struct xyz *force)
+{
+  gradientTerms(p, position, force, 0, 1);
+}
+
+#endif
+
+// result placed in force is in pN (1e-12 J/m)
+void
+calculateGradient(struct part *p, struct xyz *position, struct xyz *force)
+{
+  int j;
+
+  validSerial++;
+    
+  /* clear force vectors */
+  for (j=0; j<p->num_atoms; j++) {
+    vsetc(force[j], 0.0);
+  }
+
+  // The stress and force vector movies are written as the terms
+  // are evaluated, so they need the terms in order.
+  if (ThreadCount > 1 &&
+      !DEBUG(D_STRESS_MOVIE) &&
+      !DEBUG(D_MINIMIZE_GRADIENT_MOVIE_DETAIL))
+  {
+    calculateGradientThreaded(p, position, force);
+  } else {
+    gradientTerms(p, position, force, 0, 1);
+  }
+}
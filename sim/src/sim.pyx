@@ -47,6 +47,8 @@ cdef extern from "simhelp.c":
     double VanDerWaalsCutoffFactor
     int EnableElectrostatic
     int NeighborSearching
+    int ThreadCount
+    double VerletSkin
     double ThermostatGamma
     int UseAMBER
     int TypeFeedback
@@ -159,6 +161,10 @@ cdef class _Simulator:
             return EnableElectrostatic
         elif strcmp(key, "NeighborSearching") == 0:
             return NeighborSearching
+        elif strcmp(key, "ThreadCount") == 0:
+            return ThreadCount
+        elif strcmp(key, "VerletSkin") == 0:
+            return VerletSkin
         elif strcmp(key, "UseAMBER") == 0:
             return UseAMBER
         elif strcmp(key, "TypeFeedback") == 0:
@@ -294,6 +300,12 @@ cdef class _Simulator:
         elif strcmp(key, "NeighborSearching") == 0:
             global NeighborSearching
             NeighborSearching = value
+        elif strcmp(key, "ThreadCount") == 0:
+            global ThreadCount
+            ThreadCount = value
+        elif strcmp(key, "VerletSkin") == 0:
+            global VerletSkin
+            VerletSkin = value
         elif strcmp(key, "UseAMBER") == 0:
             global UseAMBER
             UseAMBER = value
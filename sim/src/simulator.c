@@ -69,8 +69,14 @@ usage(void)
                     maximum range of vdw force for GROMACS, in nm.\n\
    --vdw-cutoff-factor=<float>\n\
                     maximum range of vdw force, as multiple of rvdW.\n\
+   --verlet-skin=<float>\n\
+                    find vdw and electrostatic interactions with Verlet neighbor lists\n\
+                    having this skin distance (in pm), rebuilt only when some atom has\n\
+                    moved more than half of it.  Default 0 uses a wrapped grid instead.\n\
    --enable-electrostatic=<flag>\n\
                     specify 0 to disable electrostatic interactions, default is non-zero.\n\
+   --threads=<int>\n\
+                    number of threads used to evaluate forces, default 1.\n\
    -E, --print-structure-energy\n\
                     print structure potential energy\n\
    --print-energies\n\
@@ -168,6 +174,8 @@ set_py_exc_str(const char *filename,
 #define OPT_VDW_CUTOFF_RADIUS LONG_OPT (21)
 #define OPT_OUTPUT_FORMAT_3 LONG_OPT (22)
 #define OPT_NEIGHBOR_SEARCHING LONG_OPT (23)
+#define OPT_THREADS           LONG_OPT (24)
+#define OPT_VERLET_SKIN       LONG_OPT (25)
 
 static const struct option option_vec[] = {
     { "help", no_argument, NULL, 'h' },
@@ -211,6 +219,8 @@ static const struct option option_vec[] = {
     { "trace-file", required_argument, NULL, 'q' },
     { "base-file", required_argument, NULL, 'B' },
     { "neighbor-searching", required_argument, NULL, OPT_NEIGHBOR_SEARCHING },
+    { "threads", required_argument, NULL, OPT_THREADS },
+    { "verlet-skin", required_argument, NULL, OPT_VERLET_SKIN },
     { NULL, no_argument, NULL, 0 }
 };
 
@@ -330,6 +340,12 @@ main(int argc, char **argv)
         case OPT_NEIGHBOR_SEARCHING:
             NeighborSearching = atoi(optarg);
             break;
+        case OPT_THREADS:
+            ThreadCount = atoi(optarg);
+            break;
+        case OPT_VERLET_SKIN:
+            VerletSkin = atof(optarg);
+            break;
 	case 'n':
 	    // ignored
 	    break;
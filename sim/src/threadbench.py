@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+"""
+ Measure how the simulator's force evaluation scales with the number
+ of threads it uses (see --threads), and check that the threaded runs
+ give the same results as the serial one.
+
+ usage: threadbench.py [--simulator path] [--threads 1,2,4,8]
+                       [--frames N] [--iters N] [--tolerance T] file.mmp...
+
+ Each file is run as a short dynamics simulation once for each thread
+ count.  The time per iteration is read from the 'Duration' line of
+ the trace file, so it doesn't include reading the file or setting up
+ the force terms.  The positions in the last frame of each threaded
+ run are compared with those from the one thread run.  They differ
+ only by the order in which each atom's forces are summed, so the
+ largest difference (in Angstroms) should be tiny.  Any file for
+ which it is larger than the tolerance is reported, and makes the
+ exit status non-zero.
+"""
+
+import sys
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+durationPattern = re.compile(r"^# Duration: ([0-9]+):([0-9]+):([0-9]+):([0-9.]+),")
+
+def lastFramePositions(xyzFileName):
+    """
+    Return the list of (x, y, z) positions in the last frame of an
+    .xyz file written with -x.
+    """
+    lines = open(xyzFileName).readlines()
+    positions = []
+    i = 0
+    while i < len(lines):
+        count = int(lines[i])
+        positions = []
+        for line in lines[i+2:i+2+count]:
+            fields = line.split()
+            positions.append((float(fields[1]), float(fields[2]), float(fields[3])))
+        i += count + 2
+    return positions
+
+def secondsPerIteration(traceFileName, iterations):
+    """
+    Return the dynamics run time from a trace file, divided by the
+    number of iterations.
+    """
+    for line in open(traceFileName):
+        match = durationPattern.match(line)
+        if match:
+            days, hours, minutes, seconds = match.groups()
+            seconds = ((int(days) * 24 + int(hours)) * 60 + int(minutes)) * 60 \
+                      + float(seconds)
+            return seconds / iterations
+    return None
+
+def maxDifference(positions1, positions2):
+    if len(positions1) != len(positions2):
+        return None
+    worst = 0.0
+    for p1, p2 in zip(positions1, positions2):
+        for a, b in zip(p1, p2):
+            worst = max(worst, abs(a - b))
+    return worst
+
+def runOnce(simulator, mmpFileName, options, frames, iters, baseName):
+    """
+    Run a dynamics simulation of mmpFileName with the given list of
+    extra simulator options, writing baseName.xyz and baseName.trace
+    (and the simulator's output to baseName.out).
+    Returns (seconds per iteration, positions in the last frame), or
+    (None, None) if the simulator fails.
+    """
+    command = [simulator, "-x", "-f%d" % frames, "-i%d" % iters] + options + \
+              ["-o", baseName + ".xyz", "-q", baseName + ".trace", mmpFileName]
+    out = open(baseName + ".out", "w")
+    try:
+        status = subprocess.call(command, stdout = out,
+                                 stderr = subprocess.STDOUT)
+    finally:
+        out.close()
+    if status != 0:
+        print "  %s: simulator failed (status %d), see %s.out" \
+              % (" ".join(options), status, baseName)
+        return None, None
+    return secondsPerIteration(baseName + ".trace", frames * iters), \
+           lastFramePositions(baseName + ".xyz")
+
+def runWithThreads(simulator, mmpFileName, threads, frames, iters, workDirectory):
+    return runOnce(simulator, mmpFileName, ["--threads=%d" % threads],
+                   frames, iters,
+                   os.path.join(workDirectory, "threads%d" % threads))
+
+def benchmarkFile(simulator, mmpFileName, threadCounts, frames, iters, tolerance):
+    """
+    Run mmpFileName with each thread count, printing the timings and
+    differences.  Returns False if any run failed or differed from
+    the serial run by more than tolerance.
+    """
+    print mmpFileName
+    workDirectory = tempfile.mkdtemp(prefix = "threadbench")
+    ok = True
+    serialTime, serialPositions = runWithThreads(simulator, mmpFileName, 1,
+                                                 frames, iters, workDirectory)
+    if serialPositions is None:
+        return False
+    print "  %d atoms" % len(serialPositions)
+    print "  threads  sec/iteration  speedup  max difference"
+    print "  %7d  %13.6f  %7.2f  %14s" % (1, serialTime, 1.0, "-")
+    for threads in threadCounts:
+        if threads == 1:
+            continue
+        seconds, positions = runWithThreads(simulator, mmpFileName, threads,
+                                            frames, iters, workDirectory)
+        if positions is None:
+            ok = False
+            continue
+        difference = maxDifference(serialPositions, positions)
+        if difference is None or difference > tolerance:
+            ok = False
+            flag = "  ** differs from serial run"
+        else:
+            flag = ""
+        speedup = 0.0
+        if seconds:
+            speedup = serialTime / seconds
+        print "  %7d  %13.6f  %7.2f  %14s%s" % (threads, seconds, speedup,
+                                                difference, flag)
+    if ok:
+        shutil.rmtree(workDirectory)
+    else:
+        print "  output left in " + workDirectory
+    return ok
+
+def main():
+    simulator = "./simulator"
+    threadCounts = [1, 2, 4, 8]
+    frames = 5
+    iters = 10
+    tolerance = 1e-4
+    args = sys.argv[1:]
+    while args and args[0].startswith("--"):
+        option = args.pop(0)
+        if not args:
+            print __doc__
+            sys.exit(1)
+        value = args.pop(0)
+        if option == "--simulator":
+            simulator = value
+        elif option == "--threads":
+            threadCounts = [int(n) for n in value.split(",")]
+        elif option == "--frames":
+            frames = int(value)
+        elif option == "--iters":
+            iters = int(value)
+        elif option == "--tolerance":
+            tolerance = float(value)
+        else:
+            print __doc__
+            sys.exit(1)
+    if not args:
+        print __doc__
+        sys.exit(1)
+    ok = True
+    for mmpFileName in args:
+        if not benchmarkFile(simulator, mmpFileName, threadCounts,
+                             frames, iters, tolerance):
+            ok = False
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# Copyright 2009 Nanorex, Inc.  See LICENSE file for details.
+
+"""
+ Compare the time per dynamics step when van der Waals and
+ electrostatic interactions are found with the wrapped grid (the
+ default) and with Verlet neighbor lists (see --verlet-skin).
+
+ usage: verletbench.py [--simulator path] [--skin pm] [--frames N]
+                       [--iters N] [--tolerance T] [file.mmp...]
+
+ With no files, the .mmp files of the regression tests (the same test
+ directories regression.py uses) are run.  Each file is run as a short
+ dynamics simulation both ways.  The interactions found both ways are
+ the same, in a different order, so the largest difference (in
+ Angstroms) between the positions in their last frames should be tiny.
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+from glob import glob
+
+from threadbench import runOnce, maxDifference
+
+testDirs = ["tests/minimize", "tests/dynamics", "tests/rigid_organics"]
+
+def benchmarkFile(simulator, mmpFileName, skin, frames, iters, tolerance):
+    """
+    Run mmpFileName with the grid and with Verlet lists, and return
+    (grid seconds per iteration, Verlet seconds per iteration, number
+    of atoms, ok), where ok is False if either run failed or they
+    differed by more than tolerance.
+    """
+    workDirectory = tempfile.mkdtemp(prefix = "verletbench")
+    gridTime, gridPositions = runOnce(simulator, mmpFileName, "",
+                                      frames, iters,
+                                      os.path.join(workDirectory, "grid"))
+    verletTime, verletPositions = runOnce(simulator, mmpFileName,
+                                          "--verlet-skin=%f" % skin,
+                                          frames, iters,
+                                          os.path.join(workDirectory, "verlet"))
+    ok = gridPositions is not None and verletPositions is not None
+    if ok:
+        difference = maxDifference(gridPositions, verletPositions)
+        ok = difference is not None and difference <= tolerance
+    if ok:
+        shutil.rmtree(workDirectory)
+        return gridTime, verletTime, len(gridPositions), True
+    print "%s: runs failed or differ, output left in %s" \
+          % (mmpFileName, workDirectory)
+    return None, None, 0, False
+
+def main():
+    simulator = "./simulator"
+    skin = 100.0
+    frames = 5
+    iters = 20
+    tolerance = 1e-4
+    args = sys.argv[1:]
+    while args and args[0].startswith("--"):
+        option = args.pop(0)
+        if not args:
+            print __doc__
+            sys.exit(1)
+        value = args.pop(0)
+        if option == "--simulator":
+            simulator = value
+        elif option == "--skin":
+            skin = float(value)
+        elif option == "--frames":
+            frames = int(value)
+        elif option == "--iters":
+            iters = int(value)
+        elif option == "--tolerance":
+            tolerance = float(value)
+        else:
+            print __doc__
+            sys.exit(1)
+    if not args:
+        for dir in testDirs:
+            args.extend(glob(os.path.join(dir, "*.mmp")))
+        args.sort()
+    ok = True
+    totalGrid = 0.0
+    totalVerlet = 0.0
+    print "%-50s %6s %12s %12s %8s" % ("file", "atoms", "grid s/iter",
+                                       "verlet s/iter", "speedup")
+    for mmpFileName in args:
+        gridTime, verletTime, atoms, fileOk = \
+                  benchmarkFile(simulator, mmpFileName, skin,
+                                frames, iters, tolerance)
+        if not fileOk:
+            ok = False
+            continue
+        totalGrid += gridTime
+        totalVerlet += verletTime
+        speedup = 0.0
+        if verletTime:
+            speedup = gridTime / verletTime
+        print "%-50s %6d %12.6f %12.6f %8.2f" % (mmpFileName[-50:], atoms,
+                                                 gridTime, verletTime, speedup)
+    if totalVerlet:
+        print "total: grid %.6f s/iter, verlet %.6f s/iter, speedup %.2f" \
+              % (totalGrid, totalVerlet, totalGrid / totalVerlet)
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()